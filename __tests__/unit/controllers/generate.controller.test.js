@@ -4,6 +4,7 @@ jest.unstable_mockModule('../../../src/services/ollama.service.js', () => ({
   ollamaService: {
     generateCode: jest.fn(),
     generateCodeStream: jest.fn(),
+    resumeStream: jest.fn(),
   }
 }));
 
@@ -99,7 +100,8 @@ describe('Generate Controller', () => {
       ollamaServiceMock.generateCode.mockResolvedValue({ code: 'console.log("hi")' });
 
       await generateController.generate(req, res);
-      expect(ollamaServiceMock.generateCode).toHaveBeenCalledWith('llama', 'test', []);
+      // Sin traceparent del cliente no se envía ninguno: FastAPI inicia la traza
+      expect(ollamaServiceMock.generateCode).toHaveBeenCalledWith('llama', 'test', [], {});
       expect(res.json).toHaveBeenCalledWith({ code: 'console.log("hi")' });
     });
 
@@ -132,7 +134,7 @@ describe('Generate Controller', () => {
         on: jest.fn(),
         destroy: jest.fn()
       };
-      ollamaServiceMock.generateCodeStream.mockResolvedValue(mockStream);
+      ollamaServiceMock.generateCodeStream.mockResolvedValue({ stream: mockStream, headers: {} });
 
       await generateController.generateStream(req, res);
 
@@ -142,6 +144,40 @@ describe('Generate Controller', () => {
       expect(req.on).toHaveBeenCalledWith('close', expect.any(Function));
     });
 
+    it('debería reenviar el traceparent recibido a FastAPI', async () => {
+      const traceparent = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01';
+      const req = { ...mockReq({ model: 'llama', prompt: 'test' }), headers: { traceparent } };
+      const res = mockRes();
+      ollamaServiceMock.generateCodeStream.mockResolvedValue({ stream: { pipe: jest.fn(), on: jest.fn(), destroy: jest.fn() }, headers: {} });
+
+      await generateController.generateStream(req, res);
+
+      const forwarded = ollamaServiceMock.generateCodeStream.mock.calls[0].at(-1);
+      expect(forwarded).toEqual({ traceparent });
+    });
+
+    it('debería reenviar imageIds a FastAPI y sus cabeceras al cliente', async () => {
+      const req = mockReq({ model: 'llava', prompt: 'test', imageIds: '["abc"]' });
+      const res = mockRes();
+      const headers = { 'X-Image-Ids': 'abc', 'X-Stream-Session': 'f00d' };
+      ollamaServiceMock.generateCodeStream.mockResolvedValue({ stream: { pipe: jest.fn(), on: jest.fn(), destroy: jest.fn() }, headers });
+
+      await generateController.generateStream(req, res);
+
+      expect(ollamaServiceMock.generateCodeStream.mock.calls[0].at(-2)).toEqual(['abc']);
+      expect(res.setHeader).toHaveBeenCalledWith('X-Image-Ids', 'abc');
+      expect(res.setHeader).toHaveBeenCalledWith('X-Stream-Session', 'f00d');
+    });
+
+    it('debería retornar 400 si imageIds no es JSON', async () => {
+      const req = mockReq({ model: 'llava', prompt: 'test', imageIds: 'abc' });
+      const res = mockRes();
+
+      await generateController.generateStream(req, res);
+      expect(res.status).toHaveBeenCalledWith(400);
+      expect(ollamaServiceMock.generateCodeStream).not.toHaveBeenCalled();
+    });
+
     it('debería manejar errores iniciando stream', async () => {
       const req = mockReq({ model: 'llama', prompt: 'test' });
       const res = mockRes();
@@ -162,7 +198,7 @@ describe('Generate Controller', () => {
         destroy: jest.fn()
       };
       
-      ollamaServiceMock.generateCodeStream.mockResolvedValue(mockStream);
+      ollamaServiceMock.generateCodeStream.mockResolvedValue({ stream: mockStream, headers: {} });
       await generateController.generateStream(req, res);
       
       // Simular on close
@@ -181,7 +217,7 @@ describe('Generate Controller', () => {
         destroy: jest.fn()
       };
       
-      ollamaServiceMock.generateCodeStream.mockResolvedValue(mockStream);
+      ollamaServiceMock.generateCodeStream.mockResolvedValue({ stream: mockStream, headers: {} });
       await generateController.generateStream(req, res);
       
       // Simular throw de error en stream emit
@@ -191,4 +227,49 @@ describe('Generate Controller', () => {
       expect(res.end).toHaveBeenCalled();
     });
   });
+
+  describe('resumeStream', () => {
+    const mockStream = () => ({ pipe: jest.fn(), on: jest.fn(), destroy: jest.fn() });
+
+    it('debería retornar 400 sin Last-Event-ID', async () => {
+      const req = { ...mockReq(), headers: {}, query: {} };
+      const res = mockRes();
+
+      await generateController.resumeStream(req, res);
+      expect(res.status).toHaveBeenCalledWith(400);
+    });
+
+    it('debería reanudar con la query from_id', async () => {
+      const req = { ...mockReq(), headers: {}, query: { from_id: 's:4' } };
+      const res = mockRes();
+      const stream = mockStream();
+      ollamaServiceMock.resumeStream.mockResolvedValue({ stream, headers: { 'X-Stream-Session': 's' } });
+
+      await generateController.resumeStream(req, res);
+
+      expect(ollamaServiceMock.resumeStream).toHaveBeenCalledWith('s:4', {});
+      expect(res.setHeader).toHaveBeenCalledWith('X-Stream-Session', 's');
+      expect(stream.pipe).toHaveBeenCalledWith(res);
+    });
+
+    it('POST /stream con Last-Event-ID debería reanudar en lugar de generar', async () => {
+      const req = { ...mockReq({ model: 'llama', prompt: 'test' }), headers: { 'last-event-id': 's:4' } };
+      const res = mockRes();
+      ollamaServiceMock.resumeStream.mockResolvedValue({ stream: mockStream(), headers: {} });
+
+      await generateController.generateStream(req, res);
+
+      expect(ollamaServiceMock.resumeStream).toHaveBeenCalledWith('s:4', {});
+      expect(ollamaServiceMock.generateCodeStream).not.toHaveBeenCalled();
+    });
+
+    it('debería propagar el estado de FastAPI (p. ej. 404 si la sesión caducó)', async () => {
+      const req = { ...mockReq(), headers: { 'last-event-id': 's:4' }, query: {} };
+      const res = mockRes();
+      ollamaServiceMock.resumeStream.mockRejectedValue({ status: 404, message: 'Sesión de stream no encontrada o caducada' });
+
+      await generateController.resumeStream(req, res);
+      expect(res.status).toHaveBeenCalledWith(404);
+    });
+  });
 });
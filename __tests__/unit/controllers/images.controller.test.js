@@ -0,0 +1,92 @@
+import { jest } from '@jest/globals';
+
+jest.unstable_mockModule('../../../src/services/ollama.service.js', () => ({
+  ollamaService: {
+    uploadImages: jest.fn(),
+  }
+}));
+
+jest.unstable_mockModule('../../../src/utils/logger.js', () => ({
+  logger: {
+    info: jest.fn(),
+    error: jest.fn(),
+  }
+}));
+
+jest.unstable_mockModule('../../../src/config/index.js', () => ({
+  config: {
+    upload: {
+      allowedMimeTypes: ['image/jpeg', 'image/png', 'image/webp'],
+      maxSize: 5 * 1024 * 1024, // 5MB
+    }
+  }
+}));
+
+describe('Images Controller', () => {
+  let imagesController;
+  let ollamaServiceMock;
+
+  beforeAll(async () => {
+    const ollamaModule = await import('../../../src/services/ollama.service.js');
+    ollamaServiceMock = ollamaModule.ollamaService;
+
+    const controllerModule = await import('../../../src/controllers/images.controller.js');
+    imagesController = controllerModule.imagesController;
+  });
+
+  beforeEach(() => {
+    jest.clearAllMocks();
+  });
+
+  const mockReq = (files = []) => ({ body: {}, files, headers: {} });
+
+  const mockRes = () => {
+    const res = {};
+    res.status = jest.fn().mockReturnValue(res);
+    res.json = jest.fn().mockReturnValue(res);
+    return res;
+  };
+
+  it('debería retornar 400 si no hay imágenes', async () => {
+    const res = mockRes();
+
+    await imagesController.upload(mockReq(), res);
+    expect(res.status).toHaveBeenCalledWith(400);
+    expect(ollamaServiceMock.uploadImages).not.toHaveBeenCalled();
+  });
+
+  it('debería retornar 400 si hay mas de 5 imagenes', async () => {
+    const res = mockRes();
+
+    await imagesController.upload(mockReq([1, 2, 3, 4, 5, 6]), res);
+    expect(res.status).toHaveBeenCalledWith(400);
+    expect(res.json).toHaveBeenCalledWith(expect.objectContaining({ error: expect.stringContaining('Máximo 5') }));
+  });
+
+  it('debería retornar 400 si la imagen no tiene un mime type permitido', async () => {
+    const res = mockRes();
+
+    await imagesController.upload(mockReq([{ mimetype: 'image/gif' }]), res);
+    expect(res.status).toHaveBeenCalledWith(400);
+  });
+
+  it('debería devolver los ids de las imágenes guardadas', async () => {
+    const files = [{ mimetype: 'image/png', size: 4, buffer: Buffer.from('test') }];
+    const res = mockRes();
+    ollamaServiceMock.uploadImages.mockResolvedValue({ images: [{ id: 'abc', bytes: 4 }] });
+
+    await imagesController.upload(mockReq(files), res);
+    expect(ollamaServiceMock.uploadImages).toHaveBeenCalledWith(files, {});
+    expect(res.status).toHaveBeenCalledWith(201);
+    expect(res.json).toHaveBeenCalledWith({ images: [{ id: 'abc', bytes: 4 }] });
+  });
+
+  it('debería propagar el estado de los errores de FastAPI', async () => {
+    const files = [{ mimetype: 'image/png', size: 4, buffer: Buffer.from('test') }];
+    const res = mockRes();
+    ollamaServiceMock.uploadImages.mockRejectedValue({ status: 503, message: 'Almacén de imágenes deshabilitado', type: 'FASTAPI_ERROR' });
+
+    await imagesController.upload(mockReq(files), res);
+    expect(res.status).toHaveBeenCalledWith(503);
+  });
+});
@@ -16,7 +16,8 @@ jest.unstable_mockModule('../../../src/controllers/generate.controller.js', () =
   return {
     generateController: {
       generate: jest.fn((req, res) => res.status(200).json({ result: 'code' })),
-      generateStream: jest.fn((req, res) => res.status(200).json({ status: 'streaming' }))
+      generateStream: jest.fn((req, res) => res.status(200).json({ status: 'streaming' })),
+      resumeStream: jest.fn((req, res) => res.status(200).json({ status: 'resumed' }))
     }
   };
 });
@@ -48,4 +49,10 @@ describe('Generate Routes', () => {
     expect(generateController.generateStream).toHaveBeenCalledTimes(1);
     expect(res.status).toBe(200);
   });
+
+  it('GET /api/generate/stream/resume', async () => {
+    const res = await request(app).get('/api/generate/stream/resume').set('Last-Event-ID', 's:4');
+    expect(generateController.resumeStream).toHaveBeenCalledTimes(1);
+    expect(res.status).toBe(200);
+  });
 });
@@ -0,0 +1,44 @@
+import { jest } from '@jest/globals';
+import express from 'express';
+import request from 'supertest';
+
+// Mocks
+jest.unstable_mockModule('multer', () => {
+  const dummyMiddleware = jest.fn((req, res, next) => next());
+  const multerMock = jest.fn(() => ({
+    array: jest.fn(() => dummyMiddleware)
+  }));
+  multerMock.memoryStorage = jest.fn();
+  return { default: multerMock };
+});
+
+jest.unstable_mockModule('../../../src/controllers/images.controller.js', () => {
+  return {
+    imagesController: {
+      upload: jest.fn((req, res) => res.status(201).json({ images: [] }))
+    }
+  };
+});
+
+const imagesRoutes = (await import('../../../src/routes/images.routes.js')).default;
+const { imagesController } = await import('../../../src/controllers/images.controller.js');
+
+describe('Images Routes', () => {
+  let app;
+
+  beforeAll(() => {
+    app = express();
+    app.use(express.json());
+    app.use('/api/images', imagesRoutes);
+  });
+
+  afterEach(() => {
+    jest.clearAllMocks();
+  });
+
+  it('POST /api/images', async () => {
+    const res = await request(app).post('/api/images').send({});
+    expect(imagesController.upload).toHaveBeenCalledTimes(1);
+    expect(res.status).toBe(201);
+  });
+});
@@ -18,6 +18,9 @@ jest.unstable_mockModule('../../../src/routes/models.routes.js', () => ({
 jest.unstable_mockModule('../../../src/routes/generate.routes.js', () => ({
   default: express.Router().get('/', (req, res) => res.status(200).send('generate'))
 }));
+jest.unstable_mockModule('../../../src/routes/images.routes.js', () => ({
+  default: express.Router().get('/', (req, res) => res.status(200).send('images'))
+}));
 jest.unstable_mockModule('../../../src/routes/chats.routes.js', () => ({
   default: express.Router().get('/', (req, res) => res.status(200).send('chats'))
 }));
@@ -75,6 +78,12 @@ describe('Index Routes', () => {
     expect(res.status).toBe(200);
   });
 
+  it('debería montar la ruta de images', async () => {
+    const res = await request(app).get('/api/images');
+    expect(res.text).toBe('images');
+    expect(res.status).toBe(200);
+  });
+
   it('debería montar la ruta de chats', async () => {
     const res = await request(app).get('/api/chats');
     expect(res.text).toBe('chats');
@@ -1,4 +1,5 @@
 import { jest } from '@jest/globals';
+import { Readable } from 'node:stream';
 
 jest.unstable_mockModule('axios', () => {
   return {
@@ -96,7 +97,21 @@ describe('OllamaService', () => {
 
       const res = await ollamaService.generateCodeStream('model', 'prompt');
       expect(axios.post).toHaveBeenCalledWith(expect.stringContaining('/generate/stream'), expect.any(Object), expect.objectContaining({ responseType: 'stream' }));
-      expect(res).toEqual(mockStream);
+      expect(mockStream.on).toHaveBeenCalledWith('data', expect.any(Function));
+    });
+
+    it('debería enviar image_ids y devolver las cabeceras para el cliente', async () => {
+      const mockStream = { on: jest.fn() };
+      axios.post.mockResolvedValue({
+        data: mockStream,
+        headers: { 'x-image-ids': 'abc,def', 'x-stream-session': 'f00d', 'content-type': 'text/event-stream' },
+      });
+
+      const res = await ollamaService.generateCodeStream('model', 'prompt', [], [], false, null, null, ['abc']);
+
+      const formData = axios.post.mock.calls[0][1];
+      expect(formData.data.get('image_ids').value).toBe('["abc"]');
+      expect(res.headers).toEqual({ 'X-Image-Ids': 'abc,def', 'X-Stream-Session': 'f00d' });
     });
 
     it('debería soportar historial e imágenes y autoMode', async () => {
@@ -107,7 +122,92 @@ describe('OllamaService', () => {
       const res = await ollamaService.generateCodeStream('model', 'prompt', images, [{ role: 'user', content: 'hi' }], true);
       
       expect(axios.post).toHaveBeenCalled();
-      expect(res).toEqual(mockStream);
+      expect(mockStream.on).toHaveBeenCalledWith('data', expect.any(Function));
+    });
+  });
+
+  describe('reconexión del stream', () => {
+    const collect = (stream) => new Promise((resolve, reject) => {
+      let out = '';
+      stream.on('data', (chunk) => { out += chunk; });
+      stream.on('end', () => resolve(out));
+      stream.on('error', reject);
+    });
+
+    beforeEach(() => {
+      ollamaService.resumeDelay = 0;
+    });
+
+    it('debería reanudar desde el último id si el stream se corta antes de [DONE]', async () => {
+      axios.post.mockResolvedValue({
+        data: Readable.from(['id: s:1\ndata: "a"\n\nid: s:2\ndata: "b"\n\nid: s:3\nda']),
+        headers: {},
+      });
+      axios.get.mockResolvedValue({ data: Readable.from(['id: s:3\ndata: "c"\n\nid: s:4\ndata: [DONE]\n\n']) });
+
+      const { stream } = await ollamaService.generateCodeStream('model', 'prompt');
+      const out = await collect(stream);
+
+      expect(axios.get).toHaveBeenCalledWith(
+        expect.stringContaining('/generate/stream/resume'),
+        expect.objectContaining({ headers: expect.objectContaining({ 'Last-Event-ID': 's:2' }) })
+      );
+      // El frame incompleto no se reenvía: llega entero con la reanudación
+      expect(out).toBe('id: s:1\ndata: "a"\n\nid: s:2\ndata: "b"\n\nid: s:3\ndata: "c"\n\nid: s:4\ndata: [DONE]\n\n');
+    });
+
+    it('no debería reconectar si el stream ya terminó', async () => {
+      axios.post.mockResolvedValue({ data: Readable.from(['id: s:1\ndata: [DONE]\n\n']), headers: {} });
+
+      const { stream } = await ollamaService.generateCodeStream('model', 'prompt');
+      await collect(stream);
+
+      expect(axios.get).not.toHaveBeenCalled();
+    });
+
+    it('debería fallar tras agotar los intentos', async () => {
+      axios.post.mockResolvedValue({ data: Readable.from(['id: s:1\ndata: "a"\n\n']), headers: {} });
+      const error = new Error('Not Found');
+      error.response = { status: 404, data: { detail: 'Sesión de stream no encontrada o caducada' } };
+      axios.get.mockRejectedValue(error);
+
+      const { stream } = await ollamaService.generateCodeStream('model', 'prompt');
+
+      await expect(collect(stream)).rejects.toThrow('Stream interrumpido');
+      expect(axios.get).toHaveBeenCalledTimes(ollamaService.resumeAttempts);
+    });
+
+    it('debería reanudar a petición del cliente', async () => {
+      axios.get.mockResolvedValue({
+        data: Readable.from(['id: s:5\ndata: [DONE]\n\n']),
+        headers: { 'x-stream-session': 's' },
+      });
+
+      const { stream, headers } = await ollamaService.resumeStream('s:4');
+
+      expect(await collect(stream)).toBe('id: s:5\ndata: [DONE]\n\n');
+      expect(headers).toEqual({ 'X-Stream-Session': 's' });
+    });
+  });
+
+  describe('uploadImages', () => {
+    it('debería subir las imágenes al almacén de FastAPI', async () => {
+      const mockData = { images: [{ id: 'abc', bytes: 4 }] };
+      axios.post.mockResolvedValue({ data: mockData });
+
+      const images = [{ buffer: Buffer.from('test'), mimetype: 'image/png' }];
+      const res = await ollamaService.uploadImages(images);
+
+      expect(axios.post).toHaveBeenCalledWith(expect.stringContaining('/images/'), expect.any(Object), expect.any(Object));
+      expect(res).toEqual(mockData);
+    });
+
+    it('debería manejar errores de respuesta HTTP', async () => {
+      const error = new Error('HTTP Error');
+      error.response = { status: 503, data: { detail: 'Almacén de imágenes deshabilitado' } };
+      axios.post.mockRejectedValue(error);
+
+      await expect(ollamaService.uploadImages([])).rejects.toEqual(expect.objectContaining({ status: 503 }));
     });
   });
 
@@ -0,0 +1,16 @@
+import { traceHeaders } from '../../../src/utils/trace.js';
+
+describe('Trace Utility', () => {
+  const traceparent = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01';
+
+  it('should forward a valid traceparent and tracestate', () => {
+    const headers = traceHeaders({ headers: { traceparent, tracestate: 'vendor=1' } });
+    expect(headers).toEqual({ traceparent, tracestate: 'vendor=1' });
+  });
+
+  it('should send nothing when the header is missing or invalid', () => {
+    for (const received of [{}, { traceparent: 'garbage' }, { tracestate: 'vendor=1' }]) {
+      expect(traceHeaders({ headers: received })).toEqual({});
+    }
+  });
+});
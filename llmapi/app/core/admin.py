@@ -0,0 +1,34 @@
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.core.config import ADMIN_TOKEN
+
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """
+    Comprueba un token de administración en tiempo constante.
+    
+    Args:
+        token: Valor recibido en la petición
+        
+    Returns:
+        True si la administración está habilitada y el token coincide
+    """
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER)) -> None:
+    """
+    Dependencia de FastAPI para los endpoints de administración.
+    
+    Raises:
+        HTTPException: 404 si la administración está deshabilitada, 403 si el token no es válido
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token de administración no válido")
@@ -0,0 +1,402 @@
+"""
+Cachés de servicio con backend intercambiable.
+
+Todas las cachés del servicio se crean con create_cache(nombre) y comparten la
+misma interfaz (get/set/delete/clear) con TTL, límite de bytes y métricas de
+aciertos y fallos. El backend se elige con CACHE_BACKEND:
+
+- "memory": LRU en el propio proceso (por defecto; cada worker tiene la suya).
+- "sqlite": fichero local compartido por todos los workers de la máquina.
+- "redis": servidor Redis o compatible, compartido entre máquinas. Requiere
+  el paquete `redis`, que se importa solo al usar este backend.
+
+Los valores se guardan serializados en JSON para que sirvan entre procesos;
+el tamaño en bytes que cuenta para el límite es el de esa serialización.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import (
+    CACHE_BACKEND,
+    CACHE_MAX_BYTES,
+    CACHE_REDIS_URL,
+    CACHE_SQLITE_PATH,
+)
+from app.core.logger import logger
+from app.core.metrics import CACHE_REQUESTS_TOTAL, REGISTRY, Counter, Gauge
+
+CACHE_EVICTIONS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_cache_evictions_total", "Entradas expulsadas por límite de bytes", ("cache",)
+))
+CACHE_BYTES = REGISTRY.register(Gauge(
+    "llmapi_cache_bytes", "Bytes ocupados por las cachés en proceso", ("cache",)
+))
+
+# Cachés creadas, para el resumen de /admin/memory
+CACHES: Dict[str, "Cache"] = {}
+
+
+class Cache:
+    """
+    Interfaz común de las cachés.
+
+    Las subclases implementan el almacenamiento de bytes (_load, _store,
+    _remove, _clear, stats); esta clase se encarga de la serialización, los
+    TTL por defecto y las métricas. Un fallo del backend se registra y se
+    trata como un fallo de caché: nunca rompe la petición.
+    """
+
+    backend = "base"
+
+    def __init__(self, name: str, ttl: Optional[float] = None, max_bytes: int = CACHE_MAX_BYTES):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            data = self._load(key)
+            if data is None:
+                CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="miss")
+                return default
+            # Una entrada corrupta o ajena en un almacén compartido se trata como un fallo
+            value = json.loads(data)
+        except Exception as e:
+            logger.warning("Caché %s (%s) no disponible al leer: %s", self.name, self.backend, e)
+            CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="error")
+            return default
+        CACHE_REQUESTS_TOTAL.inc(cache=self.name, result="hit")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Guarda un valor serializable en JSON.
+
+        Args:
+            key: Clave
+            value: Valor
+            ttl: Segundos de validez; por defecto, el TTL de la caché (None = sin caducidad)
+        """
+        data = json.dumps(value, separators=(",", ":")).encode()
+        if self.max_bytes and len(data) > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            self._store(key, data, expires_at)
+        except Exception as e:
+            logger.warning("Caché %s (%s) no disponible al escribir: %s", self.name, self.backend, e)
+
+    def delete(self, key: str) -> None:
+        try:
+            self._remove(key)
+        except Exception as e:
+            logger.warning("Caché %s (%s) no disponible al borrar: %s", self.name, self.backend, e)
+
+    def clear(self) -> None:
+        self._clear()
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            return self._load(key) is not None
+        except Exception:
+            return False
+
+    # ── Backend ──────────────────────────────────────────────────────────────
+
+    def _load(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _store(self, key: str, data: bytes, expires_at: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _remove(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """LRU en memoria del proceso."""
+
+    backend = "memory"
+
+    def __init__(self, name: str, ttl: Optional[float] = None, max_bytes: int = CACHE_MAX_BYTES):
+        super().__init__(name, ttl, max_bytes)
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _store(self, key: str, data: bytes, expires_at: Optional[float]) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (data, expires_at)
+            self._bytes += len(data)
+            while self.max_bytes and self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                CACHE_EVICTIONS_TOTAL.inc(cache=self.name)
+            CACHE_BYTES.set(self._bytes, cache=self.name)
+
+    def _drop(self, key: str) -> None:
+        data, _ = self._entries.pop(key)
+        self._bytes -= len(data)
+        CACHE_BYTES.set(self._bytes, cache=self.name)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            CACHE_BYTES.set(0, cache=self.name)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "entries": len(self._entries), "bytes": self._bytes}
+
+
+class SQLiteCache(Cache):
+    """
+    Caché en un fichero SQLite local, compartida por los procesos de la máquina.
+
+    Cada caché ocupa su propio espacio de nombres dentro de la misma tabla.
+    El orden LRU se mantiene con la hora del último acceso.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float] = None,
+        max_bytes: int = CACHE_MAX_BYTES,
+        path: str = CACHE_SQLITE_PATH
+    ):
+        super().__init__(name, ttl, max_bytes)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.name, key)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        with conn:
+            if expires_at is not None and expires_at <= now:
+                conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.name, key))
+                return None
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.name, key)
+            )
+        return bytes(value)
+
+    def _store(self, key: str, data: bytes, expires_at: Optional[float]) -> None:
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, key, data, len(data), expires_at, now)
+            )
+            if self.max_bytes:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.name, now)
+        )
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (self.name,)
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at", (self.name,)
+        ):
+            if total <= self.max_bytes:
+                break
+            victims.append((self.name, key))
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", victims)
+        CACHE_EVICTIONS_TOTAL.inc(len(victims), cache=self.name)
+
+    def _remove(self, key: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.name, key))
+
+    def _clear(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.name,))
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.name,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (self.name,)
+        ).fetchone()
+        return {"backend": self.backend, "path": self.path, "entries": entries, "bytes": size}
+
+
+class RedisCache(Cache):
+    """
+    Caché en Redis (o un servidor compatible como Valkey o KeyDB).
+
+    Las claves llevan el prefijo "llmapi:<nombre>:" y el TTL lo aplica Redis.
+    El límite total de bytes lo gestiona el propio servidor (maxmemory con una
+    política allkeys-lru); aquí solo se descartan las entradas que por sí
+    solas superan max_bytes.
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        name: str,
+        ttl: Optional[float] = None,
+        max_bytes: int = CACHE_MAX_BYTES,
+        url: str = CACHE_REDIS_URL,
+        client: Any = None
+    ):
+        super().__init__(name, ttl, max_bytes)
+        self.url = url
+        self.prefix = f"llmapi:{name}:"
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("CACHE_BACKEND=redis requiere el paquete 'redis' (pip install redis)") from e
+            client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._client = client
+
+    def _load(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.prefix + key)
+
+    def _store(self, key: str, data: bytes, expires_at: Optional[float]) -> None:
+        ttl_ms = max(int((expires_at - time.time()) * 1000), 1) if expires_at else None
+        self._client.set(self.prefix + key, data, px=ttl_ms)
+
+    def _remove(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def _clear(self) -> None:
+        keys = list(self._client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            entries = sum(1 for _ in self._client.scan_iter(match=self.prefix + "*"))
+        except Exception:
+            entries = None
+        return {"backend": self.backend, "url": self.url, "entries": entries}
+
+
+_BACKENDS = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "redis": RedisCache,
+}
+
+
+def create_cache(
+    name: str,
+    ttl: Optional[float] = None,
+    max_bytes: int = CACHE_MAX_BYTES,
+    backend: str = CACHE_BACKEND
+) -> Cache:
+    """
+    Crea (o devuelve la ya creada) caché de servicio con el backend configurado.
+
+    Si el backend configurado no se puede inicializar se usa uno en memoria
+    para que el servicio arranque igualmente.
+
+    Args:
+        name: Nombre de la caché (espacio de nombres y etiqueta de las métricas)
+        ttl: Segundos de validez por defecto (None = sin caducidad)
+        max_bytes: Límite de bytes de la caché (0 = sin límite)
+        backend: "memory", "sqlite" o "redis"
+
+    Raises:
+        ValueError: Si el backend no existe
+    """
+    if name in CACHES:
+        return CACHES[name]
+    if backend not in _BACKENDS:
+        raise ValueError(f"Backend de caché desconocido: {backend}")
+    try:
+        cache = _BACKENDS[backend](name, ttl=ttl, max_bytes=max_bytes)
+    except Exception as e:
+        logger.error("No se pudo crear la caché %s con backend %s: %s; se usa memoria", name, backend, e)
+        cache = MemoryCache(name, ttl=ttl, max_bytes=max_bytes)
+    CACHES[name] = cache
+    return cache
+
+
+def caches_summary() -> Dict[str, Dict[str, Any]]:
+    """Estado de todas las cachés creadas."""
+    summary = {}
+    for name, cache in CACHES.items():
+        try:
+            summary[name] = cache.stats()
+        except Exception as e:
+            summary[name] = {"backend": cache.backend, "error": str(e)}
+    return summary
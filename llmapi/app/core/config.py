@@ -4,7 +4,10 @@ import os
 load_dotenv()
 
 # Configuración de Ollama
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# unix:///ruta/ollama.sock conecta por socket Unix; las URLs usan entonces http://localhost
+_OLLAMA_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_SOCKET = _OLLAMA_URL[len("unix://"):] if _OLLAMA_URL.startswith("unix://") else ""
+OLLAMA_BASE_URL = "http://localhost" if OLLAMA_SOCKET else _OLLAMA_URL
 OLLAMA_CHAT_URL = f"{OLLAMA_BASE_URL}/api/chat"
 OLLAMA_TAGS_URL = f"{OLLAMA_BASE_URL}/api/tags"
 OLLAMA_SHOW_URL = f"{OLLAMA_BASE_URL}/api/show"
@@ -13,11 +16,182 @@ OLLAMA_GENERATE_URL = f"{OLLAMA_BASE_URL}/api/generate"
 # Timeout en segundos
 OLLAMA_TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", 600))  # 10 minutes por defecto
 OLLAMA_TAGS_TIMEOUT = int(os.getenv("OLLAMA_TAGS_TIMEOUT", 30))  # Para listar modelos
+# Conexiones a Ollama que se mantienen abiertas para reutilizarlas
+OLLAMA_POOL_MAXSIZE = int(os.getenv("OLLAMA_POOL_MAXSIZE", 32))
 
 # Configuración del servidor
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8001))
+# Socket Unix en el que escucha el servidor de producción (vacío = HOST:PORT)
+UDS = os.getenv("UDS", "")
 
 # CConfiguración de CORS
 ALLOWED_ORIGINS_STR = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173")
 ALLOWED_ORIGINS = [origin.strip() for origin in ALLOWED_ORIGINS_STR.split(",")]
+
+# Administración (endpoints /admin y funciones de diagnóstico). Vacío = deshabilitado
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Perfilado bajo demanda (cabecera X-Profile o ?profile=1 con token de administración)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
+# Monitor de lag del event loop
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100))
+# En modo debug se registra la pila del event loop si se bloquea más de este umbral
+LOOP_MONITOR_DEBUG = os.getenv("LOOP_MONITOR_DEBUG", "false").lower() == "true"
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", 250))
+
+# Precalentamiento al arrancar (catálogo, capacidades de visión y modelos)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+# Modelos a precargar separados por comas; "auto" añade los seleccionados para el modo auto
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+WARMUP_KEEP_ALIVE = os.getenv("WARMUP_KEEP_ALIVE", "30m")
+# Generación mínima por modelo para dejar listo el runner
+WARMUP_GENERATE = os.getenv("WARMUP_GENERATE", "true").lower() == "true"
+# Petición típica con la que se dimensiona num_ctx al precalentar (tokens de texto e imágenes en el
+# paso de visión), para cargar el runner con las mismas opciones que usará la primera petición real
+WARMUP_PROMPT_TOKENS = int(os.getenv("WARMUP_PROMPT_TOKENS", 1024))
+WARMUP_IMAGES = int(os.getenv("WARMUP_IMAGES", 1))
+# Pasado este plazo (segundos) el servicio se declara listo aunque no haya terminado
+WARMUP_DEADLINE = float(os.getenv("WARMUP_DEADLINE", 300))
+
+# Servidor de producción (python -m app.server)
+# Workers: 0 = automático según las CPUs disponibles, limitado por WORKERS_MAX
+WORKERS = int(os.getenv("WORKERS", 0))
+WORKERS_MAX = int(os.getenv("WORKERS_MAX", 8))
+# Debe superar el keep-alive del gateway para que no sea FastAPI quien cierre primero
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 65))
+BACKLOG = int(os.getenv("BACKLOG", 2048))
+# Segundos que se esperan a los streams SSE en curso al apagar
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 120))
+# Reciclado de workers: tras N peticiones o al superar M MB de RSS (0 = desactivado)
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", 0))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", 0))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", 0))
+WORKER_RSS_CHECK_INTERVAL = float(os.getenv("WORKER_RSS_CHECK_INTERVAL", 10))
+
+# Cachés de servicio: "memory" (por worker), "sqlite" (compartida en la máquina) o "redis"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache/llmapi-cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Límite de bytes por caché (0 = sin límite)
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Validez (segundos) de las capacidades de visión consultadas a Ollama
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", 86400))
+
+# Planificador: peticiones simultáneas enviadas a Ollama por modelo. El resto
+# espera en cola (FIFO). SCHEDULER_MODEL_SLOTS ajusta modelos concretos: "modelo=n,modelo=n"
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", 4))
+SCHEDULER_MODEL_SLOTS = {
+    name.strip(): int(slots)
+    for name, _, slots in (
+        item.rpartition("=") for item in os.getenv("SCHEDULER_MODEL_SLOTS", "").split(",") if "=" in item
+    )
+}
+
+# Lotes (/generate/batch)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 500))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 16))
+# Hilos propios para los elementos de lotes y los trabajos: esperan ranura del planificador
+# fuera del threadpool de las peticiones, que así no se agota con lotes grandes
+BACKGROUND_GENERATION_THREADS = int(os.getenv("BACKGROUND_GENERATION_THREADS", 16))
+
+# Trabajos asíncronos (/jobs): almacén SQLite y ejecución en segundo plano
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "false").lower() == "true"
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+# Trabajos ejecutándose a la vez en cada worker
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", 2))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", 0.5))
+# Cada cuántos segundos se guarda la salida parcial
+JOBS_FLUSH_INTERVAL = float(os.getenv("JOBS_FLUSH_INTERVAL", 1.0))
+# Intentos antes de marcar como fallido un trabajo interrumpido por reinicios
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 3))
+# Segundos sin renovar la concesión tras los que un trabajo en ejecución vuelve a la cola
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", 30))
+
+# Streams SSE reanudables con Last-Event-ID
+# Segundos que la generación sigue sin clientes conectados (0 = se detiene al desconectar)
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", 60))
+SSE_BUFFER_MEMORY_BYTES = int(os.getenv("SSE_BUFFER_MEMORY_BYTES", 256 * 1024))
+SSE_BUFFER_DISK_BYTES = int(os.getenv("SSE_BUFFER_DISK_BYTES", 16 * 1024 * 1024))
+# Directorio de los ficheros de desbordamiento (vacío = directorio temporal del sistema)
+SSE_BUFFER_DIR = os.getenv("SSE_BUFFER_DIR", "")
+SSE_KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", 15))
+# Sesiones de streaming a la vez por worker (en curso o esperando reanudación)
+SSE_MAX_SESSIONS = int(os.getenv("SSE_MAX_SESSIONS", 256))
+# Segundos que el apagado espera, después de GRACEFUL_TIMEOUT, a los streams sin cliente que siguen generando
+SSE_DRAIN_TIMEOUT = float(os.getenv("SSE_DRAIN_TIMEOUT", 10))
+
+# Paso 2 del modo auto: enviar al modelo de código el PlantUML en forma canónica mínima
+PLANTUML_COMPACT = os.getenv("PLANTUML_COMPACT", "true").lower() == "true"
+
+# Paso de visión: cortar la generación en cuanto cada imagen tiene su bloque PlantUML o "No diagram"
+VISION_EARLY_STOP = os.getenv("VISION_EARLY_STOP", "true").lower() == "true"
+# Límite de tokens generados por imagen (num_predict = límite x imágenes; 0 = sin límite)
+VISION_MAX_TOKENS_PER_IMAGE = int(os.getenv("VISION_MAX_TOKENS_PER_IMAGE", 2048))
+
+# Opciones de Ollama por modelo: JSON {patrón: {opción: valor}} (patrones tipo fnmatch)
+MODEL_PROFILES = os.getenv("MODEL_PROFILES", "")
+# num_ctx automático (prompt estimado + salida esperada) cuando ni el perfil ni la petición lo fijan
+NUM_CTX_AUTO = os.getenv("NUM_CTX_AUTO", "true").lower() == "true"
+# Tamaños permitidos: pocos valores para que Ollama reutilice el mismo runner
+NUM_CTX_BUCKETS = sorted(int(b) for b in os.getenv("NUM_CTX_BUCKETS", "4096,8192,16384,32768").split(",") if b.strip())
+# Salida esperada cuando no hay num_predict, y coste estimado de cada imagen en tokens
+NUM_CTX_OUTPUT_TOKENS = int(os.getenv("NUM_CTX_OUTPUT_TOKENS", 2048))
+NUM_CTX_IMAGE_TOKENS = int(os.getenv("NUM_CTX_IMAGE_TOKENS", 768))
+
+# Almacén de imágenes por contenido (SHA-256): el historial referencia imágenes por id
+IMAGE_STORE_ENABLED = os.getenv("IMAGE_STORE_ENABLED", "true").lower() == "true"
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "data/images")
+# Al superar este tamaño se borran las imágenes menos usadas (0 = sin límite)
+IMAGE_STORE_MAX_BYTES = int(os.getenv("IMAGE_STORE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Rendimiento medido por modelo (estadísticas de Ollama): muestras recientes y mínimo para usarlas
+MODEL_STATS_WINDOW = int(os.getenv("MODEL_STATS_WINDOW", 50))
+MODEL_STATS_MIN_SAMPLES = int(os.getenv("MODEL_STATS_MIN_SAMPLES", 3))
+# Respuestas con menos tokens generados no cuentan como muestra (p. ej. la generación de 1 token del warmup)
+MODEL_STATS_MIN_EVAL_COUNT = int(os.getenv("MODEL_STATS_MIN_EVAL_COUNT", 32))
+# Política de /models/auto-select y del modo auto: largest, fastest, largest_under_slo o quality_throughput
+MODEL_SELECTION_POLICY = os.getenv("MODEL_SELECTION_POLICY", "largest")
+# Petición de referencia y SLO de largest_under_slo
+MODEL_SELECTION_SLO_SECONDS = float(os.getenv("MODEL_SELECTION_SLO_SECONDS", 60))
+MODEL_SELECTION_PROMPT_TOKENS = int(os.getenv("MODEL_SELECTION_PROMPT_TOKENS", 1500))
+MODEL_SELECTION_OUTPUT_TOKENS = int(os.getenv("MODEL_SELECTION_OUTPUT_TOKENS", 1024))
+
+# Enrutado por cola en el paso 2 del modo auto: si el modelo de código elegido no termina a tiempo
+# (cola + velocidad medida) para el latency_target del cliente, usar uno más pequeño que sí llegue
+QUEUE_ROUTING_ENABLED = os.getenv("QUEUE_ROUTING_ENABLED", "false").lower() == "true"
+# Solo modelos de la misma familia (el nombre antes de ":"), p. ej. qwen2.5-coder:14b -> qwen2.5-coder:7b
+QUEUE_ROUTING_SAME_FAMILY = os.getenv("QUEUE_ROUTING_SAME_FAMILY", "true").lower() == "true"
+# Segundos que se reutiliza la lista de modelos de código candidatos (evita consultar /api/tags por petición)
+QUEUE_ROUTING_CANDIDATES_TTL = float(os.getenv("QUEUE_ROUTING_CANDIDATES_TTL", 60))
+
+# Captura anonimizada del tráfico de /generate (formas y tiempos, sin texto ni imágenes) para loadtest/replay.py
+TRAFFIC_CAPTURE_ENABLED = os.getenv("TRAFFIC_CAPTURE_ENABLED", "false").lower() == "true"
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH", "data/traffic.jsonl")
+# Fracción de peticiones capturadas y registros pendientes de escribir antes de descartar
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", 1.0))
+TRAFFIC_CAPTURE_QUEUE = int(os.getenv("TRAFFIC_CAPTURE_QUEUE", 1000))
+# Clave de los hashes de prompts e imágenes (vacía = aleatoria, compartida por los workers en TRAFFIC_CAPTURE_PATH.salt)
+TRAFFIC_CAPTURE_SALT = os.getenv("TRAFFIC_CAPTURE_SALT", "")
+
+# Logging: nivel, formato (text o json, una línea por registro) y registros pendientes antes de descartar
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Mensajes repetitivos del camino caliente (líneas de Ollama no válidas, errores en streams): uno por periodo
+LOG_RATE_LIMIT_SECONDS = float(os.getenv("LOG_RATE_LIMIT_SECONDS", 10))
+
+# Trazas W3C (traceparent) de /generate exportadas en OTLP/JSON: "file" (TRACING_FILE) u "otlp" (TRACING_OTLP_ENDPOINT)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "data/traces.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "llmapi")
+# Fracción de peticiones sin traceparent que se trazan (con traceparent manda su flag de muestreo)
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+# Trazas pendientes de exportar antes de descartar, y trazas por envío
+TRACING_QUEUE = int(os.getenv("TRACING_QUEUE", 1000))
+TRACING_BATCH_SIZE = int(os.getenv("TRACING_BATCH_SIZE", 64))
@@ -0,0 +1,153 @@
+"""
+Registro de las generaciones en curso y cancelación desde administración.
+
+Cada RequestTelemetry crea una Generation al empezar y la retira al terminar,
+de modo que el registro refleja todo lo que está usando Ollama en este worker
+(streams, /generate, lotes y trabajos): modelo, ruta, cliente, paso del modo
+automático, tokens recibidos y tokens/s.
+
+Cancelar una generación marca la bandera y cierra la respuesta de Ollama que
+se está leyendo; el hilo lector lanza GenerationCancelled en cuanto vuelve a
+leer, y al cerrarse la conexión Ollama deja de generar.
+"""
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.logger import logger
+from app.core.metrics import REGISTRY, Counter
+
+GENERATIONS_CANCELLED_TOTAL = REGISTRY.register(Counter(
+    "llmapi_generations_cancelled_total", "Generaciones canceladas desde administración", ("route",)
+))
+
+_ids = itertools.count(1)
+_active: Dict[int, "Generation"] = {}
+_active_lock = threading.Lock()
+
+
+class GenerationCancelled(Exception):
+    """La generación se ha cancelado desde administración."""
+
+
+class Generation:
+    """Estado visible de una generación en curso."""
+
+    def __init__(self, route: str, model: str = "", client: Optional[str] = None):
+        self.id = next(_ids)
+        self.route = route
+        self.model = model
+        self.client = client
+        self.started = time.time()
+        self.step: Optional[str] = None
+        self.tokens = 0
+        self.cancelled = False
+        self._first_token_at: Optional[float] = None
+        self._last_token_at: Optional[float] = None
+        self._upstream = None
+        self._lock = threading.Lock()
+        with _active_lock:
+            _active[self.id] = self
+
+    def begin_step(self, step: str, model: str) -> None:
+        self.step = step
+        self.model = model
+
+    def token(self) -> None:
+        """Cuenta un fragmento recibido de Ollama (un token por chunk en /api/chat)."""
+        now = time.perf_counter()
+        if self._first_token_at is None:
+            self._first_token_at = now
+        self._last_token_at = now
+        self.tokens += 1
+
+    def tokens_per_second(self) -> Optional[float]:
+        if self._first_token_at is None or self.tokens < 2:
+            return None
+        elapsed = self._last_token_at - self._first_token_at
+        return round((self.tokens - 1) / elapsed, 2) if elapsed > 0 else None
+
+    def attach(self, resp) -> None:
+        """
+        Registra la respuesta de Ollama que se está leyendo.
+
+        Raises:
+            GenerationCancelled: Si ya se había cancelado (se cierra al momento)
+        """
+        with self._lock:
+            self._upstream = resp
+            cancelled = self.cancelled
+        if cancelled:
+            resp.close()
+            raise GenerationCancelled("Generación cancelada")
+
+    def detach(self) -> None:
+        with self._lock:
+            self._upstream = None
+
+    def check(self) -> None:
+        """
+        Raises:
+            GenerationCancelled: Si la generación se ha cancelado
+        """
+        if self.cancelled:
+            raise GenerationCancelled("Generación cancelada")
+
+    def cancel(self) -> None:
+        """Marca la generación como cancelada y cierra la conexión con Ollama."""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            resp = self._upstream
+        GENERATIONS_CANCELLED_TOTAL.inc(route=self.route)
+        logger.warning("Generación %s cancelada (%s, modelo: %s)", self.id, self.route, self.model)
+        if resp is not None:
+            try:
+                resp.close()
+            except Exception as e:
+                logger.debug("Error cerrando la respuesta de Ollama: %s", e)
+
+    def close(self) -> None:
+        """Retira la generación del registro (idempotente)."""
+        self.detach()
+        with _active_lock:
+            _active.pop(self.id, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "model": self.model,
+            "client": self.client,
+            "step": self.step,
+            "started": self.started,
+            "age_s": round(time.time() - self.started, 2),
+            "tokens": self.tokens,
+            "tokens_per_second": self.tokens_per_second(),
+            "cancelled": self.cancelled,
+        }
+
+
+def active_generations() -> List[Dict[str, Any]]:
+    """Devuelve las generaciones en curso, de la más antigua a la más reciente."""
+    with _active_lock:
+        entries = list(_active.values())
+    return [entry.to_dict() for entry in entries]
+
+
+def cancel_generation(generation_id: int) -> Dict[str, Any]:
+    """
+    Cancela una generación en curso.
+
+    Returns:
+        Estado de la generación tras marcarla como cancelada
+
+    Raises:
+        KeyError: Si no hay ninguna generación en curso con ese id
+    """
+    with _active_lock:
+        generation = _active[generation_id]
+    generation.cancel()
+    return generation.to_dict()
@@ -0,0 +1,251 @@
+"""
+Almacén de imágenes direccionado por contenido.
+
+Cada imagen se guarda una sola vez en disco con su SHA-256 como identificador
+(<IMAGE_STORE_DIR>/<2 primeros caracteres>/<sha256>). Subir la misma imagen
+otra vez devuelve el mismo id sin volver a escribirla, y el historial de un
+chat puede referenciar imágenes por id en lugar de reenviar su base64 en
+cada turno.
+
+El orden LRU es la fecha de modificación del fichero, que se actualiza en
+cada lectura; así lo comparten todos los workers de la máquina. Cuando el
+total supera IMAGE_STORE_MAX_BYTES se borran las menos usadas hasta quedar
+por debajo del 90 % del límite.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import IMAGE_STORE_DIR, IMAGE_STORE_MAX_BYTES
+from app.core.logger import logger
+from app.core.metrics import REGISTRY, Counter, Gauge
+
+IMAGE_STORE_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_image_store_requests_total",
+    "Operaciones del almacén de imágenes por resultado (stored, dedup, hit, miss)", ("result",)
+))
+IMAGE_STORE_EVICTIONS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_image_store_evictions_total", "Imágenes borradas del almacén por límite de bytes"
+))
+IMAGE_STORE_BYTES = REGISTRY.register(Gauge(
+    "llmapi_image_store_bytes", "Bytes ocupados por el almacén de imágenes (vistos por este worker)"
+))
+
+_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+_LOW_WATERMARK = 0.9
+
+
+def is_image_id(value: Any) -> bool:
+    """Si el valor tiene forma de id del almacén (SHA-256 en hexadecimal)."""
+    return isinstance(value, str) and bool(_ID_RE.match(value))
+
+
+class ImageStore:
+    """Imágenes en disco deduplicadas por SHA-256 con expulsión LRU."""
+
+    def __init__(self, directory: str = IMAGE_STORE_DIR, max_bytes: int = IMAGE_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total: Optional[int] = None
+
+    def _path(self, image_id: str) -> str:
+        return os.path.join(self.directory, image_id[:2], image_id)
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """(mtime, tamaño, ruta) de todas las imágenes guardadas."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for prefix in os.listdir(self.directory):
+            folder = os.path.join(self.directory, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if not _ID_RE.match(name):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(folder, name)))
+        return entries
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._scan())
+                IMAGE_STORE_BYTES.set(self._total)
+            return self._total
+
+    def put(self, data: bytes) -> str:
+        """
+        Guarda una imagen (si no estaba ya) y devuelve su id.
+
+        Returns:
+            SHA-256 del contenido en hexadecimal
+        """
+        image_id = hashlib.sha256(data).hexdigest()
+        path = self._path(image_id)
+        if os.path.exists(path):
+            try:
+                os.utime(path)
+                IMAGE_STORE_REQUESTS_TOTAL.inc(result="dedup")
+                return image_id
+            except FileNotFoundError:
+                # Otro worker la ha expulsado entre medias: se vuelve a escribir
+                pass
+        # El total se inicializa (recorriendo el disco) antes de escribir la nueva
+        self.total_bytes()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: otro worker puede estar guardando la misma imagen
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        IMAGE_STORE_REQUESTS_TOTAL.inc(result="stored")
+        with self._lock:
+            self._total += len(data)
+            IMAGE_STORE_BYTES.set(self._total)
+            over_limit = self.max_bytes > 0 and self._total > self.max_bytes
+        if over_limit:
+            self.evict(keep=image_id)
+        return image_id
+
+    def get(self, image_id: str) -> bytes:
+        """
+        Lee una imagen y la marca como usada.
+
+        Raises:
+            KeyError: Si el id no es válido o la imagen no está (o se expulsó)
+        """
+        if not is_image_id(image_id):
+            raise KeyError(image_id)
+        path = self._path(image_id)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            IMAGE_STORE_REQUESTS_TOTAL.inc(result="miss")
+            raise KeyError(image_id)
+        IMAGE_STORE_REQUESTS_TOTAL.inc(result="hit")
+        return data
+
+    def __contains__(self, image_id: str) -> bool:
+        return is_image_id(image_id) and os.path.exists(self._path(image_id))
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Borra las imágenes menos usadas hasta quedar por debajo del 90 % del límite.
+
+        Se recorre el directorio para contar también lo que han guardado otros
+        workers.
+
+        Returns:
+            Número de imágenes borradas
+        """
+        with self._lock:
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * _LOW_WATERMARK
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                if keep and path.endswith(keep):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total = total
+            IMAGE_STORE_BYTES.set(total)
+        if removed:
+            IMAGE_STORE_EVICTIONS_TOTAL.inc(removed)
+            logger.info("Image store over %s bytes: evicted %s images", self.max_bytes, removed)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": self.directory, "bytes": self.total_bytes(), "max_bytes": self.max_bytes}
+
+
+image_store = ImageStore()
+
+
+def load_images(image_ids: List[str]) -> List[bytes]:
+    """
+    Bytes de varias imágenes del almacén.
+
+    Raises:
+        ValueError: Si algún id no existe (el cliente debe volver a subir la imagen)
+    """
+    images = []
+    for image_id in image_ids:
+        try:
+            images.append(image_store.get(image_id))
+        except KeyError:
+            raise ValueError(f"Imagen {image_id} no encontrada; vuelve a subirla")
+    return images
+
+
+def expand_message_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Sustituye los ids de imagen del historial por su base64.
+
+    Las entradas de "images" que no son ids (base64 de clientes antiguos) se
+    mantienen tal cual. Los mensajes con ids se copian; el resto se reutiliza.
+
+    Raises:
+        ValueError: Si algún id no existe en el almacén
+    """
+    started = time.perf_counter()
+    expanded = []
+    resolved = 0
+    for message in messages:
+        images = message.get("images") if isinstance(message, dict) else None
+        if not images or not any(is_image_id(image) for image in images):
+            expanded.append(message)
+            continue
+        encoded = []
+        for image in images:
+            if is_image_id(image):
+                encoded.append(base64.b64encode(load_images([image])[0]).decode("ascii"))
+                resolved += 1
+            else:
+                encoded.append(image)
+        expanded.append({**message, "images": encoded})
+    if resolved:
+        logger.info("Resolved %s history images from the store in %.1f ms", resolved, (time.perf_counter() - started) * 1000)
+    return expanded
+
+
+def parse_image_ids(raw: Optional[str]) -> List[str]:
+    """
+    Valida la lista de ids recibida como JSON en un campo de formulario.
+
+    Raises:
+        ValueError: Si no es una lista JSON de ids válidos
+    """
+    if not raw:
+        return []
+    try:
+        image_ids = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"image_ids no válido: {str(e)}")
+    if not isinstance(image_ids, list) or not all(is_image_id(i) for i in image_ids):
+        raise ValueError("image_ids debe ser una lista de ids de imagen (SHA-256 en hexadecimal)")
+    return image_ids
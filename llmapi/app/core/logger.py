@@ -1,13 +1,203 @@
+"""
+Logging sin bloqueos.
+
+Los handlers de la raíz se sustituyen por un QueueHandler: quien registra solo
+encola el LogRecord (sin formatear) y un QueueListener en su propio hilo lo
+formatea y lo escribe en stderr. Si la cola se llena el registro se descarta
+y se cuenta en llmapi_log_records_dropped_total; escribir un log nunca espera
+a la consola.
+
+- Formato: texto (por defecto) o una línea JSON por registro (LOG_FORMAT=json).
+  Ambos llevan el id de la petición (ver app.core.request_context) si lo hay.
+- Formateo perezoso: usar argumentos al estilo % (logger.info("... %s", x)),
+  que solo se interpolan si el nivel está activo y ya en el hilo del listener.
+  Los argumentos se formatean más tarde, así que deben ser valores (no objetos
+  que se sigan modificando).
+- Mensajes repetitivos del camino caliente: log_limited deja pasar uno por
+  clave cada LOG_RATE_LIMIT_SECONDS y resume cuántos se han omitido.
+"""
+import atexit
+import json
 import logging
-import os
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RATE_LIMIT_SECONDS
+from app.core.metrics import REGISTRY, Counter
+from app.core.request_context import request_id_var
+
+LOG_RECORDS_DROPPED_TOTAL = REGISTRY.register(Counter(
+    "llmapi_log_records_dropped_total",
+    "Registros de log descartados por tener la cola llena"
+))
+LOG_RECORDS_SUPPRESSED_TOTAL = REGISTRY.register(Counter(
+    "llmapi_log_records_suppressed_total",
+    "Registros de log omitidos por el límite de frecuencia", ("key",)
+))
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s%(request_tag)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class RequestIdFilter(logging.Filter):
+    """Añade request_id (y request_tag para el formato de texto) a cada registro."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = getattr(record, "request_id", None) or request_id_var.get()
+        record.request_id = request_id
+        record.request_tag = f" [{request_id}]" if request_id else ""
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", ""):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta en lugar de bloquear y no formatea en el hilo que registra."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El formateo (mensaje y traza) se hace en el hilo del listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED_TOTAL.inc()
+
+
+def build_formatter(fmt: str = LOG_FORMAT) -> logging.Formatter:
+    if fmt == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE) -> logging.Handler:
+    """
+    Instala el QueueHandler en la raíz y arranca el listener (idempotente).
+
+    Returns:
+        El QueueHandler instalado, para conectar otros loggers (p. ej. los de uvicorn)
+    """
+    global _listener
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            return handler
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(build_formatter(fmt))
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(RequestIdFilter())
+
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return handler
+
+
+def stop_logging() -> None:
+    """Detiene el listener escribiendo antes los registros pendientes."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def route_uvicorn_logs() -> None:
+    """
+    Hace que los logs de uvicorn (incluido el de acceso) pasen por la cola.
+
+    uvicorn instala sus propios StreamHandler al arrancar, después de importar
+    este módulo; se llama desde el arranque de la aplicación.
+    """
+    handler = configure_logging()
+    # uvicorn.error no tiene handlers propios: propaga a "uvicorn"
+    for name in ("uvicorn", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [handler]
+        uvicorn_logger.propagate = False
+
+
+class RateLimiter:
+    """Deja pasar un evento por clave y periodo, y cuenta los omitidos."""
+
+    def __init__(self, interval: float = LOG_RATE_LIMIT_SECONDS):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, int]] = {}
+
+    def allow(self, key: str) -> Tuple[bool, int]:
+        """
+        Returns:
+            (si el evento pasa, cuántos se omitieron desde el último que pasó)
+        """
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._state.get(key, (float("-inf"), 0))
+            if now - last >= self.interval:
+                self._state[key] = (now, 0)
+                return True, suppressed
+            self._state[key] = (last, suppressed + 1)
+            return False, suppressed + 1
+
+
+_limiter = RateLimiter()
+
+
+def log_limited(key: str, level: int, msg: str, *args, exc_info: bool = False) -> None:
+    """
+    Registra como mucho un mensaje por clave cada LOG_RATE_LIMIT_SECONDS.
+
+    El que pasa tras un periodo con omisiones indica cuántos se omitieron.
+
+    Args:
+        key: Clave del tipo de mensaje (p. ej. "ollama.undecodable_line")
+        level: Nivel de logging
+        msg: Mensaje con argumentos al estilo %
+        exc_info: Si se adjunta la traza de la excepción en curso
+    """
+    if not logger.isEnabledFor(level):
+        return
+    allowed, suppressed = _limiter.allow(key)
+    if not allowed:
+        LOG_RECORDS_SUPPRESSED_TOTAL.inc(key=key)
+        return
+    if suppressed:
+        msg = f"{msg} (%d similares omitidos en los últimos %ss)"
+        args = (*args, suppressed, _limiter.interval)
+    logger.log(level, msg, *args, exc_info=exc_info)
 
-# Obtener nivel de log desde el entorno
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="%(asctime)s [%(levelname)s] %(name)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+configure_logging()
 
 logger = logging.getLogger("fastapi-ollama")
@@ -0,0 +1,113 @@
+"""
+Monitor del lag del event loop.
+
+Una tarea duerme a intervalos fijos y mide cuánto tarda de más en despertar:
+ese retraso es el tiempo que el loop ha estado ocupado con otra cosa. El lag
+se exporta como histograma.
+
+En modo debug, un hilo vigilante comprueba el último latido del loop y, si
+lleva bloqueado más del umbral, registra la pila actual del hilo del loop,
+que señala la llamada bloqueante.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from app.core.config import (
+    LOOP_BLOCK_THRESHOLD_MS,
+    LOOP_MONITOR_DEBUG,
+    LOOP_MONITOR_INTERVAL_MS,
+)
+from app.core.logger import log_limited, logger
+from app.core.metrics import REGISTRY, Counter, Histogram
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_event_loop_lag_seconds", "Retraso del event loop respecto al intervalo de muestreo",
+    buckets=LAG_BUCKETS
+))
+LOOP_BLOCKS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_event_loop_blocks_total", "Bloqueos del event loop por encima del umbral"
+))
+
+
+class LoopMonitor:
+    """Mide el lag del event loop y, en debug, detecta bloqueos largos."""
+
+    def __init__(
+        self,
+        interval_ms: float = LOOP_MONITOR_INTERVAL_MS,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+        debug: bool = LOOP_MONITOR_DEBUG
+    ):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.debug = debug
+        self.heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    def start(self) -> None:
+        """Arranca el muestreo en el loop actual (llamar desde una corrutina)."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                LOOP_BLOCKS_TOTAL.inc()
+                if not self.debug:
+                    log_limited("loop.blocked", logging.WARNING, "Event loop bloqueado %.0f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        reported_for = None
+        while not self._stop.wait(self.threshold / 2):
+            stalled = time.monotonic() - self.heartbeat - self.interval
+            if stalled < self.threshold:
+                reported_for = None
+                continue
+            # Un único informe por bloqueo (mismo latido)
+            if reported_for == self.heartbeat:
+                continue
+            reported_for = self.heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(pila no disponible)"
+            logger.warning(
+                "Event loop bloqueado más de %.0f ms. Pila del loop:\n%s", stalled * 1000, stack
+            )
+
+
+loop_monitor = LoopMonitor()
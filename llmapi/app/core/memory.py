@@ -0,0 +1,198 @@
+"""
+Contabilidad de memoria por petición y utilidades de tracemalloc.
+
+Cada petición registra explícitamente los buffers grandes que mantiene vivos
+(bytes de imagen, cadenas base64, contenido PlantUML del paso 1) para conocer
+el pico y los bytes vivos por petición y el total retenido por los streams
+activos, sin el coste de tracemalloc en cada asignación.
+"""
+import itertools
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from app.core.metrics import REGISTRY, Gauge, Histogram
+
+# Buckets en bytes: 64 KB .. 512 MB
+BYTES_BUCKETS = tuple(64 * 1024 * 4 ** i for i in range(8))
+
+HELD_BYTES = REGISTRY.register(Gauge(
+    "llmapi_request_held_bytes",
+    "Bytes retenidos por las peticiones en curso, por tipo de buffer",
+    ("kind",)
+))
+REQUEST_PEAK_BYTES = REGISTRY.register(Histogram(
+    "llmapi_request_peak_bytes", "Pico de bytes retenidos por petición", ("route",),
+    buckets=BYTES_BUCKETS
+))
+
+# Tipo de buffer cuyos bytes forman el gauge de imágenes retenidas por streams
+IMAGES = "images"
+
+_ids = itertools.count(1)
+_active: Dict[int, "RequestMemory"] = {}
+_active_lock = threading.Lock()
+
+
+class RequestMemory:
+    """Bytes retenidos por una petición, por tipo de buffer."""
+
+    def __init__(self, route: str):
+        self.id = next(_ids)
+        self.route = route
+        self.started = time.time()
+        self.held: Dict[str, int] = {}
+        self.live = 0
+        self.peak = 0
+        self._closed = False
+        with _active_lock:
+            _active[self.id] = self
+
+    def hold(self, kind: str, nbytes: int) -> None:
+        """Registra (o reemplaza) los bytes retenidos de un tipo de buffer."""
+        previous = self.held.get(kind, 0)
+        self.held[kind] = nbytes
+        self.live += nbytes - previous
+        self.peak = max(self.peak, self.live)
+        HELD_BYTES.inc(nbytes - previous, kind=kind)
+
+    def release(self, kind: str) -> None:
+        """Marca como liberado un tipo de buffer."""
+        nbytes = self.held.pop(kind, 0)
+        if nbytes:
+            self.live -= nbytes
+            HELD_BYTES.dec(nbytes, kind=kind)
+
+    def close(self) -> None:
+        """Libera todo y registra el pico de la petición (idempotente)."""
+        if self._closed:
+            return
+        self._closed = True
+        for kind in list(self.held):
+            self.release(kind)
+        REQUEST_PEAK_BYTES.observe(self.peak, route=self.route)
+        with _active_lock:
+            _active.pop(self.id, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "age_s": round(time.time() - self.started, 2),
+            "live_bytes": self.live,
+            "peak_bytes": self.peak,
+            "held": dict(self.held),
+        }
+
+
+def active_requests() -> List[Dict[str, Any]]:
+    """Devuelve la contabilidad de las peticiones en curso."""
+    with _active_lock:
+        entries = list(_active.values())
+    return [entry.to_dict() for entry in entries]
+
+
+def held_bytes_by_kind() -> Dict[str, int]:
+    """Total de bytes retenidos por las peticiones en curso, por tipo de buffer."""
+    totals: Dict[str, int] = {}
+    for entry in active_requests():
+        for kind, nbytes in entry["held"].items():
+            totals[kind] = totals.get(kind, 0) + nbytes
+    return totals
+
+
+def rss_bytes() -> Optional[int]:
+    """RSS actual del proceso (Linux), o None si no está disponible."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# ─── tracemalloc ─────────────────────────────────────────────────────────────
+
+_snapshots: Dict[int, Dict[str, Any]] = {}
+_snapshot_ids = itertools.count(1)
+MAX_SNAPSHOTS = 10
+
+
+def start_tracing(nframes: int = 1) -> bool:
+    """Inicia tracemalloc si no estaba activo. Devuelve True si se ha iniciado ahora."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(nframes)
+    return True
+
+
+def stop_tracing() -> None:
+    tracemalloc.stop()
+    _snapshots.clear()
+
+
+def take_snapshot() -> Dict[str, Any]:
+    """
+    Toma una instantánea de tracemalloc y la guarda en memoria.
+
+    Solo se conservan las MAX_SNAPSHOTS más recientes.
+
+    Raises:
+        RuntimeError: Si tracemalloc no está activo
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc no está activo")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    snapshot_id = next(_snapshot_ids)
+    current, peak = tracemalloc.get_traced_memory()
+    _snapshots[snapshot_id] = {
+        "snapshot": snapshot,
+        "taken_at": time.time(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+    }
+    while len(_snapshots) > MAX_SNAPSHOTS:
+        _snapshots.pop(min(_snapshots))
+    return describe_snapshot(snapshot_id)
+
+
+def describe_snapshot(snapshot_id: int) -> Dict[str, Any]:
+    entry = _snapshots[snapshot_id]
+    return {
+        "id": snapshot_id,
+        "taken_at": entry["taken_at"],
+        "traced_bytes": entry["traced_bytes"],
+        "traced_peak_bytes": entry["traced_peak_bytes"],
+    }
+
+
+def list_snapshots() -> List[Dict[str, Any]]:
+    return [describe_snapshot(i) for i in sorted(_snapshots)]
+
+
+def diff_snapshots(old_id: int, new_id: int, limit: int = 20, key_type: str = "lineno") -> List[Dict[str, Any]]:
+    """
+    Compara dos instantáneas y devuelve las ubicaciones que más han crecido.
+
+    Raises:
+        KeyError: Si alguna de las instantáneas no existe
+    """
+    old = _snapshots[old_id]["snapshot"]
+    new = _snapshots[new_id]["snapshot"]
+    stats = new.compare_to(old, key_type)
+    return [
+        {
+            "location": str(stat.traceback),
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        }
+        for stat in stats[:limit]
+    ]
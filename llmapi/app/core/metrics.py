@@ -0,0 +1,282 @@
+"""
+Métricas en formato de exposición de Prometheus.
+
+Registro mínimo en proceso (contadores, gauges e histogramas con etiquetas)
+para no añadir dependencias. Cada worker expone sus propias series; Prometheus
+las agrega por instancia.
+"""
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from app.core.model_stats import model_stats
+
+# Buckets por defecto (segundos), pensados para latencias de LLM
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 50.0, 75.0, 100.0, 200.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Base común: nombre, ayuda, etiquetas y un lock para los valores."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:  # pragma: no cover - implementado en subclases
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Contador monótono."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Valor que puede subir y bajar."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # clave -> [cuentas por bucket (+Inf al final), suma, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def get_count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def get_sum(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0.0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total_sum, total_count) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {total_count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Colección de métricas que se renderiza en formato texto de Prometheus."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_requests_total", "Peticiones atendidas por ruta, modelo y estado",
+    ("route", "model", "status")
+))
+INFLIGHT_STREAMS = REGISTRY.register(Gauge(
+    "llmapi_inflight_streams", "Streams SSE en curso por ruta", ("route",)
+))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_queue_wait_seconds",
+    "Tiempo desde que se acepta la petición hasta que se envía a Ollama",
+    ("route", "model")
+))
+TTFT_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_time_to_first_token_seconds", "Tiempo hasta el primer token enviado al cliente",
+    ("route", "model")
+))
+REQUEST_DURATION_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_request_duration_seconds", "Latencia total de la petición", ("route", "model")
+))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "llmapi_generation_tokens_per_second", "Velocidad de generación reportada por Ollama",
+    ("model",), buckets=RATE_BUCKETS
+))
+PROMPT_TOKENS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_prompt_tokens_total", "Tokens de prompt evaluados (prompt_eval_count)", ("model",)
+))
+EVAL_TOKENS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_eval_tokens_total", "Tokens generados (eval_count)", ("model",)
+))
+MODEL_LOAD_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_model_load_duration_seconds", "Tiempo de carga del modelo (load_duration)",
+    ("model",)
+))
+CACHE_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_cache_requests_total", "Consultas a cachés internas por resultado (hit/miss)",
+    ("cache", "result")
+))
+UPSTREAM_ERRORS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_upstream_errors_total", "Errores al llamar a Ollama por clase", ("model", "error_class")
+))
+
+
+def observe_ollama_stats(model: str, stats: Dict) -> None:
+    """
+    Registra las estadísticas del chunk final de Ollama (done=true) en las
+    métricas y en el rendimiento medido del modelo.
+
+    Las duraciones de Ollama vienen en nanosegundos.
+
+    Args:
+        model: Nombre del modelo que generó la respuesta
+        stats: Chunk final o respuesta completa de Ollama
+    """
+    if not isinstance(stats, dict):
+        return
+    prompt_count = stats.get("prompt_eval_count")
+    if prompt_count:
+        PROMPT_TOKENS_TOTAL.inc(prompt_count, model=model)
+    eval_count = stats.get("eval_count")
+    if eval_count:
+        EVAL_TOKENS_TOTAL.inc(eval_count, model=model)
+        eval_duration = stats.get("eval_duration")
+        if eval_duration:
+            TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model=model)
+    load_duration = stats.get("load_duration")
+    if load_duration is not None:
+        MODEL_LOAD_SECONDS.observe(load_duration / 1e9, model=model)
+    model_stats.record(model, stats)
+
+
+def classify_upstream_error(error: BaseException) -> str:
+    """
+    Clasifica una excepción de la llamada a Ollama en una etiqueta de baja cardinalidad.
+
+    Args:
+        error: Excepción capturada
+
+    Returns:
+        Clase de error ("timeout", "connection", "http_4xx", "http_5xx", "decode" u "other")
+    """
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None and 400 <= status < 500:
+            return "http_4xx"
+        return "http_5xx"
+    if isinstance(error, ValueError):
+        return "decode"
+    return "other"
+
+
+def record_upstream_error(model: Optional[str], error: BaseException) -> None:
+    """Incrementa el contador de errores de Ollama para el modelo dado."""
+    UPSTREAM_ERRORS_TOTAL.inc(model=model or "", error_class=classify_upstream_error(error))
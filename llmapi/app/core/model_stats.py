@@ -0,0 +1,126 @@
+"""
+Rendimiento medido de cada modelo a partir de las estadísticas de Ollama.
+
+Cada respuesta completa de Ollama (chunk final con done=true) trae el tiempo
+de carga, los tokens y la duración de la evaluación del prompt y de la
+generación. Aquí se guardan las últimas MODEL_STATS_WINDOW muestras de cada
+modelo y se resumen con la mediana, para elegir modelos por velocidad real y
+no solo por el tamaño que indica el nombre. Las respuestas con menos de
+MODEL_STATS_MIN_EVAL_COUNT tokens generados se descartan: su velocidad está
+dominada por la latencia fija y no representa una petición real.
+
+Las muestras son por worker y se pierden al reiniciar.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import MODEL_STATS_MIN_EVAL_COUNT, MODEL_STATS_MIN_SAMPLES, MODEL_STATS_WINDOW
+
+
+def _median(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class ModelPerformance:
+    """Ventana de muestras recientes de un modelo."""
+
+    def __init__(self, window: int = MODEL_STATS_WINDOW):
+        self.load_seconds: Deque[float] = deque(maxlen=window)
+        self.prompt_rates: Deque[float] = deque(maxlen=window)
+        self.eval_rates: Deque[float] = deque(maxlen=window)
+        self.samples = 0
+        self.last_seen: Optional[float] = None
+
+    def add(self, stats: Dict[str, Any]) -> None:
+        load = stats.get("load_duration")
+        if load is not None:
+            self.load_seconds.append(load / 1e9)
+        prompt_count, prompt_ns = stats.get("prompt_eval_count"), stats.get("prompt_eval_duration")
+        if prompt_count and prompt_ns:
+            self.prompt_rates.append(prompt_count / (prompt_ns / 1e9))
+        eval_count, eval_ns = stats.get("eval_count"), stats.get("eval_duration")
+        if eval_count and eval_ns:
+            self.eval_rates.append(eval_count / (eval_ns / 1e9))
+        self.samples += 1
+        self.last_seen = time.time()
+
+    def measured(self, min_samples: int = MODEL_STATS_MIN_SAMPLES) -> bool:
+        """Si hay suficientes muestras de generación para fiarse de la velocidad."""
+        return len(self.eval_rates) >= max(min_samples, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        load = _median(list(self.load_seconds))
+        prompt = _median(list(self.prompt_rates))
+        rate = _median(list(self.eval_rates))
+        return {
+            "samples": self.samples,
+            "load_seconds": round(load, 3) if load is not None else None,
+            "prompt_tokens_per_second": round(prompt, 1) if prompt is not None else None,
+            "eval_tokens_per_second": round(rate, 1) if rate is not None else None,
+            "last_seen": self.last_seen,
+        }
+
+
+class ModelStats:
+    """Registro de rendimiento por modelo, seguro entre hilos."""
+
+    def __init__(self, window: int = MODEL_STATS_WINDOW, min_eval_count: int = MODEL_STATS_MIN_EVAL_COUNT):
+        self.window = window
+        self.min_eval_count = min_eval_count
+        self._lock = threading.Lock()
+        self._models: Dict[str, ModelPerformance] = {}
+
+    def record(self, model: str, stats: Dict[str, Any]) -> None:
+        """Añade una muestra con el chunk final de Ollama (las duraciones van en nanosegundos)."""
+        if not model or not isinstance(stats, dict):
+            return
+        if (stats.get("eval_count") or 0) < self.min_eval_count:
+            return
+        with self._lock:
+            performance = self._models.get(model)
+            if performance is None:
+                performance = self._models[model] = ModelPerformance(self.window)
+            performance.add(stats)
+
+    def get(self, model: str) -> Optional[Dict[str, Any]]:
+        """Resumen del modelo, o None si no hay muestras suficientes."""
+        with self._lock:
+            performance = self._models.get(model)
+            if performance is None or not performance.measured():
+                return None
+            return performance.to_dict()
+
+    def estimate_seconds(self, model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+        """
+        Duración estimada de una petición: carga + evaluación del prompt + generación.
+
+        Returns:
+            Segundos estimados, o None si el modelo no tiene muestras suficientes
+        """
+        summary = self.get(model)
+        if summary is None:
+            return None
+        seconds = summary["load_seconds"] or 0.0
+        if summary["prompt_tokens_per_second"]:
+            seconds += prompt_tokens / summary["prompt_tokens_per_second"]
+        return seconds + output_tokens / summary["eval_tokens_per_second"]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Resumen de todos los modelos con alguna muestra."""
+        with self._lock:
+            return {model: {**p.to_dict(), "measured": p.measured()} for model, p in self._models.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+model_stats = ModelStats()
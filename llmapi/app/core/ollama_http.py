@@ -0,0 +1,86 @@
+"""
+Sesión HTTP compartida con Ollama, por TCP o por socket Unix.
+
+Todas las llamadas a Ollama pasan por una única requests.Session, así que las
+conexiones se reutilizan (keep-alive) en lugar de abrir una por petición. Si
+OLLAMA_BASE_URL es unix:///ruta/ollama.sock (p. ej. un Ollama publicado en un
+socket a través de un proxy local), la sesión conecta por ese socket: las URLs
+siguen siendo http://localhost/api/... y solo cambia el transporte.
+"""
+import socket
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+
+from app.core.config import OLLAMA_POOL_MAXSIZE, OLLAMA_SOCKET
+
+# Host de las URLs cuando se conecta por socket (cabecera Host que recibe Ollama)
+UNIX_HOST = "localhost"
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    """Conexión HTTP de urllib3 sobre un socket Unix."""
+
+    def __init__(self, *args, socket_path: str, **kwargs):
+        self.socket_path = socket_path
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        timeout = self.timeout if isinstance(self.timeout, (int, float)) else socket.getdefaulttimeout()
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+
+class _UnixConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixHTTPConnection
+
+    def __init__(self, socket_path: str, maxsize: int):
+        super().__init__(UNIX_HOST, maxsize=maxsize, socket_path=socket_path)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """Adaptador de requests que envía todas las peticiones por un socket Unix."""
+
+    def __init__(self, socket_path: str, pool_maxsize: int = OLLAMA_POOL_MAXSIZE):
+        self.socket_path = socket_path
+        self._unix_pool = _UnixConnectionPool(socket_path, pool_maxsize)
+        super().__init__(pool_maxsize=pool_maxsize)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._unix_pool
+
+    def get_connection(self, url, proxies=None):
+        return self._unix_pool
+
+    def close(self) -> None:
+        self._unix_pool.close()
+        super().close()
+
+
+def create_session(socket_path: str = "", pool_maxsize: int = OLLAMA_POOL_MAXSIZE) -> requests.Session:
+    """
+    Sesión con un pool de conexiones dimensionado para los hilos del servicio.
+
+    Args:
+        socket_path: Socket Unix por el que conectar ("" = TCP)
+        pool_maxsize: Conexiones reutilizables como máximo
+    """
+    session = requests.Session()
+    if socket_path:
+        session.mount("http://", UnixSocketAdapter(socket_path, pool_maxsize))
+    else:
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+
+ollama_session = create_session(OLLAMA_SOCKET)
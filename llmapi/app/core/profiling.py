@@ -0,0 +1,208 @@
+"""
+Perfilado de CPU bajo demanda para una petición concreta.
+
+Un hilo muestrea periódicamente la pila de los hilos que están trabajando para
+la petición (el hilo del event loop mientras se ejecuta la ruta y los hilos
+del threadpool mientras avanzan el generador de streaming) y acumula las pilas
+en formato "folded" (compatible con flamegraph.pl y speedscope).
+
+El hilo del event loop se muestrea mientras dura la petición, por lo que las
+muestras pueden incluir otras corrutinas que se ejecuten a la vez.
+
+El middleware solo se instala cuando hay ADMIN_TOKEN configurado, así que las
+peticiones sin perfilado no pagan nada.
+"""
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+from urllib.parse import parse_qs
+
+from app.core.admin import ADMIN_TOKEN_HEADER, is_admin_token
+from app.core.config import PROFILE_DIR, PROFILE_INTERVAL_MS
+from app.core.logger import logger
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_EXTENSION = ".folded"
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfiler:
+    """Profiler de muestreo limitado a los hilos asociados a una petición."""
+
+    def __init__(self, label: str = "request", interval_ms: float = PROFILE_INTERVAL_MS):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.label = _UNSAFE_CHARS.sub("_", label).strip("_") or "request"
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name=f"profiler-{self.profile_id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for tid in thread_ids:
+                frame = frames.get(tid)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+            self.samples += 1
+
+    @contextmanager
+    def bound(self):
+        """Incluye el hilo actual en el muestreo mientras dura el bloque."""
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads[tid] = self._threads.get(tid, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._threads[tid] - 1
+                if remaining:
+                    self._threads[tid] = remaining
+                else:
+                    del self._threads[tid]
+
+    def wrap_iterator(self, iterator: Iterable) -> Iterator:
+        """
+        Envuelve un iterador síncrono para muestrear cada next().
+
+        StreamingResponse avanza los generadores síncronos en el threadpool,
+        posiblemente en un hilo distinto cada vez, así que el enlace se hace
+        por llamada y no para todo el stream.
+        """
+        iterator = iter(iterator)
+        try:
+            while True:
+                with self.bound():
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    def write(self, directory: str = PROFILE_DIR) -> str:
+        """
+        Guarda las pilas en formato folded.
+
+        Returns:
+            Ruta del fichero generado
+        """
+        os.makedirs(directory, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        filename = f"{timestamp}-{self.label}-{self.profile_id}{PROFILE_EXTENSION}"
+        path = os.path.join(directory, filename)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _profile_requested(scope) -> bool:
+    if _header(scope, PROFILE_HEADER.lower().encode()) in ("1", "true"):
+        return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return any(value in ("1", "true") for value in query.get("profile", ()))
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila las peticiones marcadas por un administrador.
+
+    La petición debe llevar X-Profile: 1 (o ?profile=1) y X-Admin-Token válido.
+    El fichero se guarda en PROFILE_DIR y su identificador se devuelve en la
+    cabecera X-Profile-Id para descargarlo desde /admin/profiles.
+    """
+
+    def __init__(self, app, directory: str = PROFILE_DIR):
+        self.app = app
+        self.directory = directory
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not is_admin_token(_header(scope, ADMIN_TOKEN_HEADER.lower().encode())):
+            logger.warning("Perfilado solicitado sin token de administración válido; se ignora")
+            await self.app(scope, receive, send)
+            return
+
+        profiler = RequestProfiler(label=scope.get("path", "request"))
+        scope.setdefault("state", {})["profiler"] = profiler
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profiler.profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            with profiler.bound():
+                await self.app(scope, receive, send_with_header)
+        finally:
+            profiler.stop()
+            path = profiler.write(self.directory)
+            logger.info(
+                "Perfil %s guardado en %s (%s muestras, %.2fs)",
+                profiler.profile_id, path, profiler.samples, profiler.duration
+            )
+
+
+def get_profiler(request) -> Optional[RequestProfiler]:
+    """Devuelve el profiler asociado a la petición, si la está perfilando un administrador."""
+    return getattr(request.state, "profiler", None)
@@ -0,0 +1,77 @@
+"""
+Reciclado de workers por memoria.
+
+Una tarea comprueba periódicamente el RSS del proceso y, si supera el límite,
+envía SIGTERM al propio worker. uvicorn lo trata como un apagado ordenado
+(deja de aceptar conexiones y espera a los streams en curso) y el supervisor
+de app.server arranca un worker nuevo en su lugar.
+
+Solo tiene sentido bajo el supervisor: en modo desarrollo el proceso no se
+reinicia.
+"""
+import asyncio
+import os
+import signal
+from typing import Optional
+
+from app.core.config import WORKER_MAX_RSS_MB, WORKER_RSS_CHECK_INTERVAL
+from app.core.logger import logger
+from app.core.memory import rss_bytes
+from app.core.metrics import REGISTRY, Gauge
+
+WORKER_RSS_BYTES = REGISTRY.register(Gauge(
+    "llmapi_worker_rss_bytes", "RSS del worker en la última comprobación"
+))
+
+
+class RssWatchdog:
+    """Pide el reciclado del worker cuando su RSS supera max_rss_mb."""
+
+    def __init__(
+        self,
+        max_rss_mb: int = WORKER_MAX_RSS_MB,
+        interval: float = WORKER_RSS_CHECK_INTERVAL
+    ):
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.interval = interval
+        self.triggered = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Arranca la comprobación en el loop actual (no hace nada si no hay límite)."""
+        if self.max_rss_bytes <= 0 or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def check(self) -> bool:
+        """Comprueba el RSS una vez. Devuelve True si se ha pedido el reciclado."""
+        rss = rss_bytes()
+        if rss is None:
+            return False
+        WORKER_RSS_BYTES.set(rss)
+        if self.triggered or rss < self.max_rss_bytes:
+            return False
+        self.triggered = True
+        logger.warning(
+            "Worker %s con RSS %.0f MB por encima de %.0f MB; reciclando tras drenar las peticiones",
+            os.getpid(), rss / 1024 / 1024, self.max_rss_bytes / 1024 / 1024
+        )
+        os.kill(os.getpid(), signal.SIGTERM)
+        return True
+
+    async def _watch(self) -> None:
+        while not self.triggered:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+
+rss_watchdog = RssWatchdog()
@@ -0,0 +1,78 @@
+"""
+Id de petición para correlacionar logs, y contexto de traza entrante.
+
+RequestIdMiddleware toma el X-Request-Id entrante (si es un valor razonable)
+o genera uno, lo deja en request_id_var durante la petición y lo devuelve en
+la cabecera de respuesta. Las variables de contexto se copian a
+run_in_threadpool y a los hilos de los streams (app.core.stream_sessions),
+así que los logs de una petición llevan su id aunque se escriban fuera del
+event loop.
+
+El middleware guarda también la cabecera traceparent y el instante de
+llegada, que usa RequestTelemetry para la traza (ver app.core.tracing).
+"""
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+REQUEST_ID_HEADER = "X-Request-Id"
+
+# Id de la petición en curso ("" fuera de una petición)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="")
+# Cabecera traceparent recibida ("" si no hay)
+traceparent_var: ContextVar[str] = ContextVar("traceparent", default="")
+# perf_counter() al llegar la petición, antes de leer el cuerpo (None fuera de una petición)
+request_started_var: ContextVar[Optional[float]] = ContextVar("request_started", default=None)
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def resolve_request_id(incoming: str) -> str:
+    """El id recibido si es válido; si no, uno nuevo."""
+    return incoming if incoming and _VALID_REQUEST_ID.match(incoming) else new_request_id()
+
+
+class RequestIdMiddleware:
+    """Middleware ASGI que fija el contexto de la petición y devuelve X-Request-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        incoming = ""
+        traceparent = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                incoming = value.decode("latin-1")
+            elif name == b"traceparent":
+                traceparent = value.decode("latin-1")
+        request_id = resolve_request_id(incoming)
+        tokens = (
+            request_id_var.set(request_id),
+            traceparent_var.set(traceparent),
+            request_started_var.set(started),
+        )
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            request_id_var.reset(tokens[0])
+            traceparent_var.reset(tokens[1])
+            request_started_var.reset(tokens[2])
@@ -0,0 +1,419 @@
+"""
+Sesiones de streaming SSE reanudables.
+
+La generación (productor) se ejecuta en su propio hilo y escribe cada frame SSE
+en un buffer de repetición; la conexión HTTP (consumidor) solo lee de ese
+buffer. Cada frame lleva un `id: <sesión>:<n>`, de modo que si la conexión se
+corta el cliente puede volver con la cabecera Last-Event-ID y recibir
+exactamente los frames posteriores.
+
+Sin consumidores conectados, el productor sigue durante SSE_RESUME_GRACE
+segundos; pasado ese plazo un hilo de limpieza lo detiene aunque no llegue
+ningún frame (cancelando la generación, lo que la saca de la cola del
+planificador o cierra la conexión con Ollama). Una sesión detenida así ya no
+se puede reanudar. Las sesiones terminadas se conservan el mismo plazo para
+reanudaciones tardías y el mismo hilo las libera.
+
+Como mucho hay SSE_MAX_SESSIONS sesiones a la vez por worker; al apagar, el
+servidor espera a los productores que siguen en marcha hasta SSE_DRAIN_TIMEOUT
+(ver drain_sessions).
+
+El buffer mantiene en memoria hasta SSE_BUFFER_MEMORY_BYTES; los frames más
+antiguos pasan a un fichero temporal de hasta SSE_BUFFER_DISK_BYTES. Si también
+se llena, se descartan y ya no es posible reanudar desde antes de ese punto.
+
+Las sesiones viven en el proceso: con varios workers, la reanudación debe
+llegar al mismo worker (para trabajos que sobreviven a todo, ver /jobs).
+"""
+import contextvars
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import (
+    SSE_BUFFER_DIR,
+    SSE_BUFFER_DISK_BYTES,
+    SSE_BUFFER_MEMORY_BYTES,
+    SSE_KEEPALIVE_INTERVAL,
+    SSE_MAX_SESSIONS,
+    SSE_RESUME_GRACE,
+)
+from app.core.logger import log_limited, logger
+from app.core.metrics import REGISTRY, Counter, Gauge
+
+STREAM_SESSIONS = REGISTRY.register(Gauge(
+    "llmapi_stream_sessions", "Sesiones de streaming activas o esperando reanudación"
+))
+STREAM_RESUMES_TOTAL = REGISTRY.register(Counter(
+    "llmapi_stream_resumes_total", "Reanudaciones de streams con Last-Event-ID por resultado", ("result",)
+))
+
+KEEPALIVE_FRAME = ": keep-alive\n\n"
+
+
+class ResumeUnavailable(Exception):
+    """Los frames pedidos ya no están en el buffer de repetición."""
+
+
+class TooManySessions(Exception):
+    """Se ha alcanzado SSE_MAX_SESSIONS en este worker."""
+
+
+class ReplayBuffer:
+    """Frames numerados desde 1, en memoria y, los más antiguos, en disco."""
+
+    def __init__(
+        self,
+        memory_bytes: int = SSE_BUFFER_MEMORY_BYTES,
+        disk_bytes: int = SSE_BUFFER_DISK_BYTES,
+        directory: str = SSE_BUFFER_DIR
+    ):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory or tempfile.gettempdir()
+        self.first_seq = 1
+        self.last_seq = 0
+        self._memory: Deque[Tuple[int, str]] = deque()
+        self._memory_size = 0
+        self._file = None
+        self._spilled: List[Tuple[int, int]] = []  # (offset, longitud) desde first_seq
+        self._disk_size = 0
+
+    def append(self, frame: str) -> int:
+        self.last_seq += 1
+        self._memory.append((self.last_seq, frame))
+        self._memory_size += len(frame)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            self._spill()
+        return self.last_seq
+
+    def _spill(self) -> None:
+        seq, frame = self._memory.popleft()
+        self._memory_size -= len(frame)
+        data = frame.encode()
+        if self._disk_size + len(data) > self.disk_bytes:
+            # Disco lleno: se descarta lo que había en disco y este frame
+            self._reset_disk()
+            self.first_seq = seq + 1
+            return
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.directory)
+        if not self._spilled:
+            self.first_seq = seq
+        self._file.seek(0, os.SEEK_END)
+        self._spilled.append((self._file.tell(), len(data)))
+        self._file.write(data)
+        self._disk_size += len(data)
+
+    def _reset_disk(self) -> None:
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+        self._spilled = []
+        self._disk_size = 0
+
+    def frames_after(self, seq: int) -> List[Tuple[int, str]]:
+        """
+        Frames con número mayor que seq.
+
+        Raises:
+            ResumeUnavailable: Si alguno de esos frames ya se ha descartado
+        """
+        if seq + 1 < self.first_seq:
+            raise ResumeUnavailable(f"Frames anteriores a {self.first_seq} descartados")
+        frames = []
+        if self._spilled:
+            for index in range(max(seq + 1 - self.first_seq, 0), len(self._spilled)):
+                offset, length = self._spilled[index]
+                self._file.seek(offset)
+                frames.append((self.first_seq + index, self._file.read(length).decode()))
+        frames.extend(item for item in self._memory if item[0] > seq)
+        return frames
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory.clear()
+        self._spilled = []
+
+
+class StreamSession:
+    """Productor de frames SSE desacoplado de las conexiones que lo consumen."""
+
+    def __init__(
+        self,
+        source: Iterator[str],
+        grace: float = SSE_RESUME_GRACE,
+        buffer: Optional[ReplayBuffer] = None,
+        on_abandon: Optional[Callable[[], None]] = None
+    ):
+        """
+        Args:
+            source: Iterador de frames SSE (la generación)
+            grace: Segundos que sigue la generación sin clientes
+            buffer: Buffer de repetición
+            on_abandon: Detiene la generación aunque no produzca frames
+                (p. ej. Generation.cancel)
+        """
+        self.id = uuid.uuid4().hex[:16]
+        self.grace = grace
+        self.buffer = buffer or ReplayBuffer()
+        self.done = False
+        self.stopped = False
+        self.consumers = 0
+        self.detached_at: Optional[float] = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self._source = source
+        self._on_abandon = on_abandon
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        # El hilo hereda el contexto de la petición (id para los logs)
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(
+            target=context.run, args=(self._produce,), name=f"sse-{self.id}", daemon=True
+        )
+        self._thread.start()
+
+    def _abandoned(self) -> bool:
+        return (
+            self.consumers == 0
+            and self.detached_at is not None
+            and time.monotonic() - self.detached_at > self.grace
+        )
+
+    def stop_if_abandoned(self) -> bool:
+        """Detiene la generación si lleva más del plazo de gracia sin clientes."""
+        with self._cond:
+            if self.done or self.stopped or not self._abandoned():
+                return False
+            self.stopped = True
+        logger.info("Stream %s sin clientes durante %ss; se detiene la generación", self.id, self.grace)
+        if self._on_abandon is not None:
+            try:
+                self._on_abandon()
+            except Exception:
+                logger.exception("Error deteniendo la generación del stream %s", self.id)
+        return True
+
+    def _produce(self) -> None:
+        try:
+            for frame in self._source:
+                with self._cond:
+                    if self.stopped:
+                        break
+                    self.buffer.append(frame)
+                    self._cond.notify_all()
+                if self.stop_if_abandoned():
+                    break
+        except Exception:
+            log_limited("stream.producer_error", logging.ERROR, "Error en el productor del stream %s", self.id, exc_info=True)
+        finally:
+            close = getattr(self._source, "close", None)
+            if close:
+                close()
+            with self._cond:
+                self.done = True
+                self.finished_at = time.monotonic()
+                self._cond.notify_all()
+
+    def frames(self, after_seq: int = 0, keepalive: float = SSE_KEEPALIVE_INTERVAL) -> Iterator[str]:
+        """
+        Entrega los frames posteriores a after_seq con su id y sigue en vivo hasta el final.
+
+        Raises:
+            ResumeUnavailable: Si los frames pedidos ya no están en el buffer
+        """
+        with self._cond:
+            pending = self.buffer.frames_after(after_seq)
+            self.consumers += 1
+            self.detached_at = None
+        position = after_seq
+        try:
+            while True:
+                for seq, frame in pending:
+                    position = seq
+                    yield f"id: {self.id}:{seq}\n{frame}"
+                with self._cond:
+                    if self.done and position >= self.buffer.last_seq:
+                        return
+                    if position >= self.buffer.last_seq:
+                        self._cond.wait(keepalive)
+                    pending = self.buffer.frames_after(position)
+                if not pending:
+                    yield KEEPALIVE_FRAME
+        finally:
+            with self._cond:
+                self.consumers -= 1
+                if self.consumers == 0:
+                    self.detached_at = time.monotonic()
+
+    def expired(self) -> bool:
+        """Sesión terminada (o abandonada) y sin clientes durante más del plazo de gracia."""
+        if self.consumers or self.detached_at is None:
+            return False
+        idle_since = max(self.detached_at, self.finished_at or 0)
+        return self.done and time.monotonic() - idle_since > self.grace
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine el productor; devuelve si ha terminado."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.done
+
+    def close(self) -> None:
+        self.buffer.close()
+
+
+_sessions: Dict[str, StreamSession] = {}
+_lock = threading.Lock()
+_reaper: Optional[threading.Thread] = None
+_reaper_wakeup = threading.Event()
+
+
+def _snapshot() -> List[StreamSession]:
+    with _lock:
+        return list(_sessions.values())
+
+
+def _reap() -> None:
+    for session in _snapshot():
+        session.stop_if_abandoned()
+    with _lock:
+        expired = [sid for sid, session in _sessions.items() if session.expired()]
+        for sid in expired:
+            _sessions.pop(sid).close()
+            STREAM_SESSIONS.dec()
+
+
+def _reap_interval() -> float:
+    # Una fracción del plazo de gracia más corto entre las sesiones vivas
+    graces = [session.grace for session in _snapshot()]
+    return min(max(min(graces, default=20.0) / 4, 0.05), 5.0)
+
+
+def _reap_forever() -> None:
+    while True:
+        _reaper_wakeup.wait(_reap_interval())
+        _reaper_wakeup.clear()
+        try:
+            _reap()
+        except Exception:
+            logger.exception("Error limpiando sesiones de streaming")
+
+
+def _ensure_reaper() -> None:
+    global _reaper
+    if _reaper is not None:
+        return
+    with _lock:
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_forever, name="sse-reaper", daemon=True)
+            _reaper.start()
+
+
+def _evict_finished() -> bool:
+    """Libera la sesión terminada y sin clientes más antigua (con _lock tomado)."""
+    idle = [
+        (session.finished_at, sid) for sid, session in _sessions.items()
+        if session.done and not session.consumers
+    ]
+    if not idle:
+        return False
+    _sessions.pop(min(idle)[1]).close()
+    STREAM_SESSIONS.dec()
+    return True
+
+
+def create_session(
+    source: Iterator[str],
+    grace: float = SSE_RESUME_GRACE,
+    on_abandon: Optional[Callable[[], None]] = None,
+    max_sessions: int = SSE_MAX_SESSIONS
+) -> StreamSession:
+    """
+    Registra y arranca una sesión que produce los frames de source.
+
+    Raises:
+        TooManySessions: Si hay max_sessions sesiones con generación o clientes
+    """
+    _reap()
+    _ensure_reaper()
+    session = StreamSession(source, grace=grace, on_abandon=on_abandon)
+    with _lock:
+        # Las terminadas que esperan una reanudación ceden su sitio a las nuevas
+        if len(_sessions) >= max_sessions and not _evict_finished():
+            raise TooManySessions(f"Máximo de {max_sessions} streams simultáneos")
+        _sessions[session.id] = session
+        STREAM_SESSIONS.inc()
+    session.start()
+    # El limpiador recalcula su intervalo con el plazo de la sesión nueva
+    _reaper_wakeup.set()
+    return session
+
+
+def drain_sessions(timeout: float) -> int:
+    """
+    Espera, como mucho timeout segundos en total, a los productores en marcha.
+
+    Los hilos de los productores son daemon: sin esto, al salir del proceso se
+    cortarían las generaciones que siguen dentro de su plazo de gracia.
+
+    Returns:
+        Número de productores que no han terminado a tiempo
+    """
+    deadline = time.monotonic() + timeout
+    pending = 0
+    for session in _snapshot():
+        if not session.join(max(deadline - time.monotonic(), 0)):
+            pending += 1
+    if pending:
+        logger.warning("%s streams sin terminar al apagar", pending)
+    return pending
+
+
+def parse_last_event_id(value: str) -> Tuple[str, int]:
+    """
+    Separa un Last-Event-ID "<sesión>:<n>".
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    session_id, _, seq = value.strip().rpartition(":")
+    if not session_id or not seq.isdigit():
+        raise ValueError(f"Last-Event-ID no válido: {value}")
+    return session_id, int(seq)
+
+
+def resume(last_event_id: str) -> Iterator[str]:
+    """
+    Reanuda una sesión a partir de su Last-Event-ID.
+
+    Returns:
+        Iterador de frames SSE posteriores al último recibido
+
+    Raises:
+        ValueError: Si el Last-Event-ID no es válido
+        KeyError: Si la sesión no existe, ha caducado o se detuvo por abandono
+        ResumeUnavailable: Si los frames pedidos ya se han descartado
+    """
+    session_id, seq = parse_last_event_id(last_event_id)
+    _reap()
+    session = _sessions.get(session_id)
+    if session is None or session.stopped:
+        # Una sesión detenida por abandono no tiene final que entregar
+        STREAM_RESUMES_TOTAL.inc(result="expired")
+        raise KeyError(session_id)
+    if seq + 1 < session.buffer.first_seq or seq > session.buffer.last_seq:
+        STREAM_RESUMES_TOTAL.inc(result="unavailable")
+        raise ResumeUnavailable(f"No se puede reanudar {session_id} desde {seq}")
+    STREAM_RESUMES_TOTAL.inc(result="ok")
+    logger.info("Reanudando stream %s desde el frame %s", session_id, seq)
+    return session.frames(seq)
@@ -0,0 +1,279 @@
+"""
+Seguimiento por petición de los tiempos que alimentan las métricas.
+
+Un RequestTelemetry se crea en la ruta y se pasa opcionalmente al servicio,
+que marca cuándo se envía la petición a Ollama y qué estadísticas devuelve.
+Solo se toman marcas de tiempo en eventos puntuales; nunca por token.
+
+Además del registro en métricas, guarda un desglose de tiempos (spans propios
+y duraciones de Ollama) por paso, que se devuelve al cliente en la cabecera
+Server-Timing o en el evento SSE final de estadísticas.
+
+Con TRACING_ENABLED, los mismos eventos alimentan la traza W3C de la petición
+(ver app.core.tracing); sin tracing no se crea ningún span.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Optional
+
+from app.core.generations import Generation
+from app.core.memory import RequestMemory
+from app.core.request_context import request_started_var, traceparent_var
+from app.core.tracing import KIND_CLIENT, TRACEPARENT_HEADER, Span, parse_traceparent, start_trace, trace_exporter
+from app.core.traffic_capture import traffic_recorder
+from app.core.metrics import (
+    INFLIGHT_STREAMS,
+    QUEUE_WAIT_SECONDS,
+    REQUEST_DURATION_SECONDS,
+    REQUESTS_TOTAL,
+    TTFT_SECONDS,
+)
+
+# Paso por defecto cuando la petición no está dividida (modo manual)
+DEFAULT_STEP = "generate"
+
+# Duraciones de Ollama (ns) que se copian al desglose (ms)
+_OLLAMA_DURATIONS = ("load_duration", "prompt_eval_duration", "eval_duration")
+_OLLAMA_COUNTS = ("prompt_eval_count", "eval_count")
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class RequestTelemetry:
+    """Marcas de tiempo y desglose de una petición a /generate."""
+
+    def __init__(self, route: str, model: Optional[str] = None, client: Optional[str] = None):
+        self.route = route
+        self.model = model or ""
+        self.start = time.perf_counter()
+        self.dispatched_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.status: Optional[str] = None
+        # Forma anonimizada de la petición si se está capturando (ver app.core.traffic_capture)
+        self.capture: Optional[Dict[str, Any]] = None
+        self.spans: Dict[str, float] = {}
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._step: Optional[str] = None
+        self._step_dispatched_at: Optional[float] = None
+        self._streaming = False
+        self.memory = RequestMemory(route)
+        self.generation = Generation(route, self.model, client)
+        self._traceparent = traceparent_var.get()
+        self.trace = start_trace(route, self.start, self._traceparent)
+        self._step_span: Optional[Span] = None
+        self._ollama_span: Optional[Span] = None
+        arrived = request_started_var.get()
+        if self.trace is not None and arrived is not None and arrived < self.start:
+            # FastAPI lee el formulario (imágenes incluidas) antes de llamar a la ruta
+            self.trace.root.start = arrived
+            self.trace.add_span("request_parse", arrived, self.start)
+
+    # ── Desglose ─────────────────────────────────────────────────────────────
+
+    def begin_step(self, step: str, model: str) -> None:
+        """Inicia un paso (p. ej. "step1"/"step2" en modo auto) con el modelo que lo atiende."""
+        self._step = step
+        self._step_dispatched_at = None
+        self.steps[step] = {"model": model}
+        self.generation.begin_step(step, model)
+        if self.trace is not None:
+            now = time.perf_counter()
+            self._end_step_spans(now)
+            self._step_span = self.trace.start_span(step, now, model=model)
+
+    def _current(self) -> Dict[str, Any]:
+        if self._step is None:
+            return self.spans
+        return self.steps[self._step]
+
+    def add_span(self, name: str, seconds: float) -> None:
+        """Acumula una duración (en ms) en el paso actual o a nivel de petición."""
+        target = self._current()
+        key = f"{name}_ms"
+        target[key] = round(target.get(key, 0) + seconds * 1000, 2)
+        if self.trace is not None:
+            now = time.perf_counter()
+            self.trace.add_span(name, now - seconds, now, parent=self._ollama_span or self._step_span)
+
+    @contextmanager
+    def span(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - t0)
+
+    def annotate(self, **values: Any) -> None:
+        """Añade valores (contadores, tamaños) al paso actual o a nivel de petición."""
+        self._current().update(values)
+
+    def upstream_first_byte(self) -> None:
+        """Marca la primera respuesta de Ollama en el paso actual."""
+        if self._step_dispatched_at is not None:
+            self.add_span("upstream_wait", time.perf_counter() - self._step_dispatched_at)
+
+    def ollama_stats(self, stats: Dict[str, Any]) -> None:
+        """Copia las duraciones y contadores del chunk final de Ollama al paso actual."""
+        if not isinstance(stats, dict):
+            return
+        target = self._current()
+        for key in _OLLAMA_DURATIONS:
+            value = stats.get(key)
+            if value is not None:
+                target[key.replace("_duration", "_ms")] = round(value / 1e6, 2)
+        for key in _OLLAMA_COUNTS:
+            value = stats.get(key)
+            if value is not None:
+                target[key] = value
+        if self._step_dispatched_at is not None:
+            target["upstream_ms"] = _ms(time.perf_counter() - self._step_dispatched_at)
+        if self._ollama_span is not None:
+            # Atributos del span de la llamada con los mismos valores que el desglose
+            attributes = self._ollama_span.attributes
+            for key in _OLLAMA_DURATIONS:
+                if stats.get(key) is not None:
+                    attributes[f"ollama.{key.replace('_duration', '_ms')}"] = round(stats[key] / 1e6, 2)
+            for key in _OLLAMA_COUNTS:
+                if stats.get(key) is not None:
+                    attributes[f"ollama.{key}"] = stats[key]
+            self._ollama_span.end = time.perf_counter()
+            self._ollama_span = None
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Devuelve el desglose de tiempos en milisegundos."""
+        end = self.finished_at or time.perf_counter()
+        result: Dict[str, Any] = {"total_ms": _ms(end - self.start)}
+        if self.dispatched_at is not None:
+            result["queue_ms"] = _ms(self.dispatched_at - self.start)
+        if self.first_token_at is not None:
+            result["ttft_ms"] = _ms(self.first_token_at - self.start)
+        result.update(self.spans)
+        result["steps"] = {name: dict(values) for name, values in self.steps.items()}
+        if self.trace is not None:
+            result["trace_id"] = self.trace.trace_id
+        return result
+
+    def server_timing(self) -> str:
+        """
+        Serializa el desglose como cabecera Server-Timing.
+
+        Con varios pasos, las entradas de cada paso llevan su nombre como prefijo.
+        """
+        breakdown = self.breakdown()
+        entries = []
+        for key, value in breakdown.items():
+            if key.endswith("_ms"):
+                entries.append(f"{key[:-3]};dur={value}")
+        steps = breakdown["steps"]
+        for step, values in steps.items():
+            prefix = f"{step}-" if len(steps) > 1 else ""
+            for key, value in values.items():
+                if key.endswith("_ms"):
+                    entries.append(f"{prefix}{key[:-3]};dur={value}")
+        return ", ".join(entries)
+
+    # ── Eventos de la petición ───────────────────────────────────────────────
+
+    def dispatched(self, model: str) -> None:
+        """
+        Marca el envío a Ollama; solo el primero cuenta como espera en cola.
+        
+        Raises:
+            GenerationCancelled: Si se ha cancelado mientras esperaba turno
+        """
+        self.generation.check()
+        if not self.model:
+            self.model = model
+        now = time.perf_counter()
+        self._step_dispatched_at = now
+        if self.trace is not None:
+            if self._ollama_span is not None:
+                self._ollama_span.end = now
+            self._ollama_span = self.trace.start_span(
+                "ollama.chat", now, parent=self._step_span, kind=KIND_CLIENT, model=model
+            )
+        if self.dispatched_at is None:
+            self.dispatched_at = now
+            QUEUE_WAIT_SECONDS.observe(
+                self.dispatched_at - self.start, route=self.route, model=model
+            )
+
+    def first_token(self) -> None:
+        """Marca el primer fragmento de contenido entregado al cliente."""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            TTFT_SECONDS.observe(
+                self.first_token_at - self.start, route=self.route, model=self.model
+            )
+            if self.trace is not None:
+                self.trace.add_span("first_token", self.trace.root.start, self.first_token_at)
+
+    def stream_started(self) -> None:
+        self._streaming = True
+        INFLIGHT_STREAMS.inc(route=self.route)
+
+    def finish(self, status: str) -> None:
+        """Cierra la petición registrando su estado y latencia total (idempotente)."""
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        self.status = status
+        if self._streaming:
+            INFLIGHT_STREAMS.dec(route=self.route)
+        REQUESTS_TOTAL.inc(route=self.route, model=self.model, status=status)
+        REQUEST_DURATION_SECONDS.observe(
+            self.finished_at - self.start, route=self.route, model=self.model
+        )
+        self.memory.close()
+        self.generation.close()
+        if self.capture is not None:
+            traffic_recorder.record(self.capture, self)
+        if self.trace is not None:
+            self._finish_trace(status)
+
+    # ── Traza ────────────────────────────────────────────────────────────────
+
+    def _end_step_spans(self, now: float) -> None:
+        for span in (self._ollama_span, self._step_span):
+            if span is not None and span.end is None:
+                span.end = now
+        self._ollama_span = None
+
+    def _finish_trace(self, status: str) -> None:
+        end = self.finished_at
+        if self._streaming and self.first_token_at is not None:
+            self.trace.add_span("stream", self.first_token_at, end)
+        self._end_step_spans(end)
+        self.trace.root.attributes.update({"http.route": self.route, "model": self.model, "status": status})
+        self.trace.close(end, error=status == "error")
+        trace_exporter.submit(self.trace)
+
+    def trace_headers(self) -> Dict[str, str]:
+        """
+        Cabeceras de contexto de traza para la llamada a Ollama en curso.
+
+        Con tracing, el padre es el span de la llamada; sin tracing se reenvía el
+        traceparent entrante si es válido.
+        """
+        if self.trace is not None:
+            return {TRACEPARENT_HEADER: self.trace.traceparent(self._ollama_span or self._step_span)}
+        if parse_traceparent(self._traceparent):
+            return {TRACEPARENT_HEADER: self._traceparent}
+        return {}
+
+
+def trace_headers(telemetry: Optional[RequestTelemetry]) -> Optional[Dict[str, str]]:
+    """Cabeceras de traza sobre un telemetry opcional (None si no hay ninguna)."""
+    if telemetry is None:
+        return None
+    return telemetry.trace_headers() or None
+
+
+def span(telemetry: Optional[RequestTelemetry], name: str):
+    """Span sobre un telemetry opcional (no hace nada si es None)."""
+    if telemetry is None:
+        return nullcontext()
+    return telemetry.span(name)
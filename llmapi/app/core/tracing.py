@@ -0,0 +1,271 @@
+"""
+Trazas distribuidas (W3C Trace Context) a partir de RequestTelemetry.
+
+Cada petición a /generate abre una traza que continúa la de la cabecera
+traceparent entrante (la del gateway Node) o empieza una nueva. Los spans no
+se miden aparte: los genera RequestTelemetry con las mismas marcas de tiempo
+que ya toma para el desglose y las métricas:
+
+- request_parse: desde que llega la petición hasta que FastAPI ha leído el
+  formulario multipart,
+- upload, image_store, encode, plantuml_compact, scheduler_wait (cola),
+- un span por paso (generate, o step1/step2 en modo auto) con un span hijo
+  ollama.chat por llamada a Ollama, que lleva como atributos las duraciones y
+  contadores del chunk final de Ollama,
+- first_token (hasta el primer fragmento) y stream (del primer fragmento al
+  final).
+
+A Ollama se le envía traceparent con el span de su llamada como padre. Si el
+tracing está deshabilitado, el traceparent entrante se reenvía tal cual.
+
+Las trazas terminadas se encolan y un hilo propio las convierte a OTLP/JSON
+y las escribe en TRACING_FILE (una petición ExportTraceServiceRequest por
+línea) o las envía a TRACING_OTLP_ENDPOINT (p. ej. un OpenTelemetry
+Collector en :4318). Si la cola está llena la traza se descarta.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from app.core.config import (
+    TRACING_BATCH_SIZE,
+    TRACING_ENABLED,
+    TRACING_EXPORTER,
+    TRACING_FILE,
+    TRACING_OTLP_ENDPOINT,
+    TRACING_QUEUE,
+    TRACING_SAMPLE_RATE,
+    TRACING_SERVICE_NAME,
+)
+from app.core.logger import log_limited
+from app.core.metrics import REGISTRY, Counter
+
+TRACES_TOTAL = REGISTRY.register(Counter(
+    "llmapi_traces_total",
+    "Trazas por resultado de la exportación (exported, dropped o failed)", ("result",)
+))
+
+TRACEPARENT_HEADER = "traceparent"
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Códigos de estado de OTLP
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+# SpanKind de OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Valida una cabecera traceparent.
+
+    Returns:
+        {"trace_id", "parent_id", "sampled"} o None si no es válida
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return {"trace_id": trace_id, "parent_id": parent_id, "sampled": bool(int(flags, 16) & 1)}
+
+
+def _new_id(nbytes: int) -> str:
+    return random.getrandbits(nbytes * 8).to_bytes(nbytes, "big").hex()
+
+
+class Span:
+    """Span de una traza (tiempos en segundos de perf_counter)."""
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], start: float, kind: int = KIND_INTERNAL):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.end: Optional[float] = None
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {}
+        self.error = False
+
+
+class Trace:
+    """Spans de una petición, exportados juntos al terminar."""
+
+    def __init__(self, name: str, start: float, incoming: Optional[str] = None,
+                 sample_rate: float = TRACING_SAMPLE_RATE):
+        parent = parse_traceparent(incoming)
+        if parent:
+            self.trace_id = parent["trace_id"]
+            self.sampled = parent["sampled"]
+        else:
+            self.trace_id = _new_id(16)
+            self.sampled = sample_rate >= 1 or random.random() < sample_rate
+        # Ancla para pasar de perf_counter a tiempo Unix en nanosegundos
+        self._wall_ns = time.time_ns() - int((time.perf_counter() - start) * 1e9)
+        self._perf = start
+        self.root = Span(name, _new_id(8), parent["parent_id"] if parent else None, start, KIND_SERVER)
+        self.spans: List[Span] = [self.root]
+
+    def start_span(self, name: str, start: float, parent: Optional[Span] = None,
+                   kind: int = KIND_INTERNAL, **attributes) -> Span:
+        span = Span(name, _new_id(8), (parent or self.root).span_id, start, kind)
+        span.attributes.update(attributes)
+        self.spans.append(span)
+        return span
+
+    def add_span(self, name: str, start: float, end: float, parent: Optional[Span] = None, **attributes) -> Span:
+        span = self.start_span(name, start, parent, **attributes)
+        span.end = end
+        return span
+
+    def traceparent(self, span: Optional[Span] = None) -> str:
+        """Cabecera traceparent con el span indicado (por defecto la raíz) como padre."""
+        span_id = (span or self.root).span_id
+        return f"00-{self.trace_id}-{span_id}-{'01' if self.sampled else '00'}"
+
+    def close(self, end: float, error: bool = False) -> None:
+        """Cierra los spans abiertos y marca el estado de la raíz."""
+        for span in self.spans:
+            if span.end is None:
+                span.end = end
+        self.root.error = error
+
+    def _unix_nano(self, t: float) -> str:
+        return str(self._wall_ns + int((t - self._perf) * 1e9))
+
+    def to_otlp(self) -> List[Dict[str, Any]]:
+        """Spans en el formato JSON de OTLP."""
+        spans = []
+        for span in self.spans:
+            entry: Dict[str, Any] = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": self._unix_nano(span.start),
+                "endTimeUnixNano": self._unix_nano(span.end if span.end is not None else span.start),
+                "attributes": [_attribute(k, v) for k, v in span.attributes.items() if v is not None],
+            }
+            if span.parent_id:
+                entry["parentSpanId"] = span.parent_id
+            if span is self.root:
+                entry["status"] = {"code": _STATUS_ERROR if span.error else _STATUS_OK}
+            spans.append(entry)
+        return spans
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def export_request(traces: List[Trace], service_name: str = TRACING_SERVICE_NAME) -> Dict[str, Any]:
+    """ExportTraceServiceRequest (OTLP/JSON) con las trazas indicadas."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "llmapi"},
+                "spans": [span for trace in traces for span in trace.to_otlp()],
+            }],
+        }]
+    }
+
+
+class TraceExporter:
+    """Exportador en segundo plano: fichero JSONL u OTLP/HTTP."""
+
+    def __init__(self, exporter: str = TRACING_EXPORTER, path: str = TRACING_FILE,
+                 endpoint: str = TRACING_OTLP_ENDPOINT, max_queue: int = TRACING_QUEUE,
+                 batch_size: int = TRACING_BATCH_SIZE):
+        self.exporter = exporter
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = max(batch_size, 1)
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[requests.Session] = None
+
+    def submit(self, trace: Trace) -> None:
+        """Encola una traza terminada (nunca bloquea)."""
+        if not trace.sampled:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            TRACES_TOTAL.inc(result="dropped")
+
+    def flush(self) -> None:
+        """Espera a que se exporten las trazas encoladas."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.export(batch)
+                TRACES_TOTAL.inc(len(batch), result="exported")
+            except Exception as e:
+                TRACES_TOTAL.inc(len(batch), result="failed")
+                log_limited("tracing.export_error", logging.WARNING, "Error exportando trazas (%s): %s", self.exporter, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def export(self, traces: List[Trace]) -> None:
+        body = export_request(traces)
+        if self.exporter == "otlp":
+            if self._session is None:
+                self._session = requests.Session()
+            self._session.post(self.endpoint, json=body, timeout=10).raise_for_status()
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(body) + "\n")
+
+
+trace_exporter = TraceExporter()
+
+
+def start_trace(name: str, start: float, incoming: Optional[str]) -> Optional[Trace]:
+    """Traza de una petición nueva, o None si el tracing está deshabilitado."""
+    if not TRACING_ENABLED:
+        return None
+    return Trace(name, start, incoming)
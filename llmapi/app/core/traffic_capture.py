@@ -0,0 +1,215 @@
+"""
+Captura anonimizada del tráfico de /generate y /generate/stream.
+
+Con TRAFFIC_CAPTURE_ENABLED, cada petición muestreada deja una línea JSON en
+TRAFFIC_CAPTURE_PATH con su forma (modelo, modo, opciones, tamaño del prompt,
+del historial y de cada imagen) y sus tiempos (llegada, TTFT, latencia total,
+estado). Nunca se guarda texto ni imágenes: en su lugar van su tamaño y un
+hash con clave (HMAC-SHA256 con TRAFFIC_CAPTURE_SALT, truncado), que solo
+sirve para saber qué prompts o imágenes se repiten. Sin TRAFFIC_CAPTURE_SALT,
+el primer worker genera una sal aleatoria en TRAFFIC_CAPTURE_PATH + ".salt" y
+los demás la leen, de modo que todos los workers dan el mismo hash.
+
+loadtest/replay.py reconstruye las peticiones con relleno del mismo tamaño
+(el mismo hash da el mismo relleno) y las relanza con la cadencia original.
+
+La escritura se hace en un hilo propio: la petición solo encola el registro
+y, si la cola está llena, se descarta y se cuenta en una métrica. Cada línea
+se escribe con una sola llamada a os.write sobre un descriptor O_APPEND, así
+que las líneas de varios workers no se mezclan en el fichero compartido.
+"""
+import hashlib
+import hmac
+import json
+import os
+import queue
+import random
+import secrets
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from app.core.config import (
+    TRAFFIC_CAPTURE_ENABLED,
+    TRAFFIC_CAPTURE_PATH,
+    TRAFFIC_CAPTURE_QUEUE,
+    TRAFFIC_CAPTURE_SALT,
+    TRAFFIC_CAPTURE_SAMPLE_RATE,
+)
+from app.core.logger import logger
+from app.core.metrics import REGISTRY, Counter
+
+TRAFFIC_CAPTURE_TOTAL = REGISTRY.register(Counter(
+    "llmapi_traffic_capture_total",
+    "Peticiones capturadas por resultado (written o dropped)", ("result",)
+))
+
+# Versión del formato de cada línea
+CAPTURE_VERSION = 1
+
+_salt: Optional[bytes] = None
+_salt_lock = threading.Lock()
+
+
+def shared_salt(path: str) -> bytes:
+    """
+    Sal aleatoria compartida por los workers, guardada junto a la captura.
+
+    El primero que llega la crea de forma atómica (enlace de un fichero
+    temporal ya escrito, que falla si otro se adelantó); el resto la lee.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory or None, prefix=".salt-")
+    try:
+        os.write(fd, secrets.token_hex(16).encode())
+        os.close(fd)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(tmp)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _get_salt() -> bytes:
+    global _salt
+    if _salt is None:
+        with _salt_lock:
+            if _salt is None:
+                _salt = TRAFFIC_CAPTURE_SALT.encode() if TRAFFIC_CAPTURE_SALT else shared_salt(f"{TRAFFIC_CAPTURE_PATH}.salt")
+    return _salt
+
+
+def digest(data: Union[bytes, str]) -> str:
+    """Hash con clave de un prompt o una imagen (16 caracteres hex)."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hmac.new(_get_salt(), data, hashlib.sha256).hexdigest()[:16]
+
+
+def _image_shape(image: Union[bytes, str]) -> Dict[str, Any]:
+    # Las imágenes del historial llegan en base64: se guarda el tamaño decodificado
+    size = len(image) if isinstance(image, bytes) else len(image) * 3 // 4
+    return {"bytes": size, "hash": digest(image)}
+
+
+def _text_shape(text: str) -> Dict[str, Any]:
+    return {"chars": len(text), "hash": digest(text)}
+
+
+def request_shape(
+    route: str,
+    model: str,
+    prompt: str,
+    images: Optional[List[bytes]] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    **fields
+) -> Dict[str, Any]:
+    """
+    Forma anonimizada de una petición (hashea el contenido: llamar fuera del event loop).
+
+    Args:
+        route: Ruta de la petición
+        model: Modelo pedido
+        prompt: Prompt del turno
+        images: Imágenes del turno
+        history: Historial de mensajes (con las imágenes ya en base64)
+        **fields: Otros campos que se copian tal cual (modo, opciones, ...)
+
+    Returns:
+        Diccionario sin texto ni imágenes, listo para RequestTelemetry.capture
+    """
+    shape: Dict[str, Any] = {
+        "v": CAPTURE_VERSION,
+        "route": route,
+        "model": model,
+        "prompt": _text_shape(prompt),
+        "images": [_image_shape(img) for img in images or []],
+        "history": [
+            {
+                "role": message.get("role", "user"),
+                **_text_shape(str(message.get("content") or "")),
+                "images": [_image_shape(img) for img in message.get("images") or []],
+            }
+            for message in history or [] if isinstance(message, dict)
+        ],
+    }
+    shape.update(fields)
+    return shape
+
+
+class TrafficRecorder:
+    """Escritor en segundo plano de las líneas de captura."""
+
+    def __init__(self, path: str = TRAFFIC_CAPTURE_PATH, enabled: bool = TRAFFIC_CAPTURE_ENABLED,
+                 sample_rate: float = TRAFFIC_CAPTURE_SAMPLE_RATE, max_queue: int = TRAFFIC_CAPTURE_QUEUE):
+        self.path = path
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def sampled(self) -> bool:
+        """Si se captura la petición que empieza ahora."""
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def record(self, shape: Dict[str, Any], telemetry) -> None:
+        """Completa la forma con los tiempos de la petición ya cerrada y la encola."""
+        total = telemetry.finished_at - telemetry.start
+        entry = {
+            **shape,
+            "t": round(time.time() - total, 3),
+            "status": telemetry.status,
+            "ttft_ms": round((telemetry.first_token_at - telemetry.start) * 1000, 2)
+            if telemetry.first_token_at is not None else None,
+            "total_ms": round(total * 1000, 2),
+            "eval_count": sum(step.get("eval_count", 0) for step in telemetry.steps.values()),
+        }
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            TRAFFIC_CAPTURE_TOTAL.inc(result="dropped")
+
+    def flush(self) -> None:
+        """Espera a que se escriban los registros encolados."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Sin buffer propio: cada línea completa va en un único write con O_APPEND
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        while True:
+            entry = self._queue.get()
+            try:
+                os.write(fd, (json.dumps(entry) + "\n").encode())
+                TRAFFIC_CAPTURE_TOTAL.inc(result="written")
+            except Exception:
+                logger.exception("Error writing traffic capture")
+            finally:
+                self._queue.task_done()
+
+
+traffic_recorder = TrafficRecorder()
@@ -1,8 +1,18 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.config import ALLOWED_ORIGINS, HOST, PORT
-from app.core.logger import logger
-from app.routes import generate, models
+from fastapi.responses import JSONResponse
+from app.core.config import ADMIN_TOKEN, ALLOWED_ORIGINS, HOST, PORT, JOBS_ENABLED, LOOP_MONITOR_ENABLED, SSE_DRAIN_TIMEOUT
+from app.core.logger import logger, route_uvicorn_logs
+from app.core.loop_monitor import loop_monitor
+from app.core.profiling import ProfilingMiddleware
+from app.core.recycling import rss_watchdog
+from app.core.request_context import RequestIdMiddleware
+from app.core.stream_sessions import drain_sessions
+from app.routes import admin, generate, images, jobs, models, metrics
+from app.services.jobs import job_worker
+from app.services.warmup import run_warmup, warmup_state
 
 app = FastAPI(
     title="Servicio IA - FastAPI (Ollama)",
@@ -19,26 +29,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado bajo demanda: solo se instala con la administración habilitada
+if ADMIN_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+
+# Id de petición en los logs y en la cabecera X-Request-Id (el más externo)
+app.add_middleware(RequestIdMiddleware)
+
 # Incluir routers
 app.include_router(models.router, prefix="/models", tags=["Modelos"])
 app.include_router(generate.router, prefix="/generate", tags=["Generar"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Trabajos"])
+app.include_router(images.router, prefix="/images", tags=["Imágenes"])
+app.include_router(metrics.router, tags=["Métricas"])
+app.include_router(admin.router, prefix="/admin", tags=["Administración"])
 
 @app.get("/", tags=["Salud"])
 def root():
     """Endpoint de verificación de salud"""
     return {"message": "Servicio IA FastAPI en ejecución", "status": "ok"}
 
+@app.get("/ready", tags=["Salud"])
+def ready():
+    """Endpoint de readiness: 503 hasta que termina el precalentamiento o vence su plazo"""
+    return JSONResponse(
+        status_code=200 if warmup_state.ready else 503,
+        content=warmup_state.to_dict()
+    )
+
 @app.on_event("startup")
 async def startup_event():
+    # uvicorn ya ha instalado sus handlers: pasarlos también por la cola de logs
+    route_uvicorn_logs()
     logger.info("Aplicación FastAPI iniciando...")
-    logger.info(f"El servidor se ejecutará en {HOST}:{PORT}")
-    logger.info(f"CORS habilitado para orígenes: {ALLOWED_ORIGINS}")
+    logger.info("El servidor se ejecutará en %s:%s", HOST, PORT)
+    logger.info("CORS habilitado para orígenes: %s", ALLOWED_ORIGINS)
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    rss_watchdog.start()
+    app.state.warmup_task = asyncio.create_task(run_warmup())
+    if JOBS_ENABLED:
+        await job_worker.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Aplicación FastAPI cerrándose...")
+    await loop_monitor.stop()
+    await rss_watchdog.stop()
+    await job_worker.stop()
+    # Streams que siguen generando dentro de su plazo de gracia, sin cliente; uvicorn ya
+    # ha consumido GRACEFUL_TIMEOUT esperando a las conexiones, así que el plazo es aparte
+    await run_in_threadpool(drain_sessions, SSE_DRAIN_TIMEOUT)
 
 if __name__ == "__main__":
     import uvicorn
-    logger.info(f"Iniciando FastAPI en {HOST}:{PORT}")
+    logger.info("Iniciando FastAPI en %s:%s", HOST, PORT)
     uvicorn.run("app.main:app", host=HOST, port=PORT, reload=True)
@@ -0,0 +1,163 @@
+import os
+import tracemalloc
+from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from app.core import generations, memory
+from app.core.admin import require_admin
+from app.core.cache import caches_summary
+from app.core.config import PROFILE_DIR
+from app.core.profiling import PROFILE_EXTENSION
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiles", response_model=Dict[str, Any])
+def list_profiles():
+    """
+    Lista los perfiles de CPU generados con X-Profile.
+    
+    Returns:
+        Dictionary con los ficheros disponibles (más recientes primero)
+    """
+    if not os.path.isdir(PROFILE_DIR):
+        return {"profiles": []}
+    names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(PROFILE_EXTENSION)]
+    profiles = []
+    for name in sorted(names, reverse=True):
+        path = os.path.join(PROFILE_DIR, name)
+        profiles.append({
+            "name": name,
+            "profile_id": name[:-len(PROFILE_EXTENSION)].rsplit("-", 1)[-1],
+            "size": os.path.getsize(path),
+        })
+    return {"profiles": profiles}
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str):
+    """
+    Descarga un perfil en formato folded (flamegraph.pl, speedscope).
+    
+    Args:
+        profile_id: Identificador devuelto en la cabecera X-Profile-Id
+        
+    Raises:
+        HTTPException: 404 si el perfil no existe
+    """
+    if os.path.isdir(PROFILE_DIR):
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith(f"-{profile_id}{PROFILE_EXTENSION}"):
+                return FileResponse(
+                    os.path.join(PROFILE_DIR, name),
+                    media_type="text/plain",
+                    filename=name
+                )
+    raise HTTPException(status_code=404, detail="Perfil no encontrado")
+
+
+@router.get("/generations", response_model=Dict[str, Any])
+def list_generations():
+    """
+    Generaciones en curso en este worker.
+    
+    Returns:
+        Dictionary con modelo, ruta, cliente, inicio, paso, tokens recibidos y
+        tokens/s de cada generación
+    """
+    return {"generations": generations.active_generations()}
+
+
+@router.post("/generations/{generation_id}/cancel", response_model=Dict[str, Any])
+def cancel_generation(generation_id: int):
+    """
+    Cancela una generación: cierra la conexión con Ollama y termina el stream
+    del cliente con un evento "cancelled".
+    
+    Args:
+        generation_id: Identificador devuelto en /admin/generations
+        
+    Raises:
+        HTTPException: 404 si no hay ninguna generación en curso con ese id
+    """
+    try:
+        return generations.cancel_generation(generation_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Generación no encontrada")
+
+
+@router.get("/memory", response_model=Dict[str, Any])
+def memory_summary():
+    """
+    Resumen de memoria del worker.
+    
+    Returns:
+        Dictionary con RSS, estado de tracemalloc, bytes retenidos por tipo de
+        buffer, contabilidad de cada petición en curso y tamaño de las cachés
+    """
+    traced, traced_peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "rss_bytes": memory.rss_bytes(),
+        "tracemalloc": {
+            "tracing": tracemalloc.is_tracing(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": traced_peak,
+        },
+        "held_bytes": memory.held_bytes_by_kind(),
+        "active_requests": memory.active_requests(),
+        "caches": caches_summary(),
+    }
+
+
+@router.post("/memory/tracemalloc/start", response_model=Dict[str, Any])
+def tracemalloc_start(nframes: int = Query(1, ge=1, le=50)):
+    """Activa tracemalloc (tiene coste en cada asignación mientras está activo)."""
+    started = memory.start_tracing(nframes)
+    return {"tracing": True, "started": started}
+
+
+@router.post("/memory/tracemalloc/stop", response_model=Dict[str, Any])
+def tracemalloc_stop():
+    """Detiene tracemalloc y descarta las instantáneas guardadas."""
+    memory.stop_tracing()
+    return {"tracing": False}
+
+
+@router.post("/memory/snapshots", response_model=Dict[str, Any])
+def take_memory_snapshot():
+    """
+    Toma una instantánea de tracemalloc.
+    
+    Raises:
+        HTTPException: 409 si tracemalloc no está activo
+    """
+    try:
+        return memory.take_snapshot()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/memory/snapshots", response_model=Dict[str, Any])
+def list_memory_snapshots():
+    """Lista las instantáneas disponibles."""
+    return {"snapshots": memory.list_snapshots()}
+
+
+@router.get("/memory/snapshots/{old_id}/diff/{new_id}", response_model=Dict[str, Any])
+def diff_memory_snapshots(
+    old_id: int,
+    new_id: int,
+    limit: int = Query(20, ge=1, le=500),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$")
+):
+    """
+    Compara dos instantáneas y devuelve las ubicaciones con mayor crecimiento.
+    
+    Raises:
+        HTTPException: 404 si alguna instantánea no existe
+    """
+    try:
+        diff = memory.diff_snapshots(old_id, new_id, limit, key_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Instantánea no encontrada")
+    return {"old": old_id, "new": new_id, "top": diff}
@@ -1,18 +1,35 @@
+import json
+import logging
 from typing import Optional, List
-from fastapi import APIRouter, Form, UploadFile, File, HTTPException
+from fastapi import APIRouter, Form, Header, UploadFile, File, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from app.services.ollama_service import generate_with_image, generate_with_image_stream, generate_with_image_stream_auto
-from app.schemas.generate_request import GenerateResponse
-from app.core.logger import logger
+from app.schemas.generate_request import BatchRequest, GenerateResponse
+from app.core.config import IMAGE_STORE_ENABLED
+from app.core.logger import log_limited, logger
+from app.core.generations import GenerationCancelled
+from app.core.image_store import expand_message_images, image_store, load_images, parse_image_ids
+from app.core.memory import IMAGES
+from app.core.profiling import get_profiler
+from app.core.stream_sessions import ResumeUnavailable, TooManySessions, create_session, resume
+from app.core.telemetry import RequestTelemetry
+from app.core.traffic_capture import request_shape, traffic_recorder
+from app.services.batch import run_batch
+from app.services.code_blocks import FenceTracker
+from app.services.model_options import parse_overrides
 
 router = APIRouter()
 
 
 @router.post("/", response_model=GenerateResponse)
 async def generate(
+    request: Request,
+    response: Response,
     model: str = Form(..., description="Nombre del modelo en Ollama"),
     prompt: str = Form(..., description="Texto del prompt"),
-    image: Optional[UploadFile] = File(None, description="Archivo de imagen opcional")
+    image: Optional[UploadFile] = File(None, description="Archivo de imagen opcional"),
+    options: Optional[str] = Form(None, description="Opciones de Ollama en JSON: num_ctx, num_predict, temperature, seed, keep_alive, num_thread")
 ):
     """
     Genera texto o código a partir de un prompt y opcionalmente una imagen.
@@ -21,18 +38,23 @@ async def generate(
         model: Nombre del modelo en Ollama
         prompt: Texto del prompt para la generación
         image: Archivo de imagen opcional para análisis multimodal
+        options: Opciones de Ollama para esta petición (sobre el perfil del modelo)
         
     Returns:
-        GenerateResponse con el resultado generado
+        GenerateResponse con el resultado generado (con el desglose de tiempos
+        en la cabecera Server-Timing)
         
     Raises:
-        HTTPException: Si hay error en la generación
+        HTTPException: Si hay error en la generación (409 si se cancela desde administración)
     """
+    telemetry = RequestTelemetry("/generate", model, _client(request))
     try:
+        overrides = parse_overrides(options)
         image_bytes = None
         if image:
-            logger.info(f"Processing image: {image.filename}, content-type: {image.content_type}")
-            image_bytes = await image.read()
+            logger.info("Processing image: %s, content-type: %s", image.filename, image.content_type)
+            with telemetry.span("upload"):
+                image_bytes = await image.read()
             
             # Validate image size (max 10MB)
             if len(image_bytes) > 10 * 1024 * 1024:
@@ -40,12 +62,22 @@ async def generate(
                     status_code=400, 
                     detail="Imagen demasiado grande. Máximo 10MB"
                 )
+            telemetry.memory.hold(IMAGES, len(image_bytes))
+        if traffic_recorder.sampled():
+            telemetry.capture = await run_in_threadpool(
+                request_shape, "/generate/", model, prompt,
+                images=[image_bytes] if image_bytes else None, options=overrides
+            )
         
-        logger.info(f"Generating with model: {model}, prompt length: {len(prompt)}")
-        ollama_resp = generate_with_image(
+        logger.info("Generating with model: %s, prompt length: %s", model, len(prompt))
+        # Llamada bloqueante a Ollama: fuera del event loop
+        ollama_resp = await run_in_threadpool(
+            generate_with_image,
             model=model, 
             prompt=prompt, 
-            image_bytes_list=[image_bytes] if image_bytes else None
+            image_bytes_list=[image_bytes] if image_bytes else None,
+            telemetry=telemetry,
+            options=overrides
         )
 
         # Extract content from Ollama response
@@ -58,16 +90,25 @@ async def generate(
                 detail="Respuesta vacía del modelo"
             )
         
-        logger.info(f"Successfully generated {len(content)} characters")
+        logger.info("Successfully generated %s characters", len(content))
+        telemetry.first_token()
+        telemetry.finish("ok")
+        response.headers["Server-Timing"] = telemetry.server_timing()
         return GenerateResponse(result=content)
         
-    except HTTPException:
+    except HTTPException as e:
+        telemetry.finish("client_error" if e.status_code < 500 else "error")
         raise
+    except GenerationCancelled as e:
+        telemetry.finish("cancelled")
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
+        telemetry.finish("client_error")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error en /generate")
+        telemetry.finish("error")
         raise HTTPException(
             status_code=500, 
             detail=f"Error generando respuesta: {str(e)}"
@@ -110,19 +151,70 @@ def _extract_content(ollama_resp: dict) -> str:
         return ollama_resp["response"]
     
     # Fallback: stringify whole response
-    logger.warning(f"Unknown response format: {ollama_resp.keys()}")
+    logger.warning("Unknown response format: %s", ollama_resp.keys())
     return str(ollama_resp)
 
 
+def _client(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+
+def _sse_data(chunk: str) -> str:
+    """Serializa un chunk de texto como frame SSE (JSON para preservar saltos de línea)."""
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Serializa un evento SSE con nombre y datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(frames, session_id: str, headers: Optional[dict] = None) -> StreamingResponse:
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Stream-Session": session_id,
+            **(headers or {}),
+        }
+    )
+
+
+def _resume_response(last_event_id: str) -> StreamingResponse:
+    """
+    Reanuda un stream a partir del Last-Event-ID recibido.
+    
+    Raises:
+        HTTPException: 400 si el identificador no es válido, 404 si la sesión
+            no existe o ha caducado, 410 si los frames pedidos ya se descartaron
+    """
+    try:
+        frames = resume(last_event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Sesión de stream no encontrada o caducada")
+    except ResumeUnavailable as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    return _sse_response(frames, last_event_id.rpartition(":")[0])
+
+
 @router.post("/stream")
 async def generate_stream(
+    request: Request,
     model: str = Form(..., description="Nombre del modelo en Ollama"),
     prompt: str = Form(..., description="Texto del prompt"),
     messages: Optional[str] = Form(None, description="Historial de mensajes en formato JSON"),
     images: Optional[List[UploadFile]] = File(None, description="Archivos de imagen opcionales (hasta 5)"),
+    image_ids: Optional[str] = Form(None, description="Ids de imágenes ya guardadas (lista JSON), cuentan en el límite de 5"),
     auto_mode: Optional[str] = Form("false", description="Si está en modo automático"),
     vision_model: Optional[str] = Form(None, description="Modelo de visión a usar en modo automático"),
-    coding_model: Optional[str] = Form(None, description="Modelo de generación a usar en modo automático")
+    coding_model: Optional[str] = Form(None, description="Modelo de generación a usar en modo automático"),
+    structured: Optional[str] = Form("false", description="Si se añaden eventos tipados de texto y bloques de código"),
+    options: Optional[str] = Form(None, description="Opciones de Ollama en JSON: num_ctx, num_predict, temperature, seed, keep_alive, num_thread"),
+    latency_target: Optional[float] = Form(None, gt=0, description="Segundos objetivo para el paso 2 del modo automático")
 ):
     """
     Genera texto en streaming, mostrando la respuesta a medida que se genera.
@@ -131,26 +223,56 @@ async def generate_stream(
     Args:
         model: Nombre del modelo en Ollama
         prompt: Texto del prompt para la generación
-        messages: Historial de mensajes en formato JSON
+        messages: Historial de mensajes en formato JSON; el campo "images" de
+            cada mensaje puede llevar ids del almacén en lugar de base64
         images: Lista de archivos de imagen opcionales para análisis multimodal
+        image_ids: Ids de imágenes del almacén para este turno (van antes que las subidas)
         auto_mode: Si está en modo automático ("true" o "false")
+        structured: Si es "true", tras cada chunk se envían los eventos "text",
+            "code_block_start" (con el lenguaje), "code_delta" y "code_block_end"
+            que completa (en modo automático, solo para la respuesta del paso 2)
+        options: Opciones de Ollama para esta petición (en modo automático, para el paso 2)
+        latency_target: En modo automático, con QUEUE_ROUTING_ENABLED, el paso 2 se
+            sirve con un modelo de código más pequeño si el elegido no llega a
+            tiempo por su cola; steps.step2 del evento "stats" lleva el modelo que
+            la sirvió y requested_model
         
     Returns:
-        StreamingResponse con chunks de texto
+        StreamingResponse con chunks de texto. Antes de [DONE] se envía un evento
+        SSE "stats" con el desglose de tiempos (por paso en modo automático).
+        Cada frame lleva un id; si la petición trae Last-Event-ID se reanuda
+        ese stream en lugar de empezar otra generación. Si se cancela desde
+        administración se envía un evento "cancelled" seguido de [ERROR].
+        Con el almacén de imágenes habilitado, las imágenes subidas se guardan
+        y la cabecera X-Image-Ids lleva los ids de las imágenes del turno para
+        referenciarlas en el historial de las siguientes peticiones.
     """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        return _resume_response(last_event_id)
+    
+    telemetry = RequestTelemetry("/generate/stream", model, _client(request))
     try:
+        overrides = parse_overrides(options)
+        stored_ids = parse_image_ids(image_ids)
+        if stored_ids and not IMAGE_STORE_ENABLED:
+            raise HTTPException(status_code=400, detail="Almacén de imágenes deshabilitado")
         image_bytes_list = []
-        if images:
-            # Validar límite de imágenes
-            if len(images) > 5:
+        if images or stored_ids:
+            # Validar límite de imágenes (subidas y referenciadas por id)
+            if len(images or []) + len(stored_ids) > 5:
                 raise HTTPException(
                     status_code=400,
                     detail="Máximo 5 imágenes permitidas"
                 )
+            if stored_ids:
+                with telemetry.span("image_store"):
+                    image_bytes_list = await run_in_threadpool(load_images, stored_ids)
             
-            for image in images:
-                logger.info(f"Processing image: {image.filename}, content-type: {image.content_type}")
-                image_bytes = await image.read()
+            for image in images or []:
+                logger.info("Processing image: %s, content-type: %s", image.filename, image.content_type)
+                with telemetry.span("upload"):
+                    image_bytes = await image.read()
                 
                 # Validate image size (max 10MB)
                 if len(image_bytes) > 10 * 1024 * 1024:
@@ -160,26 +282,59 @@ async def generate_stream(
                     )
                 
                 image_bytes_list.append(image_bytes)
+                if IMAGE_STORE_ENABLED:
+                    with telemetry.span("image_store"):
+                        stored_ids.append(await run_in_threadpool(image_store.put, image_bytes))
+            telemetry.memory.hold(IMAGES, sum(len(img) for img in image_bytes_list))
         
-        logger.info(f"Starting streaming with model: {model}, prompt length: {len(prompt)}, {len(image_bytes_list)} images, auto_mode: {auto_mode}")
+        logger.info("Starting streaming with model: %s, prompt length: %s, %s images, auto_mode: %s", model, len(prompt), len(image_bytes_list), auto_mode)
         
         # Parsear el historial de mensajes si está presente
         message_history = []
         if messages:
             try:
-                import json
                 message_history = json.loads(messages)
-                logger.info(f"Received message history with {len(message_history)} messages")
+                logger.info("Received message history with %s messages", len(message_history))
             except json.JSONDecodeError as e:
-                logger.error(f"Error parsing message history: {str(e)}")
+                logger.error("Error parsing message history: %s", e)
+        if IMAGE_STORE_ENABLED and isinstance(message_history, list):
+            # Las imágenes del historial referenciadas por id se recuperan del almacén
+            with telemetry.span("image_store"):
+                message_history = await run_in_threadpool(expand_message_images, message_history)
         
         # Check if auto mode with images should use two-step process
         is_auto_with_images = auto_mode.lower() == "true" and len(image_bytes_list) > 0
+        if is_auto_with_images:
+            telemetry.model = "auto"
+        if traffic_recorder.sampled():
+            telemetry.capture = await run_in_threadpool(
+                request_shape, "/generate/stream", model, prompt,
+                images=image_bytes_list,
+                history=message_history if isinstance(message_history, list) else None,
+                auto_mode=auto_mode.lower() == "true",
+                vision_model=vision_model,
+                coding_model=coding_model,
+                structured=structured.lower() == "true",
+                options=overrides,
+                latency_target=latency_target
+            )
+        
+        def release_images():
+            # El servicio ya las ha codificado; no retenerlas durante todo el stream
+            image_bytes_list.clear()
+            telemetry.memory.release(IMAGES)
+        
+        tracker = FenceTracker() if structured.lower() == "true" else None
+        
+        def structured_events(events):
+            for event, data in events:
+                yield _sse_event(event, data)
         
         def event_generator():
+            telemetry.stream_started()
+            first_token_pending = True
+            in_step2 = False
             try:
-                import json
-                
                 if is_auto_with_images:
                     # Proceso en dos pasos: extracción de PlantUML y luego generación de código
                     logger.info("Using two-step auto mode with PlantUML extraction")
@@ -189,14 +344,27 @@ async def generate_stream(
                             image_bytes_list=image_bytes_list,
                             message_history=message_history,
                             vision_model_override=vision_model,
-                            coding_model_override=coding_model
+                            coding_model_override=coding_model,
+                            telemetry=telemetry,
+                            options=overrides,
+                            latency_target=latency_target
                         ):
-                            # Codificar en JSON para preservar caracteres especiales y saltos de línea
-                            yield f"data: {json.dumps(chunk)}\n\n"
+                            if first_token_pending and not chunk.startswith("[STEP"):
+                                first_token_pending = False
+                                telemetry.first_token()
+                            elif chunk == "[STEP1_END]":
+                                release_images()
+                            yield _sse_data(chunk)
+                            if chunk == "[STEP2_START]":
+                                in_step2 = True
+                            elif tracker and in_step2:
+                                yield from structured_events(tracker.feed(chunk))
                     except ValueError as ve:
                         # Error específico cuando las imágenes no son diagramas
-                        logger.warning(f"No UML diagrams detected: {str(ve)}")
-                        yield f"data: {json.dumps(str(ve))}\n\n"
+                        logger.warning("No UML diagrams detected: %s", ve)
+                        telemetry.finish("no_diagram")
+                        yield _sse_data(str(ve))
+                        yield _sse_event("stats", telemetry.breakdown())
                         yield "data: [DONE]\n\n"
                         return
                 else:
@@ -205,32 +373,107 @@ async def generate_stream(
                         model=model, 
                         prompt=prompt, 
                         image_bytes_list=image_bytes_list,
-                        message_history=message_history
+                        message_history=message_history,
+                        telemetry=telemetry,
+                        options=overrides
                     ):
-                        # Codificar en JSON para preservar caracteres especiales y saltos de línea
-                        yield f"data: {json.dumps(chunk)}\n\n"
+                        if first_token_pending:
+                            first_token_pending = False
+                            telemetry.first_token()
+                            release_images()
+                        yield _sse_data(chunk)
+                        if tracker:
+                            yield from structured_events(tracker.feed(chunk))
+                if tracker:
+                    yield from structured_events(tracker.finish())
+                telemetry.finish("ok")
+                yield _sse_event("stats", telemetry.breakdown())
                 yield "data: [DONE]\n\n"
+            except GenerationCancelled as e:
+                telemetry.finish("cancelled")
+                yield _sse_event("cancelled", {"generation_id": telemetry.generation.id})
+                yield f"data: [ERROR] {str(e)}\n\n"
             except Exception as e:
-                logger.error(f"Error in stream generator: {str(e)}")
+                log_limited("generate.stream_error", logging.ERROR, "Error in stream generator: %s", e)
+                telemetry.finish("error")
                 yield f"data: [ERROR] {str(e)}\n\n"
+            finally:
+                # Cliente desconectado antes de terminar
+                telemetry.finish("cancelled")
         
-        return StreamingResponse(
-            event_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            }
-        )
+        content = event_generator()
+        profiler = get_profiler(request)
+        if profiler:
+            content = profiler.wrap_iterator(content)
+        
+        # La generación sigue en su propio hilo aunque se corte la conexión
+        try:
+            # Si nadie reanuda el stream en el plazo de gracia, la generación se cancela
+            session = create_session(content, on_abandon=telemetry.generation.cancel)
+        except TooManySessions as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        headers = {"X-Image-Ids": ",".join(stored_ids)} if stored_ids else None
+        return _sse_response(session.frames(), session.id, headers)
         
-    except HTTPException:
+    except HTTPException as e:
+        telemetry.finish("client_error" if e.status_code < 500 else "error")
         raise
     except ValueError as e:
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
+        telemetry.finish("client_error")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error en /generate/stream")
+        telemetry.finish("error")
         raise HTTPException(
             status_code=500, 
             detail=f"Error generando respuesta en streaming: {str(e)}"
         )
+
+
+@router.get("/stream/resume")
+def resume_stream(
+    last_event_id: Optional[str] = Header(None, description="Id del último frame recibido"),
+    from_id: Optional[str] = None
+):
+    """
+    Reanuda un stream de /generate/stream cortado (compatible con EventSource).
+    
+    Args:
+        last_event_id: Cabecera Last-Event-ID con el id del último frame recibido
+        from_id: Alternativa en la query para clientes que no pueden enviar la cabecera
+        
+    Returns:
+        StreamingResponse con los frames posteriores, en vivo si la generación sigue
+    """
+    value = last_event_id or from_id
+    if not value:
+        raise HTTPException(status_code=400, detail="Falta Last-Event-ID")
+    return _resume_response(value)
+
+
+@router.post("/batch")
+async def generate_batch(batch: BatchRequest):
+    """
+    Ejecuta un lote de generaciones con concurrencia limitada.
+    
+    Args:
+        batch: Elementos (modelo, prompt, imágenes en base64 y opciones) y
+            número máximo de elementos en curso a la vez
+        
+    Returns:
+        StreamingResponse NDJSON con una línea por elemento en orden de
+        finalización (index, model, status, result o error, timing) y una
+        línea final de resumen con done=true
+    """
+    logger.info("Starting batch with %s items, concurrency: %s", len(batch.items), batch.concurrency)
+    
+    async def ndjson_lines():
+        async for result in run_batch(batch.items, batch.concurrency):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
@@ -0,0 +1,68 @@
+from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from app.core.config import IMAGE_STORE_ENABLED
+from app.core.image_store import image_store
+from app.core.logger import logger
+
+router = APIRouter()
+
+
+def _require_store() -> None:
+    if not IMAGE_STORE_ENABLED:
+        raise HTTPException(status_code=503, detail="Almacén de imágenes deshabilitado")
+
+
+@router.post("/")
+async def upload_images(
+    images: List[UploadFile] = File(..., description="Archivos de imagen (hasta 5)")
+):
+    """
+    Guarda imágenes en el almacén y devuelve sus ids.
+
+    Los ids se pueden enviar en image_ids de /generate/stream o en el campo
+    "images" de los mensajes del historial en lugar del base64.
+
+    Returns:
+        Dictionary con una entrada (id, bytes) por imagen, en el mismo orden
+
+    Raises:
+        HTTPException: Si el almacén está deshabilitado o las imágenes no son válidas
+    """
+    _require_store()
+    if len(images) > 5:
+        raise HTTPException(status_code=400, detail="Máximo 5 imágenes permitidas")
+    stored = []
+    for image in images:
+        data = await image.read()
+        if len(data) > 10 * 1024 * 1024:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Imagen {image.filename} demasiado grande. Máximo 10MB"
+            )
+        image_id = await run_in_threadpool(image_store.put, data)
+        stored.append({"id": image_id, "bytes": len(data)})
+    logger.info("Stored %s images", len(stored))
+    return {"images": stored}
+
+
+@router.get("/{image_id}")
+def get_image(image_id: str):
+    """
+    Devuelve los bytes de una imagen del almacén.
+
+    Raises:
+        HTTPException: 404 si no existe o ya se ha expulsado
+    """
+    _require_store()
+    try:
+        data = image_store.get(image_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    # El id es el hash del contenido: la respuesta nunca cambia
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{image_id}"'}
+    )
@@ -0,0 +1,249 @@
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from fastapi import APIRouter, Form, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.core.config import IMAGE_STORE_ENABLED, JOBS_ENABLED, JOBS_POLL_INTERVAL
+from app.core.image_store import expand_message_images, load_images, parse_image_ids
+from app.core.logger import logger
+from app.routes.generate import _sse_data, _sse_event
+from app.services.jobs import (
+    CHUNK,
+    END,
+    ERROR,
+    FINISHED,
+    get_channel,
+    job_result,
+    job_store,
+    job_worker,
+    replay_chunks,
+)
+from app.services.model_options import parse_overrides
+
+router = APIRouter()
+
+
+def _get_job(job_id: str) -> Dict[str, Any]:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+def _job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "step": job["step"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "output_chars": {step: len(text) for step, text in job["outputs"].items()},
+        "error": job["error"],
+    }
+
+
+@router.post("/", status_code=202)
+async def submit_job(
+    model: str = Form(..., description="Nombre del modelo en Ollama"),
+    prompt: str = Form(..., description="Texto del prompt"),
+    messages: Optional[str] = Form(None, description="Historial de mensajes en formato JSON"),
+    images: Optional[List[UploadFile]] = File(None, description="Archivos de imagen opcionales (hasta 5)"),
+    image_ids: Optional[str] = Form(None, description="Ids de imágenes ya guardadas (lista JSON), cuentan en el límite de 5"),
+    auto_mode: Optional[str] = Form("false", description="Si está en modo automático"),
+    vision_model: Optional[str] = Form(None, description="Modelo de visión a usar en modo automático"),
+    coding_model: Optional[str] = Form(None, description="Modelo de generación a usar en modo automático"),
+    options: Optional[str] = Form(None, description="Opciones de Ollama en JSON: num_ctx, num_predict, temperature, seed, keep_alive, num_thread")
+):
+    """
+    Encola una generación con los mismos campos que /generate/stream.
+
+    Las imágenes referenciadas por id (en image_ids o en el historial) se
+    resuelven al encolar: el trabajo no depende de que sigan en el almacén.
+
+    Returns:
+        Dictionary con el identificador del trabajo y su estado inicial
+
+    Raises:
+        HTTPException: Si la API de trabajos está deshabilitada o la petición no es válida
+    """
+    if not JOBS_ENABLED:
+        raise HTTPException(status_code=503, detail="API de trabajos deshabilitada")
+    try:
+        overrides = parse_overrides(options)
+        stored_ids = parse_image_ids(image_ids)
+        if stored_ids and not IMAGE_STORE_ENABLED:
+            raise ValueError("Almacén de imágenes deshabilitado")
+        if len(images or []) + len(stored_ids) > 5:
+            raise ValueError("Máximo 5 imágenes permitidas")
+        image_bytes_list = await run_in_threadpool(load_images, stored_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if images:
+        for image in images:
+            image_bytes = await image.read()
+            if len(image_bytes) > 10 * 1024 * 1024:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Imagen {image.filename} demasiado grande. Máximo 10MB"
+                )
+            image_bytes_list.append(image_bytes)
+
+    message_history = []
+    if messages:
+        try:
+            message_history = json.loads(messages)
+        except json.JSONDecodeError as e:
+            logger.error("Error parsing message history: %s", e)
+    if IMAGE_STORE_ENABLED and isinstance(message_history, list):
+        try:
+            message_history = await run_in_threadpool(expand_message_images, message_history)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    inputs = {
+        "model": model,
+        "prompt": prompt,
+        "messages": message_history,
+        "auto_mode": auto_mode.lower() == "true" and len(image_bytes_list) > 0,
+        "vision_model": vision_model,
+        "coding_model": coding_model,
+        "options": overrides,
+    }
+    job_id = await run_in_threadpool(job_store.create, inputs, image_bytes_list)
+    job_worker.notify()
+    logger.info("Job %s queued (model: %s, %s images)", job_id, model, len(image_bytes_list))
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    """
+    Estado de un trabajo.
+
+    Returns:
+        Dictionary con estado, paso actual, intentos, marcas de tiempo y
+        caracteres generados por paso hasta el momento
+    """
+    return _job_status(_get_job(job_id))
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    """
+    Resultado de un trabajo terminado.
+
+    Returns:
+        Dictionary con el texto final (salida del último paso), las salidas de
+        cada paso, el error si lo hubo y el desglose de tiempos
+
+    Raises:
+        HTTPException: 404 si no existe, 409 si aún no ha terminado
+    """
+    job = _get_job(job_id)
+    if job["status"] not in FINISHED:
+        return JSONResponse(status_code=409, content=_job_status(job))
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job_result(job),
+        "outputs": job["outputs"],
+        "error": job["error"],
+        "timing": job["timing"],
+    }
+
+
+def _final_events(job: Dict[str, Any]) -> Iterator[str]:
+    if job["error"]:
+        yield f"data: [ERROR] {job['error']}\n\n"
+        return
+    yield _sse_event("stats", job["timing"] or {})
+    yield "data: [DONE]\n\n"
+
+
+def _follow_channel(channel) -> Iterator[str]:
+    failed = False
+    for kind, data in channel.follow():
+        if kind is None:
+            yield ": keep-alive\n\n"
+        elif kind == CHUNK:
+            yield _sse_data(data)
+        elif kind == ERROR:
+            failed = True
+            yield f"data: [ERROR] {data}\n\n"
+        elif kind == END and not failed:
+            yield _sse_event("stats", data)
+            yield "data: [DONE]\n\n"
+
+
+def _follow_store(job_id: str) -> Iterator[str]:
+    """
+    Sigue un trabajo en cola o en otro worker leyendo su salida parcial guardada.
+
+    Si el trabajo se vuelve a ejecutar (otro intento tras un reinicio), su
+    salida empieza de cero: se envía un evento "reset" y se reenvía desde el
+    principio.
+    """
+    sent: Dict[int, int] = {}
+    attempts = None
+    while True:
+        job = job_store.get(job_id)
+        if attempts is not None and job["attempts"] != attempts and sent:
+            yield _sse_event("reset", {"attempt": job["attempts"]})
+            sent = {}
+        attempts = job["attempts"]
+        channel = get_channel(job_id)
+        if channel is not None:
+            # Ha empezado en este worker mientras esperábamos: el canal lo entrega todo
+            if sent:
+                yield _sse_event("reset", {"attempt": job["attempts"]})
+            yield from _follow_channel(channel)
+            return
+        # Los chunks guardados solo crecen (el último) o se añaden al final
+        for index, chunk in enumerate(replay_chunks(job)):
+            offset = sent.get(index, 0)
+            if len(chunk) > offset:
+                yield _sse_data(chunk[offset:])
+                sent[index] = len(chunk)
+        if job["status"] in FINISHED:
+            yield from _final_events(job)
+            return
+        yield ": keep-alive\n\n"
+        time.sleep(JOBS_POLL_INTERVAL)
+
+
+@router.get("/{job_id}/stream")
+def stream_job(job_id: str):
+    """
+    Se conecta al stream de un trabajo con el mismo formato SSE que /generate/stream.
+
+    Si el trabajo ya ha terminado se reproduce su salida completa; si está en
+    curso se reciben primero los chunks ya generados y luego los nuevos.
+
+    Returns:
+        StreamingResponse con los chunks del trabajo, el evento "stats" y [DONE]
+    """
+    job = _get_job(job_id)
+
+    def event_generator():
+        channel = get_channel(job_id)
+        if channel is not None:
+            yield from _follow_channel(channel)
+        elif job["status"] in FINISHED:
+            for chunk in replay_chunks(job):
+                yield _sse_data(chunk)
+            yield from _final_events(job)
+        else:
+            yield from _follow_store(job_id)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
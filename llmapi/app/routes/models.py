@@ -1,8 +1,9 @@
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query
 from app.services.ollama_service import list_models, unload_model, select_best_models
 from app.schemas.generate_request import UnloadRequest, UnloadResponse
 from app.core.logger import logger
+from app.core.model_stats import model_stats
 
 router = APIRouter()
 
@@ -22,7 +23,7 @@ def get_models():
         models_data = list_models()
         
         if "error" in models_data:
-            logger.error(f"Error fetching models: {models_data.get('error')}")
+            logger.error("Error fetching models: %s", models_data.get('error'))
             raise HTTPException(
                 status_code=503,
                 detail=models_data.get("error", "No se pudo conectar con Ollama")
@@ -41,19 +42,33 @@ def get_models():
 
 
 @router.get("/auto-select", response_model=Dict[str, Any])
-def get_auto_selected_models():
+def get_auto_selected_models(
+    policy: Optional[str] = Query(None, description="largest, fastest, largest_under_slo o quality_throughput"),
+    slo_seconds: Optional[float] = Query(None, gt=0, description="Duración máxima para largest_under_slo"),
+    prompt_tokens: Optional[int] = Query(None, ge=0, description="Tokens de entrada de la petición de referencia"),
+    output_tokens: Optional[int] = Query(None, ge=1, description="Tokens de salida de la petición de referencia")
+):
     """
     Selecciona automáticamente los mejores modelos disponibles.
-    Devuelve el mejor modelo con visión y el mejor modelo de código.
+    Devuelve el mejor modelo con visión y el mejor modelo de código según la política.
+    
+    Args:
+        policy: Política de selección (por defecto MODEL_SELECTION_POLICY)
+        slo_seconds: SLO para largest_under_slo (por defecto MODEL_SELECTION_SLO_SECONDS)
+        prompt_tokens: Tokens de entrada de la petición de referencia
+        output_tokens: Tokens de salida de la petición de referencia
     
     Returns:
-        Dictionary con 'auto_available' (bool) y opcionalmente 'vision_model' y 'coding_model'
+        Dictionary con 'auto_available' (bool) y opcionalmente 'vision_model',
+        'coding_model', 'policy', 'fallback' (motivo por rol si la política no
+        pudo aplicarse), 'unmeasured' (candidatos por rol aún sin muestras) y
+        'performance' (rendimiento medido de cada modelo elegido)
         
     Raises:
-        HTTPException: Si hay error al seleccionar los modelos
+        HTTPException: 400 si la política no existe, 500 si hay error al seleccionar los modelos
     """
     try:
-        selected_models = select_best_models()
+        selected_models = select_best_models(policy, slo_seconds, prompt_tokens, output_tokens)
         
         if selected_models is None:
             logger.info("Auto mode not available: insufficient models")
@@ -61,13 +76,26 @@ def get_auto_selected_models():
                 "auto_available": False
             }
         
-        logger.info(f"Auto-selected models: {selected_models}")
-        return {
+        logger.info("Auto-selected models: %s", selected_models)
+        vision_model = selected_models["vision_model"]
+        coding_model = selected_models["coding_model"]
+        result = {
             "auto_available": True,
-            "vision_model": selected_models["vision_model"],
-            "coding_model": selected_models["coding_model"]
+            "vision_model": vision_model,
+            "coding_model": coding_model,
+            "policy": selected_models.get("policy"),
+            "performance": {
+                vision_model: model_stats.get(vision_model),
+                coding_model: model_stats.get(coding_model)
+            }
         }
+        for key in ("fallback", "unmeasured"):
+            if selected_models.get(key):
+                result[key] = selected_models[key]
+        return result
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Unexpected error in /models/auto-select")
         raise HTTPException(
@@ -76,6 +104,19 @@ def get_auto_selected_models():
         )
 
 
+@router.get("/performance", response_model=Dict[str, Any])
+def get_model_performance():
+    """
+    Rendimiento medido de cada modelo en este worker.
+    
+    Returns:
+        Dictionary con, por modelo, el número de muestras, la mediana del tiempo
+        de carga y de las velocidades de prompt y de generación (tokens/s), y si
+        tiene muestras suficientes para las políticas basadas en mediciones
+    """
+    return {"models": model_stats.snapshot()}
+
+
 @router.post("/unload", response_model=UnloadResponse)
 def unload_model_endpoint(request: UnloadRequest):
     """
@@ -95,11 +136,11 @@ def unload_model_endpoint(request: UnloadRequest):
         HTTPException: Si hay error al descargar el modelo
     """
     try:
-        logger.info(f"Request to unload model: {request.model}")
+        logger.info("Request to unload model: %s", request.model)
         result = unload_model(request.model)
         
         if not result.get("success"):
-            logger.error(f"Failed to unload model: {result.get('error')}")
+            logger.error("Failed to unload model: %s", result.get('error'))
             raise HTTPException(
                 status_code=503,
                 detail=result.get("error", "No se pudo descargar el modelo")
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional
+from app.core.config import BATCH_MAX_CONCURRENCY, BATCH_MAX_ITEMS
+from app.services.model_options import validate_overrides
 
 
 class GenerateRequest(BaseModel):
@@ -69,3 +71,35 @@ class UnloadResponse(BaseModel):
                 "model": "qwen2-vl"
             }
         }
+
+
+class BatchItem(BaseModel):
+    """One generation inside a batch"""
+    model: str = Field(..., description="Nombre del modelo de Ollama a utilizar")
+    prompt: str = Field(..., description="Texto del prompt")
+    images: Optional[List[str]] = Field(None, description="Imágenes en base64 (hasta 5)")
+    options: Optional[Dict[str, Any]] = Field(
+        None, description="Opciones de Ollama: num_ctx, num_predict, temperature, seed, keep_alive, num_thread"
+    )
+
+    @field_validator("options")
+    @classmethod
+    def _validate_options(cls, options):
+        return validate_overrides(options)
+
+
+class BatchRequest(BaseModel):
+    """Request model for batch generation"""
+    items: List[BatchItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+    concurrency: int = Field(4, ge=1, le=BATCH_MAX_CONCURRENCY, description="Elementos en curso a la vez")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {"model": "qwen2.5-coder:14b", "prompt": "Genera una clase Java Usuario"},
+                    {"model": "qwen2.5-coder:14b", "prompt": "Genera una clase Java Pedido", "options": {"temperature": 0}}
+                ],
+                "concurrency": 4
+            }
+        }
@@ -0,0 +1,238 @@
+"""
+Arranque de producción del servicio.
+
+Uso:
+    python -m app.server                           # servidor con varios workers
+    python -m app.server --workers 4 --port 8001
+    python -m app.server --uds /run/llmapi.sock    # socket Unix (mismo host que el gateway)
+    python -m app.server --measure-startup         # tiempo de arranque en frío
+    python -m app.server --measure-startup --budget-ms 1500
+
+A diferencia de `python -m app.main` (un proceso con recarga automática),
+este modo:
+- calcula el número de workers a partir de las CPUs disponibles y WORKERS/WORKERS_MAX,
+- usa uvloop y httptools si están instalados,
+- ajusta keep-alive y backlog,
+- al recibir SIGTERM deja de aceptar conexiones y espera hasta GRACEFUL_TIMEOUT
+  a que terminen los streams SSE en curso,
+- recicla cada worker tras WORKER_MAX_REQUESTS peticiones o al superar
+  WORKER_MAX_RSS_MB de RSS (ver app.core.recycling).
+
+Cada worker es un proceso independiente: métricas, cachés y estado de
+precalentamiento son por worker. También las sesiones de stream: los workers
+comparten el socket y el kernel reparte las conexiones, así que una
+reanudación con Last-Event-ID puede llegar a otro worker y recibir 404 (el
+gateway la reintenta hasta STREAM_RESUME_ATTEMPTS veces). Para reanudaciones
+garantizadas, WORKERS=1 o /jobs, que persiste en SQLite.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+from app.core.config import (
+    BACKLOG,
+    GRACEFUL_TIMEOUT,
+    HOST,
+    KEEPALIVE_TIMEOUT,
+    PORT,
+    UDS,
+    WORKER_MAX_REQUESTS,
+    WORKER_MAX_REQUESTS_JITTER,
+    WORKERS,
+    WORKERS_MAX,
+)
+from app.core.logger import logger
+
+APP = "app.main:app"
+
+
+def available_cpus() -> int:
+    """CPUs que puede usar el proceso (respeta la afinidad en contenedores)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def resolve_workers(configured: int = WORKERS, maximum: int = WORKERS_MAX, cpus: Optional[int] = None) -> int:
+    """
+    Número de workers a lanzar.
+
+    El trabajo de cada petición es sobre todo espera a Ollama, así que basta un
+    worker por CPU; el máximo evita multiplicar la memoria en máquinas grandes.
+
+    Args:
+        configured: Valor fijo; 0 para calcularlo automáticamente
+        maximum: Límite superior en modo automático (0 = sin límite)
+        cpus: CPUs disponibles (por defecto, las del proceso)
+    """
+    if configured > 0:
+        return configured
+    workers = cpus if cpus is not None else available_cpus()
+    if maximum > 0:
+        workers = min(workers, maximum)
+    return max(workers, 1)
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def build_config_kwargs(
+    host: str = HOST,
+    port: int = PORT,
+    workers: int = 0,
+    uds: str = UDS
+) -> Dict[str, Any]:
+    """Argumentos de uvicorn.Config para el modo producción (con uds se ignoran host y port)."""
+    kwargs: Dict[str, Any] = {
+        "app": APP,
+        "host": host,
+        "port": port,
+        "workers": resolve_workers(workers),
+        "loop": "uvloop" if _has_module("uvloop") else "asyncio",
+        "http": "httptools" if _has_module("httptools") else "h11",
+        "timeout_keep_alive": KEEPALIVE_TIMEOUT,
+        "backlog": BACKLOG,
+        "timeout_graceful_shutdown": GRACEFUL_TIMEOUT,
+        "proxy_headers": True,
+        "access_log": False,
+    }
+    if uds:
+        kwargs["uds"] = uds
+    if WORKER_MAX_REQUESTS > 0:
+        kwargs["limit_max_requests"] = WORKER_MAX_REQUESTS
+        kwargs["limit_max_requests_jitter"] = WORKER_MAX_REQUESTS_JITTER
+    return kwargs
+
+
+def remove_stale_socket(path: str) -> None:
+    """
+    Borra el fichero de un socket Unix que ya no tiene servidor.
+
+    Tras una parada brusca el fichero se queda en disco y bind() fallaría.
+
+    Raises:
+        RuntimeError: Si otro proceso sigue escuchando en ese socket o la ruta
+            no es un socket
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{path} existe y no es un socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Ya hay un servidor escuchando en {path}")
+
+
+def serve(**kwargs) -> None:
+    """
+    Lanza el servidor bajo el supervisor de procesos de uvicorn.
+
+    Se usa el supervisor incluso con un solo worker para que los workers que
+    salen por reciclado (peticiones o RSS) se vuelvan a arrancar.
+    """
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    config = uvicorn.Config(**build_config_kwargs(**kwargs))
+    if config.uds:
+        remove_stale_socket(config.uds)
+    listen = f"unix:{config.uds}" if config.uds else f"{config.host}:{config.port}"
+    logger.info(
+        "Servidor de producción en %s: %s workers, loop=%s, http=%s, keep-alive=%ss, backlog=%s, "
+        "apagado ordenado=%ss",
+        listen, config.workers, config.loop, config.http, config.timeout_keep_alive, config.backlog,
+        config.timeout_graceful_shutdown
+    )
+    sock = config.bind_socket()
+    try:
+        Multiprocess(config, sockets=[sock]).run()
+    except KeyboardInterrupt:
+        pass
+
+
+# ─── Tiempo de arranque ───────────────────────────────────────────────────────
+
+_STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import fastapi, starlette, uvicorn, requests
+t1 = time.perf_counter()
+import app.main
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": round((t1 - t0) * 1000, 1), "app_ms": round((t2 - t1) * 1000, 1)}))
+"""
+
+
+def measure_startup(runs: int = 3) -> Dict[str, Any]:
+    """
+    Mide el arranque en frío en procesos nuevos.
+
+    import_ms es la importación de las dependencias (FastAPI, uvicorn, requests);
+    app_ms es la importación de la aplicación y la construcción de `app`.
+    Se devuelve la mediana de `runs` ejecuciones.
+    """
+    samples: List[Dict[str, float]] = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", _STARTUP_PROBE],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    def median(key: str) -> float:
+        values = sorted(s[key] for s in samples)
+        return values[len(values) // 2]
+
+    result = {"import_ms": median("import_ms"), "app_ms": median("app_ms"), "runs": runs}
+    result["total_ms"] = round(result["import_ms"] + result["app_ms"], 1)
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Servidor de producción de llmapi")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--uds", default=UDS, help="Escuchar en este socket Unix en lugar de host:port")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="0 = según las CPUs disponibles")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="Medir el tiempo de arranque en frío y salir")
+    parser.add_argument("--runs", type=int, default=3, help="Ejecuciones para --measure-startup")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Con --measure-startup, salir con código 1 si el total lo supera")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.measure_startup:
+        result = measure_startup(args.runs)
+        print(json.dumps(result, indent=2))
+        if args.budget_ms is not None and result["total_ms"] > args.budget_ms:
+            print(f"Arranque de {result['total_ms']} ms por encima del presupuesto de {args.budget_ms} ms")
+            return 1
+        return 0
+
+    serve(host=args.host, port=args.port, workers=args.workers, uds=args.uds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
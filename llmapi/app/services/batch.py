@@ -0,0 +1,118 @@
+"""
+Ejecución de lotes de generaciones.
+
+Cada elemento se ejecuta como una generación en streaming (pasando por el
+planificador de modelos) en el pool de generaciones de fondo, fuera del
+threadpool de las peticiones, acumulando el texto, con un máximo de
+elementos en curso por lote. Los resultados se entregan en orden
+de finalización y un elemento que falla se informa como error sin detener el
+resto.
+"""
+import asyncio
+import base64
+import binascii
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.logger import logger
+from app.core.memory import IMAGES
+from app.core.telemetry import RequestTelemetry
+from app.schemas.generate_request import BatchItem
+from app.services.ollama_service import generate_with_image_stream
+from app.services.scheduler import run_in_background
+
+BATCH_ROUTE = "/generate/batch"
+MAX_IMAGES = 5
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+def _decode_images(images: List[str]) -> List[bytes]:
+    if len(images) > MAX_IMAGES:
+        raise ValueError(f"Máximo {MAX_IMAGES} imágenes permitidas")
+    decoded = []
+    for i, image in enumerate(images):
+        try:
+            data = base64.b64decode(image, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError(f"Imagen {i} no es base64 válido")
+        if len(data) > MAX_IMAGE_BYTES:
+            raise ValueError(f"Imagen {i} demasiado grande. Máximo 10MB")
+        decoded.append(data)
+    return decoded
+
+
+def run_item(index: int, item: BatchItem) -> Dict[str, Any]:
+    """
+    Ejecuta un elemento del lote. Nunca lanza: los errores van en el resultado.
+
+    Returns:
+        Diccionario con index, model, status ("ok"/"error"), result o error y
+        el desglose de tiempos del elemento
+    """
+    telemetry = RequestTelemetry(BATCH_ROUTE, item.model)
+    result: Dict[str, Any] = {"index": index, "model": item.model}
+    try:
+        image_bytes_list = _decode_images(item.images) if item.images else None
+        if image_bytes_list:
+            telemetry.memory.hold(IMAGES, sum(len(img) for img in image_bytes_list))
+        chunks = []
+        for chunk in generate_with_image_stream(
+            model=item.model,
+            prompt=item.prompt,
+            image_bytes_list=image_bytes_list,
+            telemetry=telemetry,
+            options=item.options
+        ):
+            if not chunks:
+                telemetry.first_token()
+            chunks.append(chunk)
+        content = "".join(chunks)
+        if not content:
+            raise ValueError("Respuesta vacía del modelo")
+        telemetry.finish("ok")
+        result.update(status="ok", result=content)
+    except ValueError as e:
+        telemetry.finish("client_error")
+        result.update(status="error", error=str(e))
+    except Exception as e:
+        logger.error("Error en el elemento %s del lote: %s", index, e)
+        telemetry.finish("error")
+        result.update(status="error", error=str(e))
+    result["timing"] = telemetry.breakdown()
+    return result
+
+
+async def run_batch(items: List[BatchItem], concurrency: int) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta los elementos con hasta `concurrency` en curso y los entrega según terminan.
+
+    Al final entrega un resumen con done=True. Si el consumidor se va, los
+    elementos que aún no han empezado se cancelan.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def run(index: int, item: BatchItem) -> Dict[str, Any]:
+        async with semaphore:
+            return await run_in_background(run_item, index, item)
+
+    tasks = [asyncio.ensure_future(run(i, item)) for i, item in enumerate(items)]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] != "ok":
+                failed += 1
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    logger.info("Lote de %s elementos terminado con %s errores", len(items), failed)
+    yield {
+        "done": True,
+        "total": len(items),
+        "succeeded": len(items) - failed,
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,130 @@
+"""
+Seguimiento incremental de bloques de código en la salida en streaming.
+
+El modo estructurado de /generate/stream acompaña cada chunk de eventos
+tipados (texto, inicio de bloque con su lenguaje, contenido del bloque y fin)
+para que el cliente pinte los bloques sin volver a analizar todo el markdown
+acumulado en cada token. Cada chunk se procesa una sola vez: solo se retiene
+el principio de la línea actual mientras todavía podría ser una cerca (```).
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+TEXT = "text"
+CODE_BLOCK_START = "code_block_start"
+CODE_DELTA = "code_delta"
+CODE_BLOCK_END = "code_block_end"
+
+Event = Tuple[str, Dict[str, Any]]
+
+_OPEN_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})\s*([^`\s]*)[^`]*$")
+_OPEN_PREFIX_RE = re.compile(r"^ {0,3}(`*|~*)$")
+
+
+class FenceTracker:
+    """Convierte el texto generado en eventos de texto y de bloques de código."""
+
+    def __init__(self):
+        self.blocks = 0
+        self._held = ""               # principio de la línea actual aún sin decidir
+        self._decided = False         # la línea actual ya se sabe que no es una cerca
+        self._fence: Optional[str] = None
+        self._out: List[str] = []
+
+    def _could_be_fence(self, text: str) -> bool:
+        if self._fence is None:
+            return bool(_OPEN_PREFIX_RE.match(text) or _OPEN_RE.match(text))
+        char = re.escape(self._fence[0])
+        return bool(
+            re.match(rf"^ {{0,3}}{char}*$", text)
+            or re.match(rf"^ {{0,3}}{char}{{{len(self._fence)},}}\s*$", text)
+        )
+
+    def _is_closing(self, line: str) -> bool:
+        stripped = line.strip()
+        return (
+            len(line) - len(line.lstrip(" ")) <= 3
+            and len(stripped) >= len(self._fence)
+            and set(stripped) == {self._fence[0]}
+        )
+
+    def _emit(self, text: str) -> None:
+        if text:
+            self._out.append(text)
+
+    def _flush(self, events: List[Event]) -> None:
+        if not self._out:
+            return
+        text = "".join(self._out)
+        self._out = []
+        if self._fence is None:
+            events.append((TEXT, {"text": text}))
+        else:
+            events.append((CODE_DELTA, {"index": self.blocks - 1, "text": text}))
+
+    def _complete_line(self, events: List[Event], line: str) -> None:
+        if self._fence is None:
+            match = _OPEN_RE.match(line)
+            if match:
+                self._flush(events)
+                self._fence = match.group(1)
+                self.blocks += 1
+                events.append((CODE_BLOCK_START, {"index": self.blocks - 1, "language": match.group(2)}))
+                return
+        elif self._is_closing(line):
+            self._flush(events)
+            self._fence = None
+            events.append((CODE_BLOCK_END, {"index": self.blocks - 1}))
+            return
+        self._emit(line + "\n")
+
+    def feed(self, chunk: str) -> List[Event]:
+        """
+        Procesa un chunk del stream.
+
+        Returns:
+            Eventos (nombre, datos) que el chunk completa, en orden
+        """
+        events: List[Event] = []
+        parts = chunk.split("\n")
+        for position, part in enumerate(parts):
+            if position < len(parts) - 1:
+                if self._decided:
+                    self._emit(part + "\n")
+                else:
+                    self._complete_line(events, self._held + part)
+                self._held = ""
+                self._decided = False
+            elif part:
+                if self._decided:
+                    self._emit(part)
+                else:
+                    self._held += part
+                    if not self._could_be_fence(self._held):
+                        self._emit(self._held)
+                        self._held = ""
+                        self._decided = True
+        self._flush(events)
+        return events
+
+    def finish(self) -> List[Event]:
+        """
+        Cierra el seguimiento al terminar el stream.
+
+        Returns:
+            Eventos pendientes (incluido el fin de un bloque que no se cerró)
+        """
+        events: List[Event] = []
+        if self._held:
+            if self._fence is not None and self._is_closing(self._held):
+                self._flush(events)
+                self._fence = None
+                events.append((CODE_BLOCK_END, {"index": self.blocks - 1}))
+            else:
+                self._emit(self._held)
+            self._held = ""
+        self._flush(events)
+        if self._fence is not None:
+            self._fence = None
+            events.append((CODE_BLOCK_END, {"index": self.blocks - 1}))
+        return events
@@ -0,0 +1,501 @@
+"""
+Trabajos de generación asíncronos.
+
+Un trabajo guarda en SQLite sus entradas (incluidas las imágenes), su salida
+parcial por paso, los tiempos y el resultado final, de modo que el cliente no
+necesita mantener la conexión abierta y el trabajo sobrevive a un reinicio.
+
+Con JOBS_ENABLED, cada worker del servidor ejecuta un JobWorker que reclama
+trabajos en cola de forma atómica y los ejecuta con las mismas funciones de
+servicio que /generate/stream. Mientras un trabajo se ejecuta, sus chunks se
+publican también en un canal en memoria para que /jobs/{id}/stream los reciba
+en vivo.
+
+Cada trabajo en ejecución tiene una concesión: su worker renueva updated_at
+periódicamente y cualquier worker devuelve a la cola los trabajos cuya
+concesión ha caducado (JOBS_LEASE_SECONDS), sea cual sea la máquina o el PID
+con que se reclamaron.
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import (
+    JOBS_CONCURRENCY,
+    JOBS_DB_PATH,
+    JOBS_FLUSH_INTERVAL,
+    JOBS_LEASE_SECONDS,
+    JOBS_MAX_ATTEMPTS,
+    JOBS_POLL_INTERVAL,
+)
+from app.core.logger import logger
+from app.core.metrics import REGISTRY, Counter, Gauge
+from app.core.request_context import request_id_var
+from app.core.telemetry import DEFAULT_STEP, RequestTelemetry
+from app.services.ollama_service import generate_with_image_stream, generate_with_image_stream_auto
+from app.services.scheduler import run_in_background
+
+JOBS_ROUTE = "/jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_jobs_total", "Trabajos terminados por estado", ("status",)
+))
+JOBS_RUNNING = REGISTRY.register(Gauge(
+    "llmapi_jobs_running", "Trabajos ejecutándose en este worker"
+))
+
+# Eventos del canal en vivo
+CHUNK = "chunk"
+ERROR = "error"
+END = "end"
+
+_STEP_MARKERS = {"[STEP1_START]": "step1", "[STEP2_START]": "step2"}
+
+
+def _owner() -> str:
+    # Token único por arranque: tras reiniciar un contenedor los PID se repiten
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# ─── Almacén ──────────────────────────────────────────────────────────────────
+
+class JobStore:
+    """Persistencia de trabajos en un fichero SQLite compartido por los workers."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, inputs TEXT NOT NULL,"
+                " step TEXT, outputs TEXT NOT NULL DEFAULT '{}', error TEXT, timing TEXT,"
+                " owner TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL, started_at REAL, finished_at REAL, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_images ("
+                " job_id TEXT NOT NULL, position INTEGER NOT NULL, data BLOB NOT NULL,"
+                " PRIMARY KEY (job_id, position))"
+            )
+            self._initialized = True
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["inputs"] = json.loads(job["inputs"])
+        job["outputs"] = json.loads(job["outputs"])
+        job["timing"] = json.loads(job["timing"]) if job["timing"] else None
+        return job
+
+    def create(self, inputs: Dict[str, Any], images: Optional[List[bytes]] = None) -> str:
+        """Registra un trabajo en cola y devuelve su identificador."""
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, inputs, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(inputs), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_images (job_id, position, data) VALUES (?, ?, ?)",
+                [(job_id, i, data) for i, data in enumerate(images or [])]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._row(self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def images(self, job_id: str) -> List[bytes]:
+        rows = self._conn().execute(
+            "SELECT data FROM job_images WHERE job_id = ? ORDER BY position", (job_id,)
+        ).fetchall()
+        return [bytes(row["data"]) for row in rows]
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Pasa a "running" el trabajo en cola más antiguo y lo devuelve (atómico entre procesos)."""
+        conn = self._conn()
+        # Lectura sin bloqueo de escritura: con la cola vacía no se toma el lock
+        if conn.execute("SELECT 1 FROM jobs WHERE status = ? LIMIT 1", (QUEUED,)).fetchone() is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1,"
+                " started_at = ?, updated_at = ?, step = NULL, outputs = '{}' WHERE id = ?",
+                (RUNNING, owner, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def update_progress(self, job_id: str, step: Optional[str], outputs: Dict[str, str]) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET step = ?, outputs = ?, updated_at = ? WHERE id = ?",
+            (step, json.dumps(outputs), time.time(), job_id)
+        )
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        outputs: Dict[str, str],
+        error: Optional[str] = None,
+        timing: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Guarda el resultado final y borra las imágenes, que ya no se necesitan."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, outputs = ?, error = ?, timing = ?,"
+                " finished_at = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(outputs), error, json.dumps(timing) if timing else None, now, now, job_id)
+            )
+            conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, owner: str) -> int:
+        """Renueva la concesión de los trabajos en ejecución de un worker."""
+        return self._conn().execute(
+            "UPDATE jobs SET updated_at = ? WHERE status = ? AND owner = ?",
+            (time.time(), RUNNING, owner)
+        ).rowcount
+
+    def requeue_orphans(self, lease: float = JOBS_LEASE_SECONDS, max_attempts: int = JOBS_MAX_ATTEMPTS) -> int:
+        """
+        Devuelve a la cola los trabajos "running" con la concesión caducada.
+
+        Un trabajo cuyo worker no ha renovado updated_at en `lease` segundos
+        se da por interrumpido; los que superan max_attempts se marcan como
+        fallidos.
+
+        Returns:
+            Número de trabajos recuperados
+        """
+        conn = self._conn()
+        cutoff = time.time() - lease
+        requeued = 0
+        rows = conn.execute(
+            "SELECT id, attempts FROM jobs WHERE status = ? AND updated_at < ?", (RUNNING, cutoff)
+        ).fetchall()
+        for row in rows:
+            if row["attempts"] >= max_attempts:
+                self.finish(row["id"], FAILED, {}, error="Interrumpido demasiadas veces por reinicios")
+                continue
+            # La condición evita pisar una renovación o la recuperación de otro worker
+            requeued += conn.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, step = NULL, outputs = '{}', updated_at = ?"
+                " WHERE id = ? AND status = ? AND updated_at < ?",
+                (QUEUED, time.time(), row["id"], RUNNING, cutoff)
+            ).rowcount
+        return requeued
+
+
+# ─── Canal en vivo ────────────────────────────────────────────────────────────
+
+class JobChannel:
+    """Eventos de un trabajo en ejecución para los clientes conectados a su stream."""
+
+    def __init__(self):
+        self.events: List[Tuple[str, Any]] = []
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def publish(self, kind: str, data: Any = None) -> None:
+        with self._cond:
+            self.events.append((kind, data))
+            if kind == END:
+                self.closed = True
+            self._cond.notify_all()
+
+    def follow(self, timeout: float = 15.0) -> Iterator[Tuple[str, Any]]:
+        """
+        Entrega todos los eventos desde el principio y luego los nuevos hasta END.
+
+        Entrega (None, None) si pasan `timeout` segundos sin eventos, para que el
+        llamador pueda mantener viva la conexión.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                if index >= len(self.events) and not self.closed:
+                    self._cond.wait(timeout)
+                pending = self.events[index:]
+                index += len(pending)
+                closed = self.closed
+            if not pending and not closed:
+                yield None, None
+            for event in pending:
+                yield event
+            if closed and index >= len(self.events):
+                return
+
+
+_channels: Dict[str, JobChannel] = {}
+
+
+def get_channel(job_id: str) -> Optional[JobChannel]:
+    """Canal en vivo del trabajo si se está ejecutando en este worker."""
+    return _channels.get(job_id)
+
+
+# ─── Ejecución ────────────────────────────────────────────────────────────────
+
+def replay_chunks(job: Dict[str, Any]) -> List[str]:
+    """Reconstruye la secuencia de chunks (con marcadores de paso) a partir de las salidas guardadas."""
+    outputs = job["outputs"]
+    if not job["inputs"].get("auto_mode"):
+        return [outputs[DEFAULT_STEP]] if outputs.get(DEFAULT_STEP) else []
+    chunks = []
+    if "step1" in outputs:
+        chunks += ["[STEP1_START]", outputs["step1"]]
+    if "step2" in outputs:
+        chunks += ["[STEP1_END]", "[STEP2_START]", outputs["step2"]]
+    return [chunk for chunk in chunks if chunk]
+
+
+def job_result(job: Dict[str, Any]) -> Optional[str]:
+    """Texto final del trabajo: la salida del último paso."""
+    outputs = job["outputs"]
+    for step in ("step2", "step1", DEFAULT_STEP):
+        if outputs.get(step):
+            return outputs[step]
+    return None
+
+
+def run_job(store: JobStore, job: Dict[str, Any], flush_interval: float = JOBS_FLUSH_INTERVAL) -> str:
+    """
+    Ejecuta un trabajo reclamado, guardando la salida parcial y el resultado.
+
+    Returns:
+        Estado final ("done" o "failed")
+    """
+    job_id = job["id"]
+    inputs = job["inputs"]
+    auto = inputs.get("auto_mode", False)
+    channel = JobChannel()
+    _channels[job_id] = channel
+    telemetry = RequestTelemetry(JOBS_ROUTE, "auto" if auto else inputs.get("model"))
+    parts: Dict[str, List[str]] = {}
+    step = "step1" if auto else DEFAULT_STEP
+    status, error = DONE, None
+
+    def outputs() -> Dict[str, str]:
+        return {name: "".join(chunks) for name, chunks in parts.items()}
+
+    JOBS_RUNNING.inc()
+    try:
+        images = store.images(job_id)
+        if auto:
+            chunks = generate_with_image_stream_auto(
+                prompt=inputs["prompt"],
+                image_bytes_list=images,
+                message_history=inputs.get("messages") or [],
+                vision_model_override=inputs.get("vision_model"),
+                coding_model_override=inputs.get("coding_model"),
+                telemetry=telemetry,
+                options=inputs.get("options")
+            )
+        else:
+            chunks = generate_with_image_stream(
+                model=inputs["model"],
+                prompt=inputs["prompt"],
+                image_bytes_list=images,
+                message_history=inputs.get("messages") or [],
+                telemetry=telemetry,
+                options=inputs.get("options")
+            )
+        images = None
+        last_flush = time.monotonic()
+        try:
+            for chunk in chunks:
+                channel.publish(CHUNK, chunk)
+                if chunk.startswith("[STEP"):
+                    step = _STEP_MARKERS.get(chunk, step)
+                    continue
+                if not parts:
+                    telemetry.first_token()
+                parts.setdefault(step, []).append(chunk)
+                if time.monotonic() - last_flush >= flush_interval:
+                    store.update_progress(job_id, step, outputs())
+                    last_flush = time.monotonic()
+        except ValueError as ve:
+            # Ninguna imagen es un diagrama: mismo resultado que en /generate/stream
+            if not auto:
+                raise
+            logger.warning("Trabajo %s: %s", job_id, ve)
+            channel.publish(CHUNK, str(ve))
+            parts.setdefault(step, []).append(str(ve))
+        telemetry.finish("ok")
+    except Exception as e:
+        logger.error("Error en el trabajo %s: %s", job_id, e)
+        status, error = FAILED, str(e)
+        telemetry.finish("error")
+        channel.publish(ERROR, error)
+    finally:
+        JOBS_RUNNING.dec()
+        timing = telemetry.breakdown()
+        if job.get("started_at"):
+            timing["job_queue_ms"] = round((job["started_at"] - job["created_at"]) * 1000, 2)
+        store.finish(job_id, status, outputs(), error=error, timing=timing)
+        JOBS_TOTAL.inc(status=status)
+        channel.publish(END, timing)
+        _channels.pop(job_id, None)
+    return status
+
+
+class JobWorker:
+    """
+    Reclama y ejecuta trabajos en cola dentro de un worker del servidor.
+
+    Un solo bucle reclama trabajos mientras haya hueco (hasta `concurrency` en
+    ejecución) y otro renueva la concesión de los propios y recupera los de
+    workers caídos.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        concurrency: int = JOBS_CONCURRENCY,
+        poll_interval: float = JOBS_POLL_INTERVAL,
+        lease: float = JOBS_LEASE_SECONDS
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = _owner()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        """Recupera los trabajos huérfanos y arranca los bucles (llamar desde una corrutina)."""
+        if self._tasks:
+            return
+        await self._requeue_orphans()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._claim_loop()), asyncio.create_task(self._lease_loop())]
+
+    async def stop(self) -> None:
+        tasks = self._tasks + list(self._running)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._running.clear()
+
+    def notify(self) -> None:
+        """Avisa de un trabajo nuevo para no esperar al siguiente sondeo."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _requeue_orphans(self) -> None:
+        requeued = await run_in_threadpool(self.store.requeue_orphans, self.lease)
+        if requeued:
+            logger.info("%s trabajos interrumpidos devueltos a la cola", requeued)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        # Los logs del trabajo llevan su id como id de petición
+        token = request_id_var.set(f"job:{job['id']}")
+        try:
+            await run_in_background(run_job, self.store, job)
+        finally:
+            request_id_var.reset(token)
+
+    async def _claim_loop(self) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            try:
+                job = await run_in_threadpool(self.store.claim, self.owner)
+            except Exception:
+                logger.exception("Error reclamando trabajos")
+                job = None
+            if job is not None:
+                task = asyncio.create_task(self._run(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+                task.add_done_callback(lambda _: slots.release())
+                continue
+            slots.release()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _lease_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                if self._running:
+                    await run_in_threadpool(self.store.heartbeat, self.owner)
+                await self._requeue_orphans()
+            except Exception:
+                logger.exception("Error renovando la concesión de los trabajos")
+
+
+job_store = JobStore()
+job_worker = JobWorker(job_store)
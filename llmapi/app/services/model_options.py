@@ -0,0 +1,179 @@
+"""
+Opciones de Ollama por modelo y por petición.
+
+Las opciones de cada payload se componen, de menor a mayor prioridad, de:
+
+1. El perfil del modelo (MODEL_PROFILES: JSON con patrones tipo fnmatch,
+   p. ej. {"qwen2.5-coder:*": {"temperature": 0.2}, "*": {"num_thread": 8}}).
+2. Los valores que deriva el servicio (p. ej. el límite de tokens del paso de
+   visión).
+3. Las opciones de la petición, limitadas a un conjunto seguro y validadas.
+
+Si al final no hay num_ctx, se dimensiona con la estimación del prompt más la
+salida esperada, redondeada al siguiente tamaño de NUM_CTX_BUCKETS: así un
+prompt corto no reserva una caché KV enorme y peticiones parecidas reutilizan
+el mismo runner de Ollama (cambiar num_ctx obliga a recargar el modelo).
+"""
+import fnmatch
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from app.core.config import (
+    MODEL_PROFILES,
+    NUM_CTX_AUTO,
+    NUM_CTX_BUCKETS,
+    NUM_CTX_IMAGE_TOKENS,
+    NUM_CTX_OUTPUT_TOKENS,
+)
+from app.core.logger import logger
+from app.services.plantuml import estimate_tokens
+
+# Opciones que puede fijar una petición: (tipo, mínimo, máximo)
+_NUMERIC_OVERRIDES = {
+    "num_ctx": (int, 256, NUM_CTX_BUCKETS[-1]),
+    "num_predict": (int, -1, NUM_CTX_BUCKETS[-1]),
+    "temperature": (float, 0.0, 2.0),
+    "seed": (int, 0, 2 ** 31 - 1),
+    "num_thread": (int, 1, 256),
+}
+# keep_alive va en el payload, no en options: "30s", "5m", "1h" o segundos
+_KEEP_ALIVE_RE = re.compile(r"^\d+(\.\d+)?(ms|s|m|h)?$")
+
+
+def _load_profiles(raw: str) -> Dict[str, Dict[str, Any]]:
+    if not raw:
+        return {}
+    try:
+        profiles = json.loads(raw)
+    except json.JSONDecodeError as e:
+        logger.error("MODEL_PROFILES no es JSON válido, se ignora: %s", e)
+        return {}
+    if not isinstance(profiles, dict) or not all(isinstance(v, dict) for v in profiles.values()):
+        logger.error("MODEL_PROFILES debe ser un objeto {patrón: {opción: valor}}, se ignora")
+        return {}
+    return profiles
+
+
+_profiles = _load_profiles(MODEL_PROFILES)
+
+
+def validate_overrides(overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valida las opciones de una petición.
+
+    Args:
+        overrides: Opciones recibidas (num_ctx, num_predict, temperature, seed,
+            keep_alive, num_thread)
+
+    Returns:
+        Opciones normalizadas
+
+    Raises:
+        ValueError: Si hay opciones no permitidas o fuera de rango
+    """
+    if not overrides:
+        return {}
+    if not isinstance(overrides, dict):
+        raise ValueError("Las opciones deben ser un objeto JSON")
+    result: Dict[str, Any] = {}
+    for key, value in overrides.items():
+        if key == "keep_alive":
+            if not isinstance(value, (str, int)) or isinstance(value, bool) or not _KEEP_ALIVE_RE.match(str(value)):
+                raise ValueError("keep_alive debe ser una duración como \"5m\" o un número de segundos")
+            result[key] = value
+            continue
+        if key not in _NUMERIC_OVERRIDES:
+            allowed = ", ".join(sorted([*_NUMERIC_OVERRIDES, "keep_alive"]))
+            raise ValueError(f"Opción no permitida: {key} (permitidas: {allowed})")
+        kind, minimum, maximum = _NUMERIC_OVERRIDES[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and value != int(value)):
+            raise ValueError(f"{key} debe ser {'un entero' if kind is int else 'un número'}")
+        if not minimum <= value <= maximum:
+            raise ValueError(f"{key} debe estar entre {minimum} y {maximum}")
+        result[key] = kind(value)
+    return result
+
+
+def parse_overrides(raw: Optional[str]) -> Dict[str, Any]:
+    """
+    Valida las opciones recibidas como JSON en un campo de formulario.
+
+    Raises:
+        ValueError: Si no es JSON válido o alguna opción no es válida
+    """
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Opciones no válidas: {str(e)}")
+    return validate_overrides(overrides)
+
+
+def profile_for(model: str) -> Dict[str, Any]:
+    """Opciones del perfil del modelo (se combinan todos los patrones que encajan, el más específico gana)."""
+    options: Dict[str, Any] = {}
+    matches = [pattern for pattern in _profiles if fnmatch.fnmatchcase(model, pattern)]
+    # Los patrones con menos comodines y más largos se aplican después
+    for pattern in sorted(matches, key=lambda p: (-p.count("*") - p.count("?"), len(p))):
+        options.update(_profiles[pattern])
+    return options
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Tokens aproximados de los mensajes (texto e imágenes)."""
+    tokens = 0
+    for message in messages:
+        tokens += estimate_tokens(message.get("content") or "") + 4
+        tokens += NUM_CTX_IMAGE_TOKENS * len(message.get("images") or ())
+    return tokens
+
+
+def context_size(prompt_tokens: int, output_tokens: int) -> int:
+    """Menor tamaño de NUM_CTX_BUCKETS que admite prompt y salida (el mayor si ninguno basta)."""
+    needed = prompt_tokens + output_tokens
+    for bucket in NUM_CTX_BUCKETS:
+        if bucket >= needed:
+            return bucket
+    logger.warning(
+        "Estimated context of %s tokens exceeds the largest bucket (%s); Ollama will truncate the prompt",
+        needed, NUM_CTX_BUCKETS[-1]
+    )
+    return NUM_CTX_BUCKETS[-1]
+
+
+def apply_options(
+    payload: Dict[str, Any],
+    overrides: Optional[Dict[str, Any]] = None,
+    defaults: Optional[Dict[str, Any]] = None,
+    prompt_tokens: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Completa las opciones (y keep_alive) de un payload de /api/chat.
+
+    Args:
+        payload: Payload con model y messages; se modifica en el sitio
+        overrides: Opciones ya validadas de la petición
+        defaults: Opciones derivadas por el servicio (sobre el perfil)
+        prompt_tokens: Tokens del prompt para dimensionar num_ctx; por defecto
+            se estiman a partir de messages
+
+    Returns:
+        El mismo payload
+    """
+    options = profile_for(payload["model"])
+    options.update(defaults or {})
+    options.update(overrides or {})
+    keep_alive = options.pop("keep_alive", None)
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if "num_ctx" not in options and NUM_CTX_AUTO:
+        predict = options.get("num_predict", -1)
+        output = predict if predict > 0 else NUM_CTX_OUTPUT_TOKENS
+        if prompt_tokens is None:
+            prompt_tokens = estimate_prompt_tokens(payload["messages"])
+        options["num_ctx"] = context_size(prompt_tokens, output)
+    if options:
+        payload["options"] = options
+    return payload
@@ -0,0 +1,189 @@
+"""
+Políticas de selección automática de modelos.
+
+- largest: el de más parámetros según el nombre (comportamiento original).
+- fastest: el de mayor velocidad de generación medida.
+- largest_under_slo: el más grande cuya duración estimada para una petición de
+  referencia (prompt_tokens de entrada y output_tokens de salida) cabe en el SLO;
+  si ninguno cabe, el más rápido.
+- quality_throughput: el de mayor media geométrica entre tamaño y velocidad
+  (un modelo el doble de grande compensa si es como mucho la mitad de lento).
+
+Las políticas basadas en mediciones solo consideran modelos con muestras
+suficientes (ver app.core.model_stats); si no hay ninguno se usa largest. Los
+candidatos sin medir no se eligen hasta que atiendan peticiones reales, así
+que unmeasured los devuelve para mostrarlos junto a la selección.
+
+Además, route_for_latency decide por petición si el modelo preferido, con su
+cola actual, termina dentro del objetivo de latencia del cliente o si conviene
+servirla con un modelo equivalente más pequeño.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import (
+    MODEL_SELECTION_OUTPUT_TOKENS,
+    MODEL_SELECTION_POLICY,
+    MODEL_SELECTION_PROMPT_TOKENS,
+    MODEL_SELECTION_SLO_SECONDS,
+)
+from app.core.logger import logger
+from app.core.metrics import REGISTRY, Counter
+from app.core.model_stats import model_stats
+from app.services.scheduler import scheduler
+
+QUEUE_REROUTES_TOTAL = REGISTRY.register(Counter(
+    "llmapi_queue_reroutes_total",
+    "Peticiones servidas por un modelo más pequeño por la cola del preferido", ("requested", "served")
+))
+
+LARGEST = "largest"
+FASTEST = "fastest"
+LARGEST_UNDER_SLO = "largest_under_slo"
+QUALITY_THROUGHPUT = "quality_throughput"
+POLICIES = (LARGEST, FASTEST, LARGEST_UNDER_SLO, QUALITY_THROUGHPUT)
+
+# Motivos por los que una política no pudo aplicarse tal cual
+NOT_MEASURED = "not_measured"
+SLO_UNREACHABLE = "slo_unreachable"
+
+
+def validate_policy(policy: str) -> str:
+    """
+    Raises:
+        ValueError: Si la política no existe
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Política desconocida: {policy} (disponibles: {', '.join(POLICIES)})")
+    return policy
+
+
+if MODEL_SELECTION_POLICY in POLICIES:
+    DEFAULT_POLICY = MODEL_SELECTION_POLICY
+else:
+    logger.error("MODEL_SELECTION_POLICY desconocida (%s), se usa %s", MODEL_SELECTION_POLICY, LARGEST)
+    DEFAULT_POLICY = LARGEST
+
+
+def choose_model(
+    candidates: List[Tuple[str, int]],
+    policy: str = LARGEST,
+    slo_seconds: Optional[float] = None,
+    prompt_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Elige un modelo entre los candidatos según la política.
+
+    Args:
+        candidates: Pares (nombre, tamaño en miles de millones de parámetros)
+        policy: Una de POLICIES
+        slo_seconds: Duración máxima para largest_under_slo
+        prompt_tokens: Tokens de entrada de la petición de referencia
+        output_tokens: Tokens de salida de la petición de referencia
+
+    Returns:
+        (modelo elegido o None si no hay candidatos, motivo de la alternativa
+        usada o None si la política se aplicó tal cual)
+    """
+    if not candidates:
+        return None, None
+    largest = max(candidates, key=lambda c: c[1])[0]
+    if policy == LARGEST:
+        return largest, None
+
+    measured = [(name, size, model_stats.get(name)) for name, size in candidates]
+    measured = [(name, size, summary) for name, size, summary in measured if summary is not None]
+    if not measured:
+        return largest, NOT_MEASURED
+
+    def rate(entry) -> float:
+        return entry[2]["eval_tokens_per_second"]
+
+    if policy == FASTEST:
+        return max(measured, key=rate)[0], None
+    if policy == QUALITY_THROUGHPUT:
+        return max(measured, key=lambda e: math.sqrt(max(e[1], 1) * rate(e)))[0], None
+
+    slo = slo_seconds if slo_seconds is not None else MODEL_SELECTION_SLO_SECONDS
+    prompt = prompt_tokens if prompt_tokens is not None else MODEL_SELECTION_PROMPT_TOKENS
+    output = output_tokens if output_tokens is not None else MODEL_SELECTION_OUTPUT_TOKENS
+    within = [e for e in measured if model_stats.estimate_seconds(e[0], prompt, output) <= slo]
+    if not within:
+        return max(measured, key=rate)[0], SLO_UNREACHABLE
+    return max(within, key=lambda e: (e[1], rate(e)))[0], None
+
+
+def unmeasured(candidates: List[Tuple[str, int]]) -> List[str]:
+    """Candidatos que las políticas medidas no pueden considerar por falta de muestras."""
+    return [name for name, _ in candidates if model_stats.get(name) is None]
+
+
+def estimate_completion(model: str, prompt_tokens: int, output_tokens: int) -> Optional[float]:
+    """
+    Segundos hasta completar una petición nueva en el modelo, contando su cola.
+
+    Se supone que cada petición por delante dura lo mismo que la nueva: con
+    `slots` ranuras y `ahead` peticiones en curso o en espera, la nueva empieza
+    tras (ahead - slots) // slots + 1 rondas si no hay ranura libre.
+
+    Returns:
+        Segundos estimados, o None si el modelo no tiene muestras suficientes
+    """
+    service = model_stats.estimate_seconds(model, prompt_tokens, output_tokens)
+    if service is None:
+        return None
+    load = scheduler.load(model)
+    ahead = load["active"] + load["waiting"]
+    rounds = 0 if ahead < load["slots"] else (ahead - load["slots"]) // load["slots"] + 1
+    return service * (rounds + 1)
+
+
+def route_for_latency(
+    preferred: str,
+    candidates: List[Tuple[str, int]],
+    target_seconds: float,
+    prompt_tokens: int,
+    output_tokens: int
+) -> Tuple[str, Dict[str, Optional[float]]]:
+    """
+    Elige el modelo que sirve una petición con objetivo de latencia.
+
+    Se mantiene el preferido si llega a tiempo (o si no hay mediciones para
+    saberlo); si no, el más grande de los candidatos más pequeños que sí llega.
+    Si ninguno llega, también se mantiene el preferido.
+
+    Args:
+        preferred: Modelo elegido por la selección automática o por el cliente
+        candidates: Modelos equivalentes (nombre, tamaño); solo cuentan los más pequeños
+        target_seconds: Latencia objetivo del cliente
+        prompt_tokens: Tokens estimados del prompt
+        output_tokens: Tokens de salida esperados
+
+    Returns:
+        (modelo que sirve la petición, segundos estimados por modelo evaluado)
+    """
+    estimates: Dict[str, Optional[float]] = {
+        preferred: estimate_completion(preferred, prompt_tokens, output_tokens)
+    }
+    if estimates[preferred] is None or estimates[preferred] <= target_seconds:
+        return preferred, estimates
+    preferred_size = dict(candidates).get(preferred)
+    smaller = [
+        (name, size) for name, size in candidates
+        if name != preferred and (preferred_size is None or size < preferred_size)
+    ]
+    within = []
+    for name, size in smaller:
+        estimates[name] = estimate_completion(name, prompt_tokens, output_tokens)
+        if estimates[name] is not None and estimates[name] <= target_seconds:
+            within.append((size, -estimates[name], name))
+    if not within:
+        return preferred, estimates
+    served = max(within)[2]
+    QUEUE_REROUTES_TOTAL.inc(requested=preferred, served=served)
+    logger.info(
+        "Queue routing: %s estimated %.1fs > target %ss, serving with %s (%.1fs)",
+        preferred, estimates[preferred], target_seconds, served, estimates[served]
+    )
+    return served, estimates
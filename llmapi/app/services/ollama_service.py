@@ -1,25 +1,59 @@
 import requests
 import base64
+import json
+import logging
 import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 from app.core.config import (
     OLLAMA_CHAT_URL, 
     OLLAMA_TAGS_URL, 
     OLLAMA_SHOW_URL,
     OLLAMA_GENERATE_URL,
     OLLAMA_TIMEOUT,
-    OLLAMA_TAGS_TIMEOUT
+    OLLAMA_TAGS_TIMEOUT,
+    MODEL_SELECTION_OUTPUT_TOKENS,
+    NUM_CTX_IMAGE_TOKENS,
+    PLANTUML_COMPACT,
+    QUEUE_ROUTING_CANDIDATES_TTL,
+    QUEUE_ROUTING_ENABLED,
+    QUEUE_ROUTING_SAME_FAMILY,
+    VISION_CACHE_TTL,
+    VISION_EARLY_STOP,
+    VISION_MAX_TOKENS_PER_IMAGE,
+    WARMUP_IMAGES,
+    WARMUP_PROMPT_TOKENS
 )
-from app.core.logger import logger
+from app.core.logger import log_limited, logger
+from app.core.cache import create_cache
+from app.core.generations import GenerationCancelled
+from app.core.ollama_http import ollama_session
+from app.core.metrics import observe_ollama_stats, record_upstream_error
+from app.core.telemetry import DEFAULT_STEP, RequestTelemetry, span, trace_headers
+from app.services.model_options import apply_options, estimate_prompt_tokens
+from app.services.model_selection import (
+    DEFAULT_POLICY,
+    LARGEST,
+    choose_model,
+    route_for_latency,
+    unmeasured,
+    validate_policy,
+)
+from app.services.plantuml import VISION_EARLY_STOPS_TOTAL, VisionVerdicts, compact_plantuml, estimate_tokens
+from app.services.scheduler import scheduler
 
 
-def _call_ollama(payload: Dict[str, Any], timeout: Optional[int] = None) -> Dict[str, Any]:
+def _call_ollama(
+    payload: Dict[str, Any],
+    timeout: Optional[int] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
     """
     Realiza una petición POST al endpoint de chat de Ollama.
     
     Args:
         payload: Datos de la petición conteniendo modelo y mensajes
         timeout: Tiempo de espera de la petición en segundos (usa OLLAMA_TIMEOUT de config si es None)
+        headers: Cabeceras adicionales (traceparent)
         
     Returns:
         Respuesta JSON de Ollama
@@ -31,18 +65,145 @@ def _call_ollama(payload: Dict[str, Any], timeout: Optional[int] = None) -> Dict
         timeout = OLLAMA_TIMEOUT
     
     try:
-        logger.info(f"Llamando a Ollama con modelo: {payload.get('model')} (timeout: {timeout}s)")
-        resp = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=timeout)
+        logger.info("Llamando a Ollama con modelo: %s (timeout: %ss)", payload.get('model'), timeout)
+        resp = ollama_session.post(OLLAMA_CHAT_URL, json=payload, timeout=timeout, headers=headers)
         resp.raise_for_status()
-        return resp.json()
+        data = resp.json()
+        observe_ollama_stats(payload.get("model", ""), data)
+        return data
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error llamando a Ollama: {str(e)}")
+        logger.error("Error llamando a Ollama: %s", e)
+        record_upstream_error(payload.get("model"), e)
         raise
     except Exception as e:
         logger.exception("Error inesperado llamando a Ollama")
+        record_upstream_error(payload.get("model"), e)
         raise
 
 
+def _encode_images(image_bytes_list: List[bytes]) -> List[str]:
+    """
+    Codifica las imágenes en base64 para el campo "images" de Ollama.
+    
+    Args:
+        image_bytes_list: Lista de datos de imagen como bytes
+        
+    Returns:
+        Lista de cadenas base64 (ASCII)
+    """
+    return [base64.b64encode(image_bytes).decode("ascii") for image_bytes in image_bytes_list]
+
+
+def _iter_stream_content(
+    resp: requests.Response,
+    model: str,
+    telemetry: Optional[RequestTelemetry] = None
+) -> Iterator[str]:
+    """
+    Decodifica el stream NDJSON de /api/chat y devuelve el contenido de cada chunk.
+    
+    Las estadísticas del chunk final (done=true) se registran en las métricas
+    y, si se proporciona, en el desglose de tiempos de la petición.
+    
+    Args:
+        resp: Respuesta de Ollama abierta con stream=True
+        model: Nombre del modelo (para etiquetar métricas)
+        telemetry: Seguimiento opcional de tiempos de la petición
+        
+    Yields:
+        Fragmentos de texto no vacíos
+        
+    Raises:
+        GenerationCancelled: Si la generación se cancela desde administración
+            (la respuesta se cierra y Ollama deja de generar)
+    """
+    generation = telemetry.generation if telemetry else None
+    if generation:
+        generation.attach(resp)
+    try:
+        first_line = True
+        for line in resp.iter_lines():
+            if generation and generation.cancelled:
+                break
+            if not line:
+                continue
+            if first_line:
+                first_line = False
+                if telemetry:
+                    telemetry.upstream_first_byte()
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                log_limited("ollama.undecodable_line", logging.WARNING,
+                            "Could not decode line from %s (%d bytes)", model, len(line))
+                continue
+            message = chunk.get("message")
+            if message and "content" in message:
+                content = message["content"]
+                if content:
+                    if generation:
+                        generation.token()
+                    yield content
+            if chunk.get("done"):
+                observe_ollama_stats(model, chunk)
+                if telemetry:
+                    telemetry.ollama_stats(chunk)
+    except Exception:
+        # Al cancelar se cierra la respuesta desde otro hilo y la lectura falla
+        if not (generation and generation.cancelled):
+            raise
+    finally:
+        resp.close()
+        if generation:
+            generation.detach()
+    if generation:
+        generation.check()
+
+
+def _vision_options(image_count: int) -> Dict[str, Any]:
+    """Límite de tokens del paso de visión proporcional al número de imágenes."""
+    if VISION_MAX_TOKENS_PER_IMAGE <= 0:
+        return {}
+    return {"num_predict": VISION_MAX_TOKENS_PER_IMAGE * image_count}
+
+
+def _collect_vision_output(
+    resp: requests.Response,
+    model: str,
+    image_count: int,
+    telemetry: Optional[RequestTelemetry] = None
+) -> str:
+    """
+    Lee la respuesta del modelo de visión hasta tener un veredicto por imagen.
+    
+    Con VISION_EARLY_STOP, en cuanto cada imagen tiene su bloque PlantUML o
+    su "No diagram" se cierra la conexión y Ollama deja de generar: lo que
+    viniera después se descartaría igualmente.
+    
+    Args:
+        resp: Respuesta de Ollama abierta con stream=True
+        model: Modelo de visión (para etiquetar métricas)
+        image_count: Número de imágenes enviadas
+        telemetry: Seguimiento opcional de tiempos de la petición
+        
+    Returns:
+        Texto generado por el modelo de visión
+    """
+    verdicts = VisionVerdicts(image_count)
+    stream = _iter_stream_content(resp, model, telemetry)
+    try:
+        for chunk in stream:
+            if verdicts.feed(chunk) and VISION_EARLY_STOP:
+                VISION_EARLY_STOPS_TOTAL.inc(model=model)
+                logger.info("All %s images have a verdict; stopping %s", image_count, model)
+                if telemetry:
+                    telemetry.annotate(early_stop=True)
+                break
+    finally:
+        stream.close()
+    return verdicts.text
+
+
 def list_models() -> Dict[str, Any]:
     """
     Obtiene la lista de modelos disponibles de Ollama, determinando capacidades de visión.
@@ -51,8 +212,8 @@ def list_models() -> Dict[str, Any]:
         Diccionario conteniendo información de los modelos
     """
     try:
-        logger.info(f"Obteniendo modelos desde {OLLAMA_TAGS_URL}")
-        resp = requests.get(OLLAMA_TAGS_URL, timeout=OLLAMA_TAGS_TIMEOUT)
+        logger.info("Obteniendo modelos desde %s", OLLAMA_TAGS_URL)
+        resp = ollama_session.get(OLLAMA_TAGS_URL, timeout=OLLAMA_TAGS_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
         
@@ -60,10 +221,10 @@ def list_models() -> Dict[str, Any]:
         for model in models:
             model['has_vision'] = _is_vision_model(model.get('name', ''))
             
-        logger.info(f"Se obtuvieron exitosamente {len(models)} modelos")
+        logger.info("Se obtuvieron exitosamente %s modelos", len(models))
         return data
     except requests.exceptions.RequestException as e:
-        logger.error(f"Fallo al listar modelos: {str(e)}")
+        logger.error("Fallo al listar modelos: %s", e)
         return {"error": "No se pudo listar modelos", "detail": str(e)}
     except Exception as e:
         logger.exception("Error inesperado al listar modelos")
@@ -94,7 +255,11 @@ def _extract_model_size(model_name: str) -> int:
 
 
 
-_vision_cache: Dict[str, bool] = {}
+_vision_cache = create_cache("vision", ttl=VISION_CACHE_TTL)
+
+# Validez del resultado heurístico cuando Ollama no responde: se reintenta pronto
+_VISION_FALLBACK_TTL = 60
+
 
 def _is_vision_model(model_name: str) -> bool:
     """
@@ -106,11 +271,12 @@ def _is_vision_model(model_name: str) -> bool:
     Returns:
         True si el modelo tiene capacidades de visión
     """
-    if model_name in _vision_cache:
-        return _vision_cache[model_name]
+    cached = _vision_cache.get(model_name)
+    if cached is not None:
+        return cached
         
     try:
-        resp = requests.post(OLLAMA_SHOW_URL, json={"name": model_name}, timeout=5)
+        resp = ollama_session.post(OLLAMA_SHOW_URL, json={"name": model_name}, timeout=5)
         if resp.status_code == 200:
             data = resp.json()
             model_info = data.get("model_info", {})
@@ -121,17 +287,17 @@ def _is_vision_model(model_name: str) -> bool:
                 if families:
                     has_vision = "clip" in [str(f).lower() for f in families]
             
-            _vision_cache[model_name] = has_vision
+            _vision_cache.set(model_name, has_vision)
             return has_vision
     except Exception as e:
-        logger.warning(f"Error comprobando capacidades de visión para {model_name}: {e}")
+        logger.warning("Error comprobando capacidades de visión para %s: %s", model_name, e)
         
     # Fallback heurístico en caso de error en la API
     vision_keywords = ['vl', 'vision', 'llava', 'bakllava', 'moondream', 'e2b', 'minicpm', 'pixtral', 'paligemma']
     model_lower = model_name.lower()
     fallback_result = any(keyword in model_lower for keyword in vision_keywords)
     
-    _vision_cache[model_name] = fallback_result
+    _vision_cache.set(model_name, fallback_result, ttl=_VISION_FALLBACK_TTL)
     return fallback_result
 
 
@@ -150,13 +316,31 @@ def _is_coding_model(model_name: str) -> bool:
     return any(keyword in model_lower for keyword in coding_keywords)
 
 
-def select_best_models() -> Optional[Dict[str, str]]:
+def select_best_models(
+    policy: Optional[str] = None,
+    slo_seconds: Optional[float] = None,
+    prompt_tokens: Optional[int] = None,
+    output_tokens: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
     """
     Selecciona automáticamente los mejores modelos disponibles para el modo auto.
     
+    Args:
+        policy: Política de selección (ver model_selection); por defecto MODEL_SELECTION_POLICY
+        slo_seconds: SLO para largest_under_slo
+        prompt_tokens: Tokens de entrada de la petición de referencia
+        output_tokens: Tokens de salida de la petición de referencia
+    
     Returns:
-        Diccionario con 'vision_model' y 'coding_model', o None si no hay modelos suficientes
+        Diccionario con 'vision_model', 'coding_model' y 'policy' (y 'fallback'
+        con el motivo por rol si la política no pudo aplicarse tal cual, y
+        'unmeasured' con los candidatos por rol que una política medida no pudo
+        considerar), o None si no hay modelos suficientes
+    
+    Raises:
+        ValueError: Si la política no existe
     """
+    policy = validate_policy(policy or DEFAULT_POLICY)
     try:
         models_data = list_models()
         if "error" in models_data or "models" not in models_data:
@@ -169,50 +353,111 @@ def select_best_models() -> Optional[Dict[str, str]]:
             logger.warning("No hay modelos disponibles")
             return None
         
+        names = [m.get("name", "") for m in models]
         # Filtrar modelos con visión
-        vision_models = [m for m in models if _is_vision_model(m.get("name", ""))]
+        vision_models = [n for n in names if _is_vision_model(n)]
         
         # Filtrar modelos sin visión
-        coding_models = [m for m in models if _is_coding_model(m.get("name", ""))]
-        non_vision_models = [m for m in models if not _is_vision_model(m.get("name", ""))]
-        
-        # Seleccionar el mejor modelo de visión
-        best_vision = None
-        if vision_models:
-            best_vision = max(vision_models, key=lambda m: _extract_model_size(m.get("name", "")))
-        
-        # Seleccionar el mejor modelo de código
-        best_coding = None
-        if coding_models:
-            best_coding = max(coding_models, key=lambda m: _extract_model_size(m.get("name", "")))
-        elif non_vision_models:
-            # Si no hay modelo de código específico, usar el más grande que no sea de visión
-            best_coding = max(non_vision_models, key=lambda m: _extract_model_size(m.get("name", "")))
+        coding_models = [n for n in names if _is_coding_model(n)]
+        if not coding_models:
+            # Si no hay modelo de código específico, usar los que no sean de visión
+            coding_models = [n for n in names if not _is_vision_model(n)]
+        
+        vision_candidates = [(n, _extract_model_size(n)) for n in vision_models]
+        coding_candidates = [(n, _extract_model_size(n)) for n in coding_models]
+        best_vision, vision_fallback = choose_model(
+            vision_candidates, policy, slo_seconds, prompt_tokens, output_tokens
+        )
+        best_coding, coding_fallback = choose_model(
+            coding_candidates, policy, slo_seconds, prompt_tokens, output_tokens
+        )
         
         # Verificar que hay ambos tipos de modelos
         if not best_vision or not best_coding:
-            logger.warning(f"Modelos insuficientes para modo auto: vision={bool(best_vision)}, coding={bool(best_coding)}")
+            logger.warning("Modelos insuficientes para modo auto: vision=%s, coding=%s", bool(best_vision), bool(best_coding))
             return None
         
-        vision_model_name = best_vision.get("name", "")
-        coding_model_name = best_coding.get("name", "")
+        logger.info("Modelos seleccionados automáticamente (%s): vision=%s, coding=%s", policy, best_vision, best_coding)
         
-        logger.info(f"Modelos seleccionados automáticamente: vision={vision_model_name}, coding={coding_model_name}")
-        
-        return {
-            "vision_model": vision_model_name,
-            "coding_model": coding_model_name
+        selected: Dict[str, Any] = {
+            "vision_model": best_vision,
+            "coding_model": best_coding,
+            "policy": policy
         }
+        fallback = {role: reason for role, reason in
+                    (("vision_model", vision_fallback), ("coding_model", coding_fallback)) if reason}
+        if fallback:
+            selected["fallback"] = fallback
+        if policy != LARGEST:
+            pending = {role: names for role, names in
+                       (("vision_model", unmeasured(vision_candidates)),
+                        ("coding_model", unmeasured(coding_candidates))) if names}
+            if pending:
+                selected["unmeasured"] = pending
+        return selected
         
     except Exception as e:
-        logger.error(f"Error seleccionando modelos: {str(e)}")
+        logger.error("Error seleccionando modelos: %s", e)
         return None
 
 
+_candidates_cache = create_cache("coding_candidates", ttl=QUEUE_ROUTING_CANDIDATES_TTL)
+
+
+def _coding_candidates() -> List[Tuple[str, int]]:
+    """Modelos de código (sin visión) instalados, con su tamaño; cacheado QUEUE_ROUTING_CANDIDATES_TTL."""
+    cached = _candidates_cache.get("all")
+    if cached is not None:
+        return [tuple(entry) for entry in cached]
+    models_data = list_models()
+    candidates = [
+        (name, _extract_model_size(name))
+        for name in (m.get("name", "") for m in models_data.get("models", []))
+        if _is_coding_model(name) and not _is_vision_model(name)
+    ]
+    # Un error de Ollama no se cachea: se vuelve a consultar en la siguiente petición
+    if "error" not in models_data:
+        _candidates_cache.set("all", candidates)
+    return candidates
+
+
+def route_coding_model(
+    model: str,
+    latency_target: Optional[float],
+    prompt_tokens: int,
+    options: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Dict[str, Optional[float]]]:
+    """
+    Modelo que sirve el paso de código según la cola y el objetivo de latencia.
+
+    Solo actúa con QUEUE_ROUTING_ENABLED y un objetivo del cliente; los
+    candidatos son los modelos de código (de la misma familia con
+    QUEUE_ROUTING_SAME_FAMILY) más pequeños que el preferido.
+
+    Returns:
+        (modelo que sirve la petición, segundos estimados por modelo evaluado)
+    """
+    if not QUEUE_ROUTING_ENABLED or not latency_target:
+        return model, {}
+    predict = (options or {}).get("num_predict", -1)
+    output_tokens = predict if predict > 0 else MODEL_SELECTION_OUTPUT_TOKENS
+
+    family = model.split(":")[0]
+    candidates = [
+        (name, size) for name, size in _coding_candidates()
+        if not QUEUE_ROUTING_SAME_FAMILY or name.split(":")[0] == family
+    ]
+    if model not in dict(candidates):
+        candidates.append((model, _extract_model_size(model)))
+    return route_for_latency(model, candidates, latency_target, prompt_tokens, output_tokens)
+
+
 def generate_with_image(
     model: str, 
     prompt: str, 
-    image_bytes_list: Optional[List[bytes]] = None
+    image_bytes_list: Optional[List[bytes]] = None,
+    telemetry: Optional[RequestTelemetry] = None,
+    options: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Genera una respuesta desde Ollama, opcionalmente incluyendo múltiples imágenes.
@@ -221,23 +466,25 @@ def generate_with_image(
         model: Nombre del modelo Ollama a usar
         prompt: Texto del prompt para la generación
         image_bytes_list: Lista opcional de datos de imagen como bytes
+        telemetry: Seguimiento opcional de tiempos de la petición
+        options: Opciones de la petición ya validadas (ver model_options), sobre el perfil del modelo
         
     Returns:
         Diccionario conteniendo la respuesta de generación
     """
     messages = [{"role": "user", "content": prompt}]
+    if telemetry:
+        telemetry.begin_step(DEFAULT_STEP, model)
     
     if image_bytes_list and len(image_bytes_list) > 0:
         try:
-            images_b64 = []
-            for image_bytes in image_bytes_list:
-                img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-                images_b64.append(img_b64)
+            with span(telemetry, "encode"):
+                images_b64 = _encode_images(image_bytes_list)
             
             messages[0]["images"] = images_b64
-            logger.info(f"{len(image_bytes_list)} imágenes codificadas")
+            logger.info("%s imágenes codificadas", len(image_bytes_list))
         except Exception as e:
-            logger.error(f"Fallo al codificar imágenes: {str(e)}")
+            logger.error("Fallo al codificar imágenes: %s", e)
             raise ValueError(f"Error codificando imágenes: {str(e)}")
 
     payload = {
@@ -245,15 +492,24 @@ def generate_with_image(
         "messages": messages,
         "stream": False
     }
+    apply_options(payload, options)
     
-    return _call_ollama(payload)
+    with scheduler.slot(model, telemetry):
+        if telemetry:
+            telemetry.dispatched(model)
+        result = _call_ollama(payload, headers=trace_headers(telemetry))
+    if telemetry:
+        telemetry.ollama_stats(result)
+    return result
 
 
 def generate_with_image_stream(
     model: str, 
     prompt: str, 
     image_bytes_list: Optional[List[bytes]] = None,
-    message_history: Optional[list] = None
+    message_history: Optional[list] = None,
+    telemetry: Optional[RequestTelemetry] = None,
+    options: Optional[Dict[str, Any]] = None
 ):
     """
     Genera una respuesta desde Ollama con streaming, opcionalmente incluyendo múltiples imágenes.
@@ -263,6 +519,8 @@ def generate_with_image_stream(
         prompt: Texto del prompt para la generación
         image_bytes_list: Lista opcional de datos de imagen como bytes
         message_history: Historial de mensajes previos para contexto
+        telemetry: Seguimiento opcional de tiempos de la petición
+        options: Opciones de la petición ya validadas (ver model_options), sobre el perfil del modelo
         
     Yields:
         Chunks de texto generados por el modelo
@@ -270,23 +528,25 @@ def generate_with_image_stream(
     # Si hay historial de mensajes, usarlo; si no, crear uno nuevo solo con el mensaje actual
     if message_history and len(message_history) > 0:
         messages = message_history
-        logger.info(f"Using message history with {len(messages)} messages")
+        logger.info("Using message history with %s messages", len(messages))
     else:
         messages = [{"role": "user", "content": prompt}]
+    if telemetry:
+        telemetry.begin_step(DEFAULT_STEP, model)
     
     if image_bytes_list and len(image_bytes_list) > 0:
         try:
-            images_b64 = []
-            for image_bytes in image_bytes_list:
-                img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-                images_b64.append(img_b64)
+            with span(telemetry, "encode"):
+                images_b64 = _encode_images(image_bytes_list)
+            if telemetry:
+                telemetry.memory.hold("images_b64", sum(len(img) for img in images_b64))
             
             # Agregar las imágenes al último mensaje del usuario
             if messages:
                 messages[-1]["images"] = images_b64
-            logger.info(f"{len(image_bytes_list)} imágenes codificadas")
+            logger.info("%s imágenes codificadas", len(image_bytes_list))
         except Exception as e:
-            logger.error(f"Fallo al codificar imágenes: {str(e)}")
+            logger.error("Fallo al codificar imágenes: %s", e)
             raise ValueError(f"Error codificando imágenes: {str(e)}")
 
     payload = {
@@ -294,30 +554,28 @@ def generate_with_image_stream(
         "messages": messages,
         "stream": True
     }
+    apply_options(payload, options)
     
     try:
-        logger.info(f"Iniciando streaming con modelo: {model}")
-        resp = requests.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT)
-        resp.raise_for_status()
-        
-        for line in resp.iter_lines():
-            if line:
-                try:
-                    import json
-                    chunk = json.loads(line)
-                    if "message" in chunk and "content" in chunk["message"]:
-                        content = chunk["message"]["content"]
-                        if content:
-                            yield content
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode line: {line}")
-                    continue
+        logger.info("Iniciando streaming con modelo: %s", model)
+        with scheduler.slot(model, telemetry):
+            if telemetry:
+                telemetry.dispatched(model)
+            resp = ollama_session.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT,
+                                       headers=trace_headers(telemetry))
+            resp.raise_for_status()
+            
+            yield from _iter_stream_content(resp, model, telemetry)
                     
+    except GenerationCancelled:
+        raise
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error en streaming de Ollama: {str(e)}")
+        log_limited("ollama.stream_request_error", logging.ERROR, "Error en streaming de Ollama: %s", e)
+        record_upstream_error(model, e)
         raise
     except Exception as e:
-        logger.exception("Error inesperado en streaming")
+        log_limited("ollama.stream_error", logging.ERROR, "Error inesperado en streaming con %s", model, exc_info=True)
+        record_upstream_error(model, e)
         raise
 
 
@@ -394,13 +652,10 @@ OR, for a non-diagram:
 No diagram"""
     
     try:
-        logger.info(f"Extracting PlantUML from {len(image_bytes_list)} images using {vision_model}")
+        logger.info("Extracting PlantUML from %s images using %s", len(image_bytes_list), vision_model)
         
         # Codificar imágenes en base64
-        images_b64 = []
-        for image_bytes in image_bytes_list:
-            img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-            images_b64.append(img_b64)
+        images_b64 = _encode_images(image_bytes_list)
         
         messages = [{
             "role": "user",
@@ -411,19 +666,17 @@ No diagram"""
         payload = {
             "model": vision_model,
             "messages": messages,
-            "stream": False
+            "stream": True
         }
+        apply_options(payload, defaults=_vision_options(len(image_bytes_list)))
         
-        resp = _call_ollama(payload)
-        
-        # Extraer el contenido de la respuesta
-        content = ""
-        if "message" in resp and isinstance(resp["message"], dict):
-            content = resp["message"].get("content", "")
-        elif "response" in resp:
-            content = resp["response"]
+        # En streaming para poder cortar en cuanto cada imagen tiene su veredicto
+        with scheduler.slot(vision_model):
+            resp = ollama_session.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT)
+            resp.raise_for_status()
+            content = _collect_vision_output(resp, vision_model, len(image_bytes_list))
         
-        logger.info(f"PlantUML extraction completed, response length: {len(content)}")
+        logger.info("PlantUML extraction completed, response length: %s", len(content))
         
         # Verificar si todas las imágenes resultaron en "No diagram"
         # Contar cuántas veces aparece "No diagram" en la respuesta
@@ -431,19 +684,27 @@ No diagram"""
         
         # Si hay tantos "No diagram" como imágenes, significa que ninguna es un diagrama UML
         if no_diagram_count >= len(image_bytes_list) and len(image_bytes_list) > 0:
-            logger.warning(f"All {len(image_bytes_list)} images were identified as non-UML diagrams")
+            logger.warning("All %s images were identified as non-UML diagrams", len(image_bytes_list))
             raise ValueError("No se ha detectado ningún diagrama UML")
         
         return content
         
-    except ValueError:
-        # Re-lanzar ValueError para que sea capturado en el nivel superior
+    except (ValueError, GenerationCancelled):
+        # Re-lanzar para que sea capturado en el nivel superior
         raise
     except Exception as e:
-        logger.error(f"Error extracting PlantUML: {str(e)}")
+        logger.error("Error extracting PlantUML: %s", e)
+        record_upstream_error(vision_model, e)
         raise
 
 
+_IMAGES_REF_RE = re.compile(r'\b(imagenes|imágenes|images)\b', re.IGNORECASE)
+_IMAGE_REF_RE = re.compile(r'\b(imagen|imágen|image)\b', re.IGNORECASE)
+
+# Bloques de código entre triple backticks en la salida del modelo de visión
+_CODE_BLOCK_RE = re.compile(r'```[\s\S]*?```')
+
+
 def replace_image_references(prompt: str) -> str:
     """
     Reemplaza referencias a imágenes en el prompt con referencias a código PlantUML.
@@ -454,8 +715,8 @@ def replace_image_references(prompt: str) -> str:
     Returns:
         Prompt modificado con referencias a PlantUML
     """
-    prompt = re.sub(r'\b(imagenes|imágenes|images)\b', 'PlantUML codes', prompt, flags=re.IGNORECASE)
-    prompt = re.sub(r'\b(imagen|imágen|image)\b', 'PlantUML code', prompt, flags=re.IGNORECASE)
+    prompt = _IMAGES_REF_RE.sub('PlantUML codes', prompt)
+    prompt = _IMAGE_REF_RE.sub('PlantUML code', prompt)
     return prompt
 
 
@@ -464,7 +725,10 @@ def generate_with_image_stream_auto(
     image_bytes_list: List[bytes],
     message_history: Optional[list] = None,
     vision_model_override: Optional[str] = None,
-    coding_model_override: Optional[str] = None
+    coding_model_override: Optional[str] = None,
+    telemetry: Optional[RequestTelemetry] = None,
+    options: Optional[Dict[str, Any]] = None,
+    latency_target: Optional[float] = None
 ):
     """
     Genera una respuesta en modo automático con dos pasos:
@@ -475,10 +739,16 @@ def generate_with_image_stream_auto(
         prompt: Texto del prompt para la generación
         image_bytes_list: Lista de datos de imagen como bytes
         message_history: Historial de mensajes previos para contexto
+        telemetry: Seguimiento opcional de tiempos de la petición
+        options: Opciones de la petición ya validadas, para el paso 2
+        latency_target: Segundos en que el cliente quiere la respuesta del paso 2;
+            con QUEUE_ROUTING_ENABLED puede servirse con un modelo de código más
+            pequeño (el desglose del paso 2 lleva el modelo que sirvió y el pedido)
         
     Yields:
         Chunks de texto generados por el modelo o eventos de control
     """
+    current_model = None
     try:
         # Seleccionar los mejores modelos disponibles
         if vision_model_override and coding_model_override:
@@ -489,20 +759,21 @@ def generate_with_image_stream_auto(
             vision_model = best_models["vision_model"]
             coding_model = best_models["coding_model"]
         
-        logger.info(f"Auto mode using: vision={vision_model}, coding={coding_model}")
+        logger.info("Auto mode using: vision=%s, coding=%s", vision_model, coding_model)
         
         # Enviar evento de inicio del paso 1
         yield "[STEP1_START]"
         
         # Paso 1: Extraer PlantUML de las imágenes
-        plantuml_content = ""
-        logger.info(f"Extracting PlantUML from {len(image_bytes_list)} images using {vision_model}")
+        logger.info("Extracting PlantUML from %s images using %s", len(image_bytes_list), vision_model)
+        if telemetry:
+            telemetry.begin_step("step1", vision_model)
         
         # Codificar imágenes en base64
-        images_b64 = []
-        for image_bytes in image_bytes_list:
-            img_b64 = base64.b64encode(image_bytes).decode("utf-8")
-            images_b64.append(img_b64)
+        with span(telemetry, "encode"):
+            images_b64 = _encode_images(image_bytes_list)
+        if telemetry:
+            telemetry.memory.hold("images_b64", sum(len(img) for img in images_b64))
         
         messages = [{
             "role": "user",
@@ -563,30 +834,31 @@ No diagram""",
             "messages": messages,
             "stream": True
         }
+        apply_options(payload, defaults=_vision_options(len(image_bytes_list)))
+        
+        current_model = vision_model
+        with scheduler.slot(vision_model, telemetry):
+            if telemetry:
+                telemetry.dispatched(vision_model)
+            resp = ollama_session.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT,
+                                       headers=trace_headers(telemetry))
+            resp.raise_for_status()
+            
+            # Primero recopilar todo el contenido sin hacer stream
+            plantuml_content = _collect_vision_output(resp, vision_model, len(image_bytes_list), telemetry)
         
-        resp = requests.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT)
-        resp.raise_for_status()
+        # Las imágenes ya no se necesitan: soltar las referencias antes del paso 2
+        images_b64 = messages = payload = resp = None
+        if telemetry:
+            telemetry.memory.release("images_b64")
+            telemetry.memory.hold("plantuml", len(plantuml_content))
         
-        # Primero recopilar todo el contenido sin hacer stream
-        for line in resp.iter_lines():
-            if line:
-                try:
-                    import json
-                    chunk = json.loads(line)
-                    if "message" in chunk and "content" in chunk["message"]:
-                        content = chunk["message"]["content"]
-                        if content:
-                            plantuml_content += content
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode line: {line}")
-                    continue
-        
-        logger.info(f"PlantUML extraction completed, response length: {len(plantuml_content)}")
+        logger.info("PlantUML extraction completed, response length: %s", len(plantuml_content))
         
         # Verificar si todas las imágenes resultaron en "No diagram" ANTES de enviar nada
         no_diagram_count = plantuml_content.lower().count("no diagram")
         if no_diagram_count >= len(image_bytes_list) and len(image_bytes_list) > 0:
-            logger.warning(f"All {len(image_bytes_list)} images were identified as non-UML diagrams")
+            logger.warning("All %s images were identified as non-UML diagrams", len(image_bytes_list))
             raise ValueError("No se ha detectado ningún diagrama UML")
         
         # Si pasó la validación, ahora sí enviar el contenido
@@ -596,14 +868,42 @@ No diagram""",
         yield "[STEP1_END]"
         yield "[STEP2_START]"
         
-        # Paso 2: Modificar el prompt para reemplazar referencias a imágenes
+        # Paso 2: con objetivo de latencia, el modelo de código puede cambiar según su cola
+        requested_model = coding_model
+        coding_model, estimates = route_coding_model(
+            coding_model, latency_target,
+            estimate_prompt_tokens(message_history or []) + estimate_tokens(prompt + plantuml_content),
+            options
+        )
+        if telemetry:
+            telemetry.begin_step("step2", coding_model)
+            if latency_target:
+                telemetry.annotate(
+                    requested_model=requested_model,
+                    latency_target_s=latency_target,
+                    estimated_s={m: round(e, 2) for m, e in estimates.items() if e is not None}
+                )
+        
+        # Modificar el prompt para reemplazar referencias a imágenes
         modified_prompt = replace_image_references(prompt)
         
         # Extraer solo los bloques de código (entre triple backticks) del contenido PlantUML
-        code_blocks = re.findall(r'```[\s\S]*?```', plantuml_content)
+        code_blocks = _CODE_BLOCK_RE.findall(plantuml_content)
         filtered_plantuml = '\n\n'.join(code_blocks) if code_blocks else plantuml_content
         
-        logger.info(f"Extracted {len(code_blocks)} code blocks from PlantUML content")
+        logger.info("Extracted %s code blocks from PlantUML content", len(code_blocks))
+        
+        # Forma canónica mínima: menos tokens de prompt para el modelo de código
+        if PLANTUML_COMPACT:
+            with span(telemetry, "plantuml_compact"):
+                filtered_plantuml, compaction = compact_plantuml(filtered_plantuml)
+            if telemetry:
+                telemetry.annotate(**compaction)
+            logger.info(
+                "PlantUML compacted: %s/%s blocks, ~%s prompt tokens saved",
+                compaction["plantuml_compacted"], compaction["plantuml_blocks"],
+                compaction.get("plantuml_tokens_saved_est", 0)
+            )
         
         # Añadir instrucciones para generar bloques de código separados
         code_generation_instructions = """
@@ -615,7 +915,13 @@ IMPORTANT: When generating code from the PlantUML:
         # Construir mensaje con códigos PlantUML e instrucciones
         final_prompt = f"{modified_prompt}{code_generation_instructions}\n\n{filtered_plantuml}"
         
-        logger.info(f"Modified prompt created, length: {len(final_prompt)}")
+        logger.info("Modified prompt created, length: %s", len(final_prompt))
+        
+        # El contenido PlantUML ya forma parte del prompt final
+        plantuml_content = filtered_plantuml = code_blocks = None
+        if telemetry:
+            telemetry.memory.release("plantuml")
+            telemetry.memory.hold("prompt", len(final_prompt))
         
         # Preparar mensajes para siguiente modelo
         if message_history and len(message_history) > 0:
@@ -630,29 +936,26 @@ IMPORTANT: When generating code from the PlantUML:
             "messages": messages,
             "stream": True
         }
-        
-        logger.info(f"Starting streaming with {coding_model}")
-        resp = requests.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT)
-        resp.raise_for_status()
-        
-        for line in resp.iter_lines():
-            if line:
-                try:
-                    import json
-                    chunk = json.loads(line)
-                    if "message" in chunk and "content" in chunk["message"]:
-                        content = chunk["message"]["content"]
-                        if content:
-                            yield content
-                except json.JSONDecodeError:
-                    logger.warning(f"Could not decode line: {line}")
-                    continue
+        apply_options(payload, options)
+        
+        logger.info("Starting streaming with %s", coding_model)
+        current_model = coding_model
+        with scheduler.slot(coding_model, telemetry):
+            if telemetry:
+                telemetry.dispatched(coding_model)
+            resp = ollama_session.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=OLLAMA_TIMEOUT,
+                                       headers=trace_headers(telemetry))
+            resp.raise_for_status()
+            
+            yield from _iter_stream_content(resp, coding_model, telemetry)
                     
-    except ValueError:
-        # Re-lanzar ValueError para que sea capturado en el nivel superior
+    except (ValueError, GenerationCancelled):
+        # Re-lanzar para que sea capturado en el nivel superior
         raise
     except Exception as e:
-        logger.error(f"Error en generate_with_image_stream_auto: {str(e)}")
+        logger.error("Error en generate_with_image_stream_auto: %s", e)
+        if current_model:
+            record_upstream_error(current_model, e)
         raise
 
 
@@ -673,7 +976,7 @@ def unload_model(model: str) -> Dict[str, Any]:
         requests.RequestException: Si la petición falla
     """
     try:
-        logger.info(f"Descargando modelo: {model}")
+        logger.info("Descargando modelo: %s", model)
         
         # Enviar una petición con keep_alive=0 descarga el modelo
         payload = {
@@ -682,10 +985,10 @@ def unload_model(model: str) -> Dict[str, Any]:
             "keep_alive": 0  # Descargar inmediatamente
         }
         
-        resp = requests.post(OLLAMA_GENERATE_URL, json=payload, timeout=30)
+        resp = ollama_session.post(OLLAMA_GENERATE_URL, json=payload, timeout=30)
         resp.raise_for_status()
         
-        logger.info(f"Modelo descargado exitosamente: {model}")
+        logger.info("Modelo descargado exitosamente: %s", model)
         return {
             "success": True,
             "message": f"Modelo {model} descargado de memoria exitosamente",
@@ -693,7 +996,7 @@ def unload_model(model: str) -> Dict[str, Any]:
         }
         
     except requests.exceptions.RequestException as e:
-        logger.error(f"Fallo al descargar modelo {model}: {str(e)}")
+        logger.error("Fallo al descargar modelo %s: %s", model, e)
         return {
             "success": False,
             "error": "No se pudo descargar el modelo",
@@ -701,10 +1004,93 @@ def unload_model(model: str) -> Dict[str, Any]:
             "model": model
         }
     except Exception as e:
-        logger.exception(f"Error inesperado al descargar modelo {model}")
+        logger.exception("Error inesperado al descargar modelo %s", model)
         return {
             "success": False,
             "error": "Error inesperado al descargar el modelo",
             "detail": str(e),
             "model": model
         }
+
+
+def warmup_options(model: str, images: int = WARMUP_IMAGES, prompt_tokens: int = WARMUP_PROMPT_TOKENS) -> Dict[str, Any]:
+    """
+    Opciones con las que se cargará el runner en la primera petición real.
+
+    Ollama recarga el modelo si cambia num_ctx, así que el precalentamiento
+    usa el mismo cálculo (perfil, límite del paso de visión y bucket de
+    num_ctx) que un paso con una petición típica.
+    """
+    images = images if _is_vision_model(model) else 0
+    payload: Dict[str, Any] = {"model": model, "messages": []}
+    apply_options(
+        payload,
+        defaults=_vision_options(images) if images else None,
+        prompt_tokens=prompt_tokens + NUM_CTX_IMAGE_TOKENS * images
+    )
+    return payload.get("options", {})
+
+
+def preload_model(model: str, keep_alive: str) -> Dict[str, Any]:
+    """
+    Carga un modelo en memoria sin generar nada.
+    
+    Una petición a /api/generate sin prompt hace que Ollama cargue el modelo y
+    lo mantenga en memoria durante keep_alive.
+    
+    Args:
+        model: Nombre del modelo Ollama a cargar
+        keep_alive: Tiempo que el modelo debe permanecer cargado (ej: "30m")
+        
+    Returns:
+        Diccionario con estado de éxito y load_duration en ms
+    """
+    try:
+        logger.info("Precargando modelo: %s (keep_alive=%s)", model, keep_alive)
+        payload = {"model": model, "keep_alive": keep_alive}
+        options = warmup_options(model)
+        if options:
+            payload["options"] = options
+        resp = ollama_session.post(OLLAMA_GENERATE_URL, json=payload, timeout=OLLAMA_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()
+        observe_ollama_stats(model, data)
+        return {
+            "success": True,
+            "model": model,
+            "load_ms": round(data.get("load_duration", 0) / 1e6, 2)
+        }
+    except Exception as e:
+        logger.error("Fallo al precargar modelo %s: %s", model, e)
+        record_upstream_error(model, e)
+        return {"success": False, "model": model, "error": str(e)}
+
+
+def warmup_generation(model: str, keep_alive: str) -> Dict[str, Any]:
+    """
+    Genera un único token con el modelo para inicializar su runner.
+    
+    Args:
+        model: Nombre del modelo Ollama
+        keep_alive: Tiempo que el modelo debe permanecer cargado
+        
+    Returns:
+        Diccionario con estado de éxito y duración total en ms
+    """
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": "hi"}],
+        "stream": False,
+        "keep_alive": keep_alive,
+        # Mismas opciones de carga que la precarga; num_predict no obliga a recargar
+        "options": {**warmup_options(model), "num_predict": 1}
+    }
+    try:
+        data = _call_ollama(payload)
+        return {
+            "success": True,
+            "model": model,
+            "total_ms": round(data.get("total_duration", 0) / 1e6, 2)
+        }
+    except Exception as e:
+        return {"success": False, "model": model, "error": str(e)}
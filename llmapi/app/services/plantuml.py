@@ -0,0 +1,542 @@
+"""
+Representación canónica y compacta de diagramas PlantUML para el paso 2.
+
+El modelo de visión devuelve bloques ```@startuml ... @enduml``` con
+comentarios "' Assumption:", directivas de estilo, colores y espacios que el
+modelo de código no necesita pero que paga en evaluación del prompt. Este
+módulo analiza los diagramas de clases, secuencia y componentes a un modelo
+estructurado (clases con atributos y métodos, participantes y mensajes,
+componentes y relaciones) y lo vuelve a serializar en PlantUML mínimo.
+
+Si un bloque no se reconoce (otro tipo de diagrama o una línea que el parser
+no entiende) se mantiene tal cual: nunca se pierde información del paso 1.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.metrics import REGISTRY, Counter
+
+PLANTUML_BLOCKS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_plantuml_blocks_total",
+    "Bloques PlantUML del paso 1 por tipo de diagrama y resultado de la compactación",
+    ("kind", "result")
+))
+PLANTUML_TOKENS_SAVED_TOTAL = REGISTRY.register(Counter(
+    "llmapi_plantuml_prompt_tokens_saved_total",
+    "Tokens de prompt (estimados) ahorrados en el paso 2 al compactar PlantUML"
+))
+VISION_EARLY_STOPS_TOTAL = REGISTRY.register(Counter(
+    "llmapi_vision_early_stops_total",
+    "Pasos de visión cortados al tener un veredicto para cada imagen", ("model",)
+))
+
+CLASS = "class"
+SEQUENCE = "sequence"
+COMPONENT = "component"
+
+_BLOCK_RE = re.compile(r"@startuml\b[^\n]*\n(.*?)@enduml", re.S | re.I)
+_BLOCK_COMMENT_RE = re.compile(r"/'.*?'/", re.S)
+
+# Directivas de presentación que no cambian el modelo
+_DIRECTIVE_RE = re.compile(
+    r"^(?:skinparam|hide|show|title|header|footer|caption|scale|autonumber|newpage|"
+    r"set|mainframe|autoactivate|skin|allowmixing|left to right direction|"
+    r"top to bottom direction)\b(?!\s*[:(])|^!",
+    re.I
+)
+# Bloques de presentación multilínea y la línea que los cierra
+_DIRECTIVE_BLOCKS = (
+    (re.compile(r"^skinparam\b.*\{$", re.I), re.compile(r"^\}$")),
+    (re.compile(r"^<style>", re.I), re.compile(r"^</style>", re.I)),
+    (re.compile(r"^legend\b", re.I), re.compile(r"^end\s?legend$", re.I)),
+    (re.compile(r"^header$", re.I), re.compile(r"^end\s?header$", re.I)),
+    (re.compile(r"^footer$", re.I), re.compile(r"^end\s?footer$", re.I)),
+    (re.compile(r"^title$", re.I), re.compile(r"^end\s?title$", re.I)),
+)
+_NOTE_RE = re.compile(r"^([rh]?note\b[^:]*?)(?:\s*:\s*(.*))?$", re.I)
+_NOTE_END_RE = re.compile(r"^end\s?[rh]?note$", re.I)
+
+_COLOR_RE = re.compile(r"\s+#[\w#;:.\-]+(?=\s|\{|$)")
+_SPOT_RE = re.compile(r"<<\s*\(\w,\s*#?[\w]+\)\s*([^>]*)>>")
+_MEMBER_COLON_RE = re.compile(r"\s*(?<!:):(?!:)\s*")
+
+# Flechas: cabeza, cuerpo con color/dirección opcionales, cabeza
+_HEAD = r"(?:<\|?|\*|o|#|x|\}|\+|\^|\\\\?|//?)"
+_TAIL = r"(?:\|?>>?|\*|o|#|x|\{|\+|\^|\\\\?|//?)"
+_ARROW = (
+    rf"{_HEAD}?[-.]+(?:(?:\[[^\]]*\]|up|down|left|right|le|ri|do|u|d|l|r)[-.]*)?{_TAIL}?"
+)
+_NAME = r'(?:"[^"]+"|\[[^\]]+\]|\(\)\s*"[^"]+"|\(\)\s*[\w.:$]+|[\w.:$]+)'
+_RELATION_RE = re.compile(
+    rf'^({_NAME})\s*("[^"]*")?\s*({_ARROW})\s*("[^"]*")?\s*({_NAME})\s*(?::\s*(.*))?$'
+)
+_SEQ_NAME = r'(?:"[^"]+"|[\w.:$]+|\[|\]|\?)'
+_MESSAGE_RE = re.compile(
+    rf'^({_SEQ_NAME})\s*({_ARROW})\s*({_SEQ_NAME})\s*(?:(?:\+\+|--|\*\*|!!)\s*)*(?::\s*(.*))?$'
+)
+
+_CLASS_KEYWORDS = (
+    r"abstract\s+class|abstract|class|interface|enum|annotation|entity|struct|record|"
+    r"exception|protocol|metaclass|stereotype"
+)
+_CLASS_DECL_RE = re.compile(rf"^({_CLASS_KEYWORDS})\s+(.+?)\s*(\{{)?(\}})?$", re.I)
+_CLASS_MEMBER_RE = re.compile(r'^("[^"]+"|[\w.$]+)\s+:\s+(.+)$')
+_PACKAGE_RE = re.compile(r"^(package|namespace)\s+(.+?)\s*\{$", re.I)
+_TOGETHER_RE = re.compile(r"^together\s*\{$", re.I)
+_SEPARATOR_RE = re.compile(r"^(?:--|\.\.|==|__)(?:.*(?:--|\.\.|==|__))?$")
+
+_PARTICIPANT_RE = re.compile(
+    r"^(participant|actor|boundary|control|entity|database|collections|queue)\s+(.+)$", re.I
+)
+_SEQ_CONTROL_RE = re.compile(
+    r"^(?:alt|else|opt|loop|par|par2|break|critical|group|end|return|create|destroy|ref\s+over)\b", re.I
+)
+_SEQ_IGNORED_RE = re.compile(
+    r"^(?:activate|deactivate|box|end\s+box|delay|\.\.\.|\|\|\||==.*==|\|\|\d+\|\|)", re.I
+)
+
+_COMPONENT_KEYWORDS = (
+    r"component|interface|node|package|folder|frame|cloud|database|rectangle|artifact|"
+    r"storage|queue|port|portin|portout|card|file|agent|stack|hexagon|actor|usecase"
+)
+_COMPONENT_DECL_RE = re.compile(rf"^({_COMPONENT_KEYWORDS})\s+(.+?)\s*(\{{)?$", re.I)
+_COMPONENT_INLINE_RE = re.compile(r'^(\[[^\]]+\]|\(\)\s*"?[^"]+"?)(?:\s+as\s+\S+)?(?:\s+<<[^>]+>>)?$')
+
+
+class PlantUMLParseError(Exception):
+    """El bloque no se puede representar con el modelo estructurado."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata de tokens (unos 4 caracteres por token en código)."""
+    return (len(text) + 3) // 4
+
+
+def _clean(text: str) -> str:
+    """Quita colores y spots de estereotipos y normaliza espacios."""
+    text = _SPOT_RE.sub(lambda m: f"<<{m.group(1).strip()}>>" if m.group(1).strip() else "", text)
+    text = _COLOR_RE.sub("", f" {text}")
+    return " ".join(text.split())
+
+
+def _normalize_arrow(arrow: str, keep_length: bool) -> str:
+    arrow = re.sub(r"\[[^\]]*\]", "", arrow)
+    arrow = re.sub(r"(?<=[-.])(?:up|down|left|right|le|ri|do|u|d|l|r)(?![a-z])", "", arrow)
+    if not keep_length:
+        arrow = re.sub(r"-+", "--", arrow)
+        arrow = re.sub(r"\.+", "..", arrow)
+    return arrow
+
+
+def _logical_lines(body: str) -> List[str]:
+    """Líneas con contenido: sin comentarios, directivas de estilo ni espacios sobrantes."""
+    lines = []
+    skip_until = None
+    note: Optional[Tuple[str, List[str]]] = None
+    for raw in _BLOCK_COMMENT_RE.sub("", body).splitlines():
+        line = raw.strip()
+        if note is not None:
+            if _NOTE_END_RE.match(line):
+                head, text = note
+                lines.append(f"{head} : " + "\\n".join(text))
+                note = None
+            elif line:
+                note[1].append(" ".join(line.split()))
+            continue
+        if skip_until is not None:
+            if skip_until.match(line):
+                skip_until = None
+            continue
+        if not line or line.startswith("'"):
+            continue
+        block = next((end for start, end in _DIRECTIVE_BLOCKS if start.match(line)), None)
+        if block is not None:
+            skip_until = block
+            continue
+        if _DIRECTIVE_RE.match(line):
+            continue
+        note_match = _NOTE_RE.match(line)
+        if note_match:
+            head = _clean(note_match.group(1))
+            if note_match.group(2) is None and '"' not in head:
+                note = (head, [])
+            else:
+                lines.append(_clean(line) if note_match.group(2) is None else f"{head} : {note_match.group(2).strip()}")
+            continue
+        lines.append(line)
+    if note is not None or skip_until is not None:
+        raise PlantUMLParseError("Bloque sin cerrar")
+    return lines
+
+
+def _detect_kind(lines: List[str]) -> Optional[str]:
+    if any(re.match(r"^(?:component\b|\[[^\]]+\])", line, re.I) for line in lines):
+        return COMPONENT
+    if any(_CLASS_DECL_RE.match(line) and not line.lower().startswith("entity") for line in lines):
+        return CLASS
+    if any(_PARTICIPANT_RE.match(line) or _SEQ_CONTROL_RE.match(line) for line in lines):
+        return SEQUENCE
+    if any(_MESSAGE_RE.match(line) and ":" in line for line in lines):
+        return SEQUENCE
+    if any(re.search(r"<\|--|--\|>|\*--|--\*|o--|--o", line) for line in lines):
+        return CLASS
+    return None
+
+
+def _class_name(decl: str) -> str:
+    """Nombre con el que se referencia una clase declarada (alias si lo tiene)."""
+    alias = re.search(r"\sas\s+(\S+)", decl)
+    if alias:
+        return alias.group(1)
+    return re.match(r'"[^"]+"|[^\s<]+', decl).group(0)
+
+
+def _relation(line: str, keep_length: bool = False) -> Optional[str]:
+    match = _RELATION_RE.match(line)
+    if not match:
+        return None
+    left, left_card, arrow, right_card, right, label = match.groups()
+    parts = [_clean(left)]
+    if left_card:
+        parts.append(left_card)
+    parts.append(_normalize_arrow(arrow, keep_length))
+    if right_card:
+        parts.append(right_card)
+    parts.append(_clean(right))
+    relation = " ".join(parts)
+    if label:
+        relation += f" : {' '.join(label.split())}"
+    return relation
+
+
+class Diagram:
+    """Modelo estructurado de un diagrama PlantUML."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        # Clases: nombre -> {"header", "members", "package"}
+        self.classes: Dict[str, Dict[str, Any]] = {}
+        # Contenedores (paquetes, nodos...) en orden de aparición: ruta -> cabecera
+        self.containers: Dict[Tuple[str, ...], str] = {}
+        # Componentes: (ruta del contenedor, declaración)
+        self.components: List[Tuple[Tuple[str, ...], str]] = []
+        self.participants: List[str] = []
+        # Mensajes y bloques (alt/loop/...) en orden
+        self.events: List[str] = []
+        self.relations: List[str] = []
+        self.notes: List[str] = []
+
+    def is_empty(self) -> bool:
+        return not (self.classes or self.components or self.participants or self.events or self.relations)
+
+    def serialize(self) -> str:
+        """PlantUML canónico mínimo del modelo."""
+        lines = ["@startuml"]
+        if self.kind == SEQUENCE:
+            lines.extend(self.participants)
+            lines.extend(self.events)
+        else:
+            lines.extend(self._serialize_container(()))
+            lines.extend(self.relations)
+        lines.extend(self.notes)
+        lines.append("@enduml")
+        return "\n".join(lines)
+
+    def _serialize_container(self, path: Tuple[str, ...]) -> List[str]:
+        lines = []
+        for name, cls in self.classes.items():
+            if cls["package"] == path:
+                if cls["members"]:
+                    lines.append(f"{cls['header']} {{")
+                    lines.extend(f"  {member}" for member in cls["members"])
+                    lines.append("}")
+                else:
+                    lines.append(cls["header"])
+        lines.extend(decl for parent, decl in self.components if parent == path)
+        for child, header in self.containers.items():
+            if child[:-1] == path:
+                lines.append(f"{header} {{")
+                lines.extend(self._serialize_container(child))
+                lines.append("}")
+        return lines
+
+
+def _add_relation(diagram: Diagram, relation: str) -> None:
+    if relation not in diagram.relations:
+        diagram.relations.append(relation)
+
+
+def _parse_class(lines: List[str]) -> Diagram:
+    diagram = Diagram(CLASS)
+    stack: List[Optional[str]] = []  # nombre del contenedor o None (together)
+    current: Optional[Dict[str, Any]] = None
+
+    def path() -> Tuple[str, ...]:
+        return tuple(name for name in stack if name is not None)
+
+    for line in lines:
+        if current is not None:
+            if line == "}":
+                current = None
+            elif not _SEPARATOR_RE.match(line):
+                member = re.sub(r"^([-+#~])\s+", r"\1", " ".join(line.split()))
+                current["members"].append(_MEMBER_COLON_RE.sub(": ", member))
+            continue
+        if line == "}":
+            if not stack:
+                raise PlantUMLParseError("Llave de cierre sin abrir")
+            stack.pop()
+            continue
+        if line.lower().startswith("note"):
+            diagram.notes.append(line)
+            continue
+        package = _PACKAGE_RE.match(line)
+        if package:
+            name = _clean(package.group(2))
+            stack.append(name)
+            diagram.containers.setdefault(path(), f"{package.group(1).lower()} {name}")
+            continue
+        if _TOGETHER_RE.match(line):
+            stack.append(None)
+            continue
+        decl = _CLASS_DECL_RE.match(line)
+        if decl:
+            keyword = " ".join(decl.group(1).lower().split())
+            header = f"{keyword} {_clean(decl.group(2))}"
+            name = _class_name(_clean(decl.group(2)))
+            cls = diagram.classes.setdefault(name, {"header": header, "members": [], "package": path()})
+            cls["header"] = header
+            if decl.group(3) and not decl.group(4):
+                current = cls
+            continue
+        relation = _relation(line)
+        if relation:
+            _add_relation(diagram, relation)
+            continue
+        member = _CLASS_MEMBER_RE.match(line)
+        if member:
+            name = member.group(1)
+            cls = diagram.classes.setdefault(name, {"header": f"class {name}", "members": [], "package": path()})
+            text = re.sub(r"^([-+#~])\s+", r"\1", " ".join(member.group(2).split()))
+            cls["members"].append(_MEMBER_COLON_RE.sub(": ", text))
+            continue
+        raise PlantUMLParseError(f"Línea no reconocida: {line}")
+    if stack or current is not None:
+        raise PlantUMLParseError("Bloque sin cerrar")
+    return diagram
+
+
+def _parse_sequence(lines: List[str]) -> Diagram:
+    diagram = Diagram(SEQUENCE)
+    for line in lines:
+        participant = _PARTICIPANT_RE.match(line)
+        if participant:
+            decl = re.sub(r"\s+order\s+-?\d+", "", _clean(participant.group(2)))
+            diagram.participants.append(f"{participant.group(1).lower()} {decl}")
+            continue
+        if _SEQ_IGNORED_RE.match(line):
+            continue
+        if _SEQ_CONTROL_RE.match(line):
+            diagram.events.append(" ".join(line.split()))
+            continue
+        if line.lower().startswith(("note", "rnote", "hnote")):
+            diagram.events.append(line)
+            continue
+        message = _MESSAGE_RE.match(line)
+        if message:
+            left, arrow, right, label = message.groups()
+            text = f"{left} {_normalize_arrow(arrow, keep_length=True)} {right}"
+            if label:
+                text += f" : {' '.join(label.split())}"
+            diagram.events.append(text)
+            continue
+        raise PlantUMLParseError(f"Línea no reconocida: {line}")
+    return diagram
+
+
+def _parse_component(lines: List[str]) -> Diagram:
+    diagram = Diagram(COMPONENT)
+    stack: List[str] = []
+    for line in lines:
+        if line == "}":
+            if not stack:
+                raise PlantUMLParseError("Llave de cierre sin abrir")
+            stack.pop()
+            continue
+        if line.lower().startswith("note"):
+            diagram.notes.append(line)
+            continue
+        decl = _COMPONENT_DECL_RE.match(line)
+        if decl:
+            text = f"{decl.group(1).lower()} {_clean(decl.group(2))}"
+            if decl.group(3):
+                stack.append(text)
+                diagram.containers.setdefault(tuple(stack), text)
+            else:
+                diagram.components.append((tuple(stack), text))
+            continue
+        relation = _relation(line)
+        if relation:
+            _add_relation(diagram, relation)
+            continue
+        if _COMPONENT_INLINE_RE.match(line):
+            diagram.components.append((tuple(stack), _clean(line)))
+            continue
+        raise PlantUMLParseError(f"Línea no reconocida: {line}")
+    if stack:
+        raise PlantUMLParseError("Bloque sin cerrar")
+    return diagram
+
+
+_PARSERS = {CLASS: _parse_class, SEQUENCE: _parse_sequence, COMPONENT: _parse_component}
+
+
+def parse_diagram(body: str) -> Diagram:
+    """
+    Analiza el contenido de un bloque @startuml ... @enduml.
+
+    Args:
+        body: Líneas entre @startuml y @enduml (sin los marcadores)
+
+    Returns:
+        Diagram con el modelo estructurado
+
+    Raises:
+        PlantUMLParseError: Si el tipo de diagrama no está soportado o hay
+            líneas que el parser no reconoce
+    """
+    lines = _logical_lines(body)
+    kind = _detect_kind(lines)
+    if kind is None:
+        raise PlantUMLParseError("Tipo de diagrama no soportado")
+    diagram = _PARSERS[kind](lines)
+    if diagram.is_empty():
+        raise PlantUMLParseError("Diagrama vacío")
+    return diagram
+
+
+def compact_plantuml(text: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Sustituye los bloques PlantUML de la salida del paso 1 por su forma canónica.
+
+    Los bloques que no se pueden analizar se conservan sin cercas ni cambios;
+    si no hay ningún bloque @startuml se devuelve el texto original.
+
+    Args:
+        text: Salida (filtrada) del modelo de visión
+
+    Returns:
+        Tupla (texto para el prompt del paso 2, estadísticas con bloques
+        encontrados y compactados y tokens estimados antes y después)
+    """
+    blocks = _BLOCK_RE.findall(text)
+    stats: Dict[str, Any] = {"plantuml_blocks": len(blocks), "plantuml_compacted": 0}
+    if not blocks:
+        return text, stats
+
+    serialized = []
+    for body in blocks:
+        raw = f"@startuml\n{body.strip()}\n@enduml"
+        try:
+            diagram = parse_diagram(body)
+        except PlantUMLParseError:
+            PLANTUML_BLOCKS_TOTAL.inc(kind="unknown", result="fallback")
+            serialized.append(raw)
+            continue
+        compact = diagram.serialize()
+        if len(compact) >= len(raw):
+            PLANTUML_BLOCKS_TOTAL.inc(kind=diagram.kind, result="fallback")
+            serialized.append(raw)
+            continue
+        PLANTUML_BLOCKS_TOTAL.inc(kind=diagram.kind, result="compacted")
+        stats["plantuml_compacted"] += 1
+        serialized.append(compact)
+
+    result = "\n\n".join(serialized)
+    raw_tokens = estimate_tokens(text)
+    compact_tokens = estimate_tokens(result)
+    saved = max(raw_tokens - compact_tokens, 0)
+    PLANTUML_TOKENS_SAVED_TOTAL.inc(saved)
+    stats.update({
+        "plantuml_tokens_est": raw_tokens,
+        "plantuml_compact_tokens_est": compact_tokens,
+        "plantuml_tokens_saved_est": saved,
+    })
+    return result, stats
+
+
+# ─── Veredictos del paso de visión ───────────────────────────────────────────
+
+_START = "@startuml"
+_END = "@enduml"
+_NO_DIAGRAM = "no diagram"
+_MARKER_LEN = max(len(_START), len(_END), len(_NO_DIAGRAM))
+
+
+class VisionVerdicts:
+    """
+    Cuenta, sobre el stream del modelo de visión, los veredictos ya emitidos.
+
+    Cada bloque @startuml ... @enduml completo o cada "No diagram" fuera de un
+    bloque es el veredicto de una imagen. Cuando hay tantos como imágenes, el
+    resto de la respuesta se descarta igualmente y se puede cortar la
+    generación. El análisis es incremental: cada chunk solo se examina desde
+    donde se quedó el anterior.
+    """
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.verdicts = 0
+        self.diagrams = 0
+        self._parts: List[str] = []
+        self._tail = ""
+        self._in_block = False
+
+    @property
+    def complete(self) -> bool:
+        return self.expected > 0 and self.verdicts >= self.expected
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Añade un chunk del stream.
+
+        Returns:
+            True si ya hay un veredicto para cada imagen
+        """
+        self._parts.append(chunk)
+        window = self._tail + chunk.lower()
+        position = 0
+        while not self.complete:
+            if self._in_block:
+                found = window.find(_END, position)
+                if found < 0:
+                    break
+                self._in_block = False
+                self.diagrams += 1
+                self.verdicts += 1
+                position = found + len(_END)
+            else:
+                start = window.find(_START, position)
+                no_diagram = window.find(_NO_DIAGRAM, position)
+                if no_diagram >= 0 and (start < 0 or no_diagram < start):
+                    self.verdicts += 1
+                    position = no_diagram + len(_NO_DIAGRAM)
+                elif start >= 0:
+                    self._in_block = True
+                    position = start + len(_START)
+                else:
+                    break
+        # Lo que queda puede ser el principio de un marcador partido entre chunks
+        self._tail = window[max(position, len(window) - _MARKER_LEN + 1):]
+        return self.complete
+
+    @property
+    def text(self) -> str:
+        """
+        Salida acumulada. Si se ha cortado justo tras el último @enduml, se
+        cierra la cerca ``` que quedó abierta para que el bloque se extraiga igual.
+        """
+        text = "".join(self._parts)
+        if self.complete and text.count("```") % 2:
+            text += "\n```"
+        return text
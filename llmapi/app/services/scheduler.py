@@ -0,0 +1,171 @@
+"""
+Planificador de peticiones a Ollama.
+
+Limita cuántas generaciones se envían a la vez a cada modelo; el resto espera
+en una cola FIFO por modelo. Así la cola es visible (profundidad y espera en
+métricas y en el desglose de la petición) en lugar de quedar oculta dentro de
+Ollama, y sirve de punto único para decidir qué se envía y cuándo.
+
+Las funciones de servicio son síncronas y se ejecutan en el threadpool, por lo
+que las ranuras se esperan con primitivas de threading. Una petición cuya
+generación se cancela (p. ej. un stream abandonado) sale de la cola sin
+esperar a tener ranura.
+
+Los lotes y los trabajos pueden dejar muchas generaciones esperando ranura a
+la vez; run_in_background las ejecuta en un pool propio y acotado para que no
+ocupen los hilos del threadpool que atienden al resto de peticiones.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+from app.core.config import BACKGROUND_GENERATION_THREADS, SCHEDULER_MODEL_SLOTS, SCHEDULER_SLOTS
+from app.core.generations import Generation, GenerationCancelled
+from app.core.metrics import LATENCY_BUCKETS, REGISTRY, Gauge, Histogram
+from app.core.telemetry import RequestTelemetry
+
+SCHEDULER_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "llmapi_scheduler_wait_seconds", "Espera en la cola del planificador por modelo", ("model",),
+    buckets=LATENCY_BUCKETS
+))
+SCHEDULER_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "llmapi_scheduler_queue_depth", "Peticiones esperando ranura por modelo", ("model",)
+))
+SCHEDULER_ACTIVE = REGISTRY.register(Gauge(
+    "llmapi_scheduler_active", "Peticiones en curso en Ollama por modelo", ("model",)
+))
+
+T = TypeVar("T")
+
+# Cada cuánto comprueba una petición en espera si su generación se ha cancelado
+CANCEL_POLL_INTERVAL = 0.25
+
+
+class _ModelQueue:
+    """Ranuras de un modelo con cola FIFO de espera."""
+
+    def __init__(self, model: str, slots: int):
+        self.model = model
+        self.slots = max(slots, 1)
+        self.active = 0
+        self._waiters: Deque[object] = deque()
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, generation: Optional[Generation] = None) -> None:
+        """
+        Raises:
+            GenerationCancelled: Si la generación se cancela mientras espera
+        """
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            SCHEDULER_QUEUE_DEPTH.inc(model=self.model)
+            while self._waiters[0] is not ticket or self.active >= self.slots:
+                if generation is not None and generation.cancelled:
+                    self._waiters.remove(ticket)
+                    SCHEDULER_QUEUE_DEPTH.dec(model=self.model)
+                    self._cond.notify_all()
+                    raise GenerationCancelled("Generación cancelada")
+                self._cond.wait(CANCEL_POLL_INTERVAL if generation is not None else None)
+            self._waiters.popleft()
+            self.active += 1
+            SCHEDULER_QUEUE_DEPTH.dec(model=self.model)
+            SCHEDULER_ACTIVE.inc(model=self.model)
+            # El siguiente en la cola puede tener ranura libre también
+            self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            SCHEDULER_ACTIVE.dec(model=self.model)
+            self._cond.notify_all()
+
+
+class ModelScheduler:
+    """Ranuras por modelo para las llamadas de generación a Ollama."""
+
+    def __init__(self, default_slots: int = SCHEDULER_SLOTS, model_slots: Optional[Dict[str, int]] = None):
+        self.default_slots = default_slots
+        self.model_slots = dict(SCHEDULER_MODEL_SLOTS if model_slots is None else model_slots)
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        with self._lock:
+            queue = self._queues.get(model)
+            if queue is None:
+                queue = _ModelQueue(model, self.model_slots.get(model, self.default_slots))
+                self._queues[model] = queue
+            return queue
+
+    @contextmanager
+    def slot(self, model: str, telemetry: Optional[RequestTelemetry] = None):
+        """
+        Bloquea hasta obtener una ranura del modelo y la libera al salir.
+
+        La espera se registra en métricas y, si hay telemetry, como span
+        "scheduler_wait" del paso actual.
+        """
+        queue = self._queue(model)
+        t0 = time.perf_counter()
+        queue.acquire(telemetry.generation if telemetry else None)
+        waited = time.perf_counter() - t0
+        SCHEDULER_WAIT_SECONDS.observe(waited, model=model)
+        if telemetry:
+            telemetry.add_span("scheduler_wait", waited)
+        try:
+            yield
+        finally:
+            queue.release()
+
+    def depth(self, model: str) -> int:
+        """Peticiones esperando ranura para el modelo."""
+        queue = self._queues.get(model)
+        return queue.waiting if queue else 0
+
+    def load(self, model: str) -> Dict[str, int]:
+        """Ranuras, peticiones en curso y en espera de un modelo (aunque aún no tenga cola)."""
+        queue = self._queues.get(model)
+        if queue is None:
+            return {"slots": max(self.model_slots.get(model, self.default_slots), 1), "active": 0, "waiting": 0}
+        return {"slots": queue.slots, "active": queue.active, "waiting": queue.waiting}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de las colas: ranuras, en curso y en espera por modelo."""
+        with self._lock:
+            queues = list(self._queues.values())
+        return {
+            q.model: {"slots": q.slots, "active": q.active, "waiting": q.waiting}
+            for q in queues
+        }
+
+
+scheduler = ModelScheduler()
+
+
+_background_executor = ThreadPoolExecutor(
+    max_workers=max(BACKGROUND_GENERATION_THREADS, 1), thread_name_prefix="background-generation"
+)
+
+
+async def run_in_background(func: Callable[..., T], *args: Any) -> T:
+    """
+    Ejecuta una función síncrona en el pool de generaciones de fondo (lotes y trabajos).
+
+    Como run_in_threadpool, conserva las variables de contexto (id de petición).
+    Si se cancela antes de que empiece, la función no llega a ejecutarse.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _background_executor, functools.partial(context.run, func, *args)
+    )
@@ -0,0 +1,132 @@
+"""
+Precalentamiento del servicio al arrancar.
+
+Recorre el catálogo de modelos (lo que también rellena la caché de capacidades
+de visión), calcula la selección del modo auto y, opcionalmente, precarga los
+modelos configurados con keep_alive y lanza una generación mínima en cada uno.
+El estado se expone en GET /ready para que el balanceador no envíe tráfico a
+una instancia fría.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import (
+    WARMUP_DEADLINE,
+    WARMUP_ENABLED,
+    WARMUP_GENERATE,
+    WARMUP_KEEP_ALIVE,
+    WARMUP_MODELS,
+)
+from app.core.logger import logger
+from app.services.ollama_service import (
+    list_models,
+    preload_model,
+    select_best_models,
+    warmup_generation,
+)
+
+
+class WarmupState:
+    """Estado del precalentamiento consultado por el endpoint de readiness."""
+
+    def __init__(self):
+        self.status = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.deadline_exceeded = False
+        self.steps: List[Dict[str, Any]] = []
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "disabled")
+
+    def record(self, step: str, started: float, **details) -> None:
+        self.steps.append({
+            "step": step,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            **details,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "status": self.status,
+            "ready": self.ready,
+            "deadline_exceeded": self.deadline_exceeded,
+            "steps": list(self.steps),
+        }
+        if self.started_at is not None:
+            end = self.finished_at or time.time()
+            result["elapsed_s"] = round(end - self.started_at, 2)
+        return result
+
+
+warmup_state = WarmupState()
+
+
+def _models_to_preload(configured: List[str]) -> List[str]:
+    models: List[str] = []
+    for name in configured:
+        if name == "auto":
+            selected = select_best_models()
+            if selected:
+                models.extend([selected["vision_model"], selected["coding_model"]])
+        else:
+            models.append(name)
+    # Sin duplicados, respetando el orden
+    return list(dict.fromkeys(models))
+
+
+def _run_steps(state: WarmupState, models: List[str], generate: bool, keep_alive: str) -> None:
+    started = time.perf_counter()
+    catalog = list_models()
+    count = len(catalog.get("models", []))
+    state.record("catalog", started, success="error" not in catalog, models=count)
+
+    started = time.perf_counter()
+    to_preload = _models_to_preload(models)
+    state.record("select", started, models=to_preload)
+
+    for model in to_preload:
+        started = time.perf_counter()
+        result = preload_model(model, keep_alive)
+        state.record("preload", started, **result)
+        if generate and result.get("success"):
+            started = time.perf_counter()
+            state.record("generate", started, **warmup_generation(model, keep_alive))
+
+
+async def run_warmup(
+    state: WarmupState = warmup_state,
+    enabled: bool = WARMUP_ENABLED,
+    models: Optional[List[str]] = None,
+    generate: bool = WARMUP_GENERATE,
+    keep_alive: str = WARMUP_KEEP_ALIVE,
+    deadline: float = WARMUP_DEADLINE
+) -> None:
+    """
+    Ejecuta el precalentamiento y marca el servicio como listo al terminar
+    o al vencer el plazo, lo que ocurra antes.
+    """
+    if not enabled:
+        state.status = "disabled"
+        return
+    models = WARMUP_MODELS if models is None else models
+    state.status = "warming"
+    state.started_at = time.time()
+    logger.info("Precalentamiento iniciado (modelos: %s, plazo: %ss)", models or 'ninguno', deadline)
+    try:
+        await asyncio.wait_for(
+            run_in_threadpool(_run_steps, state, models, generate, keep_alive),
+            timeout=deadline
+        )
+    except asyncio.TimeoutError:
+        state.deadline_exceeded = True
+        logger.warning("Precalentamiento sin terminar tras %ss; se declara listo igualmente", deadline)
+    except Exception:
+        logger.exception("Error durante el precalentamiento")
+    state.finished_at = time.time()
+    state.status = "ready"
+    logger.info("Precalentamiento terminado en %.1fs", state.finished_at - state.started_at)
@@ -0,0 +1,170 @@
+"""
+Casos de microbenchmark de las funciones del camino de la petición.
+
+Cada caso es un context manager que prepara los datos, entrega una función
+sin argumentos a medir y deshace cualquier parche al salir.
+"""
+import json
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+from unittest.mock import patch
+
+from app.core.cache import MemoryCache
+from app.routes.generate import _extract_content, _sse_data
+from app.services import ollama_service
+from app.services.ollama_service import (
+    _CODE_BLOCK_RE,
+    _encode_images,
+    _iter_stream_content,
+    replace_image_references,
+)
+
+CASES: Dict[str, Callable[[], Iterator[Callable[[], object]]]] = {}
+
+
+def case(name: str):
+    """Registra un caso de benchmark bajo el nombre dado."""
+    def decorator(fn):
+        CASES[name] = contextmanager(fn)
+        return fn
+    return decorator
+
+
+class _FakeResponse:
+    """Respuesta mínima con iter_lines() como la de requests en modo stream."""
+
+    def __init__(self, lines: List[bytes]):
+        self._lines = lines
+
+    def iter_lines(self):
+        return iter(self._lines)
+
+    def close(self):
+        pass
+
+
+def _ndjson_lines(tokens: int) -> List[bytes]:
+    lines = [
+        json.dumps({"model": "bench", "message": {"role": "assistant", "content": f"tok{i} "}, "done": False}).encode()
+        for i in range(tokens)
+    ]
+    lines.append(json.dumps({
+        "model": "bench", "message": {"role": "assistant", "content": ""}, "done": True,
+        "prompt_eval_count": 100, "prompt_eval_duration": 10**8,
+        "eval_count": tokens, "eval_duration": 10**9, "load_duration": 10**6,
+    }).encode())
+    return lines
+
+
+_PLANTUML_BLOCK = "```\n@startuml\nclass Usuario {\n  - id: int\n  + login(): boolean\n}\n@enduml\n```"
+
+
+# ─── _extract_content ─────────────────────────────────────────────────────────
+
+@case("extract_content[message]")
+def _extract_message():
+    resp = {"message": {"content": "def hello(): pass"}, "done": True}
+    yield lambda: _extract_content(resp)
+
+
+@case("extract_content[choices]")
+def _extract_choices():
+    resp = {"choices": [{"message": {"content": "result"}}]}
+    yield lambda: _extract_content(resp)
+
+
+@case("extract_content[response]")
+def _extract_response():
+    resp = {"response": "result"}
+    yield lambda: _extract_content(resp)
+
+
+# ─── Decodificación NDJSON ────────────────────────────────────────────────────
+
+@case("ndjson_decode[100_tokens]")
+def _ndjson_100():
+    resp = _FakeResponse(_ndjson_lines(100))
+    yield lambda: sum(1 for _ in _iter_stream_content(resp, "bench"))
+
+
+@case("ndjson_decode[1000_tokens]")
+def _ndjson_1000():
+    resp = _FakeResponse(_ndjson_lines(1000))
+    yield lambda: sum(1 for _ in _iter_stream_content(resp, "bench"))
+
+
+# ─── Codificación base64 ──────────────────────────────────────────────────────
+
+def _base64_case(megabytes: int):
+    def run():
+        data = os.urandom(megabytes * 1024 * 1024)
+        yield lambda: _encode_images([data])
+    return run
+
+
+for _mb in (1, 5, 10):
+    case(f"base64_encode[{_mb}MB]")(_base64_case(_mb))
+
+
+# ─── Prompt del paso 2 ────────────────────────────────────────────────────────
+
+@case("replace_image_references[short]")
+def _replace_short():
+    prompt = "Genera el código Java de la imagen adjunta"
+    yield lambda: replace_image_references(prompt)
+
+
+@case("replace_image_references[long]")
+def _replace_long():
+    prompt = ("Con estas imágenes genera las clases; cada image representa un módulo. " * 50)
+    yield lambda: replace_image_references(prompt)
+
+
+@case("code_block_regex[1_block]")
+def _code_block_1():
+    content = _PLANTUML_BLOCK
+    yield lambda: _CODE_BLOCK_RE.findall(content)
+
+
+@case("code_block_regex[5_blocks]")
+def _code_block_5():
+    content = "\n\nNo diagram\n\n".join([_PLANTUML_BLOCK] * 5)
+    yield lambda: _CODE_BLOCK_RE.findall(content)
+
+
+# ─── Frames SSE ───────────────────────────────────────────────────────────────
+
+@case("sse_frame[token]")
+def _sse_token():
+    yield lambda: _sse_data(" hello")
+
+
+@case("sse_frame[multiline_chunk]")
+def _sse_multiline():
+    chunk = _PLANTUML_BLOCK * 4
+    yield lambda: _sse_data(chunk)
+
+
+# ─── select_best_models ───────────────────────────────────────────────────────
+
+def _catalog(size: int) -> List[str]:
+    families = ["llava", "qwen2.5-coder", "llama3", "mistral", "deepseek-coder", "qwen2-vl", "phi3", "gemma2"]
+    return [f"{families[i % len(families)]}-v{i}:{(i % 70) + 1}b" for i in range(size)]
+
+
+def _select_case(size: int):
+    def run():
+        names = _catalog(size)
+        data = {"models": [{"name": n} for n in names]}
+        vision = MemoryCache("bench-vision", max_bytes=0)
+        for n in names:
+            vision.set(n, any(k in n for k in ("llava", "-vl")))
+        with patch.object(ollama_service, "list_models", return_value=data), \
+                patch.object(ollama_service, "_vision_cache", vision):
+            yield ollama_service.select_best_models
+    return run
+
+
+for _size in (10, 100, 500):
+    case(f"select_best_models[{_size}_models]")(_select_case(_size))
@@ -0,0 +1,142 @@
+"""
+Ejecuta los microbenchmarks y compara con una línea base.
+
+Uso:
+    python -m benchmarks.run                                  # mostrar resultados
+    python -m benchmarks.run --output benchmarks/baseline.json  # guardar línea base
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.15
+
+En modo comparación el proceso termina con código 1 si algún caso es más lento
+que la línea base por encima del umbral (0.15 = +15 %).
+"""
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.cases import CASES
+
+
+def measure(fn: Callable[[], object], min_time: float, repeats: int) -> Dict[str, Any]:
+    """
+    Mide el coste por llamada de fn.
+
+    Calibra el número de iteraciones para que cada repetición dure al menos
+    min_time y devuelve la mediana y el mínimo en nanosegundos por llamada.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9 or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time * 1e8 else 2
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter_ns() - start) / loops)
+
+    return {
+        "ns_per_call": round(statistics.median(samples), 1),
+        "min_ns": round(min(samples), 1),
+        "loops": loops,
+        "repeats": repeats,
+    }
+
+
+def run_cases(name_filter: Optional[str], min_time: float, repeats: int) -> Dict[str, Any]:
+    results = {}
+    for name, factory in CASES.items():
+        if name_filter and name_filter not in name:
+            continue
+        with factory() as fn:
+            results[name] = measure(fn, min_time, repeats)
+        print(f"{name:<40} {_format_ns(results[name]['ns_per_call']):>12}")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compara los resultados con la línea base.
+
+    Returns:
+        Lista de casos que empeoran por encima del umbral
+    """
+    regressions = []
+    base_results = baseline.get("results", {})
+    print(f"\n{'caso':<40} {'base':>12} {'actual':>12} {'cambio':>8}")
+    for name, result in current["results"].items():
+        base = base_results.get(name)
+        if not base:
+            print(f"{name:<40} {'-':>12} {_format_ns(result['ns_per_call']):>12} {'nuevo':>8}")
+            continue
+        ratio = result["ns_per_call"] / base["ns_per_call"] - 1
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESIÓN"
+        print(f"{name:<40} {_format_ns(base['ns_per_call']):>12} "
+              f"{_format_ns(result['ns_per_call']):>12} {ratio:>+8.1%}{flag}")
+    return regressions
+
+
+def _format_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks de llmapi")
+    parser.add_argument("--filter", default=None, help="Solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Segundos mínimos por repetición")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Guardar los resultados en JSON")
+    parser.add_argument("--compare", default=None, help="Línea base JSON con la que comparar")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Empeoramiento relativo tolerado antes de marcar regresión")
+    args = parser.parse_args(argv)
+
+    # Los logs del servicio no forman parte de lo que se mide
+    logging.getLogger("fastapi-ollama").setLevel(logging.ERROR)
+
+    current = run_cases(args.filter, args.min_time, args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones por encima de {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("\nSin regresiones")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Generador de carga para /generate/stream (modo manual y modo automático).
+
+Lanza peticiones con una concurrencia objetivo durante un tiempo o un número
+total de peticiones y resume throughput, percentiles de TTFT y latencia, y el
+consumo de CPU y RSS del proceso FastAPI (leído de /proc, solo Linux).
+
+Uso:
+    python -m loadtest.loadgen --url http://127.0.0.1:8001 --concurrency 8 \\
+        --duration 60 --auto-ratio 0.3 --pid $(pgrep -f "uvicorn app.main")
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Marcadores de control del modo auto que no cuentan como primer token
+_CONTROL_CHUNKS = ("[STEP1_START]", "[STEP1_END]", "[STEP2_START]")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal (pct entre 0 y 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p90": round(percentile(values, 90), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+class ProcessSampler:
+    """Muestrea CPU y RSS de un proceso leyendo /proc/<pid>."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.rss_samples: List[int] = []
+        self.cpu_seconds_start: Optional[float] = None
+        self.cpu_seconds_end: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime y stime son los campos 14 y 15 (índices 11 y 12 tras el nombre)
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_bytes(self) -> int:
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    async def _run(self):
+        while True:
+            self.rss_samples.append(self._rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self.cpu_seconds_start = self._cpu_seconds()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.cpu_seconds_end = self._cpu_seconds()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        cpu = (self.cpu_seconds_end or 0) - (self.cpu_seconds_start or 0)
+        rss = self.rss_samples or [0]
+        return {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else 0.0,
+            "rss_max_mb": round(max(rss) / 2**20, 1),
+            "rss_avg_mb": round(sum(rss) / len(rss) / 2**20, 1),
+        }
+
+
+def build_form(args, auto: bool) -> Dict[str, Any]:
+    """Construye los campos y ficheros multipart de una petición."""
+    data = {"model": args.model, "prompt": "Genera el código de las clases del diagrama"}
+    files = []
+    if auto:
+        data["auto_mode"] = "true"
+        if args.vision_model and args.coding_model:
+            data["vision_model"] = args.vision_model
+            data["coding_model"] = args.coding_model
+        for i in range(args.images):
+            files.append(("images", (f"diagram{i}.png", os.urandom(args.image_kb * 1024), "image/png")))
+    return {"data": data, "files": files or None}
+
+
+async def run_request(client: httpx.AsyncClient, url: str, form: Dict[str, Any]) -> Dict[str, Any]:
+    """Lanza una petición SSE y mide TTFT, latencia total y bytes recibidos."""
+    start = time.perf_counter()
+    ttft = None
+    result: Dict[str, Any] = {"ok": False}
+    try:
+        async with client.stream("POST", url, data=form["data"], files=form["files"]) as resp:
+            if resp.status_code != 200:
+                result["error"] = f"http_{resp.status_code}"
+                await resp.aread()
+                return result
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[6:]
+                if payload == "[DONE]":
+                    result["ok"] = True
+                    break
+                if payload.startswith("[ERROR]"):
+                    result["error"] = "stream_error"
+                    break
+                if ttft is None:
+                    try:
+                        chunk = json.loads(payload)
+                    except json.JSONDecodeError:
+                        chunk = payload
+                    if chunk not in _CONTROL_CHUNKS:
+                        ttft = time.perf_counter() - start
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    result["latency"] = time.perf_counter() - start
+    result["ttft"] = ttft
+    return result
+
+
+async def run_load(args) -> Dict[str, Any]:
+    url = args.url.rstrip("/") + "/generate/stream"
+    results: List[Dict[str, Any]] = []
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    remaining = [args.requests]
+    sampler = ProcessSampler(args.pid) if args.pid else None
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if deadline is None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            auto = random.random() < args.auto_ratio
+            res = await run_request(client, url, build_form(args, auto))
+            res["mode"] = "auto" if auto else "manual"
+            results.append(res)
+
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    start = time.perf_counter()
+    if sampler:
+        sampler.start()
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    if sampler:
+        await sampler.stop()
+
+    return build_report(results, elapsed, sampler.report(elapsed) if sampler else None)
+
+
+def build_report(results: List[Dict[str, Any]], elapsed: float,
+                 process: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Agrega los resultados individuales en el informe final."""
+    ok = [r for r in results if r.get("ok")]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r.get("ok"):
+            errors[r.get("error", "unknown")] = errors.get(r.get("error", "unknown"), 0) + 1
+    report: Dict[str, Any] = {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "ttft_s": summarize([r["ttft"] for r in ok if r.get("ttft") is not None]),
+        "latency_s": summarize([r["latency"] for r in ok]),
+    }
+    for mode in ("manual", "auto"):
+        subset = [r for r in ok if r.get("mode") == mode]
+        if subset:
+            report[mode] = {
+                "ok": len(subset),
+                "ttft_s": summarize([r["ttft"] for r in subset if r.get("ttft") is not None]),
+                "latency_s": summarize([r["latency"] for r in subset]),
+            }
+    if process:
+        report["process"] = process
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Peticiones: {report['requests']}  OK: {report['ok']}  Errores: {report['errors']}")
+    print(f"Duración: {report['elapsed_s']}s  Throughput: {report['throughput_rps']} req/s")
+    print(f"TTFT (s):     {report['ttft_s']}")
+    print(f"Latencia (s): {report['latency_s']}")
+    for mode in ("manual", "auto"):
+        if mode in report:
+            print(f"  [{mode}] TTFT {report[mode]['ttft_s']}  latencia {report[mode]['latency_s']}")
+    if "process" in report:
+        print(f"Proceso FastAPI: {report['process']}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generador de carga para /generate/stream")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="URL base de llmapi")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=0, help="Segundos de prueba (0 = usar --requests)")
+    parser.add_argument("--requests", type=int, default=20, help="Total de peticiones si no hay --duration")
+    parser.add_argument("--model", default="qwen2.5-coder:7b")
+    parser.add_argument("--auto-ratio", type=float, default=0.0, help="Fracción de peticiones en modo auto")
+    parser.add_argument("--vision-model", default=None)
+    parser.add_argument("--coding-model", default=None)
+    parser.add_argument("--images", type=int, default=1, help="Imágenes por petición auto")
+    parser.add_argument("--image-kb", type=int, default=256, help="Tamaño de cada imagen en KB")
+    parser.add_argument("--pid", type=int, default=None, help="PID del proceso FastAPI a muestrear")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--json", dest="json_output", default=None, help="Guardar el informe en JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
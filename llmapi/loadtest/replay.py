@@ -0,0 +1,265 @@
+"""
+Reproducción del tráfico capturado (TRAFFIC_CAPTURE_ENABLED) contra un llmapi.
+
+Cada línea de la captura se convierte en una petición con la misma forma:
+prompt e historial de relleno con el mismo número de caracteres, imágenes PNG
+válidas (ruido) del mismo tamaño en bytes, que un modelo de visión real acepta
+(el mismo hash da el mismo relleno, así que las repeticiones, y con ellas la
+caché y el almacén de imágenes, se conservan) y
+los mismos modelo, modo y opciones. Las peticiones se lanzan en lazo abierto
+a su instante original dividido por --speed, sin esperar a las anteriores,
+para respetar las ráfagas.
+
+El informe es el de loadgen (throughput y percentiles de TTFT y latencia,
+por modo) más los mismos percentiles medidos durante la captura.
+
+Uso:
+    python -m loadtest.replay --capture data/traffic.jsonl --url http://127.0.0.1:8001 \\
+        --speed 4 --json replay.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import io
+import math
+import random
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from loadtest.loadgen import build_report, print_report, run_request, summarize
+
+# Palabras del relleno: texto con una tokenización parecida a la de un prompt real
+_WORDS = (
+    "genera", "clase", "diagrama", "atributo", "método", "public", "private", "void",
+    "return", "String", "int", "relación", "herencia", "interfaz", "código", "java",
+)
+
+
+def placeholder_text(chars: int, key: str) -> str:
+    """Texto de relleno de exactamente `chars` caracteres, determinista por clave."""
+    if chars <= 0:
+        return ""
+    rng = random.Random(key)
+    words: List[str] = []
+    length = 0
+    while length < chars:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+# Cabecera de un chunk PNG (longitud y tipo) más su CRC
+_PNG_CHUNK_OVERHEAD = 12
+_MIN_SIDE = 8
+
+
+def _noise_png(side: int, rng: random.Random) -> bytes:
+    image = Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _pad_png(png: bytes, padding: int) -> bytes:
+    """Inserta antes de IEND un chunk auxiliar privado que los decodificadores ignoran."""
+    data = b"\0" * (padding - _PNG_CHUNK_OVERHEAD)
+    chunk_type = b"rpAd"
+    chunk = struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+    iend = png.rindex(b"IEND") - 4
+    return png[:iend] + chunk + png[iend:]
+
+
+def placeholder_image(nbytes: int, key: str) -> bytes:
+    """
+    PNG válido de ruido de exactamente `nbytes` (si cabe el mínimo), determinista por clave.
+
+    El ruido apenas se comprime, así que el lado se elige para rondar el tamaño
+    pedido y el resto se completa con un chunk de relleno.
+    """
+    side = max(int(math.sqrt(nbytes / 3)), _MIN_SIDE)
+    while True:
+        png = _noise_png(side, random.Random(key))
+        padding = nbytes - len(png)
+        if padding == 0:
+            return png
+        if padding >= _PNG_CHUNK_OVERHEAD:
+            return _pad_png(png, padding)
+        if side == _MIN_SIDE:
+            # Más pequeño que el PNG mínimo: se devuelve este
+            return png
+        side = max(int(side * 0.9), _MIN_SIDE)
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Lee la captura ordenada por instante de llegada (ignora líneas no válidas)."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and "route" in record and "t" in record:
+                records.append(record)
+    records.sort(key=lambda r: r["t"])
+    return records[:limit] if limit else records
+
+
+def schedule(records: List[Dict[str, Any]], speed: float = 1.0) -> List[Tuple[float, Dict[str, Any]]]:
+    """Segundos desde el inicio de la reproducción en que se lanza cada petición."""
+    if not records:
+        return []
+    t0 = records[0]["t"]
+    return [((r["t"] - t0) / speed, r) for r in records]
+
+
+def build_form(record: Dict[str, Any], model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Campos y ficheros multipart equivalentes a una petición capturada.
+
+    Args:
+        record: Línea de la captura
+        model: Si se indica, sustituye al modelo de las peticiones manuales
+    """
+    prompt = record["prompt"]
+    data: Dict[str, Any] = {
+        "model": model or record["model"],
+        "prompt": placeholder_text(prompt["chars"], prompt["hash"]),
+    }
+    if record.get("options"):
+        data["options"] = json.dumps(record["options"])
+    images = [
+        placeholder_image(img["bytes"], img["hash"]) for img in record.get("images") or []
+    ]
+    if record["route"] == "/generate/":
+        files = [("image", ("image.png", images[0], "image/png"))] if images else None
+        return {"data": data, "files": files}
+
+    if record.get("history"):
+        data["messages"] = json.dumps([
+            {
+                "role": message["role"],
+                "content": placeholder_text(message["chars"], message["hash"]),
+                **({"images": [
+                    base64.b64encode(placeholder_image(img["bytes"], img["hash"])).decode()
+                    for img in message["images"]
+                ]} if message.get("images") else {}),
+            }
+            for message in record["history"]
+        ])
+    if record.get("auto_mode"):
+        data["auto_mode"] = "true"
+        for field in ("vision_model", "coding_model"):
+            if record.get(field):
+                data[field] = record[field]
+    if record.get("structured"):
+        data["structured"] = "true"
+    if record.get("latency_target"):
+        data["latency_target"] = str(record["latency_target"])
+    files = [("images", (f"image{i}.png", img, "image/png")) for i, img in enumerate(images)]
+    return {"data": data, "files": files or None}
+
+
+async def run_plain_request(client: httpx.AsyncClient, url: str, form: Dict[str, Any]) -> Dict[str, Any]:
+    """Lanza una petición a /generate/ (sin streaming: el TTFT es la latencia total)."""
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"ok": False}
+    try:
+        resp = await client.post(url, data=form["data"], files=form["files"])
+        if resp.status_code == 200:
+            result["ok"] = True
+        else:
+            result["error"] = f"http_{resp.status_code}"
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    result["latency"] = time.perf_counter() - start
+    result["ttft"] = result["latency"] if result["ok"] else None
+    return result
+
+
+def captured_report(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Percentiles de TTFT y latencia medidos en el servicio durante la captura."""
+    ok = [r for r in records if r.get("status") == "ok"]
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "span_s": round(records[-1]["t"] - records[0]["t"], 3) if records else 0.0,
+        "ttft_s": summarize([r["ttft_ms"] / 1000 for r in ok if r.get("ttft_ms") is not None]),
+        "latency_s": summarize([r["total_ms"] / 1000 for r in ok if r.get("total_ms") is not None]),
+    }
+
+
+async def replay(records: List[Dict[str, Any]], base_url: str, speed: float = 1.0,
+                 model: Optional[str] = None, timeout: float = 600.0) -> Dict[str, Any]:
+    """Reproduce la captura y devuelve el informe de loadgen con el de la captura en "captured"."""
+    base_url = base_url.rstrip("/")
+    results: List[Dict[str, Any]] = []
+    lag: List[float] = []
+
+    async def fire(client: httpx.AsyncClient, start: float, offset: float, record: Dict[str, Any]):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lag.append(max(time.perf_counter() - start - offset, 0.0))
+        form = build_form(record, None if record.get("auto_mode") else model)
+        if record["route"] == "/generate/":
+            res = await run_plain_request(client, base_url + "/generate/", form)
+        else:
+            res = await run_request(client, base_url + "/generate/stream", form)
+        res["mode"] = "auto" if record.get("auto_mode") else "manual"
+        results.append(res)
+
+    client_timeout = httpx.Timeout(timeout, connect=10.0)
+    # Lazo abierto: tantas conexiones como peticiones en curso
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(timeout=client_timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(fire(client, start, offset, r) for offset, r in schedule(records, speed)))
+        elapsed = time.perf_counter() - start
+
+    report = build_report(results, elapsed)
+    report["speed"] = speed
+    report["dispatch_lag_s"] = summarize(lag)
+    report["captured"] = captured_report(records)
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Reproduce tráfico capturado contra llmapi")
+    parser.add_argument("--capture", required=True, help="Fichero JSONL de TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="URL base de llmapi")
+    parser.add_argument("--speed", type=float, default=1.0, help="Factor de aceleración (2 = el doble de rápido)")
+    parser.add_argument("--limit", type=int, default=None, help="Reproducir solo las primeras N peticiones")
+    parser.add_argument("--model", default=None, help="Modelo para todas las peticiones manuales")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--json", dest="json_output", default=None, help="Guardar el informe en JSON")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.speed <= 0:
+        raise SystemExit("--speed debe ser mayor que 0")
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        raise SystemExit(f"No hay peticiones en {args.capture}")
+    report = asyncio.run(replay(records, args.url, args.speed, args.model, args.timeout))
+    print_report(report)
+    print(f"Retraso de lanzamiento (s): {report['dispatch_lag_s']}")
+    captured = report["captured"]
+    print(f"Captura: {captured['requests']} peticiones en {captured['span_s']}s  "
+          f"TTFT {captured['ttft_s']}  latencia {captured['latency_s']}")
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
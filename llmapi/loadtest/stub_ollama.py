@@ -0,0 +1,309 @@
+"""
+Servidor Ollama simulado para pruebas de carga sin GPU.
+
+Implementa /api/tags, /api/show, /api/chat, /api/generate y /api/ps con el
+mismo formato NDJSON que Ollama. La velocidad de generación, el tiempo de
+carga de modelos, la inyección de fallos y el número de slots paralelos por
+modelo son configurables.
+
+Uso:
+    python -m loadtest.stub_ollama --port 11435 --token-rate 40 --load-delay 1.5 \\
+        --parallel 2 --failure-rate 0.02
+    python -m loadtest.stub_ollama --uds /tmp/ollama-stub.sock
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_MODELS = "llava:7b,qwen2.5-coder:14b,qwen2.5-coder:7b,llama3:8b"
+
+# Palabras clave con las que el stub responde como modelo de visión
+_VISION_KEYWORDS = ("llava", "vl", "vision", "moondream")
+
+_PLANTUML_BLOCK = """```
+@startuml
+class Usuario {
+  - id: int
+  - nombre: String
+  + login(): boolean
+}
+class Pedido {
+  - total: float
+}
+Usuario "1" -- "*" Pedido
+@enduml
+```"""
+
+_CODE_TOKENS = (
+    "```python\n", "class", " Usuario", ":\n", "    def", " __init__", "(self", ", id", ", nombre",
+    "):\n", "        self", ".id", " =", " id", "\n", "        self", ".nombre", " =", " nombre",
+    "\n", "```\n",
+)
+
+
+class StubConfig:
+    """Parámetros de comportamiento del stub."""
+
+    def __init__(
+        self,
+        models: Optional[List[str]] = None,
+        token_rate: float = 50.0,
+        load_delay: float = 0.5,
+        parallel: int = 1,
+        failure_rate: float = 0.0,
+        midstream_failure_rate: float = 0.0,
+        max_tokens: int = 200,
+        prompt_eval_rate: float = 500.0,
+    ):
+        self.models = models or DEFAULT_MODELS.split(",")
+        self.token_rate = token_rate
+        self.load_delay = load_delay
+        self.parallel = parallel
+        self.failure_rate = failure_rate
+        self.midstream_failure_rate = midstream_failure_rate
+        self.max_tokens = max_tokens
+        self.prompt_eval_rate = prompt_eval_rate
+
+    @classmethod
+    def from_env(cls) -> "StubConfig":
+        models = os.getenv("STUB_MODELS", DEFAULT_MODELS)
+        return cls(
+            models=[m.strip() for m in models.split(",") if m.strip()],
+            token_rate=float(os.getenv("STUB_TOKEN_RATE", 50)),
+            load_delay=float(os.getenv("STUB_LOAD_DELAY", 0.5)),
+            parallel=int(os.getenv("STUB_PARALLEL", 1)),
+            failure_rate=float(os.getenv("STUB_FAILURE_RATE", 0)),
+            midstream_failure_rate=float(os.getenv("STUB_MIDSTREAM_FAILURE_RATE", 0)),
+            max_tokens=int(os.getenv("STUB_MAX_TOKENS", 200)),
+            prompt_eval_rate=float(os.getenv("STUB_PROMPT_EVAL_RATE", 500)),
+        )
+
+
+def _is_vision(name: str) -> bool:
+    lower = name.lower()
+    return any(k in lower for k in _VISION_KEYWORDS)
+
+
+def create_app(config: Optional[StubConfig] = None) -> FastAPI:
+    """Construye la aplicación del stub con la configuración dada."""
+    config = config or StubConfig.from_env()
+    app = FastAPI(title="Stub Ollama")
+    app.state.config = config
+    slots: Dict[str, asyncio.Semaphore] = {}
+    loaded: Dict[str, float] = {}
+    load_locks: Dict[str, asyncio.Lock] = {}
+
+    def _slot(model: str) -> asyncio.Semaphore:
+        if model not in slots:
+            slots[model] = asyncio.Semaphore(config.parallel)
+        return slots[model]
+
+    async def _ensure_loaded(model: str) -> int:
+        """Simula la carga del modelo; devuelve load_duration en ns."""
+        if model in loaded:
+            return 0
+        lock = load_locks.setdefault(model, asyncio.Lock())
+        async with lock:
+            if model in loaded:
+                return 0
+            t0 = time.perf_counter()
+            await asyncio.sleep(config.load_delay)
+            loaded[model] = time.time()
+            return int((time.perf_counter() - t0) * 1e9)
+
+    def _check_model(model: str) -> None:
+        if model not in config.models:
+            raise HTTPException(status_code=404, detail=f"model '{model}' not found")
+
+    def _tokens_for(model: str, images: int) -> List[str]:
+        if images and _is_vision(model):
+            text = "\n".join([_PLANTUML_BLOCK] * images)
+            return [text[i:i + 8] for i in range(0, len(text), 8)]
+        tokens = list(_CODE_TOKENS)
+        while len(tokens) < config.max_tokens:
+            tokens.extend(_CODE_TOKENS)
+        return tokens[:config.max_tokens]
+
+    def _prompt_len(body: Dict[str, Any]) -> int:
+        if "messages" in body:
+            return sum(len(str(m.get("content", ""))) for m in body["messages"])
+        return len(str(body.get("prompt", "")))
+
+    def _images(body: Dict[str, Any]) -> int:
+        if "messages" in body and body["messages"]:
+            return len(body["messages"][-1].get("images") or [])
+        return len(body.get("images") or [])
+
+    def _final(model: str, prompt_tokens: int, eval_count: int, load_ns: int,
+               prompt_ns: int, eval_ns: int, total_ns: int) -> Dict[str, Any]:
+        return {
+            "model": model,
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": total_ns,
+            "load_duration": load_ns,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": prompt_ns,
+            "eval_count": eval_count,
+            "eval_duration": eval_ns,
+        }
+
+    async def _generate(body: Dict[str, Any], chat: bool):
+        model = body.get("model", "")
+        _check_model(model)
+        if random.random() < config.failure_rate:
+            raise HTTPException(status_code=500, detail="injected failure")
+
+        stream = body.get("stream", True)
+        options = body.get("options") or {}
+        num_predict = options.get("num_predict")
+        start = time.perf_counter()
+
+        async def run():
+            async with _slot(model):
+                load_ns = await _ensure_loaded(model)
+                prompt_tokens = max(1, _prompt_len(body) // 4)
+                prompt_s = prompt_tokens / config.prompt_eval_rate
+                await asyncio.sleep(prompt_s)
+                tokens = _tokens_for(model, _images(body))
+                if num_predict and num_predict > 0:
+                    tokens = tokens[:num_predict]
+                delay = 1.0 / config.token_rate if config.token_rate > 0 else 0
+                eval_start = time.perf_counter()
+                fail_at = None
+                if random.random() < config.midstream_failure_rate:
+                    fail_at = random.randrange(max(1, len(tokens)))
+                for i, token in enumerate(tokens):
+                    if fail_at is not None and i == fail_at:
+                        raise RuntimeError("injected mid-stream failure")
+                    if delay:
+                        await asyncio.sleep(delay)
+                    yield token
+                eval_ns = int((time.perf_counter() - eval_start) * 1e9)
+                total_ns = int((time.perf_counter() - start) * 1e9)
+                yield _final(model, prompt_tokens, len(tokens), load_ns,
+                             int(prompt_s * 1e9), eval_ns, total_ns)
+
+        def frame(token: str) -> Dict[str, Any]:
+            if chat:
+                return {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+            return {"model": model, "response": token, "done": False}
+
+        if stream:
+            async def ndjson():
+                async for item in run():
+                    if isinstance(item, dict):
+                        if chat:
+                            item["message"] = {"role": "assistant", "content": ""}
+                        else:
+                            item["response"] = ""
+                        yield json.dumps(item) + "\n"
+                    else:
+                        yield json.dumps(frame(item)) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        text = []
+        final: Dict[str, Any] = {}
+        async for item in run():
+            if isinstance(item, dict):
+                final = item
+            else:
+                text.append(item)
+        if chat:
+            final["message"] = {"role": "assistant", "content": "".join(text)}
+        else:
+            final["response"] = "".join(text)
+        return JSONResponse(final)
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [
+            {"name": m, "model": m, "size": 4_000_000_000, "digest": f"stub-{i}"}
+            for i, m in enumerate(config.models)
+        ]}
+
+    @app.post("/api/show")
+    async def show(request: Request):
+        body = await request.json()
+        name = body.get("name") or body.get("model", "")
+        _check_model(name)
+        model_info = {"general.architecture": "stub"}
+        families = ["stub"]
+        if _is_vision(name):
+            model_info["stub.vision.block_count"] = 24
+            families.append("clip")
+        return {"model_info": model_info, "details": {"families": families}}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [
+            {"name": m, "model": m, "expires_at": None, "loaded_at": t}
+            for m, t in loaded.items()
+        ]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        if body.get("keep_alive") == 0 and not body.get("messages"):
+            loaded.pop(body.get("model", ""), None)
+            return {"model": body.get("model"), "done": True, "done_reason": "unload"}
+        return await _generate(body, chat=True)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        if body.get("keep_alive") == 0:
+            loaded.pop(body.get("model", ""), None)
+            return {"model": body.get("model"), "response": "", "done": True, "done_reason": "unload"}
+        if not body.get("prompt"):
+            # Petición de precarga
+            load_ns = await _ensure_loaded(body.get("model", ""))
+            return {"model": body.get("model"), "response": "", "done": True, "load_duration": load_ns}
+        return await _generate(body, chat=False)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor Ollama simulado para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--uds", default=None, help="Escuchar en este socket Unix en lugar de host:port")
+    parser.add_argument("--models", default=os.getenv("STUB_MODELS", DEFAULT_MODELS))
+    parser.add_argument("--token-rate", type=float, default=float(os.getenv("STUB_TOKEN_RATE", 50)),
+                        help="Tokens por segundo por stream (0 = sin espera)")
+    parser.add_argument("--load-delay", type=float, default=float(os.getenv("STUB_LOAD_DELAY", 0.5)),
+                        help="Segundos que tarda en cargar un modelo frío")
+    parser.add_argument("--parallel", type=int, default=int(os.getenv("STUB_PARALLEL", 1)),
+                        help="Slots paralelos por modelo (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--failure-rate", type=float, default=float(os.getenv("STUB_FAILURE_RATE", 0)),
+                        help="Probabilidad de responder 500 antes de generar")
+    parser.add_argument("--midstream-failure-rate", type=float,
+                        default=float(os.getenv("STUB_MIDSTREAM_FAILURE_RATE", 0)),
+                        help="Probabilidad de cortar el stream a mitad")
+    parser.add_argument("--max-tokens", type=int, default=int(os.getenv("STUB_MAX_TOKENS", 200)))
+    args = parser.parse_args()
+
+    config = StubConfig(
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        token_rate=args.token_rate,
+        load_delay=args.load_delay,
+        parallel=args.parallel,
+        failure_rate=args.failure_rate,
+        midstream_failure_rate=args.midstream_failure_rate,
+        max_tokens=args.max_tokens,
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, uds=args.uds, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
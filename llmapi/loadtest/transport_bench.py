@@ -0,0 +1,159 @@
+"""
+Comparación TCP frente a socket Unix hacia Ollama (con el stub).
+
+Arranca dos stubs de Ollama sin espera entre tokens, uno en 127.0.0.1 y otro
+en un socket Unix, y mide con la misma sesión que usa el servicio
+(app.core.ollama_http):
+
+- overhead por petición: GET /api/tags secuenciales, reutilizando la conexión
+  y abriendo una nueva en cada petición,
+- throughput de streaming: /api/chat con stream=True, en tokens/s y MB/s.
+
+Uso:
+    python -m loadtest.transport_bench --requests 2000 --stream-tokens 20000 --json transporte.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from app.core.ollama_http import create_session
+from loadtest.loadgen import summarize
+
+_MODEL = "qwen2.5-coder:7b"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args: List[str], ready: Callable[[], bool], timeout: float = 15.0) -> subprocess.Popen:
+    """Lanza el stub en otro proceso y espera a que acepte conexiones."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "loadtest.stub_ollama", "--load-delay", "0", "--token-rate", "0", *args],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El stub ha terminado con código {proc.returncode}")
+        if ready():
+            return proc
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("El stub no ha arrancado a tiempo")
+
+
+def _reachable(base_url: str, socket_path: str) -> bool:
+    try:
+        create_session(socket_path).get(f"{base_url}/api/tags", timeout=1).raise_for_status()
+        return True
+    except requests.RequestException:
+        return False
+
+
+def measure_overhead(base_url: str, socket_path: str, count: int, reuse: bool) -> Dict[str, Any]:
+    """Latencia de GET /api/tags secuenciales (en ms)."""
+    session = create_session(socket_path)
+    session.get(f"{base_url}/api/tags").raise_for_status()
+    latencies = []
+    for _ in range(count):
+        if not reuse:
+            session.close()
+            session = create_session(socket_path)
+        t0 = time.perf_counter()
+        session.get(f"{base_url}/api/tags").raise_for_status()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    session.close()
+    return {"requests": count, "latency_ms": summarize(latencies),
+            "mean_ms": round(sum(latencies) / len(latencies), 4)}
+
+
+def measure_stream(base_url: str, socket_path: str, runs: int) -> Dict[str, Any]:
+    """Throughput de /api/chat en streaming (el stub genera --max-tokens tokens por run)."""
+    session = create_session(socket_path)
+    payload = {"model": _MODEL, "messages": [{"role": "user", "content": "hola"}], "stream": True}
+    session.post(f"{base_url}/api/chat", json=payload).raise_for_status()  # carga el modelo
+    tokens = 0
+    nbytes = 0
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        with session.post(f"{base_url}/api/chat", json=payload, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                nbytes += len(line) + 1
+                if line and not json.loads(line).get("done"):
+                    tokens += 1
+    elapsed = time.perf_counter() - t0
+    session.close()
+    return {"runs": runs, "tokens": tokens, "seconds": round(elapsed, 3),
+            "tokens_per_s": round(tokens / elapsed, 1), "mb_per_s": round(nbytes / elapsed / 1e6, 2)}
+
+
+def run_benchmark(requests_count: int, stream_tokens: int, stream_runs: int) -> Dict[str, Any]:
+    port = _free_port()
+    tmpdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tmpdir, "ollama.sock")
+    targets = {
+        "tcp": (f"http://127.0.0.1:{port}", ""),
+        "uds": ("http://localhost", socket_path),
+    }
+    common = ["--max-tokens", str(stream_tokens)]
+    procs = [
+        start_stub(["--port", str(port), *common], lambda: _reachable(*targets["tcp"])),
+        start_stub(["--uds", socket_path, *common], lambda: _reachable(*targets["uds"])),
+    ]
+    try:
+        report: Dict[str, Any] = {}
+        for name, (base_url, path) in targets.items():
+            report[name] = {
+                "keepalive": measure_overhead(base_url, path, requests_count, reuse=True),
+                "new_connection": measure_overhead(base_url, path, requests_count, reuse=False),
+                "stream": measure_stream(base_url, path, stream_runs),
+            }
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        os.rmdir(tmpdir)
+    report["uds_vs_tcp"] = {
+        "keepalive_p50": _ratio(report, "keepalive", "p50"),
+        "new_connection_p50": _ratio(report, "new_connection", "p50"),
+        "stream_tokens_per_s": round(report["uds"]["stream"]["tokens_per_s"] / report["tcp"]["stream"]["tokens_per_s"], 3),
+    }
+    return report
+
+
+def _ratio(report: Dict[str, Any], mode: str, stat: str) -> float:
+    tcp = report["tcp"][mode]["latency_ms"][stat]
+    return round(report["uds"][mode]["latency_ms"][stat] / tcp, 3) if tcp else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Overhead y throughput hacia Ollama por TCP y por socket Unix")
+    parser.add_argument("--requests", type=int, default=1000, help="Peticiones por modo de conexión")
+    parser.add_argument("--stream-tokens", type=int, default=10000, help="Tokens por stream")
+    parser.add_argument("--stream-runs", type=int, default=3)
+    parser.add_argument("--json", default=None, help="Guardar el informe en este fichero")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.requests, args.stream_tokens, args.stream_runs)
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,12 @@ if errorlevel 1 (
     exit /b 1
 )
 
-REM Ejecutar servidor
-echo Iniciando servidor FastAPI...
-uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
+REM Ejecutar servidor (run.bat --prod para el modo produccion con varios workers)
+REM Con varios workers, reanudar un stream cortado puede llegar a otro worker (ver app/server.py)
+if "%1"=="--prod" (
+    echo Iniciando servidor FastAPI en modo produccion...
+    python -m app.server
+) else (
+    echo Iniciando servidor FastAPI...
+    uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
+)
@@ -16,6 +16,12 @@ if ! python -c "import fastapi" 2>/dev/null; then
     exit 1
 fi
 
-# Ejecutar servidor
-echo "Iniciando servidor FastAPI..."
-uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
+# Ejecutar servidor (./run.sh --prod para el modo producción con varios workers)
+# Con varios workers, reanudar un stream cortado puede llegar a otro worker (ver app/server.py)
+if [ "$1" = "--prod" ]; then
+    echo "Iniciando servidor FastAPI en modo producción..."
+    python -m app.server
+else
+    echo "Iniciando servidor FastAPI..."
+    uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
+fi
@@ -1,5 +1,17 @@
+import os
+import tempfile
+
 import pytest
 from fastapi.testclient import TestClient
+
+# API de trabajos activa con un almacén temporal: el worker arranca con la app
+os.environ.setdefault("JOBS_ENABLED", "true")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+# Almacén de imágenes temporal: las subidas se guardan en disco
+os.environ.setdefault("IMAGE_STORE_DIR", os.path.join(tempfile.mkdtemp(), "images"))
+# Captura de tráfico temporal: sin sal configurada, la compartida se crea junto a ella
+os.environ.setdefault("TRAFFIC_CAPTURE_PATH", os.path.join(tempfile.mkdtemp(), "traffic.jsonl"))
+
 from app.main import app
 
 
@@ -0,0 +1,142 @@
+"""Tests para la generación por lotes (POST /generate/batch)."""
+import base64
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from anyio import to_thread
+
+STREAM = "app.services.batch.generate_with_image_stream"
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+def _fake_stream(model, prompt, image_bytes_list=None, telemetry=None, options=None):
+    if prompt == "falla":
+        raise RuntimeError("Ollama caído")
+    if prompt.startswith("lento"):
+        time.sleep(0.15)
+    yield "resultado "
+    yield prompt
+
+
+class TestBatchEndpoint:
+    def test_resultados_en_orden_de_finalizacion(self, client):
+        items = [
+            {"model": "m", "prompt": "lento"},
+            {"model": "m", "prompt": "rapido"},
+        ]
+        with patch(STREAM, side_effect=_fake_stream):
+            resp = client.post("/generate/batch", json={"items": items, "concurrency": 2})
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        lines = _lines(resp)
+        assert [line.get("index") for line in lines[:2]] == [1, 0]
+        assert lines[0]["result"] == "resultado rapido"
+        assert "total_ms" in lines[0]["timing"]
+        assert lines[-1]["done"] is True
+
+    def test_un_error_no_aborta_el_lote(self, client):
+        items = [
+            {"model": "m", "prompt": "uno"},
+            {"model": "m", "prompt": "falla"},
+            {"model": "m", "prompt": "tres"},
+        ]
+        with patch(STREAM, side_effect=_fake_stream):
+            resp = client.post("/generate/batch", json={"items": items})
+
+        lines = _lines(resp)
+        by_index = {line["index"]: line for line in lines if "index" in line}
+        assert by_index[1]["status"] == "error"
+        assert "Ollama caído" in by_index[1]["error"]
+        assert by_index[0]["status"] == by_index[2]["status"] == "ok"
+        assert lines[-1] == {**lines[-1], "total": 3, "succeeded": 2, "failed": 1}
+
+    def test_respeta_la_concurrencia_del_lote(self, client):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def counting_stream(**kwargs):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+            yield "ok"
+
+        items = [{"model": "m", "prompt": str(i)} for i in range(6)]
+        with patch(STREAM, side_effect=counting_stream):
+            client.post("/generate/batch", json={"items": items, "concurrency": 2})
+
+        assert max(peak) == 2
+
+    def test_un_lote_esperando_no_agota_el_threadpool(self, client):
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def blocked_stream(**kwargs):
+            started.release()
+            release.wait(5)
+            yield "ok"
+
+        def set_tokens(total):
+            limiter = to_thread.current_default_thread_limiter()
+            previous, limiter.total_tokens = limiter.total_tokens, total
+            return previous
+
+        # Threadpool de 4 hilos y un lote con 8 elementos esperando a la vez
+        previous = client.portal.call(set_tokens, 4)
+        items = [{"model": "m", "prompt": str(i)} for i in range(8)]
+        try:
+            with patch(STREAM, side_effect=blocked_stream):
+                batch = threading.Thread(
+                    target=client.post, args=("/generate/batch",), kwargs={"json": {"items": items, "concurrency": 8}}
+                )
+                batch.start()
+                for _ in items:
+                    assert started.acquire(timeout=5)
+
+                health = []
+                probe = threading.Thread(target=lambda: health.append(client.get("/").status_code))
+                probe.start()
+                probe.join(5)
+                assert health == [200]
+                release.set()
+                batch.join(5)
+        finally:
+            release.set()
+            client.portal.call(set_tokens, previous)
+
+    def test_imagenes_y_opciones_se_pasan_al_servicio(self, client):
+        image = base64.b64encode(b"png-bytes").decode()
+        items = [{"model": "llava", "prompt": "describe", "images": [image], "options": {"temperature": 0}}]
+        with patch(STREAM, side_effect=_fake_stream) as mock_stream:
+            client.post("/generate/batch", json={"items": items})
+
+        kwargs = mock_stream.call_args.kwargs
+        assert kwargs["image_bytes_list"] == [b"png-bytes"]
+        assert kwargs["options"] == {"temperature": 0}
+
+    def test_imagen_invalida_es_error_del_elemento(self, client):
+        items = [{"model": "llava", "prompt": "x", "images": ["no es base64!"]}]
+        with patch(STREAM, side_effect=_fake_stream) as mock_stream:
+            resp = client.post("/generate/batch", json={"items": items})
+
+        lines = _lines(resp)
+        assert lines[0]["status"] == "error"
+        assert "base64" in lines[0]["error"]
+        mock_stream.assert_not_called()
+
+    def test_lote_vacio_es_rechazado(self, client):
+        resp = client.post("/generate/batch", json={"items": []})
+        assert resp.status_code == 422
+
+    def test_concurrencia_por_encima_del_maximo(self, client):
+        resp = client.post("/generate/batch", json={"items": [{"model": "m", "prompt": "x"}], "concurrency": 1000})
+        assert resp.status_code == 422
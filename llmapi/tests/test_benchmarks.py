@@ -0,0 +1,23 @@
+"""Tests para el runner de microbenchmarks (benchmarks/run.py)."""
+from benchmarks.cases import CASES
+from benchmarks.run import compare, measure
+
+
+class TestBenchmarkRunner:
+    def test_measure_devuelve_coste_por_llamada(self):
+        result = measure(lambda: None, min_time=0.001, repeats=2)
+        assert result["ns_per_call"] > 0
+        assert result["repeats"] == 2
+
+    def test_compare_marca_regresiones_sobre_el_umbral(self):
+        baseline = {"results": {"a": {"ns_per_call": 100}, "b": {"ns_per_call": 100}}}
+        current = {"results": {"a": {"ns_per_call": 130}, "b": {"ns_per_call": 105}}}
+
+        assert compare(current, baseline, threshold=0.2) == ["a"]
+
+    def test_todos_los_casos_se_pueden_ejecutar(self):
+        for name, factory in CASES.items():
+            if "base64" in name:
+                continue
+            with factory() as fn:
+                fn()
@@ -0,0 +1,174 @@
+"""Tests para las cachés de servicio (cache.py)."""
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.cache import (
+    CACHES,
+    MemoryCache,
+    RedisCache,
+    SQLiteCache,
+    create_cache,
+)
+from app.core.metrics import CACHE_REQUESTS_TOTAL
+
+
+class _FakeRedis:
+    """Cliente mínimo con la parte de la API de redis-py que usa RedisCache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        data, expires_at = value
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return data
+
+    def set(self, key, data, px=None):
+        self.data[key] = (data, time.time() + px / 1000 if px else None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [k for k in list(self.data) if k.startswith(prefix)]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache("test")
+    if request.param == "sqlite":
+        return SQLiteCache("test", path=str(tmp_path / "cache.sqlite3"))
+    return RedisCache("test", client=_FakeRedis())
+
+
+# ─── Interfaz común ───────────────────────────────────────────────────────────
+
+class TestCacheInterface:
+    def test_get_set_y_delete(self, cache):
+        assert cache.get("a") is None
+        cache.set("a", {"x": [1, 2]})
+        assert cache.get("a") == {"x": [1, 2]}
+        assert "a" in cache
+        cache.delete("a")
+        assert cache.get("a", "default") == "default"
+
+    def test_valores_falsy_se_distinguen_de_fallo(self, cache):
+        cache.set("false", False)
+        assert cache.get("false") is False
+
+    def test_ttl_caduca(self, cache):
+        cache.set("a", 1, ttl=0.05)
+        assert cache.get("a") == 1
+        time.sleep(0.1)
+        assert cache.get("a") is None
+
+    def test_clear(self, cache):
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.clear()
+        assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_metricas_de_aciertos_y_fallos(self, cache):
+        hits = CACHE_REQUESTS_TOTAL.get(cache="test", result="hit")
+        misses = CACHE_REQUESTS_TOTAL.get(cache="test", result="miss")
+        cache.get("nada")
+        cache.set("a", 1)
+        cache.get("a")
+        assert CACHE_REQUESTS_TOTAL.get(cache="test", result="hit") == hits + 1
+        assert CACHE_REQUESTS_TOTAL.get(cache="test", result="miss") == misses + 1
+
+    def test_entrada_mayor_que_el_limite_no_se_guarda(self, cache):
+        cache.max_bytes = 10
+        cache.set("a", "x" * 100)
+        assert cache.get("a") is None
+
+
+# ─── Límite de bytes (LRU) ────────────────────────────────────────────────────
+
+class TestEviction:
+    def test_memoria_expulsa_la_menos_usada(self):
+        cache = MemoryCache("lru", max_bytes=30)
+        cache.set("a", "x" * 8)  # 10 bytes en JSON
+        cache.set("b", "x" * 8)
+        cache.get("a")
+        cache.set("c", "x" * 8)
+        cache.set("d", "x" * 8)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["bytes"] <= 30
+
+    def test_sqlite_expulsa_la_menos_usada(self, tmp_path):
+        cache = SQLiteCache("lru", max_bytes=30, path=str(tmp_path / "c.sqlite3"))
+        cache.set("a", "x" * 8)
+        time.sleep(0.01)
+        cache.set("b", "x" * 8)
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.set("c", "x" * 8)
+        cache.set("d", "x" * 8)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()["bytes"] <= 30
+
+
+# ─── Compartición entre workers ───────────────────────────────────────────────
+
+class TestShared:
+    def test_sqlite_compartida_entre_instancias(self, tmp_path):
+        path = str(tmp_path / "shared.sqlite3")
+        worker1 = SQLiteCache("vision", path=path)
+        worker2 = SQLiteCache("vision", path=path)
+        worker1.set("llava:7b", True)
+        assert worker2.get("llava:7b") is True
+
+    def test_espacios_de_nombres_separados(self, tmp_path):
+        path = str(tmp_path / "shared.sqlite3")
+        SQLiteCache("uno", path=path).set("k", 1)
+        assert SQLiteCache("dos", path=path).get("k") is None
+
+
+# ─── create_cache ─────────────────────────────────────────────────────────────
+
+class TestCreateCache:
+    def test_reutiliza_la_cache_por_nombre(self):
+        with patch.dict(CACHES, clear=True):
+            assert create_cache("x", backend="memory") is create_cache("x", backend="memory")
+
+    def test_backend_desconocido(self):
+        with patch.dict(CACHES, clear=True), pytest.raises(ValueError):
+            create_cache("x", backend="memcached")
+
+    def test_redis_no_disponible_usa_memoria(self):
+        with patch.dict(CACHES, clear=True), \
+                patch.dict("sys.modules", {"redis": None}):
+            cache = create_cache("x", backend="redis")
+        assert isinstance(cache, MemoryCache)
+
+    def test_backend_caido_cuenta_como_error(self):
+        class _Broken(_FakeRedis):
+            def get(self, key):
+                raise ConnectionError("down")
+
+        cache = RedisCache("broken", client=_Broken())
+        errors = CACHE_REQUESTS_TOTAL.get(cache="broken", result="error")
+        assert cache.get("a") is None
+        assert CACHE_REQUESTS_TOTAL.get(cache="broken", result="error") == errors + 1
+
+    def test_entrada_corrupta_cuenta_como_error(self, tmp_path):
+        cache = SQLiteCache("corrupt", path=str(tmp_path / "cache.sqlite3"))
+        cache._store("a", b"\xff no es json", None)
+        errors = CACHE_REQUESTS_TOTAL.get(cache="corrupt", result="error")
+        assert cache.get("a", "defecto") == "defecto"
+        assert CACHE_REQUESTS_TOTAL.get(cache="corrupt", result="error") == errors + 1
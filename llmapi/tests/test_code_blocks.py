@@ -0,0 +1,63 @@
+"""Tests para el seguimiento incremental de bloques de código (code_blocks.py)."""
+import pytest
+
+from app.services.code_blocks import CODE_BLOCK_END, CODE_BLOCK_START, CODE_DELTA, TEXT, FenceTracker
+
+ANSWER = (
+    "Aquí tienes:\n\n"
+    "```java\npublic class A {\n  String s = \"``\";\n}\n```\n"
+    "Y otra:\n"
+    "~~~python\nprint(1)\n```\n~~~\n"
+    "Fin ``` en línea\n"
+)
+
+
+def _run(chunks):
+    tracker = FenceTracker()
+    events = []
+    for chunk in chunks:
+        events.extend(tracker.feed(chunk))
+    events.extend(tracker.finish())
+    # Unir fragmentos consecutivos del mismo tipo para comparar
+    merged = []
+    for event, data in events:
+        if merged and merged[-1][0] == event and event in (TEXT, CODE_DELTA):
+            merged[-1] = (event, {**data, "text": merged[-1][1]["text"] + data["text"]})
+        else:
+            merged.append((event, data))
+    return merged
+
+
+# ─── FenceTracker ─────────────────────────────────────────────────────────────
+
+class TestFenceTracker:
+    def test_eventos_de_una_respuesta_completa(self):
+        assert _run([ANSWER]) == [
+            (TEXT, {"text": "Aquí tienes:\n\n"}),
+            (CODE_BLOCK_START, {"index": 0, "language": "java"}),
+            (CODE_DELTA, {"index": 0, "text": "public class A {\n  String s = \"``\";\n}\n"}),
+            (CODE_BLOCK_END, {"index": 0}),
+            (TEXT, {"text": "Y otra:\n"}),
+            (CODE_BLOCK_START, {"index": 1, "language": "python"}),
+            (CODE_DELTA, {"index": 1, "text": "print(1)\n```\n"}),
+            (CODE_BLOCK_END, {"index": 1}),
+            (TEXT, {"text": "Fin ``` en línea\n"}),
+        ]
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 5, 7])
+    def test_mismo_resultado_con_cualquier_troceado(self, size):
+        chunks = [ANSWER[i:i + size] for i in range(0, len(ANSWER), size)]
+        assert _run(chunks) == _run([ANSWER])
+
+    def test_el_texto_se_emite_sin_esperar_al_salto_de_linea(self):
+        tracker = FenceTracker()
+        assert tracker.feed("Hola mun") == [(TEXT, {"text": "Hola mun"})]
+        assert tracker.feed("do\n``") == [(TEXT, {"text": "do\n"})]  # "``" puede ser una cerca
+        assert tracker.feed("x") == [(TEXT, {"text": "``x"})]
+
+    def test_bloque_sin_cerrar_termina_al_final(self):
+        assert _run(["```\nx = 1"]) == [
+            (CODE_BLOCK_START, {"index": 0, "language": ""}),
+            (CODE_DELTA, {"index": 0, "text": "x = 1"}),
+            (CODE_BLOCK_END, {"index": 0}),
+        ]
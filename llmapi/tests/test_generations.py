@@ -0,0 +1,117 @@
+"""Tests para el registro de generaciones en curso y /admin/generations."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core import generations
+from app.core.generations import GenerationCancelled
+from app.core.telemetry import RequestTelemetry
+from app.services.ollama_service import _iter_stream_content
+
+ADMIN_HEADERS = {"X-Admin-Token": "secreto"}
+
+
+def _line(content, done=False):
+    return json.dumps({"message": {"content": content}, "done": done}).encode()
+
+
+def _ids():
+    return [entry["id"] for entry in generations.active_generations()]
+
+
+# ─── Registro ─────────────────────────────────────────────────────────────────
+
+class TestRegistry:
+    def test_telemetry_registra_y_retira_la_generacion(self):
+        t = RequestTelemetry("/generate/stream", "auto", "10.0.0.1")
+        t.begin_step("step1", "llava:13b")
+
+        entry = next(e for e in generations.active_generations() if e["id"] == t.generation.id)
+        assert entry["client"] == "10.0.0.1"
+        assert entry["step"] == "step1"
+        assert entry["model"] == "llava:13b"
+
+        t.finish("ok")
+        assert t.generation.id not in _ids()
+
+    def test_cuenta_tokens(self):
+        t = RequestTelemetry("/test", "m")
+        resp = MagicMock()
+        resp.iter_lines.return_value = [_line("a"), _line("b"), _line("", done=True)]
+
+        assert list(_iter_stream_content(resp, "m", t)) == ["a", "b"]
+        assert t.generation.tokens == 2
+        resp.close.assert_called_once()
+        t.finish("ok")
+
+    def test_cancelar_id_desconocido(self):
+        with pytest.raises(KeyError):
+            generations.cancel_generation(-1)
+
+
+# ─── Cancelación ──────────────────────────────────────────────────────────────
+
+class TestCancel:
+    def test_cancelar_corta_el_stream_y_cierra_la_respuesta(self):
+        t = RequestTelemetry("/test", "m")
+        resp = MagicMock()
+        resp.iter_lines.return_value = iter([_line("a"), _line("b"), _line("c")])
+        stream = _iter_stream_content(resp, "m", t)
+
+        assert next(stream) == "a"
+        generations.cancel_generation(t.generation.id)
+        with pytest.raises(GenerationCancelled):
+            next(stream)
+        resp.close.assert_called()
+        t.finish("cancelled")
+
+    def test_error_de_lectura_tras_cancelar_se_convierte_en_cancelacion(self):
+        t = RequestTelemetry("/test", "m")
+
+        def lines():
+            yield _line("a")
+            t.generation.cancel()
+            raise AttributeError("'NoneType' object has no attribute 'read'")
+
+        resp = MagicMock()
+        resp.iter_lines.return_value = lines()
+        with pytest.raises(GenerationCancelled):
+            list(_iter_stream_content(resp, "m", t))
+        t.finish("cancelled")
+
+    def test_cancelada_en_cola_no_se_envia(self):
+        t = RequestTelemetry("/test", "m")
+        t.generation.cancel()
+        with pytest.raises(GenerationCancelled):
+            t.dispatched("m")
+        t.finish("cancelled")
+
+
+# ─── Endpoints ────────────────────────────────────────────────────────────────
+
+class TestAdminGenerations:
+    def test_lista_y_cancela(self, client):
+        t = RequestTelemetry("/generate/stream", "m")
+        with patch("app.core.admin.ADMIN_TOKEN", "secreto"):
+            listed = client.get("/admin/generations", headers=ADMIN_HEADERS).json()
+            resp = client.post(f"/admin/generations/{t.generation.id}/cancel", headers=ADMIN_HEADERS)
+            missing = client.post("/admin/generations/999999/cancel", headers=ADMIN_HEADERS)
+
+        assert t.generation.id in [e["id"] for e in listed["generations"]]
+        assert resp.status_code == 200
+        assert resp.json()["cancelled"] is True
+        assert missing.status_code == 404
+        t.finish("cancelled")
+
+    def test_stream_cancelado_termina_con_evento(self, client):
+        def cancelled_stream(**kwargs):
+            yield "a"
+            raise GenerationCancelled("Generación cancelada")
+
+        with patch("app.routes.generate.generate_with_image_stream", side_effect=cancelled_stream):
+            resp = client.post("/generate/stream", data={"model": "m", "prompt": "p"})
+
+        assert "event: cancelled\n" in resp.text
+        assert "[ERROR] Generación cancelada" in resp.text
+        assert "[DONE]" not in resp.text
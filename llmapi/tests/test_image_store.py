@@ -0,0 +1,142 @@
+"""Tests para image_store.py y la ruta /images."""
+import base64
+import json
+import os
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+from app.core.image_store import ImageStore, expand_message_images, image_store, is_image_id, parse_image_ids
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(str(tmp_path / "images"), max_bytes=1000)
+
+
+def _age(store, image_id, seconds_ago):
+    path = store._path(image_id)
+    mtime = os.path.getmtime(path) - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+# ─── ImageStore ───────────────────────────────────────────────────────────────
+
+class TestImageStore:
+    def test_guarda_y_lee_por_hash(self, store):
+        image_id = store.put(b"png-bytes")
+
+        assert is_image_id(image_id)
+        assert store.get(image_id) == b"png-bytes"
+        assert image_id in store
+
+    def test_deduplica_por_contenido(self, store):
+        first = store.put(b"abc")
+        second = store.put(b"abc")
+
+        assert first == second
+        assert store.total_bytes() == 3
+
+    def test_expulsada_por_otro_worker_se_vuelve_a_escribir(self, store):
+        image_id = store.put(b"abc")
+        real_utime = os.utime
+
+        def _evicted(path, *args, **kwargs):
+            os.remove(path)
+            return real_utime(path, *args, **kwargs)
+
+        with patch("app.core.image_store.os.utime", side_effect=_evicted):
+            assert store.put(b"abc") == image_id
+        assert store.get(image_id) == b"abc"
+
+    def test_id_desconocido_o_invalido(self, store):
+        with pytest.raises(KeyError):
+            store.get("0" * 64)
+        with pytest.raises(KeyError):
+            store.get("../../etc/passwd")
+
+    def test_expulsa_las_menos_usadas(self, store):
+        old = store.put(b"a" * 400)
+        used = store.put(b"b" * 400)
+        _age(store, old, 60)
+        _age(store, used, 120)
+        store.get(used)  # la lectura la marca como reciente
+
+        new = store.put(b"c" * 400)
+
+        assert old not in store
+        assert used in store and new in store
+        assert store.total_bytes() == 800
+
+    def test_reconstruye_el_total_desde_disco(self, store):
+        store.put(b"x" * 10)
+        assert ImageStore(store.directory, max_bytes=1000).total_bytes() == 10
+
+
+# ─── Historial por id ─────────────────────────────────────────────────────────
+
+class TestExpandMessageImages:
+    def test_sustituye_ids_y_mantiene_base64(self):
+        image_id = image_store.put(b"diagram")
+        legacy = base64.b64encode(b"legacy").decode()
+        messages = [
+            {"role": "user", "content": "hola", "images": [image_id, legacy]},
+            {"role": "assistant", "content": "ok"},
+        ]
+
+        expanded = expand_message_images(messages)
+
+        assert expanded[0]["images"] == [base64.b64encode(b"diagram").decode(), legacy]
+        assert expanded[1] is messages[1]
+        assert messages[0]["images"][0] == image_id
+
+    def test_id_expulsado_es_error(self):
+        with pytest.raises(ValueError):
+            expand_message_images([{"role": "user", "content": "x", "images": ["f" * 64]}])
+
+    def test_parse_image_ids(self):
+        assert parse_image_ids(json.dumps(["a" * 64])) == ["a" * 64]
+        with pytest.raises(ValueError):
+            parse_image_ids('["no-es-un-id"]')
+
+
+# ─── Rutas ────────────────────────────────────────────────────────────────────
+
+class TestImageRoutes:
+    def test_subida_y_descarga(self, client):
+        resp = client.post("/images/", files=[
+            ("images", ("a.png", BytesIO(b"uno"), "image/png")),
+            ("images", ("b.png", BytesIO(b"uno"), "image/png")),
+        ])
+
+        assert resp.status_code == 200
+        ids = [image["id"] for image in resp.json()["images"]]
+        assert ids[0] == ids[1]
+        download = client.get(f"/images/{ids[0]}")
+        assert download.content == b"uno"
+        assert "immutable" in download.headers["cache-control"]
+
+    def test_descarga_desconocida_404(self, client):
+        assert client.get(f"/images/{'e' * 64}").status_code == 404
+
+    def test_stream_con_historial_por_id(self, client):
+        image_id = image_store.put(b"turno-1")
+        history = [{"role": "user", "content": "diagrama", "images": [image_id]}]
+        with patch("app.routes.generate.generate_with_image_stream", return_value=iter(["ok"])) as mock_gen:
+            resp = client.post("/generate/stream", data={
+                "model": "llava:7b", "prompt": "sigue", "messages": json.dumps(history),
+                "image_ids": json.dumps([image_id]),
+            }, files=[("images", ("n.png", BytesIO(b"turno-2"), "image/png"))])
+
+        assert resp.status_code == 200
+        kwargs = mock_gen.call_args.kwargs
+        assert kwargs["message_history"][0]["images"] == [base64.b64encode(b"turno-1").decode()]
+        assert resp.headers["x-image-ids"].split(",")[0] == image_id
+        assert image_store.get(resp.headers["x-image-ids"].split(",")[1]) == b"turno-2"
+
+    def test_stream_con_id_desconocido_400(self, client):
+        resp = client.post("/generate/stream", data={
+            "model": "llava:7b", "prompt": "x", "image_ids": json.dumps(["d" * 64]),
+        })
+        assert resp.status_code == 400
@@ -0,0 +1,286 @@
+"""Tests para los trabajos asíncronos (jobs.py y rutas /jobs)."""
+import threading
+import time
+from io import BytesIO
+from unittest.mock import patch
+
+import pytest
+
+from app.routes.jobs import _follow_store
+from app.services.jobs import (
+    DONE,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    JobChannel,
+    JobStore,
+    _owner,
+    job_result,
+    replay_chunks,
+    run_job,
+)
+
+JOBS = "app.services.jobs"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def _auto_stream(**kwargs):
+    yield "[STEP1_START]"
+    yield "```@startuml\nclass A\n@enduml```"
+    yield "[STEP1_END]"
+    yield "[STEP2_START]"
+    yield "class A "
+    yield "{}"
+
+
+def _wait_finished(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/jobs/{job_id}").json()["status"]
+        if status in (DONE, FAILED):
+            return status
+        time.sleep(0.02)
+    raise AssertionError("El trabajo no terminó a tiempo")
+
+
+# ─── JobStore ─────────────────────────────────────────────────────────────────
+
+class TestJobStore:
+    def test_crear_y_reclamar(self, store):
+        job_id = store.create({"model": "m", "prompt": "p"}, [b"img1", b"img2"])
+        assert store.get(job_id)["status"] == QUEUED
+
+        job = store.claim("host:1")
+        assert job["id"] == job_id
+        assert job["status"] == RUNNING
+        assert job["attempts"] == 1
+        assert store.images(job_id) == [b"img1", b"img2"]
+        assert store.claim("host:2") is None
+
+    def test_reclama_en_orden_de_llegada(self, store):
+        first = store.create({"prompt": "1"})
+        second = store.create({"prompt": "2"})
+        assert store.claim("o")["id"] == first
+        assert store.claim("o")["id"] == second
+
+    def test_finish_guarda_resultado_y_borra_imagenes(self, store):
+        job_id = store.create({"prompt": "p"}, [b"img"])
+        store.claim("o")
+        store.finish(job_id, DONE, {"generate": "hola"}, timing={"total_ms": 1.0})
+        job = store.get(job_id)
+        assert job["status"] == DONE
+        assert job["outputs"] == {"generate": "hola"}
+        assert job["timing"] == {"total_ms": 1.0}
+        assert store.images(job_id) == []
+
+    def test_lectura_previa_evita_el_lock_con_la_cola_vacia(self, store):
+        store.get("x")  # crea el esquema
+        writer = store._conn()
+        writer.execute("BEGIN IMMEDIATE")
+        try:
+            # Con otro escritor activo, claim no espera al lock si no hay trabajos
+            other = JobStore(store.path)
+            start = time.monotonic()
+            assert other.claim("o") is None
+            assert time.monotonic() - start < 1
+        finally:
+            writer.execute("ROLLBACK")
+
+    def test_recupera_trabajos_con_la_concesion_caducada(self, store):
+        job_id = store.create({"prompt": "p"})
+        store.claim("host:1:a")
+        store.update_progress(job_id, "generate", {"generate": "parcial"})
+
+        assert store.requeue_orphans(lease=0) == 1
+        job = store.get(job_id)
+        assert job["status"] == QUEUED
+        assert job["outputs"] == {}
+
+    def test_no_toca_trabajos_con_la_concesion_vigente(self, store):
+        store.create({"prompt": "a"})
+        store.claim("host:1:a")
+        assert store.requeue_orphans(lease=60) == 0
+
+    def test_heartbeat_renueva_solo_los_trabajos_propios(self, store):
+        mine = store.create({"prompt": "a"})
+        other = store.create({"prompt": "b"})
+        store.claim("host:1:a")
+        store.claim("host:1:b")
+        time.sleep(0.05)
+
+        assert store.heartbeat("host:1:a") == 1
+        assert store.requeue_orphans(lease=0.03) == 1
+        assert store.get(mine)["status"] == RUNNING
+        assert store.get(other)["status"] == QUEUED
+
+    def test_demasiados_intentos_marca_fallido(self, store):
+        job_id = store.create({"prompt": "p"})
+        store.claim("host:1:a")
+        assert store.requeue_orphans(lease=0, max_attempts=1) == 0
+        assert store.get(job_id)["status"] == FAILED
+
+    def test_owner_distinto_en_cada_arranque(self):
+        assert _owner() != _owner()
+
+
+# ─── run_job ──────────────────────────────────────────────────────────────────
+
+class TestRunJob:
+    def test_modo_auto_guarda_la_salida_por_paso(self, store):
+        job_id = store.create({"prompt": "p", "auto_mode": True}, [b"img"])
+        job = store.claim("o")
+        with patch(f"{JOBS}.generate_with_image_stream_auto", side_effect=_auto_stream):
+            assert run_job(store, job) == DONE
+
+        job = store.get(job_id)
+        assert job["outputs"]["step1"].startswith("```@startuml")
+        assert job["outputs"]["step2"] == "class A {}"
+        assert job_result(job) == "class A {}"
+        assert "job_queue_ms" in job["timing"]
+        assert replay_chunks(job)[:1] == ["[STEP1_START]"]
+
+    def test_error_de_ollama_marca_fallido(self, store):
+        def failing(**kwargs):
+            yield "parcial"
+            raise RuntimeError("conexión perdida")
+
+        job_id = store.create({"model": "m", "prompt": "p"})
+        job = store.claim("o")
+        with patch(f"{JOBS}.generate_with_image_stream", side_effect=failing):
+            assert run_job(store, job) == FAILED
+
+        job = store.get(job_id)
+        assert job["error"] == "conexión perdida"
+        assert job["outputs"] == {"generate": "parcial"}
+
+    def test_guarda_salida_parcial(self, store):
+        seen = []
+
+        def slow(**kwargs):
+            yield "uno "
+            time.sleep(0.05)
+            seen.append(store.get(job_id)["outputs"])
+            yield "dos"
+
+        job_id = store.create({"model": "m", "prompt": "p"})
+        job = store.claim("o")
+        with patch(f"{JOBS}.generate_with_image_stream", side_effect=slow):
+            run_job(store, job, flush_interval=0)
+        assert seen == [{"generate": "uno "}]
+
+
+# ─── JobChannel ───────────────────────────────────────────────────────────────
+
+class TestJobChannel:
+    def test_follow_reproduce_y_sigue_en_vivo(self):
+        channel = JobChannel()
+        channel.publish("chunk", "a")
+
+        def producer():
+            time.sleep(0.05)
+            channel.publish("chunk", "b")
+            channel.publish("end", {})
+
+        threading.Thread(target=producer).start()
+        assert [e for e in channel.follow(timeout=1) if e[0]] == [("chunk", "a"), ("chunk", "b"), ("end", {})]
+
+
+# ─── Rutas /jobs ──────────────────────────────────────────────────────────────
+
+class TestJobRoutes:
+    def test_enviar_consultar_y_obtener_resultado(self, client):
+        with patch(f"{JOBS}.generate_with_image_stream", return_value=iter(["def ", "hola(): pass"])):
+            resp = client.post("/jobs/", data={"model": "m", "prompt": "p"})
+            assert resp.status_code == 202
+            job_id = resp.json()["job_id"]
+            assert _wait_finished(client, job_id) == DONE
+
+        result = client.get(f"/jobs/{job_id}/result").json()
+        assert result["result"] == "def hola(): pass"
+        assert "total_ms" in result["timing"]
+
+    def test_resultado_pendiente_devuelve_409(self, client):
+        release = threading.Event()
+
+        def blocked(**kwargs):
+            release.wait(5)
+            yield "fin"
+
+        with patch(f"{JOBS}.generate_with_image_stream", side_effect=blocked):
+            job_id = client.post("/jobs/", data={"model": "m", "prompt": "p"}).json()["job_id"]
+            resp = client.get(f"/jobs/{job_id}/result")
+            release.set()
+            _wait_finished(client, job_id)
+
+        assert resp.status_code == 409
+        assert resp.json()["status"] in (QUEUED, RUNNING)
+
+    def test_stream_de_trabajo_terminado_en_modo_auto(self, client):
+        with patch(f"{JOBS}.generate_with_image_stream_auto", side_effect=_auto_stream):
+            job_id = client.post(
+                "/jobs/",
+                data={"model": "m", "prompt": "p", "auto_mode": "true"},
+                files=[("images", ("d.png", BytesIO(b"png"), "image/png"))],
+            ).json()["job_id"]
+            _wait_finished(client, job_id)
+
+        body = client.get(f"/jobs/{job_id}/stream").text
+        assert body.index('"[STEP1_START]"') < body.index('"[STEP2_START]"') < body.index('"class A {}"')
+        assert "event: stats" in body
+        assert body.endswith("data: [DONE]\n\n")
+
+    def test_stream_en_vivo(self, client):
+        release = threading.Event()
+
+        def slow(**kwargs):
+            yield "primero "
+            release.wait(5)
+            yield "segundo"
+
+        with patch(f"{JOBS}.generate_with_image_stream", side_effect=slow):
+            job_id = client.post("/jobs/", data={"model": "m", "prompt": "p"}).json()["job_id"]
+            threading.Timer(0.2, release.set).start()
+            body = client.get(f"/jobs/{job_id}/stream").text
+
+        assert '"primero "' in body and '"segundo"' in body
+        assert body.endswith("data: [DONE]\n\n")
+
+    def test_seguidor_reinicia_si_el_trabajo_se_reintenta(self, store):
+        job_id = store.create({"model": "m", "prompt": "p"})
+        store.claim("host:1:a")
+        store.update_progress(job_id, "generate", {"generate": "intento uno largo"})
+        with patch("app.routes.jobs.job_store", store), patch("app.routes.jobs.JOBS_POLL_INTERVAL", 0):
+            follower = _follow_store(job_id)
+            assert next(follower) == 'data: "intento uno largo"\n\n'
+            assert next(follower).startswith(":")
+            # El worker muere: otro lo recupera y empieza de cero
+            store.requeue_orphans(lease=0)
+            store.claim("host:2:b")
+            store.update_progress(job_id, "generate", {"generate": "dos"})
+            store.finish(job_id, DONE, {"generate": "dos"})
+            rest = list(follower)
+
+        assert rest[0].startswith("event: reset\n")
+        assert rest[1] == 'data: "dos"\n\n'
+        assert rest[-1] == "data: [DONE]\n\n"
+
+    def test_trabajo_fallido_en_stream(self, client):
+        with patch(f"{JOBS}.generate_with_image_stream", side_effect=RuntimeError("Ollama caído")):
+            job_id = client.post("/jobs/", data={"model": "m", "prompt": "p"}).json()["job_id"]
+            assert _wait_finished(client, job_id) == FAILED
+
+        assert client.get(f"/jobs/{job_id}/stream").text.endswith("data: [ERROR] Ollama caído\n\n")
+
+    def test_trabajo_inexistente(self, client):
+        assert client.get("/jobs/no-existe").status_code == 404
+        assert client.get("/jobs/no-existe/result").status_code == 404
+        assert client.get("/jobs/no-existe/stream").status_code == 404
+
+    def test_demasiadas_imagenes(self, client):
+        files = [("images", (f"{i}.png", BytesIO(b"x"), "image/png")) for i in range(6)]
+        resp = client.post("/jobs/", data={"model": "m", "prompt": "p"}, files=files)
+        assert resp.status_code == 400
@@ -0,0 +1,154 @@
+"""Tests para el stub de Ollama y el generador de carga (loadtest/)."""
+import base64
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from loadtest.loadgen import build_report, percentile
+from loadtest.replay import build_form, captured_report, load_capture, placeholder_image, placeholder_text, schedule
+from loadtest.stub_ollama import StubConfig, create_app
+
+
+@pytest.fixture
+def stub():
+    config = StubConfig(token_rate=0, load_delay=0, max_tokens=5)
+    with TestClient(create_app(config)) as c:
+        yield c
+
+
+# ─── Stub de Ollama ───────────────────────────────────────────────────────────
+
+class TestStubOllama:
+    def test_tags_lista_modelos_configurados(self, stub):
+        resp = stub.get("/api/tags")
+        names = [m["name"] for m in resp.json()["models"]]
+        assert "llava:7b" in names
+
+    def test_show_marca_modelos_de_vision(self, stub):
+        body = stub.post("/api/show", json={"name": "llava:7b"}).json()
+        assert any(".vision." in k for k in body["model_info"])
+
+    def test_chat_stream_termina_con_estadisticas(self, stub):
+        resp = stub.post("/api/chat", json={
+            "model": "qwen2.5-coder:7b",
+            "messages": [{"role": "user", "content": "hola"}],
+            "stream": True,
+        })
+        lines = [json.loads(line) for line in resp.text.splitlines() if line]
+        assert len(lines) == 6
+        assert lines[-1]["done"] is True
+        assert lines[-1]["eval_count"] == 5
+
+    def test_chat_sin_stream_devuelve_mensaje_completo(self, stub):
+        body = stub.post("/api/chat", json={
+            "model": "qwen2.5-coder:7b",
+            "messages": [{"role": "user", "content": "hola"}],
+            "stream": False,
+        }).json()
+        assert body["done"] is True
+        assert body["message"]["content"]
+
+    def test_modelo_desconocido_devuelve_404(self, stub):
+        resp = stub.post("/api/chat", json={"model": "nope", "messages": []})
+        assert resp.status_code == 404
+
+    def test_inyeccion_de_fallos(self):
+        config = StubConfig(token_rate=0, load_delay=0, failure_rate=1.0)
+        with TestClient(create_app(config)) as c:
+            resp = c.post("/api/chat", json={
+                "model": "llama3:8b",
+                "messages": [{"role": "user", "content": "x"}],
+            })
+        assert resp.status_code == 500
+
+    def test_ps_refleja_modelos_cargados(self, stub):
+        stub.post("/api/chat", json={
+            "model": "llama3:8b",
+            "messages": [{"role": "user", "content": "x"}],
+            "stream": False,
+        })
+        names = [m["name"] for m in stub.get("/api/ps").json()["models"]]
+        assert names == ["llama3:8b"]
+
+
+# ─── Generador de carga ───────────────────────────────────────────────────────
+
+class TestLoadgenReport:
+    def test_percentil_interpola(self):
+        assert percentile([1, 2, 3, 4], 50) == 2.5
+        assert percentile([], 90) == 0.0
+
+    def test_informe_agrega_errores_y_modos(self):
+        results = [
+            {"ok": True, "ttft": 0.1, "latency": 1.0, "mode": "manual"},
+            {"ok": True, "ttft": 0.3, "latency": 2.0, "mode": "auto"},
+            {"ok": False, "error": "http_500", "latency": 0.1, "mode": "auto"},
+        ]
+        report = build_report(results, elapsed=2.0)
+
+        assert report["ok"] == 2
+        assert report["errors"] == {"http_500": 1}
+        assert report["throughput_rps"] == 1.0
+        assert report["auto"]["ok"] == 1
+
+
+# ─── Reproducción de tráfico ──────────────────────────────────────────────────
+
+CAPTURED = {
+    "v": 1, "route": "/generate/stream", "model": "llava:7b", "t": 100.0,
+    "prompt": {"chars": 37, "hash": "aaaa"},
+    "images": [{"bytes": 1000, "hash": "bbbb"}, {"bytes": 1000, "hash": "bbbb"}],
+    "history": [{"role": "user", "chars": 12, "hash": "cccc", "images": [{"bytes": 3000, "hash": "dddd"}]}],
+    "auto_mode": True, "vision_model": "llava:7b", "coding_model": "qwen2.5-coder:7b",
+    "structured": False, "options": {"temperature": 0.2}, "latency_target": None,
+    "status": "ok", "ttft_ms": 500.0, "total_ms": 2000.0,
+}
+
+
+class TestReplay:
+    def test_relleno_conserva_tamaño_y_repeticiones(self):
+        assert len(placeholder_text(37, "a")) == 37
+        assert placeholder_text(37, "a") == placeholder_text(37, "a")
+        assert placeholder_text(0, "a") == ""
+        assert len(placeholder_image(1000, "b")) == 1000
+        assert placeholder_image(1000, "b") != placeholder_image(1000, "c")
+
+    @pytest.mark.parametrize("nbytes", [300, 4321, 250_000])
+    def test_imagen_de_relleno_es_un_png_valido(self, nbytes):
+        data = placeholder_image(nbytes, "k")
+        assert len(data) == nbytes
+        Image.open(io.BytesIO(data)).verify()
+
+    def test_formulario_reproduce_la_forma(self):
+        form = build_form(CAPTURED)
+        data = form["data"]
+        history = json.loads(data["messages"])
+
+        assert len(data["prompt"]) == 37
+        assert data["auto_mode"] == "true"
+        assert json.loads(data["options"]) == {"temperature": 0.2}
+        assert "latency_target" not in data
+        assert len(form["files"]) == 2
+        assert form["files"][0][1][1] == form["files"][1][1][1]
+        assert len(history[0]["content"]) == 12
+        assert len(base64.b64decode(history[0]["images"][0])) == 3000
+
+    def test_formulario_generate_sin_stream(self):
+        record = {**CAPTURED, "route": "/generate/", "images": [{"bytes": 10, "hash": "x"}]}
+        form = build_form(record, model="llama3:8b")
+        assert form["data"]["model"] == "llama3:8b"
+        assert [f[0] for f in form["files"]] == ["image"]
+
+    def test_planifica_segun_llegada_y_velocidad(self, tmp_path):
+        path = tmp_path / "traffic.jsonl"
+        lines = [{**CAPTURED, "t": t} for t in (104.0, 100.0, 102.0)]
+        path.write_text("\n".join(json.dumps(line) for line in lines) + "\nno es json\n")
+
+        records = load_capture(str(path))
+        offsets = [offset for offset, _ in schedule(records, speed=2)]
+
+        assert offsets == [0.0, 1.0, 2.0]
+        assert captured_report(records)["span_s"] == 4.0
@@ -0,0 +1,101 @@
+"""Tests para el logging sin bloqueos (app/core/logger.py y app/core/request_context.py)."""
+import json
+import logging
+import queue
+import sys
+
+from app.core.logger import (
+    LOG_RECORDS_DROPPED_TOTAL,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RateLimiter,
+    RequestIdFilter,
+    configure_logging,
+    log_limited,
+)
+from app.core.request_context import request_id_var, resolve_request_id
+
+
+def _record(msg="hola %s", args=("mundo",), exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("fastapi-ollama", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+# ─── Cola de registros ────────────────────────────────────────────────────────
+
+class TestNonBlockingQueueHandler:
+    def test_descarta_y_cuenta_con_la_cola_llena(self):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        before = LOG_RECORDS_DROPPED_TOTAL.get()
+        handler.handle(_record())
+        handler.handle(_record())
+        assert handler.queue.qsize() == 1
+        assert LOG_RECORDS_DROPPED_TOTAL.get() == before + 1
+
+    def test_no_formatea_en_el_hilo_que_registra(self):
+        handler = NonBlockingQueueHandler(queue.Queue())
+        handler.handle(_record())
+        record = handler.queue.get_nowait()
+        assert record.msg == "hola %s" and record.args == ("mundo",)
+
+    def test_configuracion_idempotente(self):
+        root = logging.getLogger()
+        handler = configure_logging()
+        assert configure_logging() is handler
+        assert sum(isinstance(h, NonBlockingQueueHandler) for h in root.handlers) == 1
+
+
+# ─── Id de petición y formato JSON ────────────────────────────────────────────
+
+class TestRequestId:
+    def test_filtro_añade_id_del_contexto(self):
+        token = request_id_var.set("abc123")
+        try:
+            record = _record()
+            RequestIdFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+        assert record.request_id == "abc123"
+        assert record.request_tag == " [abc123]"
+
+    def test_json_con_id_y_traza(self):
+        try:
+            raise RuntimeError("fallo")
+        except RuntimeError:
+            record = _record(exc_info=sys.exc_info())
+        record.request_id = "abc123"
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["msg"] == "hola mundo"
+        assert entry["request_id"] == "abc123"
+        assert "RuntimeError: fallo" in entry["exc"]
+
+    def test_id_entrante_solo_si_es_valido(self):
+        assert resolve_request_id("req-1.2") == "req-1.2"
+        assert resolve_request_id("con espacios") != "con espacios"
+        assert len(resolve_request_id("")) == 16
+
+    def test_middleware_devuelve_cabecera(self, client):
+        assert client.get("/", headers={"X-Request-Id": "req-42"}).headers["X-Request-Id"] == "req-42"
+        assert client.get("/").headers["X-Request-Id"]
+
+
+# ─── Límite de frecuencia ─────────────────────────────────────────────────────
+
+class TestRateLimit:
+    def test_uno_por_periodo_y_cuenta_omitidos(self):
+        limiter = RateLimiter(interval=3600)
+        assert limiter.allow("a") == (True, 0)
+        assert limiter.allow("a") == (False, 1)
+        assert limiter.allow("a") == (False, 2)
+        assert limiter.allow("b") == (True, 0)
+
+    def test_informa_de_omitidos_al_reabrir(self):
+        limiter = RateLimiter(interval=0)
+        limiter._state["a"] = (0.0, 5)
+        assert limiter.allow("a") == (True, 5)
+
+    def test_log_limited_omite_repeticiones(self, caplog):
+        with caplog.at_level(logging.WARNING, logger="fastapi-ollama"):
+            for i in range(5):
+                log_limited("test.repetido", logging.WARNING, "linea %d no válida", i)
+        messages = [r.getMessage() for r in caplog.records if "no válida" in r.getMessage()]
+        assert messages == ["linea 0 no válida"]
@@ -0,0 +1,46 @@
+"""Tests para el monitor de lag del event loop (loop_monitor.py)."""
+import asyncio
+import logging
+import time
+
+from app.core.loop_monitor import LOOP_BLOCKS_TOTAL, LOOP_LAG_SECONDS, LoopMonitor
+
+
+def _blocking_call(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+async def _run_with_block(monitor: LoopMonitor, block: float) -> None:
+    monitor.start()
+    await asyncio.sleep(0.05)
+    _blocking_call(block)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+
+class TestLoopMonitor:
+    def test_registra_lag_y_bloqueos(self):
+        monitor = LoopMonitor(interval_ms=10, threshold_ms=100, debug=False)
+        count_before = LOOP_LAG_SECONDS.get_count()
+        blocks_before = LOOP_BLOCKS_TOTAL.get()
+
+        asyncio.run(_run_with_block(monitor, 0.2))
+
+        assert LOOP_LAG_SECONDS.get_count() > count_before
+        assert LOOP_BLOCKS_TOTAL.get() == blocks_before + 1
+
+    def test_debug_registra_la_pila_de_la_llamada_bloqueante(self, caplog):
+        monitor = LoopMonitor(interval_ms=10, threshold_ms=50, debug=True)
+        with caplog.at_level(logging.WARNING, logger="fastapi-ollama"):
+            asyncio.run(_run_with_block(monitor, 0.3))
+
+        stacks = [r.getMessage() for r in caplog.records if "Pila del loop" in r.getMessage()]
+        assert len(stacks) == 1
+        assert "_blocking_call" in stacks[0]
+
+    def test_sin_bloqueos_no_hay_avisos(self, caplog):
+        monitor = LoopMonitor(interval_ms=10, threshold_ms=200, debug=True)
+        with caplog.at_level(logging.WARNING, logger="fastapi-ollama"):
+            asyncio.run(_run_with_block(monitor, 0))
+
+        assert not [r for r in caplog.records if "bloqueado" in r.getMessage()]
@@ -0,0 +1,81 @@
+"""Tests para la contabilidad de memoria (memory.py) y /admin/memory."""
+import tracemalloc
+from unittest.mock import patch
+
+from app.core import memory
+from app.core.memory import HELD_BYTES, IMAGES, RequestMemory
+
+ADMIN_HEADERS = {"X-Admin-Token": "secreto"}
+
+
+# ─── RequestMemory ────────────────────────────────────────────────────────────
+
+class TestRequestMemory:
+    def test_registra_bytes_vivos_y_pico(self):
+        m = RequestMemory("/test")
+        m.hold(IMAGES, 1000)
+        m.hold("images_b64", 1400)
+        m.release(IMAGES)
+
+        assert m.live == 1400
+        assert m.peak == 2400
+        m.close()
+
+    def test_close_libera_el_gauge_y_sale_de_activas(self):
+        before = HELD_BYTES.get(kind=IMAGES)
+        m = RequestMemory("/test")
+        m.hold(IMAGES, 500)
+        assert HELD_BYTES.get(kind=IMAGES) == before + 500
+
+        m.close()
+        assert HELD_BYTES.get(kind=IMAGES) == before
+        assert all(entry["id"] != m.id for entry in memory.active_requests())
+
+
+# ─── Instantáneas de tracemalloc ──────────────────────────────────────────────
+
+class TestSnapshots:
+    def test_diff_muestra_crecimiento(self):
+        memory.start_tracing()
+        try:
+            first = memory.take_snapshot()
+            retained = [bytearray(1024) for _ in range(200)]
+            second = memory.take_snapshot()
+            diff = memory.diff_snapshots(first["id"], second["id"], limit=5)
+        finally:
+            memory.stop_tracing()
+
+        assert retained
+        assert diff[0]["size_diff"] > 0
+
+
+# ─── Endpoints /admin/memory ──────────────────────────────────────────────────
+
+class TestAdminMemoryEndpoints:
+    def test_resumen_incluye_peticiones_activas(self, client):
+        m = RequestMemory("/generate/stream")
+        m.hold(IMAGES, 2048)
+        with patch("app.core.admin.ADMIN_TOKEN", "secreto"):
+            body = client.get("/admin/memory", headers=ADMIN_HEADERS).json()
+        m.close()
+
+        assert body["held_bytes"][IMAGES] >= 2048
+        assert any(r["id"] == m.id for r in body["active_requests"])
+        assert "vision" in body["caches"]
+
+    def test_snapshot_sin_tracemalloc_devuelve_409(self, client):
+        assert not tracemalloc.is_tracing()
+        with patch("app.core.admin.ADMIN_TOKEN", "secreto"):
+            resp = client.post("/admin/memory/snapshots", headers=ADMIN_HEADERS)
+        assert resp.status_code == 409
+
+    def test_flujo_start_snapshot_diff(self, client):
+        with patch("app.core.admin.ADMIN_TOKEN", "secreto"):
+            client.post("/admin/memory/tracemalloc/start", headers=ADMIN_HEADERS)
+            a = client.post("/admin/memory/snapshots", headers=ADMIN_HEADERS).json()["id"]
+            b = client.post("/admin/memory/snapshots", headers=ADMIN_HEADERS).json()["id"]
+            diff = client.get(f"/admin/memory/snapshots/{a}/diff/{b}", headers=ADMIN_HEADERS)
+            client.post("/admin/memory/tracemalloc/stop", headers=ADMIN_HEADERS)
+
+        assert diff.status_code == 200
+        assert "top" in diff.json()
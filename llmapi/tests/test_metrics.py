@@ -0,0 +1,93 @@
+"""Tests para el registro de métricas y el endpoint /metrics."""
+import requests
+from unittest.mock import patch, MagicMock
+
+from app.core.metrics import (
+    Counter,
+    Histogram,
+    EVAL_TOKENS_TOTAL,
+    REQUESTS_TOTAL,
+    classify_upstream_error,
+    observe_ollama_stats,
+)
+
+
+# ─── Tipos de métrica ─────────────────────────────────────────────────────────
+
+class TestMetricTypes:
+    def test_counter_renderiza_etiquetas(self):
+        c = Counter("test_total", "ayuda", ("model",))
+        c.inc(model="llama3:8b")
+        c.inc(2, model="llama3:8b")
+
+        text = c.render()
+        assert "# TYPE test_total counter" in text
+        assert 'test_total{model="llama3:8b"} 3' in text
+
+    def test_histogram_acumula_buckets(self):
+        h = Histogram("test_seconds", "ayuda", buckets=(1.0, 5.0))
+        h.observe(0.5)
+        h.observe(3.0)
+        h.observe(10.0)
+
+        text = h.render()
+        assert 'test_seconds_bucket{le="1"} 1' in text
+        assert 'test_seconds_bucket{le="5"} 2' in text
+        assert 'test_seconds_bucket{le="+Inf"} 3' in text
+        assert "test_seconds_count 3" in text
+
+
+# ─── Estadísticas de Ollama ───────────────────────────────────────────────────
+
+class TestObserveOllamaStats:
+    def test_registra_tokens_del_chunk_final(self):
+        before = EVAL_TOKENS_TOTAL.get(model="stats-test")
+        observe_ollama_stats("stats-test", {
+            "done": True,
+            "prompt_eval_count": 10,
+            "eval_count": 40,
+            "eval_duration": 2_000_000_000,
+            "load_duration": 500_000_000,
+        })
+
+        assert EVAL_TOKENS_TOTAL.get(model="stats-test") == before + 40
+
+    def test_ignora_respuestas_no_dict(self):
+        observe_ollama_stats("stats-test", "texto")
+
+
+class TestClassifyUpstreamError:
+    def test_timeout(self):
+        assert classify_upstream_error(requests.exceptions.Timeout()) == "timeout"
+
+    def test_conexion(self):
+        assert classify_upstream_error(requests.exceptions.ConnectionError()) == "connection"
+
+    def test_http_5xx(self):
+        resp = MagicMock(status_code=503)
+        assert classify_upstream_error(requests.exceptions.HTTPError(response=resp)) == "http_5xx"
+
+    def test_otro(self):
+        assert classify_upstream_error(RuntimeError("x")) == "other"
+
+
+# ─── GET /metrics ─────────────────────────────────────────────────────────────
+
+class TestMetricsEndpoint:
+    def test_devuelve_formato_prometheus(self, client):
+        resp = client.get("/metrics")
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain")
+        assert "llmapi_requests_total" in resp.text
+
+    def test_cuenta_peticiones_de_stream(self, client):
+        def fake_stream(*args, **kwargs):
+            yield "hola"
+
+        before = REQUESTS_TOTAL.get(route="/generate/stream", model="metrics-model", status="ok")
+        with patch("app.routes.generate.generate_with_image_stream", side_effect=fake_stream):
+            client.post("/generate/stream", data={"model": "metrics-model", "prompt": "x"})
+
+        after = REQUESTS_TOTAL.get(route="/generate/stream", model="metrics-model", status="ok")
+        assert after == before + 1
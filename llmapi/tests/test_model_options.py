@@ -0,0 +1,111 @@
+"""Tests para las opciones de Ollama por modelo y por petición (model_options.py)."""
+from unittest.mock import patch
+
+import pytest
+
+from app.services import model_options
+from app.services.model_options import (
+    apply_options,
+    context_size,
+    parse_overrides,
+    profile_for,
+    validate_overrides,
+)
+
+PROFILES = {
+    "*": {"num_thread": 8, "temperature": 0.8},
+    "qwen2.5-coder:*": {"temperature": 0.2},
+    "qwen2.5-coder:14b": {"num_ctx": 16384},
+}
+
+
+def _payload(model="llama3:8b", content="hola"):
+    return {"model": model, "messages": [{"role": "user", "content": content}], "stream": True}
+
+
+# ─── Validación de opciones de la petición ────────────────────────────────────
+
+class TestValidateOverrides:
+    def test_normaliza_opciones_validas(self):
+        assert validate_overrides({"num_ctx": 8192.0, "temperature": 0, "keep_alive": "10m"}) == {
+            "num_ctx": 8192, "temperature": 0.0, "keep_alive": "10m"
+        }
+
+    @pytest.mark.parametrize("overrides", [
+        {"num_gpu": 1},                 # no permitida
+        {"temperature": 3},             # fuera de rango
+        {"num_ctx": 1000000},           # mayor que el mayor bucket
+        {"seed": 1.5},                  # no entero
+        {"num_predict": True},
+        {"keep_alive": "siempre"},
+    ])
+    def test_rechaza_opciones_no_validas(self, overrides):
+        with pytest.raises(ValueError):
+            validate_overrides(overrides)
+
+    def test_parse_json_no_valido(self):
+        with pytest.raises(ValueError):
+            parse_overrides("{temperature: 0}")
+        assert parse_overrides(None) == {}
+
+
+# ─── Perfiles y num_ctx ───────────────────────────────────────────────────────
+
+class TestProfiles:
+    def test_el_patron_mas_especifico_gana(self):
+        with patch.object(model_options, "_profiles", PROFILES):
+            assert profile_for("qwen2.5-coder:14b") == {"num_thread": 8, "temperature": 0.2, "num_ctx": 16384}
+            assert profile_for("llama3:8b") == {"num_thread": 8, "temperature": 0.8}
+
+    def test_context_size_redondea_al_bucket(self):
+        assert context_size(100, 2048) == 4096
+        assert context_size(3000, 2048) == 8192
+        assert context_size(100000, 2048) == model_options.NUM_CTX_BUCKETS[-1]
+
+
+class TestApplyOptions:
+    def test_num_ctx_automatico_segun_el_prompt(self):
+        small = apply_options(_payload(content="hola"))
+        large = apply_options(_payload(content="x" * 40000))
+
+        assert small["options"]["num_ctx"] == 4096
+        assert large["options"]["num_ctx"] == 16384
+
+    def test_num_predict_cuenta_como_salida_esperada(self):
+        payload = apply_options(_payload(content="x" * 8000), {"num_predict": 100})
+        assert payload["options"]["num_ctx"] == 4096
+
+    def test_prioridad_perfil_derivadas_peticion(self):
+        with patch.object(model_options, "_profiles", PROFILES):
+            payload = apply_options(
+                _payload("qwen2.5-coder:14b"),
+                overrides={"temperature": 0.5, "keep_alive": "1h"},
+                defaults={"temperature": 0.1, "num_predict": 256},
+            )
+
+        assert payload["options"] == {"num_thread": 8, "temperature": 0.5, "num_ctx": 16384, "num_predict": 256}
+        assert payload["keep_alive"] == "1h"
+
+    def test_imagenes_cuentan_en_el_contexto(self):
+        payload = _payload()
+        payload["messages"][0]["images"] = ["..."] * 5
+        assert apply_options(payload)["options"]["num_ctx"] == 8192
+
+
+# ─── Rutas ────────────────────────────────────────────────────────────────────
+
+class TestRoutesOptions:
+    def test_stream_pasa_las_opciones_al_servicio(self, client):
+        with patch("app.routes.generate.generate_with_image_stream", return_value=iter(["a"])) as mock_stream:
+            client.post("/generate/stream", data={"model": "m", "prompt": "p", "options": '{"seed": 42}'})
+
+        assert mock_stream.call_args.kwargs["options"] == {"seed": 42}
+
+    def test_opciones_no_validas_400(self, client):
+        resp = client.post("/generate/stream", data={"model": "m", "prompt": "p", "options": '{"num_gpu": 1}'})
+        assert resp.status_code == 400
+        assert "num_gpu" in resp.json()["detail"]
+
+    def test_lote_valida_las_opciones(self, client):
+        resp = client.post("/generate/batch", json={"items": [{"model": "m", "prompt": "p", "options": {"top_k": 1}}]})
+        assert resp.status_code == 422
@@ -0,0 +1,273 @@
+"""Tests para model_stats.py y model_selection.py: selección y enrutado de modelos por rendimiento medido."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.metrics import observe_ollama_stats
+from app.core.model_stats import ModelStats, model_stats
+from app.services.model_selection import (
+    FASTEST,
+    LARGEST,
+    LARGEST_UNDER_SLO,
+    NOT_MEASURED,
+    QUALITY_THROUGHPUT,
+    SLO_UNREACHABLE,
+    choose_model,
+    estimate_completion,
+    route_for_latency,
+)
+from app.core.telemetry import RequestTelemetry
+from app.services.ollama_service import (
+    _candidates_cache,
+    generate_with_image_stream_auto,
+    route_coding_model,
+    select_best_models,
+)
+
+CANDIDATES = [("qwen2.5-coder:32b", 32), ("qwen2.5-coder:14b", 14), ("qwen2.5-coder:7b", 7)]
+
+
+def _stats(eval_rate, prompt_rate=500.0, load_seconds=0.0, tokens=100):
+    return {
+        "load_duration": int(load_seconds * 1e9),
+        "prompt_eval_count": tokens,
+        "prompt_eval_duration": int(tokens / prompt_rate * 1e9),
+        "eval_count": tokens,
+        "eval_duration": int(tokens / eval_rate * 1e9),
+    }
+
+
+def _stream(*chunks):
+    resp = MagicMock()
+    lines = [json.dumps({"message": {"content": c}, "done": False}).encode() for c in chunks]
+    lines.append(json.dumps({"message": {"content": ""}, "done": True}).encode())
+    resp.iter_lines.return_value = iter(lines)
+    return resp
+
+
+def _measure(model, eval_rate, samples=3, **kwargs):
+    for _ in range(samples):
+        model_stats.record(model, _stats(eval_rate, **kwargs))
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    model_stats.reset()
+    yield
+    model_stats.reset()
+
+
+# ─── ModelStats ───────────────────────────────────────────────────────────────
+
+class TestModelStats:
+    def test_mediana_de_la_ventana(self):
+        stats = ModelStats(window=3)
+        for rate in (5.0, 100.0, 10.0, 20.0):  # la primera sale de la ventana
+            stats.record("m", _stats(rate))
+
+        assert stats.get("m")["eval_tokens_per_second"] == 20.0
+
+    def test_sin_muestras_suficientes(self):
+        model_stats.record("m", _stats(10.0))
+        assert model_stats.get("m") is None
+        assert model_stats.snapshot()["m"]["measured"] is False
+
+    def test_estimacion_de_duracion(self):
+        _measure("m", eval_rate=10.0, prompt_rate=100.0, load_seconds=2.0)
+        assert model_stats.estimate_seconds("m", prompt_tokens=500, output_tokens=100) == pytest.approx(17.0)
+
+    def test_ignora_respuestas_con_pocos_tokens(self):
+        for _ in range(3):
+            model_stats.record("m", _stats(1000.0, tokens=1))
+        assert "m" not in model_stats.snapshot()
+
+    def test_se_alimenta_de_las_estadisticas_de_ollama(self):
+        for _ in range(3):
+            observe_ollama_stats("llama3:8b", _stats(42.0))
+        assert model_stats.get("llama3:8b")["eval_tokens_per_second"] == 42.0
+
+
+# ─── Políticas ────────────────────────────────────────────────────────────────
+
+class TestChooseModel:
+    def test_largest_ignora_las_mediciones(self):
+        _measure("qwen2.5-coder:7b", 80.0)
+        assert choose_model(CANDIDATES, LARGEST) == ("qwen2.5-coder:32b", None)
+
+    def test_fastest(self):
+        _measure("qwen2.5-coder:32b", 3.0)
+        _measure("qwen2.5-coder:14b", 25.0)
+        assert choose_model(CANDIDATES, FASTEST) == ("qwen2.5-coder:14b", None)
+
+    def test_largest_under_slo(self):
+        _measure("qwen2.5-coder:32b", 3.0)
+        _measure("qwen2.5-coder:14b", 25.0)
+        _measure("qwen2.5-coder:7b", 60.0)
+
+        assert choose_model(CANDIDATES, LARGEST_UNDER_SLO, slo_seconds=60, prompt_tokens=0,
+                            output_tokens=1000) == ("qwen2.5-coder:14b", None)
+
+    def test_slo_inalcanzable_elige_el_mas_rapido(self):
+        _measure("qwen2.5-coder:32b", 3.0)
+        _measure("qwen2.5-coder:14b", 25.0)
+
+        assert choose_model(CANDIDATES, LARGEST_UNDER_SLO, slo_seconds=1, prompt_tokens=0,
+                            output_tokens=1000) == ("qwen2.5-coder:14b", SLO_UNREACHABLE)
+
+    def test_quality_throughput(self):
+        _measure("qwen2.5-coder:32b", 3.0)   # sqrt(32 * 3)  ≈ 9.8
+        _measure("qwen2.5-coder:14b", 25.0)  # sqrt(14 * 25) ≈ 18.7
+        _measure("qwen2.5-coder:7b", 40.0)   # sqrt(7 * 40)  ≈ 16.7
+        assert choose_model(CANDIDATES, QUALITY_THROUGHPUT) == ("qwen2.5-coder:14b", None)
+
+    def test_sin_mediciones_usa_largest(self):
+        assert choose_model(CANDIDATES, FASTEST) == ("qwen2.5-coder:32b", NOT_MEASURED)
+
+
+# ─── select_best_models y /models/auto-select ─────────────────────────────────
+
+MODELS = {"models": [{"name": n} for n in ("llava:7b", "llava:34b", "qwen2.5-coder:32b", "qwen2.5-coder:14b")]}
+
+
+class TestSelectBestModelsPolicies:
+    def test_politica_por_defecto_sin_cambios(self):
+        with patch("app.services.ollama_service.list_models", return_value=MODELS):
+            result = select_best_models()
+        assert result["coding_model"] == "qwen2.5-coder:32b"
+        assert result["policy"] == LARGEST
+
+    def test_fastest_con_alternativa_para_vision(self):
+        _measure("qwen2.5-coder:32b", 3.0)
+        _measure("qwen2.5-coder:14b", 25.0)
+        with patch("app.services.ollama_service.list_models", return_value=MODELS):
+            result = select_best_models(FASTEST)
+
+        assert result["coding_model"] == "qwen2.5-coder:14b"
+        assert result["vision_model"] == "llava:34b"
+        assert result["fallback"] == {"vision_model": NOT_MEASURED}
+        assert result["unmeasured"] == {"vision_model": ["llava:7b", "llava:34b"]}
+
+    def test_candidatos_sin_medir_visibles(self, client):
+        _measure("qwen2.5-coder:14b", 25.0)
+        with patch("app.services.ollama_service.list_models", return_value=MODELS):
+            body = client.get("/models/auto-select", params={"policy": "fastest"}).json()
+            default = client.get("/models/auto-select").json()
+
+        assert body["unmeasured"]["coding_model"] == ["qwen2.5-coder:32b"]
+        assert "unmeasured" not in default
+
+    def test_ruta_con_politica(self, client):
+        _measure("qwen2.5-coder:14b", 25.0)
+        with patch("app.services.ollama_service.list_models", return_value=MODELS):
+            body = client.get("/models/auto-select", params={"policy": "fastest"}).json()
+
+        assert body["coding_model"] == "qwen2.5-coder:14b"
+        assert body["performance"]["qwen2.5-coder:14b"]["eval_tokens_per_second"] == 25.0
+        assert "qwen2.5-coder:14b" in client.get("/models/performance").json()["models"]
+
+    def test_ruta_politica_desconocida(self, client):
+        assert client.get("/models/auto-select", params={"policy": "random"}).status_code == 400
+
+
+# ─── Enrutado por cola ────────────────────────────────────────────────────────
+
+def _queues(**loads):
+    """Scheduler simulado: modelo -> (en curso, en espera), una ranura por modelo."""
+    scheduler = MagicMock()
+    scheduler.load.side_effect = lambda model: {
+        "slots": 1, "active": loads.get(model, (0, 0))[0], "waiting": loads.get(model, (0, 0))[1]
+    }
+    return patch("app.services.model_selection.scheduler", scheduler)
+
+
+CODERS = [("qwen2.5-coder:14b", 14), ("qwen2.5-coder:7b", 7), ("qwen2.5-coder:3b", 3)]
+
+
+class TestRouteForLatency:
+    def setup_method(self):
+        model_stats.reset()
+        _measure("qwen2.5-coder:14b", 25.0, prompt_rate=1000.0)  # 1000 tokens: 40 s
+        _measure("qwen2.5-coder:7b", 50.0, prompt_rate=1000.0)   # 20 s
+        _measure("qwen2.5-coder:3b", 100.0, prompt_rate=1000.0)  # 10 s
+
+    def test_la_cola_cuenta_en_la_estimacion(self):
+        with _queues(**{"qwen2.5-coder:14b": (1, 2)}):
+            assert estimate_completion("qwen2.5-coder:14b", 0, 1000) == pytest.approx(160.0)
+            assert estimate_completion("qwen2.5-coder:7b", 0, 1000) == pytest.approx(20.0)
+
+    def test_sin_cola_se_mantiene_el_preferido(self):
+        with _queues():
+            served, _ = route_for_latency("qwen2.5-coder:14b", CODERS, 60, 0, 1000)
+        assert served == "qwen2.5-coder:14b"
+
+    def test_con_cola_baja_al_mayor_que_llega(self):
+        with _queues(**{"qwen2.5-coder:14b": (1, 3)}):
+            served, estimates = route_for_latency("qwen2.5-coder:14b", CODERS, 60, 0, 1000)
+
+        assert served == "qwen2.5-coder:7b"
+        assert estimates["qwen2.5-coder:14b"] == pytest.approx(200.0)
+
+    def test_si_ninguno_llega_se_mantiene_el_preferido(self):
+        with _queues(**{m: (1, 5) for m, _ in CODERS}):
+            served, _ = route_for_latency("qwen2.5-coder:14b", CODERS, 15, 0, 1000)
+        assert served == "qwen2.5-coder:14b"
+
+    def test_sin_mediciones_no_enruta(self):
+        model_stats.reset()
+        with _queues(**{"qwen2.5-coder:14b": (1, 9)}):
+            assert route_for_latency("qwen2.5-coder:14b", CODERS, 1, 0, 1000)[0] == "qwen2.5-coder:14b"
+
+
+class TestAutoModeQueueRouting:
+    CATALOG = {"models": [{"name": n} for n in ("llava:7b", "qwen2.5-coder:14b", "qwen2.5-coder:7b", "llama3:8b")]}
+
+    def _run(self, latency_target):
+        _candidates_cache.clear()
+        with patch("app.services.ollama_service.QUEUE_ROUTING_ENABLED", True), \
+                patch("app.services.ollama_service.list_models", return_value=self.CATALOG), \
+                patch("app.services.ollama_service._is_vision_model", side_effect=lambda n: "llava" in n), \
+                _queues(**{"qwen2.5-coder:14b": (1, 3)}), \
+                patch("app.services.ollama_service.ollama_session.post",
+                      side_effect=[_stream("```\n@startuml\nclass A\n@enduml\n```"), _stream("codigo")]) as mock_post:
+            telemetry = RequestTelemetry("/generate/stream", "auto")
+            list(generate_with_image_stream_auto(
+                prompt="Genera Java", image_bytes_list=[b"img"], vision_model_override="llava:7b",
+                coding_model_override="qwen2.5-coder:14b", telemetry=telemetry, latency_target=latency_target
+            ))
+            telemetry.finish("ok")
+        return mock_post.call_args_list[1].kwargs["json"]["model"], telemetry.breakdown()["steps"]["step2"]
+
+    def test_informa_del_modelo_que_sirve(self):
+        _measure("qwen2.5-coder:14b", 25.0)
+        _measure("qwen2.5-coder:7b", 50.0)
+
+        served, step2 = self._run(latency_target=60)
+
+        assert served == "qwen2.5-coder:7b"
+        assert step2["model"] == "qwen2.5-coder:7b"
+        assert step2["requested_model"] == "qwen2.5-coder:14b"
+
+    def test_sin_objetivo_no_enruta(self):
+        _measure("qwen2.5-coder:14b", 25.0)
+        _measure("qwen2.5-coder:7b", 50.0)
+
+        served, step2 = self._run(latency_target=None)
+
+        assert served == "qwen2.5-coder:14b"
+        assert "requested_model" not in step2
+
+    def test_solo_modelos_de_codigo_y_lista_cacheada(self):
+        _candidates_cache.clear()
+        _measure("qwen2.5-coder:14b", 25.0)
+        _measure("llama3:8b", 500.0)
+        with patch("app.services.ollama_service.QUEUE_ROUTING_ENABLED", True), \
+                patch("app.services.ollama_service.QUEUE_ROUTING_SAME_FAMILY", False), \
+                patch("app.services.ollama_service.list_models", return_value=self.CATALOG) as mock_list, \
+                patch("app.services.ollama_service._is_vision_model", side_effect=lambda n: "llava" in n), \
+                _queues(**{"qwen2.5-coder:14b": (1, 3)}):
+            for _ in range(2):
+                _, estimates = route_coding_model("qwen2.5-coder:14b", 60, 0)
+                # El modelo general (más rápido) nunca es candidato para el paso de código
+                assert "llama3:8b" not in estimates
+        assert mock_list.call_count == 1
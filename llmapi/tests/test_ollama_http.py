@@ -0,0 +1,104 @@
+"""Tests para la sesión compartida con Ollama por socket Unix (ollama_http.py) y --uds del servidor."""
+import json
+import os
+import socket
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app.core.ollama_http import _UnixHTTPConnection, create_session
+from app.server import build_config_kwargs, remove_stale_socket
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"models": [{"name": "llama3:8b"}], "host": self.headers["Host"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        lines = b"".join(json.dumps({"message": {"content": t}, "done": False}).encode() + b"\n" for t in "abc")
+        lines += json.dumps({"done": True}).encode() + b"\n"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(lines)))
+        self.end_headers()
+        self.wfile.write(lines)
+
+    def log_message(self, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def uds_server(tmp_path):
+    path = str(tmp_path / "ollama.sock")
+    server = _UnixHTTPServer(path, _Handler)
+    # BaseHTTPRequestHandler espera (host, puerto) como dirección del cliente
+    server.get_request = lambda: (server.socket.accept()[0], ("uds", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+# ─── Sesión por socket Unix ───────────────────────────────────────────────────
+
+class TestUnixSocketSession:
+    def test_peticion_por_socket(self, uds_server):
+        resp = create_session(uds_server).get("http://localhost/api/tags", timeout=5)
+
+        assert resp.json()["models"][0]["name"] == "llama3:8b"
+        assert resp.json()["host"] == "localhost"
+
+    def test_reutiliza_la_conexion(self, uds_server, monkeypatch):
+        connects = []
+        original = _UnixHTTPConnection._new_conn
+        monkeypatch.setattr(_UnixHTTPConnection, "_new_conn", lambda self: connects.append(1) or original(self))
+        session = create_session(uds_server)
+        for _ in range(5):
+            session.get("http://localhost/api/tags", timeout=5).raise_for_status()
+
+        assert len(connects) == 1
+
+    def test_stream_ndjson(self, uds_server):
+        resp = create_session(uds_server).post("http://localhost/api/chat", json={}, stream=True, timeout=5)
+        lines = [json.loads(line) for line in resp.iter_lines() if line]
+
+        assert "".join(line["message"]["content"] for line in lines[:-1]) == "abc"
+
+    def test_socket_inexistente(self, tmp_path):
+        with pytest.raises(Exception):
+            create_session(str(tmp_path / "nada.sock")).get("http://localhost/api/tags", timeout=1)
+
+
+# ─── Servidor en socket Unix ──────────────────────────────────────────────────
+
+class TestServerUds:
+    def test_uds_en_la_configuracion(self):
+        assert build_config_kwargs(workers=1, uds="/tmp/llmapi.sock")["uds"] == "/tmp/llmapi.sock"
+        assert "uds" not in build_config_kwargs(workers=1, uds="")
+
+    def test_borra_socket_huerfano(self, tmp_path):
+        path = str(tmp_path / "llmapi.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+
+        remove_stale_socket(path)
+        assert not os.path.exists(path)
+
+    def test_no_borra_socket_en_uso(self, uds_server):
+        with pytest.raises(RuntimeError):
+            remove_stale_socket(uds_server)
+        assert os.path.exists(uds_server)
@@ -12,7 +12,11 @@ from app.services.ollama_service import (
     select_best_models,
     unload_model,
     _call_ollama,
+    preload_model,
+    warmup_generation,
+    warmup_options,
 )
+from app.core.cache import MemoryCache
 
 
 # ─── _extract_model_size ────────────────────────────────────────────────────
@@ -60,6 +64,17 @@ class TestIsVisionModel:
     def test_no_detecta_modelos_sin_vision(self, name):
         assert _is_vision_model(name) is False
 
+    def test_resultado_de_ollama_se_cachea(self):
+        cache = MemoryCache("vision-test")
+        mock_resp = MagicMock(status_code=200)
+        mock_resp.json.return_value = {"model_info": {"clip.vision.block_count": 24}}
+        with patch("app.services.ollama_service._vision_cache", cache), \
+                patch("app.services.ollama_service.ollama_session.post", return_value=mock_resp) as mock_post:
+            assert _is_vision_model("gemma3:4b") is True
+            assert _is_vision_model("gemma3:4b") is True
+        assert mock_post.call_count == 1
+        assert cache.get("gemma3:4b") is True
+
 
 # ─── _is_coding_model ────────────────────────────────────────────────────────
 
@@ -91,7 +106,7 @@ class TestListModels:
         mock_resp.json.return_value = {"models": [{"name": "llama3:8b"}]}
         mock_resp.raise_for_status = MagicMock()
 
-        with patch("app.services.ollama_service.requests.get", return_value=mock_resp):
+        with patch("app.services.ollama_service.ollama_session.get", return_value=mock_resp):
             result = list_models()
 
         assert "models" in result
@@ -99,7 +114,7 @@ class TestListModels:
 
     def test_retorna_error_en_conexion_fallida(self):
         with patch(
-            "app.services.ollama_service.requests.get",
+            "app.services.ollama_service.ollama_session.get",
             side_effect=requests.exceptions.ConnectionError("refused"),
         ):
             result = list_models()
@@ -108,7 +123,7 @@ class TestListModels:
 
     def test_retorna_error_en_timeout(self):
         with patch(
-            "app.services.ollama_service.requests.get",
+            "app.services.ollama_service.ollama_session.get",
             side_effect=requests.exceptions.Timeout(),
         ):
             result = list_models()
@@ -208,7 +223,7 @@ class TestUnloadModel:
         mock_resp = MagicMock()
         mock_resp.raise_for_status = MagicMock()
 
-        with patch("app.services.ollama_service.requests.post", return_value=mock_resp):
+        with patch("app.services.ollama_service.ollama_session.post", return_value=mock_resp):
             result = unload_model("llama3:8b")
 
         assert result["success"] is True
@@ -217,7 +232,7 @@ class TestUnloadModel:
 
     def test_retorna_error_cuando_falla_la_peticion(self):
         with patch(
-            "app.services.ollama_service.requests.post",
+            "app.services.ollama_service.ollama_session.post",
             side_effect=requests.exceptions.ConnectionError("refused"),
         ):
             result = unload_model("llama3:8b")
@@ -226,6 +241,31 @@ class TestUnloadModel:
         assert "error" in result
 
 
+# ─── Precalentamiento ─────────────────────────────────────────────────────────
+
+class TestWarmupOptions:
+    def test_num_ctx_del_paso_de_vision(self):
+        with patch("app.services.ollama_service._is_vision_model", return_value=True):
+            one = warmup_options("llava:7b", images=1)
+            two = warmup_options("llava:7b", images=2)
+        assert one == {"num_predict": 2048, "num_ctx": 4096}
+        # 2 imágenes: 4096 tokens de salida más el prompt ya no caben en 4096
+        assert two == {"num_predict": 4096, "num_ctx": 8192}
+
+    def test_precarga_y_generacion_usan_las_mismas_opciones_de_carga(self):
+        mock_resp = MagicMock()
+        mock_resp.json.return_value = {"message": {"content": "x"}}
+        with patch("app.services.ollama_service._is_vision_model", return_value=False), \
+                patch("app.services.ollama_service.ollama_session.post", return_value=mock_resp) as mock_post:
+            preload_model("qwen2.5-coder:7b", "30m")
+            warmup_generation("qwen2.5-coder:7b", "30m")
+
+        preload, generate = (c.kwargs["json"] for c in mock_post.call_args_list)
+        assert preload["options"]["num_ctx"] == generate["options"]["num_ctx"] == 4096
+        assert generate["options"]["num_predict"] == 1
+        assert preload["keep_alive"] == generate["keep_alive"] == "30m"
+
+
 # ─── _call_ollama ─────────────────────────────────────────────────────────────
 
 class TestCallOllama:
@@ -234,14 +274,14 @@ class TestCallOllama:
         mock_resp.json.return_value = {"message": {"content": "ok"}}
         mock_resp.raise_for_status = MagicMock()
 
-        with patch("app.services.ollama_service.requests.post", return_value=mock_resp):
+        with patch("app.services.ollama_service.ollama_session.post", return_value=mock_resp):
             result = _call_ollama({"model": "llama3:8b", "messages": []})
 
         assert result["message"]["content"] == "ok"
 
     def test_lanza_excepcion_en_conexion_fallida(self):
         with patch(
-            "app.services.ollama_service.requests.post",
+            "app.services.ollama_service.ollama_session.post",
             side_effect=requests.exceptions.ConnectionError(),
         ):
             with pytest.raises(requests.exceptions.RequestException):
@@ -0,0 +1,182 @@
+"""Tests para plantuml.py: forma canónica del paso 2 y corte temprano del paso de visión."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.ollama_service import extract_plantuml_with_vision, generate_with_image_stream_auto
+from app.services.plantuml import (
+    CLASS,
+    COMPONENT,
+    SEQUENCE,
+    PlantUMLParseError,
+    VisionVerdicts,
+    compact_plantuml,
+    parse_diagram,
+)
+
+CLASS_OUTPUT = """```plantuml
+@startuml
+' Assumption: Customer has an id
+skinparam classAttributeIconSize 0
+skinparam class {
+    BackgroundColor LightYellow
+}
+package "shop" #DDDDDD {
+  abstract class   Customer   <<Entity>>  #pink {
+      -  id   :   int
+      --
+      + getName() : String
+  }
+}
+class Order
+Order : - total : double
+Customer "1" -up-> "*" Order : places
+Order *-[#red]- Item
+@enduml
+```"""
+
+
+def _stream(*chunks):
+    resp = MagicMock()
+    lines = [json.dumps({"message": {"content": c}, "done": False}).encode() for c in chunks]
+    lines.append(json.dumps({"message": {"content": ""}, "done": True}).encode())
+    resp.iter_lines.return_value = iter(lines)
+    return resp
+
+
+# ─── Parser ───────────────────────────────────────────────────────────────────
+
+class TestParseDiagram:
+    def test_diagrama_de_clases(self):
+        diagram = parse_diagram(CLASS_OUTPUT.split("@startuml")[1].split("@enduml")[0])
+
+        assert diagram.kind == CLASS
+        assert diagram.classes["Customer"]["header"] == "abstract class Customer <<Entity>>"
+        assert diagram.classes["Customer"]["members"] == ["-id: int", "+getName(): String"]
+        assert diagram.classes["Customer"]["package"] == ('"shop"',)
+        assert diagram.classes["Order"]["members"] == ["-total: double"]
+        assert diagram.relations == ['Customer "1" --> "*" Order : places', "Order *-- Item"]
+
+    def test_diagrama_de_secuencia(self):
+        diagram = parse_diagram(
+            "autonumber\n"
+            "actor User #red\n"
+            "participant \"Order Service\" as OS\n"
+            "User -> OS ++ : placeOrder(items)\n"
+            "activate OS\n"
+            "alt stock ok\n"
+            "  OS --> User : ok\n"
+            "end\n"
+        )
+
+        assert diagram.kind == SEQUENCE
+        assert diagram.participants == ["actor User", 'participant "Order Service" as OS']
+        assert diagram.events == ["User -> OS : placeOrder(items)", "alt stock ok", "OS --> User : ok", "end"]
+
+    def test_diagrama_de_componentes(self):
+        diagram = parse_diagram(
+            "node Server {\n"
+            "  component API\n"
+            "}\n"
+            "[Web UI] as web\n"
+            "web ..> API : HTTPS\n"
+        )
+
+        assert diagram.kind == COMPONENT
+        assert diagram.serialize() == (
+            "@startuml\n[Web UI] as web\nnode Server {\ncomponent API\n}\nweb ..> API : HTTPS\n@enduml"
+        )
+
+    def test_nota_multilinea_en_una_linea(self):
+        diagram = parse_diagram("class A\nnote right of A\n  uno\n  dos\nend note\n")
+        assert diagram.notes == ["note right of A : uno\\ndos"]
+
+    @pytest.mark.parametrize("body", [
+        "start\n:hola;\nstop\n",                 # actividad: no soportado
+        "class A {\n  -x: int\n",                # llave sin cerrar
+        "class A\nesto no es plantuml\n",        # línea desconocida
+    ])
+    def test_no_reconocido(self, body):
+        with pytest.raises(PlantUMLParseError):
+            parse_diagram(body)
+
+
+# ─── compact_plantuml ─────────────────────────────────────────────────────────
+
+class TestCompactPlantuml:
+    def test_compacta_y_reporta_ahorro(self):
+        text, stats = compact_plantuml(CLASS_OUTPUT)
+
+        assert text.startswith("@startuml\nclass Order {")
+        assert "Assumption" not in text and "skinparam" not in text and "```" not in text
+        assert stats["plantuml_blocks"] == 1
+        assert stats["plantuml_compacted"] == 1
+        assert stats["plantuml_tokens_saved_est"] > 0
+        assert stats["plantuml_compact_tokens_est"] < stats["plantuml_tokens_est"]
+
+    def test_bloque_no_soportado_se_mantiene(self):
+        raw = "```\n@startuml\nstart\n:hola;\nstop\n@enduml\n```"
+        text, stats = compact_plantuml(raw)
+
+        assert text == "@startuml\nstart\n:hola;\nstop\n@enduml"
+        assert stats["plantuml_compacted"] == 0
+
+    def test_sin_bloques_devuelve_el_texto(self):
+        assert compact_plantuml("class A") == ("class A", {"plantuml_blocks": 0, "plantuml_compacted": 0})
+
+
+# ─── Veredictos del paso de visión ────────────────────────────────────────────
+
+class TestVisionVerdicts:
+    def test_marcadores_partidos_entre_chunks(self):
+        verdicts = VisionVerdicts(2)
+        for chunk in ["```\n@star", "tuml\nclass A\n@end", "uml\n```\nNo dia"]:
+            assert not verdicts.feed(chunk)
+        assert verdicts.feed("gram")
+        assert verdicts.diagrams == 1
+
+    def test_no_diagram_dentro_de_un_bloque_no_cuenta(self):
+        verdicts = VisionVerdicts(1)
+        assert not verdicts.feed("@startuml\n' Assumption: no diagram title\nclass A\n")
+        assert verdicts.feed("@enduml")
+
+    def test_cierra_la_cerca_abierta_al_cortar(self):
+        verdicts = VisionVerdicts(1)
+        verdicts.feed("```\n@startuml\nclass A\n@enduml")
+        assert verdicts.text.endswith("@enduml\n```")
+
+
+class TestVisionEarlyStop:
+    def test_corta_tras_el_ultimo_veredicto(self):
+        resp = _stream("```\n@startuml\nclass A\n@enduml", "\n```\nExplanation:", " this diagram...")
+        with patch("app.services.ollama_service.ollama_session.post", return_value=resp) as mock_post:
+            content = extract_plantuml_with_vision([b"img"], vision_model="llava:7b")
+
+        assert content == "```\n@startuml\nclass A\n@enduml\n```"
+        assert "Explanation" not in content
+        resp.close.assert_called()
+        assert mock_post.call_args.kwargs["json"]["options"]["num_predict"] == 2048
+
+    def test_todas_no_diagram(self):
+        resp = _stream("No diagram\n", "No diagram\n", "No diagram\n")
+        with patch("app.services.ollama_service.ollama_session.post", return_value=resp):
+            with pytest.raises(ValueError):
+                extract_plantuml_with_vision([b"a", b"b"], vision_model="llava:7b")
+
+
+# ─── Integración con el modo auto ─────────────────────────────────────────────
+
+class TestAutoModeUsesCompactForm:
+    def test_el_prompt_del_paso_2_lleva_la_forma_canonica(self):
+        with patch("app.services.ollama_service.ollama_session.post",
+                   side_effect=[_stream(CLASS_OUTPUT), _stream("codigo")]) as mock_post:
+            chunks = list(generate_with_image_stream_auto(
+                prompt="Genera Java", image_bytes_list=[b"img"],
+                vision_model_override="llava:7b", coding_model_override="qwen2.5-coder:7b"
+            ))
+
+        assert chunks[-1] == "codigo"
+        step2_prompt = mock_post.call_args_list[1].kwargs["json"]["messages"][-1]["content"]
+        assert "class Order {\n  -total: double\n}" in step2_prompt
+        assert "Assumption" not in step2_prompt
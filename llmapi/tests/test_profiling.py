@@ -0,0 +1,122 @@
+"""Tests para el perfilado bajo demanda (profiling.py) y /admin/profiles."""
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.profiling import ProfilingMiddleware, RequestProfiler, get_profiler
+
+ADMIN = "secreto"
+
+
+def _busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path))
+
+    @app.get("/stream")
+    def stream(request: Request):
+        def gen():
+            for _ in range(3):
+                _busy(0.02)
+                yield "x"
+        content = gen()
+        profiler = get_profiler(request)
+        if profiler:
+            content = profiler.wrap_iterator(content)
+        return StreamingResponse(content)
+
+    with patch("app.core.admin.ADMIN_TOKEN", ADMIN):
+        yield app, tmp_path
+
+
+# ─── RequestProfiler ──────────────────────────────────────────────────────────
+
+class TestRequestProfiler:
+    def test_muestrea_solo_hilos_enlazados(self, tmp_path):
+        profiler = RequestProfiler(label="/test", interval_ms=1)
+        profiler.start()
+        with profiler.bound():
+            _busy(0.05)
+        _busy(0.02)
+        profiler.stop()
+
+        assert profiler.samples > 0
+        assert any("_busy" in stack for stack in profiler.stacks)
+        path = profiler.write(str(tmp_path))
+        assert path.endswith(f"-test-{profiler.profile_id}.folded")
+
+
+# ─── Middleware ───────────────────────────────────────────────────────────────
+
+class TestProfilingMiddleware:
+    def test_perfila_stream_con_token_valido(self, profiled_app):
+        app, directory = profiled_app
+        with TestClient(app) as c:
+            resp = c.get("/stream", headers={"X-Profile": "1", "X-Admin-Token": ADMIN})
+
+        assert resp.status_code == 200
+        profile_id = resp.headers["x-profile-id"]
+        files = list(directory.iterdir())
+        assert len(files) == 1
+        assert profile_id in files[0].name
+        assert "_busy" in files[0].read_text()
+
+    def test_ignora_peticiones_sin_token(self, profiled_app):
+        app, directory = profiled_app
+        with TestClient(app) as c:
+            resp = c.get("/stream?profile=1")
+
+        assert resp.status_code == 200
+        assert "x-profile-id" not in resp.headers
+        assert list(directory.iterdir()) == []
+
+    @pytest.mark.parametrize("query", ["xprofile=1", "noprofile=1", "profile=10", "a=profile=1"])
+    def test_solo_activa_el_parametro_profile_exacto(self, profiled_app, query):
+        app, directory = profiled_app
+        with TestClient(app) as c:
+            resp = c.get(f"/stream?{query}", headers={"X-Admin-Token": ADMIN})
+
+        assert "x-profile-id" not in resp.headers
+        assert list(directory.iterdir()) == []
+
+    def test_activa_con_parametro_profile(self, profiled_app):
+        app, directory = profiled_app
+        with TestClient(app) as c:
+            resp = c.get("/stream?x=1&profile=true", headers={"X-Admin-Token": ADMIN})
+
+        assert "x-profile-id" in resp.headers
+
+
+# ─── /admin/profiles ──────────────────────────────────────────────────────────
+
+class TestAdminProfiles:
+    def test_devuelve_404_si_admin_deshabilitado(self, client):
+        with patch("app.core.admin.ADMIN_TOKEN", ""):
+            resp = client.get("/admin/profiles")
+        assert resp.status_code == 404
+
+    def test_devuelve_403_con_token_incorrecto(self, client):
+        with patch("app.core.admin.ADMIN_TOKEN", ADMIN):
+            resp = client.get("/admin/profiles", headers={"X-Admin-Token": "otro"})
+        assert resp.status_code == 403
+
+    def test_lista_y_descarga_perfiles(self, client, tmp_path):
+        (tmp_path / "20260101-000000-generate-abc123def456.folded").write_text("main;f 3\n")
+        with patch("app.core.admin.ADMIN_TOKEN", ADMIN), \
+                patch("app.routes.admin.PROFILE_DIR", str(tmp_path)):
+            listing = client.get("/admin/profiles", headers={"X-Admin-Token": ADMIN}).json()
+            download = client.get("/admin/profiles/abc123def456", headers={"X-Admin-Token": ADMIN})
+
+        assert listing["profiles"][0]["profile_id"] == "abc123def456"
+        assert download.status_code == 200
+        assert download.text == "main;f 3\n"
@@ -154,3 +154,38 @@ class TestGenerateStreamEndpoint:
         )
 
         assert resp.status_code == 400
+
+    def test_modo_estructurado_añade_eventos_de_bloques(self, client):
+        def fake_stream(*args, **kwargs):
+            yield "Hola\n``"
+            yield "`java\nclass A {}\n"
+            yield "```\n"
+
+        with patch(
+            "app.routes.generate.generate_with_image_stream",
+            side_effect=fake_stream,
+        ):
+            resp = client.post(
+                "/generate/stream",
+                data={"model": "llama3:8b", "prompt": "genera algo", "structured": "true"},
+            )
+
+        content = resp.text
+        assert 'data: "Hola\\n``"' in content
+        assert 'event: text\ndata: {"text": "Hola\\n"}' in content
+        assert 'event: code_block_start\ndata: {"index": 0, "language": "java"}' in content
+        assert 'event: code_delta\ndata: {"index": 0, "text": "class A {}\\n"}' in content
+        assert 'event: code_block_end\ndata: {"index": 0}' in content
+        assert content.index("code_block_end") < content.index("[DONE]")
+
+    def test_sin_modo_estructurado_no_hay_eventos(self, client):
+        with patch(
+            "app.routes.generate.generate_with_image_stream",
+            return_value=iter(["```\ncode\n```"]),
+        ):
+            resp = client.post(
+                "/generate/stream",
+                data={"model": "llama3:8b", "prompt": "genera algo"},
+            )
+
+        assert "code_block_start" not in resp.text
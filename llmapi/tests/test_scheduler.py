@@ -0,0 +1,108 @@
+"""Tests para el planificador de ranuras por modelo (scheduler.py)."""
+import threading
+import time
+
+from app.core.generations import GenerationCancelled
+from app.core.telemetry import RequestTelemetry
+from app.services.scheduler import SCHEDULER_WAIT_SECONDS, ModelScheduler
+
+
+def _hold(scheduler: ModelScheduler, model: str, seconds: float, order: list, name: str) -> None:
+    with scheduler.slot(model):
+        order.append(name)
+        time.sleep(seconds)
+
+
+class TestModelScheduler:
+    def test_limita_las_ranuras_por_modelo(self):
+        scheduler = ModelScheduler(default_slots=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with scheduler.slot("m"):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert max(peak) == 2
+
+    def test_orden_fifo(self):
+        scheduler = ModelScheduler(default_slots=1)
+        order = []
+        first = threading.Thread(target=_hold, args=(scheduler, "m", 0.1, order, "first"))
+        first.start()
+        time.sleep(0.02)
+        waiters = []
+        for name in ("a", "b", "c"):
+            t = threading.Thread(target=_hold, args=(scheduler, "m", 0, order, name))
+            t.start()
+            waiters.append(t)
+            time.sleep(0.02)
+        assert scheduler.depth("m") == 3
+        first.join()
+        for t in waiters:
+            t.join()
+        assert order == ["first", "a", "b", "c"]
+        assert scheduler.depth("m") == 0
+
+    def test_modelos_independientes_y_ajuste_por_modelo(self):
+        scheduler = ModelScheduler(default_slots=1, model_slots={"grande": 3})
+        with scheduler.slot("a"), scheduler.slot("b"):
+            snapshot = scheduler.snapshot()
+        assert snapshot["a"]["active"] == 1
+        assert snapshot["b"]["active"] == 1
+        with scheduler.slot("grande"):
+            assert scheduler.snapshot()["grande"]["slots"] == 3
+
+    def test_registra_la_espera(self):
+        scheduler = ModelScheduler(default_slots=1)
+        telemetry = RequestTelemetry("/test", "m")
+        count = SCHEDULER_WAIT_SECONDS.get_count(model="sched-test")
+        telemetry.begin_step("generate", "sched-test")
+        with scheduler.slot("sched-test", telemetry):
+            pass
+        telemetry.finish("ok")
+        assert SCHEDULER_WAIT_SECONDS.get_count(model="sched-test") == count + 1
+        assert "scheduler_wait_ms" in telemetry.breakdown()["steps"]["generate"]
+
+    def test_libera_la_ranura_si_hay_error(self):
+        scheduler = ModelScheduler(default_slots=1)
+        try:
+            with scheduler.slot("m"):
+                raise RuntimeError("fallo")
+        except RuntimeError:
+            pass
+        assert scheduler.snapshot()["m"]["active"] == 0
+
+    def test_generacion_cancelada_sale_de_la_cola(self):
+        scheduler = ModelScheduler(default_slots=1)
+        telemetry = RequestTelemetry("/test", "m")
+        errors = []
+
+        def waiter():
+            try:
+                with scheduler.slot("m", telemetry):
+                    pass
+            except GenerationCancelled as e:
+                errors.append(e)
+
+        with scheduler.slot("m"):
+            t = threading.Thread(target=waiter)
+            t.start()
+            time.sleep(0.05)
+            assert scheduler.depth("m") == 1
+            telemetry.generation.cancel()
+            t.join(2)
+            assert errors and scheduler.depth("m") == 0
+        telemetry.finish("cancelled")
+        assert scheduler.snapshot()["m"]["active"] == 0
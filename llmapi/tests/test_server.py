@@ -0,0 +1,76 @@
+"""Tests para el arranque de producción (server.py) y el reciclado por RSS."""
+import signal
+from unittest.mock import patch
+
+from app.core.recycling import RssWatchdog
+from app.server import build_config_kwargs, main, resolve_workers
+
+
+class TestResolveWorkers:
+    def test_valor_configurado_tiene_prioridad(self):
+        assert resolve_workers(configured=3, maximum=2, cpus=16) == 3
+
+    def test_automatico_usa_las_cpus(self):
+        assert resolve_workers(configured=0, maximum=8, cpus=4) == 4
+
+    def test_automatico_respeta_el_maximo(self):
+        assert resolve_workers(configured=0, maximum=8, cpus=64) == 8
+
+    def test_minimo_un_worker(self):
+        assert resolve_workers(configured=0, maximum=0, cpus=0) == 1
+
+
+class TestBuildConfig:
+    def test_ajustes_de_produccion(self):
+        kwargs = build_config_kwargs(host="127.0.0.1", port=9000, workers=2)
+        assert kwargs["app"] == "app.main:app"
+        assert kwargs["workers"] == 2
+        assert kwargs["loop"] in ("uvloop", "asyncio")
+        assert kwargs["http"] in ("httptools", "h11")
+        assert kwargs["timeout_graceful_shutdown"] > 0
+        assert "reload" not in kwargs
+
+    def test_reciclado_por_peticiones(self):
+        with patch("app.server.WORKER_MAX_REQUESTS", 500), \
+                patch("app.server.WORKER_MAX_REQUESTS_JITTER", 50):
+            kwargs = build_config_kwargs(workers=1)
+        assert kwargs["limit_max_requests"] == 500
+        assert kwargs["limit_max_requests_jitter"] == 50
+
+    def test_sin_reciclado_por_defecto(self):
+        with patch("app.server.WORKER_MAX_REQUESTS", 0):
+            assert "limit_max_requests" not in build_config_kwargs(workers=1)
+
+
+class TestMeasureStartup:
+    def test_supera_el_presupuesto(self, capsys):
+        result = {"import_ms": 300.0, "app_ms": 100.0, "runs": 1, "total_ms": 400.0}
+        with patch("app.server.measure_startup", return_value=result):
+            assert main(["--measure-startup", "--budget-ms", "350"]) == 1
+            assert main(["--measure-startup", "--budget-ms", "500"]) == 0
+        assert '"total_ms": 400.0' in capsys.readouterr().out
+
+
+# ─── RssWatchdog ──────────────────────────────────────────────────────────────
+
+class TestRssWatchdog:
+    def test_por_debajo_del_limite_no_recicla(self):
+        watchdog = RssWatchdog(max_rss_mb=100, interval=1)
+        with patch("app.core.recycling.rss_bytes", return_value=50 * 1024 * 1024), \
+                patch("app.core.recycling.os.kill") as mock_kill:
+            assert watchdog.check() is False
+        mock_kill.assert_not_called()
+
+    def test_por_encima_envia_sigterm_una_vez(self):
+        watchdog = RssWatchdog(max_rss_mb=100, interval=1)
+        with patch("app.core.recycling.rss_bytes", return_value=200 * 1024 * 1024), \
+                patch("app.core.recycling.os.kill") as mock_kill:
+            assert watchdog.check() is True
+            assert watchdog.check() is False
+        mock_kill.assert_called_once()
+        assert mock_kill.call_args.args[1] == signal.SIGTERM
+
+    def test_sin_limite_no_arranca(self):
+        watchdog = RssWatchdog(max_rss_mb=0, interval=1)
+        watchdog.start()
+        assert watchdog._task is None
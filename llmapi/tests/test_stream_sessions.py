@@ -0,0 +1,207 @@
+"""Tests para los streams SSE reanudables (stream_sessions.py)."""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.stream_sessions import (
+    KEEPALIVE_FRAME,
+    ReplayBuffer,
+    ResumeUnavailable,
+    StreamSession,
+    TooManySessions,
+    create_session,
+    drain_sessions,
+    parse_last_event_id,
+    resume,
+)
+
+
+def _frames(n):
+    return [f"data: {i}\n\n" for i in range(1, n + 1)]
+
+
+def _ids(frames):
+    return [frame.split("\n", 1)[0].rpartition(":")[2] for frame in frames if frame != KEEPALIVE_FRAME]
+
+
+# ─── ReplayBuffer ─────────────────────────────────────────────────────────────
+
+class TestReplayBuffer:
+    def test_numera_y_devuelve_frames_posteriores(self):
+        buffer = ReplayBuffer()
+        for frame in _frames(3):
+            buffer.append(frame)
+        assert buffer.frames_after(1) == [(2, "data: 2\n\n"), (3, "data: 3\n\n")]
+        assert buffer.frames_after(3) == []
+
+    def test_desborda_a_disco_y_relee(self, tmp_path):
+        buffer = ReplayBuffer(memory_bytes=20, disk_bytes=10_000, directory=str(tmp_path))
+        for frame in _frames(10):
+            buffer.append(frame)
+        assert buffer._spilled
+        assert [seq for seq, _ in buffer.frames_after(0)] == list(range(1, 11))
+        assert buffer.frames_after(4)[0] == (5, "data: 5\n\n")
+        buffer.close()
+
+    def test_disco_lleno_descarta_lo_antiguo(self, tmp_path):
+        buffer = ReplayBuffer(memory_bytes=20, disk_bytes=30, directory=str(tmp_path))
+        for frame in _frames(20):
+            buffer.append(frame)
+        assert buffer.first_seq > 1
+        with pytest.raises(ResumeUnavailable):
+            buffer.frames_after(0)
+        assert buffer.frames_after(19) == [(20, "data: 20\n\n")]
+
+
+# ─── StreamSession ────────────────────────────────────────────────────────────
+
+class TestStreamSession:
+    def test_frames_llevan_id_de_sesion(self):
+        session = StreamSession(iter(_frames(2)), grace=1)
+        session.start()
+        frames = list(session.frames())
+        assert frames[0] == f"id: {session.id}:1\ndata: 1\n\n"
+        assert _ids(frames) == ["1", "2"]
+
+    def test_reanuda_donde_lo_dejo_mientras_sigue_generando(self):
+        release = threading.Event()
+
+        def source():
+            yield from _frames(2)
+            release.wait(5)
+            yield from ["data: 3\n\n", "data: [DONE]\n\n"]
+
+        session = create_session(source(), grace=5)
+        consumer = session.frames()
+        received = [next(consumer), next(consumer)]
+        consumer.close()  # conexión cortada
+        release.set()
+
+        last_id = received[-1].split("\n", 1)[0][len("id: "):]
+        resumed = list(resume(last_id))
+        assert _ids(resumed) == ["3", "4"]
+        assert resumed[-1].endswith("data: [DONE]\n\n")
+
+    def test_sin_clientes_se_detiene_tras_el_plazo(self):
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    time.sleep(0.01)
+                    yield "data: x\n\n"
+            finally:
+                closed.set()
+
+        session = StreamSession(endless(), grace=0.05)
+        session.start()
+        consumer = session.frames()
+        next(consumer)
+        consumer.close()
+        assert closed.wait(2)
+        assert session.stopped is True
+
+    def test_plazo_se_cumple_aunque_no_lleguen_frames(self):
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        def waiting():
+            # Como una petición en la cola del planificador: no produce nada
+            started.set()
+            cancelled.wait(5)
+            yield "data: [ERROR] cancelada\n\n"
+
+        session = create_session(waiting(), grace=0.05, on_abandon=cancelled.set)
+        assert started.wait(2)
+        assert cancelled.wait(2)
+        assert session.join(2)
+        assert session.stopped is True
+
+    def test_sesion_abandonada_no_se_reanuda(self):
+        def endless():
+            while True:
+                time.sleep(0.01)
+                yield "data: x\n\n"
+
+        session = create_session(endless(), grace=0.05)
+        consumer = session.frames()
+        next(consumer)
+        consumer.close()
+        assert session.join(2) and session.stopped
+        with pytest.raises(KeyError):
+            resume(f"{session.id}:1")
+
+    def test_limite_de_sesiones(self):
+        with patch("app.core.stream_sessions._sessions", {}):
+            release = threading.Event()
+
+            def blocked():
+                release.wait(5)
+                yield "data: [DONE]\n\n"
+
+            first = create_session(blocked(), max_sessions=1)
+            with pytest.raises(TooManySessions):
+                create_session(iter(_frames(1)), max_sessions=1)
+            release.set()
+            assert first.join(2)
+            # Una sesión terminada y sin clientes cede su sitio
+            create_session(iter(_frames(1)), max_sessions=1)
+            assert drain_sessions(2) == 0
+
+
+# ─── Last-Event-ID ────────────────────────────────────────────────────────────
+
+class TestLastEventId:
+    def test_parse(self):
+        assert parse_last_event_id("abc123:42") == ("abc123", 42)
+
+    @pytest.mark.parametrize("value", ["", "abc", "abc:", ":3", "abc:x"])
+    def test_parse_invalido(self, value):
+        with pytest.raises(ValueError):
+            parse_last_event_id(value)
+
+    def test_sesion_desconocida(self):
+        with pytest.raises(KeyError):
+            resume("noexiste:1")
+
+
+# ─── Rutas ────────────────────────────────────────────────────────────────────
+
+class TestResumableRoutes:
+    def test_stream_incluye_ids_y_cabecera_de_sesion(self, client):
+        with patch("app.routes.generate.generate_with_image_stream", return_value=iter(["a", "b"])):
+            resp = client.post("/generate/stream", data={"model": "m", "prompt": "p"})
+
+        session_id = resp.headers["x-stream-session"]
+        assert f"id: {session_id}:1\n" in resp.text
+        assert "[DONE]" in resp.text
+
+    def test_reanudar_con_last_event_id(self, client):
+        with patch("app.routes.generate.generate_with_image_stream", return_value=iter(["a", "b", "c"])):
+            resp = client.post("/generate/stream", data={"model": "m", "prompt": "p"})
+        session_id = resp.headers["x-stream-session"]
+
+        resumed = client.get("/generate/stream/resume", headers={"Last-Event-ID": f"{session_id}:2"})
+        assert resumed.status_code == 200
+        assert '"a"' not in resumed.text and '"b"' not in resumed.text
+        assert '"c"' in resumed.text
+        assert resumed.text.endswith("data: [DONE]\n\n")
+
+    def test_post_con_last_event_id_no_genera_de_nuevo(self, client):
+        with patch("app.routes.generate.generate_with_image_stream", return_value=iter(["a"])) as mock_stream:
+            resp = client.post("/generate/stream", data={"model": "m", "prompt": "p"})
+            session_id = resp.headers["x-stream-session"]
+            again = client.post(
+                "/generate/stream",
+                data={"model": "m", "prompt": "p"},
+                headers={"Last-Event-ID": f"{session_id}:1"},
+            )
+        assert again.status_code == 200
+        assert mock_stream.call_count == 1
+
+    def test_errores_de_reanudacion(self, client):
+        assert client.get("/generate/stream/resume").status_code == 400
+        assert client.get("/generate/stream/resume", headers={"Last-Event-ID": "basura"}).status_code == 400
+        assert client.get("/generate/stream/resume?from_id=noexiste:3").status_code == 404
@@ -0,0 +1,112 @@
+"""Tests para el desglose de tiempos por petición (telemetry.py)."""
+import json
+from unittest.mock import patch, MagicMock
+
+from app.core.telemetry import RequestTelemetry
+from app.services.ollama_service import generate_with_image_stream_auto
+
+
+OLLAMA_FINAL_STATS = {
+    "done": True,
+    "load_duration": 2_000_000,
+    "prompt_eval_duration": 30_000_000,
+    "eval_duration": 500_000_000,
+    "prompt_eval_count": 12,
+    "eval_count": 50,
+}
+
+
+def _ndjson_response(contents, final=OLLAMA_FINAL_STATS):
+    lines = [json.dumps({"message": {"content": c}}).encode() for c in contents]
+    lines.append(json.dumps(final).encode())
+    resp = MagicMock()
+    resp.iter_lines.return_value = lines
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
+# ─── RequestTelemetry ─────────────────────────────────────────────────────────
+
+class TestRequestTelemetry:
+    def test_desglose_incluye_duraciones_de_ollama(self):
+        t = RequestTelemetry("/generate", "llama3:8b")
+        t.begin_step("generate", "llama3:8b")
+        t.dispatched("llama3:8b")
+        t.ollama_stats(OLLAMA_FINAL_STATS)
+        t.finish("ok")
+
+        step = t.breakdown()["steps"]["generate"]
+        assert step["load_ms"] == 2.0
+        assert step["prompt_eval_ms"] == 30.0
+        assert step["eval_ms"] == 500.0
+        assert step["eval_count"] == 50
+
+    def test_server_timing_sin_prefijo_con_un_paso(self):
+        t = RequestTelemetry("/generate", "llama3:8b")
+        t.add_span("upload", 0.01)
+        t.begin_step("generate", "llama3:8b")
+        t.ollama_stats(OLLAMA_FINAL_STATS)
+
+        header = t.server_timing()
+        assert "upload;dur=10.0" in header
+        assert "eval;dur=500.0" in header
+        assert "total;dur=" in header
+
+    def test_server_timing_con_prefijo_por_paso(self):
+        t = RequestTelemetry("/generate/stream", "auto")
+        t.begin_step("step1", "llava:7b")
+        t.ollama_stats(OLLAMA_FINAL_STATS)
+        t.begin_step("step2", "qwen2.5-coder:14b")
+        t.ollama_stats(OLLAMA_FINAL_STATS)
+
+        header = t.server_timing()
+        assert "step1-load;dur=2.0" in header
+        assert "step2-eval;dur=500.0" in header
+
+
+class TestAutoModeBreakdown:
+    def test_auto_separa_paso_1_y_paso_2(self):
+        responses = [
+            _ndjson_response(["```\n@startuml\nclass A\n@enduml\n```"]),
+            _ndjson_response(["class A:", " pass"]),
+        ]
+        t = RequestTelemetry("/generate/stream", "auto")
+        with patch("app.services.ollama_service.ollama_session.post", side_effect=responses):
+            list(generate_with_image_stream_auto(
+                prompt="genera",
+                image_bytes_list=[b"img"],
+                vision_model_override="llava:7b",
+                coding_model_override="qwen2.5-coder:14b",
+                telemetry=t,
+            ))
+
+        steps = t.breakdown()["steps"]
+        assert steps["step1"]["model"] == "llava:7b"
+        assert steps["step2"]["model"] == "qwen2.5-coder:14b"
+        assert "encode_ms" in steps["step1"]
+        assert "upstream_ms" in steps["step2"]
+
+
+# ─── Respuestas HTTP ──────────────────────────────────────────────────────────
+
+class TestTimingInResponses:
+    def test_generate_devuelve_cabecera_server_timing(self, client):
+        with patch(
+            "app.routes.generate.generate_with_image",
+            return_value={"message": {"content": "ok"}},
+        ):
+            resp = client.post("/generate/", data={"model": "llama3:8b", "prompt": "x"})
+
+        assert resp.status_code == 200
+        assert "total;dur=" in resp.headers["server-timing"]
+
+    def test_stream_envia_evento_stats_antes_de_done(self, client):
+        def fake_stream(*args, **kwargs):
+            yield "hola"
+
+        with patch("app.routes.generate.generate_with_image_stream", side_effect=fake_stream):
+            resp = client.post("/generate/stream", data={"model": "llama3:8b", "prompt": "x"})
+
+        text = resp.text
+        assert "event: stats" in text
+        assert text.index("event: stats") < text.index("[DONE]")
@@ -0,0 +1,181 @@
+"""Tests para las trazas W3C (app/core/tracing.py) generadas desde RequestTelemetry."""
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.core.request_context import traceparent_var
+from app.core.telemetry import RequestTelemetry
+from app.core.tracing import Trace, TraceExporter, export_request, parse_traceparent
+
+INCOMING = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+
+
+@pytest.fixture
+def exported():
+    """Habilita el tracing y recoge las trazas enviadas al exportador."""
+    traces = []
+    with patch("app.core.tracing.TRACING_ENABLED", True), \
+            patch("app.core.telemetry.trace_exporter.submit", side_effect=traces.append):
+        yield traces
+
+
+def _stream(*chunks, **stats):
+    resp = MagicMock()
+    lines = [json.dumps({"message": {"content": c}, "done": False}).encode() for c in chunks]
+    lines.append(json.dumps({"message": {"content": ""}, "done": True, **stats}).encode())
+    resp.iter_lines.return_value = iter(lines)
+    return resp
+
+
+def _by_name(trace):
+    return {span.name: span for span in trace.spans}
+
+
+# ─── traceparent ──────────────────────────────────────────────────────────────
+
+class TestTraceparent:
+    def test_valida_cabecera(self):
+        parsed = parse_traceparent(INCOMING)
+        assert parsed == {"trace_id": TRACE_ID, "parent_id": "b7ad6b7169203331", "sampled": True}
+
+    @pytest.mark.parametrize("value", [
+        "", "basura", "ff-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01",
+        "00-00000000000000000000000000000000-b7ad6b7169203331-01",
+        "00-0af7651916cd43dd8448eb211c80319c-0000000000000000-01",
+    ])
+    def test_rechaza_cabeceras_no_validas(self, value):
+        assert parse_traceparent(value) is None
+
+    def test_continua_la_traza_entrante(self):
+        trace = Trace("/generate/stream", time.perf_counter(), INCOMING)
+        assert trace.trace_id == TRACE_ID
+        assert trace.root.parent_id == "b7ad6b7169203331"
+        assert trace.traceparent().startswith(f"00-{TRACE_ID}-{trace.root.span_id}")
+
+    def test_respeta_flag_de_no_muestreo(self):
+        trace = Trace("/generate", time.perf_counter(), INCOMING[:-2] + "00")
+        assert not trace.sampled
+        assert trace.traceparent().endswith("-00")
+
+
+# ─── Spans desde RequestTelemetry ─────────────────────────────────────────────
+
+class TestTelemetryTrace:
+    def test_spans_de_una_peticion_en_streaming(self, exported):
+        telemetry = RequestTelemetry("/generate/stream", "llama3:8b")
+        telemetry.stream_started()
+        with telemetry.span("upload"):
+            pass
+        telemetry.begin_step("generate", "llama3:8b")
+        telemetry.add_span("scheduler_wait", 0.01)
+        telemetry.dispatched("llama3:8b")
+        headers = telemetry.trace_headers()
+        telemetry.upstream_first_byte()
+        telemetry.ollama_stats({"load_duration": 2_000_000, "eval_count": 7, "eval_duration": 5_000_000})
+        telemetry.first_token()
+        telemetry.finish("ok")
+
+        [trace] = exported
+        spans = _by_name(trace)
+        assert {"upload", "generate", "scheduler_wait", "ollama.chat", "first_token", "stream"} <= set(spans)
+        assert spans["ollama.chat"].parent_id == spans["generate"].span_id
+        assert spans["scheduler_wait"].parent_id == spans["generate"].span_id
+        assert spans["upstream_wait"].parent_id == spans["ollama.chat"].span_id
+        assert spans["upload"].parent_id == trace.root.span_id
+        assert spans["ollama.chat"].attributes["ollama.eval_count"] == 7
+        assert spans["ollama.chat"].attributes["ollama.load_ms"] == 2.0
+        assert headers["traceparent"] == trace.traceparent(spans["ollama.chat"])
+        assert all(span.end is not None and span.end >= span.start for span in trace.spans)
+        assert telemetry.breakdown()["trace_id"] == trace.trace_id
+
+    def test_pasos_del_modo_auto_por_separado(self, exported):
+        telemetry = RequestTelemetry("/generate/stream", "auto")
+        for step, model in (("step1", "llava:7b"), ("step2", "qwen2.5-coder:7b")):
+            telemetry.begin_step(step, model)
+            telemetry.dispatched(model)
+            telemetry.ollama_stats({"eval_count": 3})
+        telemetry.finish("ok")
+
+        spans = exported[0].spans
+        calls = [s for s in spans if s.name == "ollama.chat"]
+        steps = {s.name: s for s in spans if s.name.startswith("step")}
+        assert [c.attributes["model"] for c in calls] == ["llava:7b", "qwen2.5-coder:7b"]
+        assert calls[0].parent_id == steps["step1"].span_id
+        assert calls[1].parent_id == steps["step2"].span_id
+        assert steps["step1"].end <= steps["step2"].start
+
+    def test_error_marca_la_raiz(self, exported):
+        telemetry = RequestTelemetry("/generate")
+        telemetry.finish("error")
+        assert exported[0].to_otlp()[0]["status"] == {"code": 2}
+
+    def test_sin_tracing_reenvia_el_traceparent_entrante(self):
+        token = traceparent_var.set(INCOMING)
+        try:
+            telemetry = RequestTelemetry("/generate")
+        finally:
+            traceparent_var.reset(token)
+        assert telemetry.trace is None
+        assert telemetry.trace_headers() == {"traceparent": INCOMING}
+        assert RequestTelemetry("/generate").trace_headers() == {}
+
+
+# ─── Exportación ──────────────────────────────────────────────────────────────
+
+class TestTraceExporter:
+    def test_fichero_otlp_json(self, tmp_path):
+        exporter = TraceExporter(exporter="file", path=str(tmp_path / "traces.jsonl"))
+        trace = Trace("/generate", time.perf_counter(), INCOMING)
+        trace.add_span("upload", trace.root.start, trace.root.start + 0.01, size=10)
+        trace.close(trace.root.start + 0.02)
+        exporter.submit(trace)
+        exporter.flush()
+
+        body = json.loads((tmp_path / "traces.jsonl").read_text())
+        spans = body["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert {s["traceId"] for s in spans} == {TRACE_ID}
+        upload = next(s for s in spans if s["name"] == "upload")
+        assert int(upload["endTimeUnixNano"]) - int(upload["startTimeUnixNano"]) == pytest.approx(1e7, rel=0.01)
+        assert upload["attributes"] == [{"key": "size", "value": {"intValue": "10"}}]
+
+    def test_no_exporta_trazas_no_muestreadas(self, tmp_path):
+        exporter = TraceExporter(exporter="file", path=str(tmp_path / "traces.jsonl"))
+        exporter.submit(Trace("/generate", time.perf_counter(), INCOMING[:-2] + "00"))
+        exporter.flush()
+        assert not (tmp_path / "traces.jsonl").exists()
+
+    def test_otlp_envia_al_endpoint(self):
+        exporter = TraceExporter(exporter="otlp", endpoint="http://collector:4318/v1/traces")
+        trace = Trace("/generate", time.perf_counter())
+        trace.close(time.perf_counter())
+        with patch("app.core.tracing.requests.Session") as session:
+            exporter.export([trace])
+        url = session.return_value.post.call_args.args[0]
+        body = session.return_value.post.call_args.kwargs["json"]
+        assert url == "http://collector:4318/v1/traces"
+        assert body == export_request([trace])
+
+
+# ─── Propagación a Ollama ─────────────────────────────────────────────────────
+
+class TestPropagation:
+    def test_stream_propaga_traceparent_a_ollama(self, client, exported):
+        with patch("app.services.ollama_service.ollama_session.post",
+                   return_value=_stream("hola", eval_count=1)) as mock_post:
+            resp = client.post(
+                "/generate/stream",
+                data={"model": "llama3:8b", "prompt": "hola"},
+                headers={"traceparent": INCOMING},
+            )
+            assert "[DONE]" in resp.text
+
+        sent = parse_traceparent(mock_post.call_args.kwargs["headers"]["traceparent"])
+        assert sent["trace_id"] == TRACE_ID
+        [trace] = exported
+        spans = _by_name(trace)
+        assert sent["parent_id"] == spans["ollama.chat"].span_id
+        assert "request_parse" in spans
+        assert trace.root.parent_id == "b7ad6b7169203331"
@@ -0,0 +1,134 @@
+"""Tests para la captura anonimizada de tráfico (app/core/traffic_capture.py)."""
+import base64
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.core.telemetry import RequestTelemetry
+from app.core.traffic_capture import TrafficRecorder, digest, request_shape, shared_salt
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    return TrafficRecorder(path=str(tmp_path / "capture" / "traffic.jsonl"), enabled=True)
+
+
+def _lines(recorder):
+    recorder.flush()
+    with open(recorder.path) as f:
+        return [json.loads(line) for line in f]
+
+
+# ─── Forma de la petición ─────────────────────────────────────────────────────
+
+class TestRequestShape:
+    def test_no_guarda_texto_ni_imagenes(self):
+        image = b"\x89PNG secreto"
+        history = [
+            {"role": "user", "content": "mi contraseña", "images": [base64.b64encode(image).decode()]},
+            {"role": "assistant", "content": "respuesta"},
+        ]
+        shape = request_shape("/generate/stream", "llava:7b", "prompt privado",
+                              images=[image], history=history, auto_mode=True)
+        dumped = json.dumps(shape)
+
+        assert "privado" not in dumped and "contraseña" not in dumped and "respuesta" not in dumped
+        assert shape["prompt"]["chars"] == len("prompt privado")
+        assert shape["images"][0]["bytes"] == len(image)
+        assert shape["history"][0]["images"][0]["bytes"] == len(image)
+        assert [m["role"] for m in shape["history"]] == ["user", "assistant"]
+        assert shape["auto_mode"] is True
+
+    def test_mismo_contenido_mismo_hash(self):
+        assert digest("hola") == digest(b"hola")
+        assert digest("hola") != digest("adios")
+        assert len(digest("hola")) == 16
+
+    def test_sal_compartida_por_los_workers(self, tmp_path):
+        path = str(tmp_path / "capture" / "traffic.jsonl.salt")
+        salts = []
+        threads = [threading.Thread(target=lambda: salts.append(shared_salt(path))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(salts)) == 1 and len(salts[0]) == 32
+        assert shared_salt(path) == salts[0]
+
+
+# ─── Escritura en segundo plano ───────────────────────────────────────────────
+
+class TestTrafficRecorder:
+    def test_escribe_forma_con_tiempos(self, recorder):
+        telemetry = RequestTelemetry("/generate")
+        telemetry.first_token()
+        telemetry.finish("ok")
+        recorder.record(request_shape("/generate/", "llama3:8b", "hola"), telemetry)
+
+        [line] = _lines(recorder)
+        assert line["status"] == "ok"
+        assert line["ttft_ms"] <= line["total_ms"]
+        assert line["route"] == "/generate/"
+        assert line["t"] > 0
+
+    def test_descarta_si_la_cola_esta_llena(self, tmp_path):
+        recorder = TrafficRecorder(path=str(tmp_path / "t.jsonl"), enabled=True, max_queue=1)
+        telemetry = RequestTelemetry("/generate")
+        telemetry.finish("ok")
+        with patch.object(recorder, "_ensure_thread"):
+            recorder.record({"route": "/generate/"}, telemetry)
+            recorder.record({"route": "/generate/"}, telemetry)
+        assert recorder._queue.qsize() == 1
+
+    def test_varios_escritores_no_mezclan_lineas(self, tmp_path):
+        path = str(tmp_path / "t.jsonl")
+        recorders = [TrafficRecorder(path=path, enabled=True) for _ in range(4)]
+        telemetry = RequestTelemetry("/generate")
+        telemetry.finish("ok")
+        for i in range(200):
+            for n, recorder in enumerate(recorders):
+                recorder.record({"route": "/generate/", "pad": "x" * 3000, "n": n, "i": i}, telemetry)
+        for recorder in recorders:
+            recorder.flush()
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 800
+
+    def test_deshabilitada_no_muestrea(self):
+        assert not TrafficRecorder(enabled=False).sampled()
+        assert not TrafficRecorder(enabled=True, sample_rate=0).sampled()
+
+
+# ─── Integración con /generate ────────────────────────────────────────────────
+
+class TestCaptureRoutes:
+    def test_captura_generate_stream(self, client, recorder):
+        def fake_stream(*args, **kwargs):
+            yield "chunk"
+
+        with patch("app.routes.generate.traffic_recorder", recorder), \
+                patch("app.core.telemetry.traffic_recorder", recorder), \
+                patch("app.routes.generate.generate_with_image_stream", side_effect=fake_stream):
+            resp = client.post(
+                "/generate/stream",
+                data={"model": "llama3:8b", "prompt": "texto privado",
+                      "messages": json.dumps([{"role": "user", "content": "antes"}])},
+            )
+            assert "[DONE]" in resp.text
+
+        [line] = _lines(recorder)
+        assert line["route"] == "/generate/stream"
+        assert line["status"] == "ok"
+        assert line["prompt"]["chars"] == len("texto privado")
+        assert line["history"][0]["chars"] == len("antes")
+        assert "privado" not in json.dumps(line)
+
+    def test_sin_captura_no_escribe(self, client, tmp_path):
+        recorder = TrafficRecorder(path=str(tmp_path / "t.jsonl"), enabled=False)
+        with patch("app.routes.generate.traffic_recorder", recorder), \
+                patch("app.routes.generate.generate_with_image",
+                      return_value={"message": {"content": "ok"}}):
+            client.post("/generate/", data={"model": "llama3:8b", "prompt": "hola"})
+        assert not (tmp_path / "t.jsonl").exists()
@@ -0,0 +1,82 @@
+"""Tests para el precalentamiento al arrancar y el endpoint /ready."""
+import asyncio
+import time
+from unittest.mock import patch
+
+from app.services.warmup import WarmupState, run_warmup, warmup_state
+
+WARMUP = "app.services.warmup"
+
+
+def _run(state: WarmupState, **kwargs) -> None:
+    asyncio.run(run_warmup(state=state, **kwargs))
+
+
+class TestRunWarmup:
+    def test_deshabilitado_queda_listo_sin_llamar_a_ollama(self):
+        state = WarmupState()
+        with patch(f"{WARMUP}.list_models") as mock_list:
+            _run(state, enabled=False)
+
+        assert state.ready is True
+        assert state.status == "disabled"
+        mock_list.assert_not_called()
+
+    def test_recorre_catalogo_precarga_y_genera(self):
+        state = WarmupState()
+        with patch(f"{WARMUP}.list_models", return_value={"models": [{"name": "a"}, {"name": "b"}]}), \
+                patch(f"{WARMUP}.select_best_models",
+                      return_value={"vision_model": "llava:7b", "coding_model": "qwen:7b"}), \
+                patch(f"{WARMUP}.preload_model",
+                      side_effect=lambda m, k: {"success": True, "model": m, "load_ms": 1.0}) as mock_preload, \
+                patch(f"{WARMUP}.warmup_generation",
+                      side_effect=lambda m, k: {"success": True, "model": m}) as mock_gen:
+            _run(state, enabled=True, models=["auto", "llava:7b"], generate=True, keep_alive="5m", deadline=5)
+
+        assert state.ready is True
+        assert state.deadline_exceeded is False
+        assert [c.args for c in mock_preload.call_args_list] == [("llava:7b", "5m"), ("qwen:7b", "5m")]
+        assert mock_gen.call_count == 2
+        steps = [s["step"] for s in state.steps]
+        assert steps == ["catalog", "select", "preload", "generate", "preload", "generate"]
+        assert state.steps[0]["models"] == 2
+
+    def test_sin_generacion_si_falla_la_precarga(self):
+        state = WarmupState()
+        with patch(f"{WARMUP}.list_models", return_value={"models": [], "error": "down"}), \
+                patch(f"{WARMUP}.preload_model", return_value={"success": False, "model": "m"}), \
+                patch(f"{WARMUP}.warmup_generation") as mock_gen:
+            _run(state, enabled=True, models=["m"], generate=True, deadline=5)
+
+        assert state.ready is True
+        assert state.steps[0]["success"] is False
+        mock_gen.assert_not_called()
+
+    def test_plazo_vencido_declara_listo(self):
+        state = WarmupState()
+        with patch(f"{WARMUP}.list_models", side_effect=lambda: time.sleep(0.5) or {"models": []}):
+            _run(state, enabled=True, models=[], deadline=0.05)
+
+        assert state.ready is True
+        assert state.deadline_exceeded is True
+
+
+# ─── GET /ready ───────────────────────────────────────────────────────────────
+
+class TestReadyEndpoint:
+    def test_503_mientras_se_calienta(self, client):
+        with patch.object(warmup_state, "status", "warming"):
+            response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["ready"] is False
+
+    def test_200_cuando_esta_listo(self, client):
+        with patch.object(warmup_state, "status", "ready"):
+            response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    def test_liveness_no_depende_del_precalentamiento(self, client):
+        with patch.object(warmup_state, "status", "warming"):
+            response = client.get("/")
+        assert response.status_code == 200
@@ -6,7 +6,12 @@ export const config = {
   // FastAPI Backend
   fastapi: {
     url: process.env.FASTAPI_URL || 'http://localhost:8001',
+    // Socket Unix de FastAPI (python -m app.server --uds); la URL solo aporta las rutas
+    socketPath: process.env.FASTAPI_SOCKET || undefined,
     timeout: Number.parseInt(process.env.REQUEST_TIMEOUT) || 600000,
+    // Reconexiones a /generate/stream/resume si el stream se corta antes de [DONE]
+    streamResumeAttempts: Number.parseInt(process.env.STREAM_RESUME_ATTEMPTS) || 3,
+    streamResumeDelay: Number.parseInt(process.env.STREAM_RESUME_DELAY) || 500,
   },
 
   // Server
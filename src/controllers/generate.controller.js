@@ -1,6 +1,7 @@
 import { ollamaService } from '../services/ollama.service.js';
 import { logger } from '../utils/logger.js';
 import { config } from '../config/index.js';
+import { traceHeaders } from '../utils/trace.js';
 
 /**
  * Controlador para generación de código
@@ -55,7 +56,8 @@ export class GenerateController {
       const result = await ollamaService.generateCode(
         model,
         prompt,
-        images
+        images,
+        traceHeaders(req)
       );
 
       res.json(result);
@@ -75,6 +77,11 @@ export class GenerateController {
    * POST /api/generate/stream
    */
   async generateStream(req, res) {
+    // Como en FastAPI, un Last-Event-ID reanuda ese stream en lugar de empezar otra generación
+    if (req.headers?.['last-event-id']) {
+      return this.resumeStream(req, res);
+    }
+
     try {
       const { model, prompt, messages, autoMode } = req.body;
       const images = req.files || [];
@@ -101,6 +108,18 @@ export class GenerateController {
       const isAutoMode = autoMode === 'true';
       const { visionModel, codingModel } = req.body;
 
+      // Ids de imágenes subidas antes con POST /api/images
+      let imageIds = [];
+      if (req.body.imageIds) {
+        try {
+          imageIds = typeof req.body.imageIds === 'string' ? JSON.parse(req.body.imageIds) : req.body.imageIds;
+        } catch (e) {
+          return res.status(400).json({
+            error: 'El campo "imageIds" debe ser una lista JSON',
+          });
+        }
+      }
+
       // Validación de imágenes si se proporcionan
       if (images.length > 0) {
         // Verificar límite de imágenes
@@ -130,49 +149,90 @@ export class GenerateController {
         logger.info(`Starting streaming with ${images.length} images`);
       }
 
-      // Configurar headers para SSE
-      res.setHeader('Content-Type', 'text/event-stream');
-      res.setHeader('Cache-Control', 'no-cache');
-      res.setHeader('Connection', 'keep-alive');
-
       // Llamar al servicio con streaming
-      const stream = await ollamaService.generateCodeStream(
+      const { stream, headers } = await ollamaService.generateCodeStream(
         model,
         prompt,
         images,
         messageHistory,
         isAutoMode,
         visionModel,
-        codingModel
+        codingModel,
+        imageIds,
+        traceHeaders(req)
       );
 
-      // Pipe del stream de FastAPI al cliente
-      stream.pipe(res);
-
-      // Manejar errores en el stream
-      stream.on('error', (error) => {
-        const sanitizedMsg = String(error?.message || error).replaceAll(/[\r\n]+/g, ' ');
-        logger.error('Error in stream:', sanitizedMsg);
-        res.write(`data: [ERROR] ${error.message}\n\n`);
-        res.end();
+      this._pipeStream(req, res, stream, headers);
+    } catch (error) {
+      const sanitizedMsg = String(error?.message || error).replaceAll(/[\r\n]+/g, ' ');
+      logger.error('Error in generateStream controller:', sanitizedMsg);
+      res.status(error.status || 500).json({
+        error: error.message || 'Error al generar código en streaming',
+        type: error.type,
+        details: error.details,
       });
+    }
+  }
 
-      // Cleanup cuando el cliente cierra la conexión
-      req.on('close', () => {
-        logger.info('Client closed connection');
-        stream.destroy();
-      });
+  /**
+   * Reanuda un stream cortado a partir del id del último frame recibido
+   * GET /api/generate/stream/resume (cabecera Last-Event-ID o query from_id)
+   */
+  async resumeStream(req, res) {
+    try {
+      const lastEventId = req.headers?.['last-event-id'] || req.query?.from_id;
 
+      if (!lastEventId) {
+        return res.status(400).json({
+          error: 'Falta Last-Event-ID',
+        });
+      }
+
+      const { stream, headers } = await ollamaService.resumeStream(lastEventId, traceHeaders(req));
+      this._pipeStream(req, res, stream, headers);
     } catch (error) {
       const sanitizedMsg = String(error?.message || error).replaceAll(/[\r\n]+/g, ' ');
-      logger.error('Error in generateStream controller:', sanitizedMsg);
+      logger.error('Error in resumeStream controller:', sanitizedMsg);
       res.status(error.status || 500).json({
-        error: error.message || 'Error al generar código en streaming',
+        error: error.message || 'Error al reanudar el stream',
         type: error.type,
         details: error.details,
       });
     }
   }
+
+  /**
+   * Envía al cliente el stream SSE de FastAPI
+   * @private
+   */
+  _pipeStream(req, res, stream, headers = {}) {
+    // Configurar headers para SSE
+    res.setHeader('Content-Type', 'text/event-stream');
+    res.setHeader('Cache-Control', 'no-cache');
+    res.setHeader('Connection', 'keep-alive');
+
+    // Ids de las imágenes del turno (para el historial) y sesión del stream
+    for (const [name, value] of Object.entries(headers || {})) {
+      res.setHeader(name, value);
+    }
+
+    // Pipe del stream de FastAPI al cliente (cada frame conserva su id para reanudar)
+    stream.pipe(res);
+
+    // Manejar errores en el stream
+    stream.on('error', (error) => {
+      const sanitizedMsg = String(error?.message || error).replaceAll(/[\r\n]+/g, ' ');
+      logger.error('Error in stream:', sanitizedMsg);
+      res.write(`data: [ERROR] ${error.message}\n\n`);
+      res.end();
+    });
+
+    // Cleanup cuando el cliente cierra la conexión
+    req.on('close', () => {
+      logger.info('Client closed connection');
+      stream.destroy();
+    });
+  }
 }
 
 export const generateController = new GenerateController();
@@ -29,7 +29,10 @@ export const healthCheck = async (req, res) => {
 
     // Check FastAPI
     try {
-      await axios.get(`${config.fastapi.url}/health`, { timeout: 5000 });
+      await axios.get(`${config.fastapi.url}/health`, {
+        timeout: 5000,
+        ...(config.fastapi.socketPath && { socketPath: config.fastapi.socketPath }),
+      });
       health.services.fastapi = 'ok';
     } catch (error) {
       health.services.fastapi = 'error';
@@ -0,0 +1,60 @@
+import { ollamaService } from '../services/ollama.service.js';
+import { logger } from '../utils/logger.js';
+import { config } from '../config/index.js';
+import { traceHeaders } from '../utils/trace.js';
+
+/**
+ * Controlador para el almacén de imágenes de FastAPI
+ */
+export class ImagesController {
+  /**
+   * Sube imágenes al almacén y devuelve sus ids, que se pueden enviar en
+   * imageIds de /api/generate/stream o en las imágenes del historial
+   * POST /api/images
+   */
+  async upload(req, res) {
+    try {
+      const images = req.files || [];
+
+      if (images.length === 0) {
+        return res.status(400).json({
+          error: 'Se requiere al menos una imagen',
+        });
+      }
+
+      if (images.length > 5) {
+        return res.status(400).json({
+          error: 'Máximo 5 imágenes permitidas',
+        });
+      }
+
+      // Validar cada imagen
+      for (const image of images) {
+        if (!config.upload.allowedMimeTypes.includes(image.mimetype)) {
+          return res.status(400).json({
+            error: `Tipo de imagen no permitido: ${image.mimetype}. Tipos aceptados: ${config.upload.allowedMimeTypes.join(', ')}`,
+          });
+        }
+
+        if (image.size > config.upload.maxSize) {
+          return res.status(400).json({
+            error: `Imagen demasiado grande: ${image.originalname}. Tamaño máximo: ${config.upload.maxSize / 1024 / 1024}MB`,
+          });
+        }
+      }
+
+      const result = await ollamaService.uploadImages(images, traceHeaders(req));
+      res.status(201).json(result);
+    } catch (error) {
+      const sanitizedMsg = String(error?.message || error).replaceAll(/[\r\n]+/g, ' ');
+      logger.error('Error in images controller:', sanitizedMsg);
+      res.status(error.status || 500).json({
+        error: error.message || 'Error al guardar las imágenes',
+        type: error.type,
+        details: error.details,
+      });
+    }
+  }
+}
+
+export const imagesController = new ImagesController();
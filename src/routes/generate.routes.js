@@ -34,4 +34,11 @@ router.post('/', upload.array('images', 5), generateController.generate.bind(gen
  */
 router.post('/stream', upload.array('images', 5), generateController.generateStream.bind(generateController));
 
+/**
+ * @route   GET /api/generate/stream/resume
+ * @desc    Reanuda un stream cortado a partir de la cabecera Last-Event-ID (o la query from_id)
+ * @access  Public
+ */
+router.get('/stream/resume', generateController.resumeStream.bind(generateController));
+
 export default router;
@@ -0,0 +1,30 @@
+import express from 'express';
+import multer from 'multer';
+import { imagesController } from '../controllers/images.controller.js';
+import { config } from '../config/index.js';
+
+const router = express.Router();
+
+// Configuración de multer para manejar archivos en memoria
+const upload = multer({
+  storage: multer.memoryStorage(),
+  limits: {
+    fileSize: config.upload.maxSize,
+  },
+  fileFilter: (req, file, cb) => {
+    if (config.upload.allowedMimeTypes.includes(file.mimetype)) {
+      cb(null, true);
+    } else {
+      cb(new Error(`Tipo de archivo no permitido: ${file.mimetype}`));
+    }
+  },
+});
+
+/**
+ * @route   POST /api/images
+ * @desc    Guarda hasta 5 imágenes en el almacén de FastAPI y devuelve sus ids
+ * @access  Public
+ */
+router.post('/', upload.array('images', 5), imagesController.upload.bind(imagesController));
+
+export default router;
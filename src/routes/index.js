@@ -4,6 +4,7 @@ import authRoutes from './auth.routes.js';
 import usersRoutes from './users.routes.js';
 import modelsRoutes from './models.routes.js';
 import generateRoutes from './generate.routes.js';
+import imagesRoutes from './images.routes.js';
 import chatsRoutes from './chats.routes.js';
 import messagesRoutes from './messages.routes.js';
 import projectsRoutes from './projects.routes.js';
@@ -37,6 +38,11 @@ router.use('/models', modelsRoutes);
  */
 router.use('/generate', generateRoutes);
 
+/**
+ * Rutas del almacén de imágenes
+ */
+router.use('/images', imagesRoutes);
+
 /**
  * Rutas de chats
  */
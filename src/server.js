@@ -17,6 +17,8 @@ logger.setLevel(config.logging.level);
 app.use(cors({
   origin: config.cors.origins,
   credentials: true,
+  // Ids de las imágenes del turno y sesión del stream de /api/generate/stream
+  exposedHeaders: ['X-Image-Ids', 'X-Stream-Session'],
 }));
 
 app.use(express.json({ limit: '50mb' }));
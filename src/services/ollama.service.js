@@ -1,5 +1,6 @@
 import axios from 'axios';
 import FormData from 'form-data';
+import { PassThrough } from 'node:stream';
 import { config } from '../config/index.js';
 import { logger } from '../utils/logger.js';
 
@@ -10,6 +11,10 @@ class OllamaService {
   constructor() {
     this.baseURL = config.fastapi.url;
     this.timeout = config.fastapi.timeout;
+    this.resumeAttempts = config.fastapi.streamResumeAttempts;
+    this.resumeDelay = config.fastapi.streamResumeDelay;
+    // Opciones de transporte comunes a todas las peticiones (socket Unix si está configurado)
+    this.transport = config.fastapi.socketPath ? { socketPath: config.fastapi.socketPath } : {};
   }
 
   /**
@@ -21,6 +26,7 @@ class OllamaService {
       logger.info('Fetching models from FastAPI');
       const response = await axios.get(`${this.baseURL}/models/`, {
         timeout: 30000, // 30 segundos para listar modelos
+        ...this.transport,
       });
       logger.info(`Successfully fetched ${response.data.models?.length || 0} models`);
       return response.data;
@@ -35,9 +41,10 @@ class OllamaService {
    * @param {string} model - Nombre del modelo
    * @param {string} prompt - Prompt para la generación
    * @param {Array} images - Array de objetos de imagen con buffer y mimetype
+   * @param {Object} traceHeaders - Cabeceras de traza W3C a reenviar (opcional)
    * @returns {Promise<Object>} Respuesta con el código generado
    */
-  async generateCode(model, prompt, images = []) {
+  async generateCode(model, prompt, images = [], traceHeaders = {}) {
     try {
       const formData = new FormData();
       formData.append('model', model);
@@ -58,10 +65,12 @@ class OllamaService {
       const response = await axios.post(`${this.baseURL}/generate/`, formData, {
         headers: {
           ...formData.getHeaders(),
+          ...traceHeaders,
         },
         timeout: this.timeout,
         maxContentLength: Infinity,
         maxBodyLength: Infinity,
+        ...this.transport,
       });
 
       logger.info(`Successfully generated code, response length: ${response.data.result?.length || 0} characters`);
@@ -81,9 +90,12 @@ class OllamaService {
    * @param {boolean} isAutoMode - Si está en modo automático (opcional)
    * @param {string} visionModel - Modelo de visión personalizado para modo automático (opcional)
    * @param {string} codingModel - Modelo de generación personalizado para modo automático (opcional)
-   * @returns {Promise<Stream>} Stream de respuesta
+   * @param {Array<string>} imageIds - Ids de imágenes ya subidas al almacén para este turno (opcional)
+   * @param {Object} traceHeaders - Cabeceras de traza W3C a reenviar (opcional)
+   * @returns {Promise<{stream: Stream, headers: Object}>} Stream de respuesta y las cabeceras
+   *   de FastAPI que interesan al cliente (X-Image-Ids, X-Stream-Session)
    */
-  async generateCodeStream(model, prompt, images = [], messageHistory = [], isAutoMode = false, visionModel = null, codingModel = null) {
+  async generateCodeStream(model, prompt, images = [], messageHistory = [], isAutoMode = false, visionModel = null, codingModel = null, imageIds = [], traceHeaders = {}) {
     try {
       const formData = new FormData();
       formData.append('model', model);
@@ -92,6 +104,7 @@ class OllamaService {
       
       if (visionModel) formData.append('vision_model', visionModel);
       if (codingModel) formData.append('coding_model', codingModel);
+      if (imageIds && imageIds.length > 0) formData.append('image_ids', JSON.stringify(imageIds));
       
       // Agregar historial de mensajes si existe
       if (messageHistory && messageHistory.length > 0) {
@@ -113,20 +126,179 @@ class OllamaService {
       const response = await axios.post(`${this.baseURL}/generate/stream`, formData, {
         headers: {
           ...formData.getHeaders(),
+          ...traceHeaders,
         },
         timeout: this.timeout,
         maxContentLength: Infinity,
         maxBodyLength: Infinity,
         responseType: 'stream',
+        ...this.transport,
       });
 
-      return response.data;
+      return {
+        stream: this._resumable(response.data, null, traceHeaders),
+        headers: this._forwardedHeaders(response.headers),
+      };
     } catch (error) {
       logger.error('Error in streaming generation:', error.message);
       throw this._handleError(error);
     }
   }
 
+  /**
+   * Reanuda un stream de /generate/stream a partir del último frame recibido
+   * @param {string} lastEventId - Id del último frame recibido (sesión:n)
+   * @param {Object} traceHeaders - Cabeceras de traza W3C a reenviar (opcional)
+   * @returns {Promise<{stream: Stream, headers: Object}>} Frames posteriores y cabeceras para el cliente
+   */
+  async resumeStream(lastEventId, traceHeaders = {}) {
+    try {
+      const response = await this._requestResume(lastEventId, traceHeaders);
+      return {
+        stream: this._resumable(response.data, lastEventId, traceHeaders),
+        headers: this._forwardedHeaders(response.headers),
+      };
+    } catch (error) {
+      logger.error('Error resuming stream:', error.message);
+      throw this._handleError(error);
+    }
+  }
+
+  /**
+   * Petición de reanudación a FastAPI
+   * @private
+   */
+  _requestResume(lastEventId, traceHeaders = {}) {
+    return axios.get(`${this.baseURL}/generate/stream/resume`, {
+      headers: {
+        'Last-Event-ID': lastEventId,
+        ...traceHeaders,
+      },
+      timeout: this.timeout,
+      responseType: 'stream',
+      ...this.transport,
+    });
+  }
+
+  /**
+   * Reenvía los frames SSE de FastAPI recordando el id del último. Si la
+   * conexión se corta antes de [DONE] o [ERROR], se reconecta con ese id
+   * hasta streamResumeAttempts veces seguidas sin recibir frames.
+   * Una sesión de stream vive en un solo worker de FastAPI: con varios
+   * workers (--prod) la reanudación puede llegar a otro y recibir 404, que
+   * también se reintenta.
+   * @private
+   */
+  _resumable(upstream, lastEventId = null, traceHeaders = {}) {
+    const output = new PassThrough();
+    let current = null;
+    let attempts = 0;
+    let finished = false;
+
+    const reconnect = (reason) => {
+      if (output.destroyed) return;
+      if (finished || !lastEventId) {
+        output.end();
+        return;
+      }
+      if (attempts >= this.resumeAttempts) {
+        output.destroy(new Error(`Stream interrumpido: ${reason}`));
+        return;
+      }
+      attempts += 1;
+      logger.info(`Stream interrupted (${reason}), resuming from ${lastEventId} (attempt ${attempts})`);
+      setTimeout(async () => {
+        if (output.destroyed) return;
+        try {
+          follow((await this._requestResume(lastEventId, traceHeaders)).data);
+        } catch (error) {
+          // 400 y 410: el id no es válido o los frames ya se descartaron, no se puede reanudar
+          if ([400, 410].includes(error.response?.status)) attempts = this.resumeAttempts;
+          reconnect(this._handleError(error).message);
+        }
+      }, this.resumeDelay);
+    };
+
+    const follow = (source) => {
+      current = source;
+      let pending = '';
+      let closed = false;
+      const close = (reason) => {
+        if (closed) return;
+        closed = true;
+        reconnect(reason);
+      };
+      source.on('data', (chunk) => {
+        pending += chunk.toString();
+        let end = pending.indexOf('\n\n');
+        while (end !== -1) {
+          const frame = pending.slice(0, end + 2);
+          pending = pending.slice(end + 2);
+          const id = /^id: (.+)$/m.exec(frame);
+          if (id) lastEventId = id[1].trim();
+          if (/^data: \[(DONE|ERROR)\]/m.test(frame)) finished = true;
+          attempts = 0;
+          output.write(frame);
+          end = pending.indexOf('\n\n');
+        }
+      });
+      source.on('end', () => close('conexión cerrada'));
+      source.on('error', (error) => close(error.message));
+    };
+
+    // Si el cliente se va, se corta también la conexión con FastAPI
+    output.on('close', () => current?.destroy?.());
+    follow(upstream);
+    return output;
+  }
+
+  /**
+   * Guarda imágenes en el almacén de FastAPI para referenciarlas por id
+   * @param {Array} images - Array de objetos de imagen con buffer y mimetype
+   * @param {Object} traceHeaders - Cabeceras de traza W3C a reenviar (opcional)
+   * @returns {Promise<Object>} Ids de las imágenes guardadas ({ images: [{ id, bytes }] })
+   */
+  async uploadImages(images, traceHeaders = {}) {
+    try {
+      const formData = new FormData();
+      images.forEach((image, index) => {
+        formData.append('images', image.buffer, {
+          filename: `image${index}.png`,
+          contentType: image.mimetype,
+        });
+      });
+
+      logger.info(`Uploading ${images.length} images`);
+      const response = await axios.post(`${this.baseURL}/images/`, formData, {
+        headers: {
+          ...formData.getHeaders(),
+          ...traceHeaders,
+        },
+        timeout: 30000,
+        maxContentLength: Infinity,
+        maxBodyLength: Infinity,
+        ...this.transport,
+      });
+      return response.data;
+    } catch (error) {
+      logger.error('Error uploading images:', error.message);
+      throw this._handleError(error);
+    }
+  }
+
+  /**
+   * Cabeceras de la respuesta de FastAPI que se reenvían al cliente
+   * @private
+   */
+  _forwardedHeaders(headers = {}) {
+    const forwarded = {};
+    for (const name of ['X-Image-Ids', 'X-Stream-Session']) {
+      const value = headers[name.toLowerCase()];
+      if (value) forwarded[name] = value;
+    }
+    return forwarded;
+  }
+
   /**
    * Descarga un modelo de la memoria
    * @param {string} model - Nombre del modelo a descargar
@@ -137,7 +309,7 @@ class OllamaService {
       logger.info('Unloading model...');
       const response = await axios.post(`${this.baseURL}/models/unload`, 
         { model },
-        { timeout: 30000 }
+        { timeout: 30000, ...this.transport }
       );
       logger.info('Successfully unloaded model');
       return response.data;
@@ -156,6 +328,7 @@ class OllamaService {
       logger.info('Fetching auto-selected models from FastAPI');
       const response = await axios.get(`${this.baseURL}/models/auto-select`, {
         timeout: 30000,
+        ...this.transport,
       });
       logger.info(`Auto-selected models: vision=${response.data.vision_model}, coding=${response.data.coding_model}`);
       return response.data;
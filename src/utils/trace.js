@@ -0,0 +1,19 @@
+const TRACEPARENT = /^[0-9a-f]{2}-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$/;
+
+/**
+ * Cabeceras W3C Trace Context para reenviar a FastAPI.
+ * Se reenvía el traceparent del cliente si es válido (y su tracestate);
+ * si no, no se envía nada y FastAPI inicia la traza y decide el muestreo.
+ * @param {import('express').Request} req - Petición entrante
+ * @returns {Object} Cabeceras traceparent y tracestate, o vacío
+ */
+export function traceHeaders(req) {
+  const received = req.headers || {};
+  const incoming = String(received.traceparent || '').trim().toLowerCase();
+  if (TRACEPARENT.test(incoming) && !incoming.startsWith('ff-')) {
+    const headers = { traceparent: incoming };
+    if (received.tracestate) headers.tracestate = received.tracestate;
+    return headers;
+  }
+  return {};
+}